@@ -3,13 +3,18 @@
 from flask import Flask
 from flask_cors import CORS
 from app.config.firebase import db
+from app import data, discovery, realtime
+from app.utils.identity_map import reads_saved
+from app.utils.token_cache import token_cache
+from app.utils.token_verifier import get_service_account_key
 
 def create_app(config_name='development'):
     """Create Flask application with the specified configuration."""
     app = Flask(__name__)
     
     # Enable Cross-Origin Resource Sharing with credentials support
-    CORS(app, supports_credentials=True, resources={r"/*": {"origins": ["http://localhost:3000", "http://127.0.0.1:3000"]}})
+    CORS(app, supports_credentials=True, resources={r"/*": {"origins": ["http://localhost:3000", "http://127.0.0.1:3000"]}},
+         expose_headers=['X-Cursor-Before', 'X-Cursor-After', 'X-Has-More', 'X-Sync-Token', 'X-Other-Last-Read-At'])
     
     # Configure app based on environment
     if config_name == 'development':
@@ -19,6 +24,27 @@ def create_app(config_name='development'):
     elif config_name == 'testing':
         app.config.from_object('app.config.testing')
     
+    # Size the shared verified-token cache
+    token_cache.max_size = app.config.get('TOKEN_CACHE_MAX_SIZE', token_cache.max_size)
+    token_cache.ttl = app.config.get('TOKEN_CACHE_TTL', token_cache.ttl)
+    
+    # Attach the data access layer for the configured backend
+    store = data.init_app(app)
+    
+    # Custom tokens from /login are verified locally with the service-account key;
+    # without it every one of them would be refused, so don't start at all
+    if store.backend == data.BACKEND_FIRESTORE and get_service_account_key()[0] is None:
+        raise RuntimeError(
+            "No service-account key at FIREBASE_CREDENTIALS_PATH: "
+            "custom tokens issued by /api/auth/login could not be verified"
+        )
+    
+    # Fan-out hub for streamed message changes and the cross-worker event bus
+    realtime.init_app(app, store.client)
+    
+    # In-memory candidate index for discover
+    discovery.init_app(app, store)
+    
     # Register blueprints
     from app.api.auth import auth_bp
     from app.api.profiles import profiles_bp
@@ -26,6 +52,7 @@ def create_app(config_name='development'):
     from app.api.messages import messages_bp
     from app.api.ratings import ratings_bp
     from app.api.images import images_bp
+    from app.api.events import events_bp
     
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(profiles_bp, url_prefix='/api/profiles')
@@ -33,11 +60,18 @@ def create_app(config_name='development'):
     app.register_blueprint(messages_bp, url_prefix='/api/messages')
     app.register_blueprint(ratings_bp)
     app.register_blueprint(images_bp, url_prefix='/api/images')
+    app.register_blueprint(events_bp, url_prefix='/api/events')
     
     # Check Firebase connection
-    if not db:
+    if store.backend == data.BACKEND_FIRESTORE and not db:
         print("Warning: Firebase not initialized correctly")
     
+    @app.after_request
+    def report_reads_saved(response):
+        """Expose how many document reads the identity map saved in this request."""
+        response.headers['X-Firestore-Reads-Saved'] = str(reads_saved())
+        return response
+    
     @app.route('/health', methods=['GET'])
     def health_check():
         """Simple health check endpoint."""
@@ -2,14 +2,20 @@
 
 from flask import Blueprint, request, jsonify
 from firebase_admin import auth, firestore, exceptions
-from app.utils.decorators import token_required
-from app.config.firebase import db
+from app.utils.decorators import admin_required, token_required
+from app.utils.stream_token import STREAM_TOKEN_LIFETIME, issue_stream_token
+from app.utils.token_cache import token_cache
+from app.utils.token_verifier import get_verification_stats
+from app.data import store
 import json
 import requests
 import os
 
 auth_bp = Blueprint('auth', __name__)
 
+# Seconds a custom token from create_custom_token stays valid
+CUSTOM_TOKEN_LIFETIME = 3600
+
 @auth_bp.route('/register', methods=['POST'])
 def register():
     """Register a new user with email and password."""
@@ -36,11 +42,12 @@ def register():
             'email': email,
             'display_name': display_name,
             'profile_completed': False,
-            'created_at': firestore.SERVER_TIMESTAMP
+            'created_at': firestore.SERVER_TIMESTAMP,
+            'updated_at': firestore.SERVER_TIMESTAMP
         }
         
         # Add user to Firestore collection
-        db.collection('users').document(user.uid).set(user_data)
+        store.users.set(user.uid, user_data)
         
         return jsonify({
             "message": "User registered successfully",
@@ -90,17 +97,63 @@ def login():
         # Generate a custom token for the user
         custom_token = auth.create_custom_token(uid)
         
-        # Return the token in the response
+        # Return the token in the response. Custom tokens expire after an hour;
+        # the refresh token exchanges for a new one at /refresh.
         return jsonify({
             "message": "Login successful",
             "uid": uid,
             "token": custom_token.decode(),
+            "refresh_token": auth_response.get('refreshToken'),
+            "expires_in": CUSTOM_TOKEN_LIFETIME,
             "email": email
         }), 200
         
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
+@auth_bp.route('/refresh', methods=['POST'])
+def refresh_token():
+    """Exchange a Firebase refresh token for a new custom token and refresh token."""
+    try:
+        data = request.get_json()
+        
+        if not data or not data.get('refresh_token'):
+            return jsonify({"error": "Refresh token is required"}), 400
+        
+        firebase_api_key = os.getenv('FIREBASE_WEB_API_KEY')
+        
+        if not firebase_api_key:
+            return jsonify({"error": "Firebase configuration missing"}), 500
+        
+        # Use the Secure Token REST API to exchange the refresh token for an ID token
+        token_url = f"https://securetoken.googleapis.com/v1/token?key={firebase_api_key}"
+        payload = {
+            "grant_type": "refresh_token",
+            "refresh_token": data.get('refresh_token')
+        }
+        
+        response = requests.post(token_url, data=payload)
+        
+        if response.status_code != 200:
+            auth_error = response.json().get('error', {})
+            error_message = auth_error.get('message', 'Invalid refresh token')
+            return jsonify({"error": error_message}), 401
+        
+        # Firebase rotates the refresh token; the ID token proves the user is still valid
+        token_response = response.json()
+        uid = token_response.get('user_id')
+        custom_token = auth.create_custom_token(uid)
+        
+        return jsonify({
+            "uid": uid,
+            "token": custom_token.decode(),
+            "refresh_token": token_response.get('refresh_token'),
+            "expires_in": CUSTOM_TOKEN_LIFETIME
+        }), 200
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
 @auth_bp.route('/verify-token', methods=['POST'])
 def verify_token():
     """Verify a Firebase ID token."""
@@ -129,6 +182,9 @@ def get_current_user(current_user):
     """Get current user info - requires valid token."""
     try:
         # current_user is provided by the @token_required decorator
+        if not current_user.exists:
+            return jsonify({"message": "User not found!"}), 404
+        
         return jsonify({
             "uid": current_user['uid'],
             "email": current_user.get('email', ''),
@@ -138,6 +194,29 @@ def get_current_user(current_user):
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
+@auth_bp.route('/stream-token', methods=['POST'])
+@token_required
+def get_stream_token(current_user):
+    """Issue a short-lived token for opening event streams with EventSource."""
+    try:
+        return jsonify({
+            "stream_token": issue_stream_token(current_user['uid']),
+            "expires_in": STREAM_TOKEN_LIFETIME
+        }), 200
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+@auth_bp.route('/token-stats', methods=['GET'])
+@token_required
+@admin_required
+def get_token_stats(current_user):
+    """Report token cache hit rates and per-class verification latency."""
+    return jsonify({
+        "cache": token_cache.stats(),
+        "verification": get_verification_stats()
+    }), 200
+
 @auth_bp.route('/get-test-token/<uid>', methods=['GET'])
 def get_test_token(uid):
     """Temporary endpoint for testing - generates a Firebase token for a user."""
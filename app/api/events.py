@@ -0,0 +1,49 @@
+# app/api/events.py
+
+import json
+
+from flask import Blueprint, jsonify, current_app
+from app.utils.decorators import admin_required, stream_token_required, token_required
+from app.realtime import get_bus, user_topic
+from app.realtime.sse import event_stream, format_event
+from app.realtime.subscription import Subscription
+
+events_bp = Blueprint('events', __name__)
+
+@events_bp.route('/stream', methods=['GET'])
+@stream_token_required
+def stream_events(current_user):
+    """Stream the current user's notifications (new messages, new matches) as Server-Sent Events."""
+    try:
+        bus = get_bus()
+        topic = user_topic(current_user['uid'])
+        
+        def on_event(event_topic, event):
+            # Runs on the bus's thread: only enqueue
+            subscription.publish(event)
+        
+        subscription = Subscription(
+            current_app.config['STREAM_QUEUE_SIZE'],
+            on_close=lambda _: bus.unsubscribe(topic, on_event)
+        )
+        bus.subscribe(topic, on_event)
+        
+        def render(event):
+            return format_event(event.get('type', 'event'), json.dumps(event))
+        
+        return event_stream(subscription, render)
+        
+    except Exception as e:
+        print(f"Error in stream_events: {str(e)}")
+        return jsonify({"error": str(e)}), 400
+
+@events_bp.route('/stats', methods=['GET'])
+@token_required
+@admin_required
+def get_event_stats(current_user):
+    """Get event bus delivery counters for this worker."""
+    try:
+        return jsonify(get_bus().stats()), 200
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
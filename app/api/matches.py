@@ -1,14 +1,18 @@
 # app/api/matches.py
 
 from flask import Blueprint, request, jsonify
-from firebase_admin import firestore
-from app.utils.decorators import token_required
-from app.config.firebase import db
+from app.utils.decorators import token_required, user_required
+from app.data import store
+from app.discovery import get_deck_builder
+from app.realtime import publish_event, user_topic
+from app.utils.fields import requested_fields, select_fields, wants
+from app.utils.helpers import absolute_photo_urls
 
 matches_bp = Blueprint('matches', __name__)
 
 @matches_bp.route('/like/<target_uid>', methods=['POST'])
 @token_required
+@user_required
 def like_profile(current_user, target_uid):
     """Like another user's profile."""
     try:
@@ -19,41 +23,42 @@ def like_profile(current_user, target_uid):
             return jsonify({"error": "You cannot like your own profile"}), 400
         
         # Check if target user exists
-        target_user = db.collection('users').document(target_uid).get()
+        target_user = store.users.get(target_uid)
         if not target_user.exists:
             return jsonify({"error": "User not found"}), 404
         
-        # Create a like document
-        like_data = {
-            'liker_uid': liker_uid,
-            'target_uid': target_uid,
-            'created_at': firestore.SERVER_TIMESTAMP
-        }
-        
         # Add to likes collection
-        db.collection('likes').add(like_data)
+        store.likes.like(liker_uid, target_uid)
+        
+        # Keep the profile out of discover from now on
+        store.seen.add(liker_uid, target_uid)
+        
+        # A pair has at most one match (one document read): liking again doesn't
+        # re-create it, and doesn't undo an unmatch either
+        existing = store.matches.find_between(liker_uid, target_uid)
+        if existing is not None:
+            if existing.to_dict().get('active', True):
+                return jsonify({
+                    "message": "It's a match!",
+                    "is_match": True,
+                    "match_id": existing.id
+                }), 200
+            return jsonify({
+                "message": "Like recorded",
+                "is_match": False
+            }), 200
         
         # Check if this creates a match (if the other user has liked this user)
-        mutual_like = db.collection('likes').where(
-            'liker_uid', '==', target_uid
-        ).where(
-            'target_uid', '==', liker_uid
-        ).limit(1).get()
-        
-        is_match = len(mutual_like) > 0
+        is_match = store.likes.has_liked(target_uid, liker_uid)
         
         if is_match:
-            # Create a match document
-            match_data = {
-                'user1_uid': liker_uid,
-                'user2_uid': target_uid,
-                'created_at': firestore.SERVER_TIMESTAMP,
-                'last_message_at': None,
-                'active': True
-            }
+            # Create the match document, unless a simultaneous like from the other user just did
+            match_id, created = store.matches.create(liker_uid, target_uid)
             
-            match_ref = db.collection('matches').add(match_data)
-            match_id = match_ref[1].id
+            # Tell both users about the new match (once)
+            if created:
+                publish_event(user_topic(liker_uid), {'type': 'match', 'match_id': match_id, 'other_uid': target_uid})
+                publish_event(user_topic(target_uid), {'type': 'match', 'match_id': match_id, 'other_uid': liker_uid})
             
             return jsonify({
                 "message": "It's a match!",
@@ -71,20 +76,15 @@ def like_profile(current_user, target_uid):
 
 @matches_bp.route('/dislike/<target_uid>', methods=['POST'])
 @token_required
+@user_required
 def dislike_profile(current_user, target_uid):
     """Dislike another user's profile."""
     try:
         disliker_uid = current_user['uid']
         
-        # Create a dislike document to keep track
-        dislike_data = {
-            'disliker_uid': disliker_uid,
-            'target_uid': target_uid,
-            'created_at': firestore.SERVER_TIMESTAMP
-        }
-        
-        # Add to dislikes collection
-        db.collection('dislikes').add(dislike_data)
+        # Add to dislikes collection to keep track
+        store.dislikes.dislike(disliker_uid, target_uid)
+        store.seen.add(disliker_uid, target_uid)
         
         return jsonify({
             "message": "Dislike recorded"
@@ -96,67 +96,36 @@ def dislike_profile(current_user, target_uid):
 @matches_bp.route('/matches', methods=['GET'])
 @token_required
 def get_matches(current_user):
-    """Get all matches for the current user."""
+    """Get all matches for the current user (only the fields named in `fields`, if given)."""
     try:
         uid = current_user['uid']
-        
-        # Get matches where user is user1 or user2
-        matches_as_user1 = db.collection('matches').where('user1_uid', '==', uid).where('active', '==', True).get()
-        matches_as_user2 = db.collection('matches').where('user2_uid', '==', uid).where('active', '==', True).get()
+        try:
+            fields = requested_fields()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
         results = []
-        processed_match_ids = set()  # Track processed match IDs to prevent duplicates
         
-        # Process matches where current user is user1
-        for match in matches_as_user1:
-            match_id = match.id
-            
-            # Skip if we've already processed this match
-            if match_id in processed_match_ids:
-                continue
-                
-            processed_match_ids.add(match_id)
-            match_data = match.to_dict()
-            
-            # Get the other user's profile
-            other_uid = match_data['user2_uid']
-            other_user = db.collection('users').document(other_uid).get()
-            
-            if other_user.exists:
-                other_user_data = other_user.to_dict()
-                match_obj = {
-                    'match_id': match_id,
-                    'user_uid': other_uid,
-                    'display_name': other_user_data.get('display_name', ''),
-                    'bio': other_user_data.get('bio', ''),
-                    'photos': other_user_data.get('photos', []),
-                    'created_at': match_data.get('created_at')
-                }
-                results.append(match_obj)
+        # Matches where user is user1 or user2; with `fields`, only what the listing shows is read
+        matches = store.matches.for_user(uid, fields=None if fields is None else ['created_at'])
         
-        # Process matches where current user is user2
-        for match in matches_as_user2:
-            match_id = match.id
-            
-            # Skip if we've already processed this match
-            if match_id in processed_match_ids:
-                continue
-                
-            processed_match_ids.add(match_id)
+        # Load all the other users' public profiles in chunked batches instead of one read per match
+        profile_fields = None
+        if fields is not None:
+            profile_fields = [field for field in ('display_name', 'bio', 'photos') if wants(fields, field)]
+        other_users = store.public_profiles.profiles([other_uid for _, other_uid in matches], fields=profile_fields)
+        
+        for match, other_uid in matches:
             match_data = match.to_dict()
+            other_user_data = other_users.get(other_uid)
             
-            # Get the other user's profile
-            other_uid = match_data['user1_uid']
-            other_user = db.collection('users').document(other_uid).get()
-            
-            if other_user.exists:
-                other_user_data = other_user.to_dict()
+            if other_user_data is not None:
                 match_obj = {
-                    'match_id': match_id,
+                    'match_id': match.id,
                     'user_uid': other_uid,
                     'display_name': other_user_data.get('display_name', ''),
                     'bio': other_user_data.get('bio', ''),
-                    'photos': other_user_data.get('photos', []),
+                    'photos': absolute_photo_urls(other_user_data.get('photos', [])[:1]),
                     'created_at': match_data.get('created_at')
                 }
                 results.append(match_obj)
@@ -164,7 +133,7 @@ def get_matches(current_user):
         # Sort by creation time (newest first)
         results.sort(key=lambda x: x.get('created_at', 0), reverse=True)
         
-        return jsonify(results), 200
+        return jsonify([select_fields(result, fields) for result in results]), 200
         
     except Exception as e:
         return jsonify({"error": str(e)}), 400
@@ -177,7 +146,7 @@ def unmatch(current_user, match_id):
         uid = current_user['uid']
         
         # Get the match
-        match_doc = db.collection('matches').document(match_id).get()
+        match_doc = store.matches.get(match_id)
         
         if not match_doc.exists:
             return jsonify({"error": "Match not found"}), 404
@@ -189,11 +158,7 @@ def unmatch(current_user, match_id):
             return jsonify({"error": "Unauthorized"}), 403
         
         # Set match as inactive
-        db.collection('matches').document(match_id).update({
-            'active': False,
-            'unmatch_initiated_by': uid,
-            'unmatched_at': firestore.SERVER_TIMESTAMP
-        })
+        store.matches.deactivate(match_id, uid)
         
         return jsonify({
             "message": "Unmatched successfully"
@@ -210,24 +175,19 @@ def clear_all_likes(current_user):
         uid = current_user['uid']
         
         # Delete all likes FROM this user
-        likes_from_user = db.collection('likes').where('liker_uid', '==', uid).stream()
-        for like in likes_from_user:
-            like.reference.delete()
+        store.likes.delete_from(uid)
             
         # DO NOT delete likes TO this user - this preserves matching potential
-        # likes_to_user = db.collection('likes').where('target_uid', '==', uid).stream()
-        # for like in likes_to_user:
-        #     like.reference.delete()
             
         # Delete all dislikes FROM this user
-        dislikes_from_user = db.collection('dislikes').where('disliker_uid', '==', uid).stream()
-        for dislike in dislikes_from_user:
-            dislike.reference.delete()
+        store.dislikes.delete_from(uid)
             
         # DO NOT delete dislikes TO this user
-        # dislikes_to_user = db.collection('dislikes').where('target_uid', '==', uid).stream()
-        # for dislike in dislikes_to_user:
-        #     dislike.reference.delete()
+        
+        # Everyone swiped on can show up in discover again
+        store.seen.clear(uid)
+        store.decks.invalidate(uid)
+        get_deck_builder().schedule(uid)
         
         return jsonify({
             "message": "All likes and dislikes from you have been cleared successfully"
@@ -1,12 +1,91 @@
 # app/api/messages.py
 
+import json
+
 from flask import Blueprint, request, jsonify
-from firebase_admin import firestore
-from app.utils.decorators import token_required
-from app.config.firebase import db
+from app.utils.decorators import stream_token_required, token_required, user_required
+from app.data import store
+from app.realtime import StreamLimitError, get_hub, publish_event, user_topic
+from app.realtime.sse import event_stream, format_event
+from app.utils.fields import requested_fields, select_fields, wants
+from app.utils.helpers import absolute_photo_urls
+from app.utils.sync_token import EPOCH, as_utc, decode_sync_token, encode_sync_token
 
 messages_bp = Blueprint('messages', __name__)
 
+# Messages per page for get_messages
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+
+# Most changes returned for one `since` poll; beyond this the client should reload
+MAX_SYNC_CHANGES = 200
+
+def match_sync_time(match_data):
+    """The time of the last change to a match and its messages."""
+    changed_at = match_data.get('updated_at') or match_data.get('created_at')
+    return as_utc(changed_at) if changed_at else EPOCH
+
+def other_participant(match_data, uid):
+    """The UID of the other user in a match."""
+    return match_data['user2_uid'] if uid == match_data['user1_uid'] else match_data['user1_uid']
+
+def read_watermark(match_data, uid):
+    """The time up to which `uid` has read the match's messages, or None."""
+    read_through = (match_data.get('last_read_at') or {}).get(uid)
+    return as_utc(read_through) if read_through else None
+
+def is_read(msg_data, match_data):
+    """Whether the recipient's read watermark covers a message."""
+    # Messages from before read watermarks carry their own flag
+    if msg_data.get('read'):
+        return True
+    read_through = read_watermark(match_data, other_participant(match_data, msg_data.get('sender_uid')))
+    created_at = msg_data.get('created_at')
+    return read_through is not None and created_at is not None and as_utc(created_at) <= read_through
+
+def serialize_message(msg_doc, match_data):
+    """Message snapshot as a JSON-ready dict with its ID, read state and ISO timestamps."""
+    msg_data = msg_doc.to_dict()
+    msg_data['id'] = msg_doc.id
+    msg_data['read'] = is_read(msg_data, match_data)
+    
+    # Convert timestamps to ISO format for JSON serialization
+    for field in ('created_at', 'read_at', 'updated_at'):
+        if msg_data.get(field):
+            msg_data[field] = msg_data[field].isoformat()
+    
+    return msg_data
+
+def set_read_state_header(response, match_data, uid):
+    """Tell the reader of a match how far the other user has read it (for read receipts)."""
+    other_read_through = read_watermark(match_data, other_participant(match_data, uid))
+    if other_read_through is not None:
+        response.headers['X-Other-Last-Read-At'] = other_read_through.isoformat()
+    return response
+
+def unread_count_for(match_id, match_data, uid):
+    """Unread messages for `uid` in a match, from the counter kept on the match."""
+    unread_counts = match_data.get('unread_counts') or {}
+    if uid in unread_counts:
+        return unread_counts[uid]
+    
+    # Matches from before counters were kept (or with only the other user's counter
+    # yet): count server-side instead of fetching messages
+    return store.messages.count_unread(
+        match_id,
+        other_participant(match_data, uid),
+        (match_data.get('last_read_at') or {}).get(uid)
+    )
+
+def publish_read_receipt(match_id, reader_uid, sender_uid, read_through):
+    """Tell the sender how far the reader has read."""
+    publish_event(user_topic(sender_uid), {
+        'type': 'read',
+        'match_id': match_id,
+        'reader_uid': reader_uid,
+        'last_read_at': as_utc(read_through).isoformat()
+    })
+
 @messages_bp.route('/<match_id>', methods=['GET'])
 @token_required
 def get_messages(current_user, match_id):
@@ -15,7 +94,7 @@ def get_messages(current_user, match_id):
         uid = current_user['uid']
         
         # Verify match exists and user is part of it
-        match_doc = db.collection('matches').document(match_id).get()
+        match_doc = store.matches.get(match_id)
         if not match_doc.exists:
             return jsonify({"error": "Match not found"}), 404
         
@@ -26,56 +105,197 @@ def get_messages(current_user, match_id):
         if not match_data.get('active', True):
             return jsonify({"error": "This match is no longer active"}), 400
         
-        # Get messages for this match without ordering (to avoid index requirement)
-        messages_query = db.collection('messages').where(
-            'match_id', '==', match_id
-        ).get()
+        # Delta sync: only messages created or changed after the client's token
+        since = request.args.get('since')
+        if since:
+            try:
+                since_time = decode_sync_token(since)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            
+            # Every message write also touches the match, so an unchanged match means no changes
+            if match_sync_time(match_data) <= since_time:
+                response = set_read_state_header(jsonify([]), match_data, uid)
+                response.headers['X-Sync-Token'] = since
+                return response, 200
+            
+            page = store.messages.changed_since(match_id, since_time, MAX_SYNC_CHANGES + 1)
+            if len(page) > MAX_SYNC_CHANGES:
+                return jsonify({"error": "Too many changes since this sync token, reload the conversation"}), 410
+        else:
+            # Page size and optional before/after message ID cursors
+            try:
+                limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+            except ValueError:
+                return jsonify({"error": "limit must be an integer"}), 400
+            limit = max(1, min(limit, MAX_PAGE_SIZE))
+            
+            before_id = request.args.get('before')
+            after_id = request.args.get('after')
+            if before_id and after_id:
+                return jsonify({"error": "Use either before or after, not both"}), 400
+            
+            cursor = None
+            if before_id or after_id:
+                cursor = store.messages.get(before_id or after_id)
+                if not cursor.exists or cursor.to_dict().get('match_id') != match_id:
+                    return jsonify({"error": "Invalid cursor"}), 400
+            
+            # Newest page first; messages within a page are in ascending order
+            if after_id:
+                page, has_more = store.messages.page(match_id, limit, after=cursor)
+            else:
+                page, has_more = store.messages.page(match_id, limit, before=cursor)
         
-        messages = []
-        unread_message_ids = []  # Track unread messages that need to be marked as read
+        read_through = None  # Newest message from the other user not yet covered by our watermark
         
-        for msg_doc in messages_query:
+        for msg_doc in page:
             msg_data = msg_doc.to_dict()
-            msg_data['id'] = msg_doc.id
             
             # Check if this is an unread message from the other user
-            if (msg_data.get('sender_uid') != uid and 
-                msg_data.get('read') is False):
-                unread_message_ids.append(msg_doc.id)
+            if msg_data.get('sender_uid') != uid and not is_read(msg_data, match_data):
+                if read_through is None or as_utc(msg_data['created_at']) > as_utc(read_through):
+                    read_through = msg_data['created_at']
+        
+        # Loading the newest messages moves the read watermark up to them and resets
+        # the unread counter: one write to the match however many messages it covers.
+        # Older pages (`before`) never hold messages newer than the watermark.
+        reached_newest = since or not (before_id or after_id) or (after_id and not has_more)
+        if read_through is not None and reached_newest:
+            store.messages.mark_read(match_id, uid, read_through)
+            publish_read_receipt(match_id, uid, other_participant(match_data, uid), read_through)
+            match_data['last_read_at'] = dict(match_data.get('last_read_at') or {}, **{uid: read_through})
+        
+        messages = [serialize_message(msg_doc, match_data) for msg_doc in page]
+        
+        response = jsonify(messages)
+        
+        # Cursors for the neighbouring pages; X-Has-More refers to the direction paged
+        if not since:
+            if messages:
+                response.headers['X-Cursor-Before'] = messages[0]['id']
+                response.headers['X-Cursor-After'] = messages[-1]['id']
+            elif after_id:
+                response.headers['X-Cursor-After'] = after_id
+            response.headers['X-Has-More'] = 'true' if has_more else 'false'
+        
+        # Token for the next `since` poll, taken from the match as read before the query
+        response.headers['X-Sync-Token'] = encode_sync_token(match_sync_time(match_data))
+        
+        # Read receipts move the match, not the messages, so deltas carry them separately
+        set_read_state_header(response, match_data, uid)
+        
+        return response, 200
+        
+    except Exception as e:
+        print(f"Error in get_messages: {str(e)}")
+        return jsonify({"error": str(e)}), 400
+
+@messages_bp.route('/<match_id>/stream', methods=['GET'])
+@stream_token_required
+def stream_messages(current_user, match_id):
+    """Stream new and changed messages in a match as Server-Sent Events."""
+    try:
+        uid = current_user['uid']
+        
+        # Verify match exists and user is part of it
+        match_doc = store.matches.get(match_id)
+        if not match_doc.exists:
+            return jsonify({"error": "Match not found"}), 404
+        
+        match_data = match_doc.to_dict()
+        if uid != match_data['user1_uid'] and uid != match_data['user2_uid']:
+            return jsonify({"error": "Unauthorized to view these messages"}), 403
+        
+        if not match_data.get('active', True):
+            return jsonify({"error": "This match is no longer active"}), 400
+        
+        # Reconnecting clients resume from their last event (a sync token)
+        since = request.headers.get('Last-Event-ID') or request.args.get('since')
+        since_time = None
+        if since:
+            try:
+                since_time = decode_sync_token(since)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+        
+        # Changes after the client's token, or after the match as just read (server times both)
+        watermark = since_time if since_time is not None else match_sync_time(match_data)
+        
+        try:
+            subscription = get_hub().subscribe(match_id, watermark)
+        except StreamLimitError as e:
+            return jsonify({"error": str(e)}), 503
+        
+        # Replay after subscribing so no change can fall between the two
+        try:
+            backlog = store.messages.changed_since(match_id, watermark, MAX_SYNC_CHANGES + 1)
+        except Exception:
+            subscription.close()
+            raise
+        if len(backlog) > MAX_SYNC_CHANGES:
+            subscription.close()
+            return jsonify({"error": "Too many changes since this sync token, reload the conversation"}), 410
+        
+        other_uid = other_participant(match_data, uid)
+        sent = set()  # (id, updated_at) of changes already sent; replay and listener can overlap
+        receipt = {'read_through': None, 'other_read_through': read_watermark(match_data, other_uid)}
+        
+        def render_read_state(match_snapshot):
+            # The match changes on every message too; only send the other user's watermark moving
+            other_read_through = ((match_snapshot.to_dict() or {}).get('last_read_at') or {}).get(other_uid)
+            if not other_read_through:
+                return ''
+            other_read_through = as_utc(other_read_through)
+            if receipt['other_read_through'] is not None and other_read_through <= receipt['other_read_through']:
+                return ''
+            receipt['other_read_through'] = other_read_through
+            match_data['last_read_at'] = dict(match_data.get('last_read_at') or {}, **{other_uid: other_read_through})
+            return format_event('read', json.dumps({
+                'match_id': match_id,
+                'reader_uid': other_uid,
+                'last_read_at': other_read_through.isoformat()
+            }))
+        
+        def render(doc):
+            if doc.reference.parent.id == 'matches':
+                return render_read_state(doc)
             
-            # Convert timestamps to ISO format for JSON serialization
-            if 'created_at' in msg_data and msg_data['created_at']:
-                msg_data['created_at'] = msg_data['created_at'].isoformat()
-            if 'read_at' in msg_data and msg_data['read_at']:
-                msg_data['read_at'] = msg_data['read_at'].isoformat()
-                
-            messages.append(msg_data)
-        
-        # Sort messages by created_at timestamp in memory (ascending order)
-        messages.sort(key=lambda x: x.get('created_at', ''))
-        
-        # Mark unread messages as read if the current user is the recipient
-        # Using direct ID access instead of complex query
-        if unread_message_ids:
-            batch = db.batch()
-            for msg_id in unread_message_ids:
-                msg_ref = db.collection('messages').document(msg_id)
-                batch.update(msg_ref, {
-                    'read': True,
-                    'read_at': firestore.SERVER_TIMESTAMP
-                })
+            change = (doc.id, doc.get('updated_at'))
+            if change in sent:
+                return ''
+            sent.add(change)
+            
+            msg_data = serialize_message(doc, match_data)
+            
+            # Delivering a message to the recipient's open stream counts as reading it;
+            # the watermark moves once per batch, in flush()
+            if msg_data.get('sender_uid') != uid and not msg_data['read']:
+                created_at = as_utc(doc.get('created_at'))
+                if receipt['read_through'] is None or created_at > receipt['read_through']:
+                    receipt['read_through'] = created_at
+                msg_data['read'] = True
             
-            # Execute batch update - no need to check for writes
-            batch.commit()
+            return format_event('message', json.dumps(msg_data), encode_sync_token(doc.get('updated_at')))
         
-        return jsonify(messages), 200
+        def flush():
+            read_through, receipt['read_through'] = receipt['read_through'], None
+            if read_through is None:
+                return ''
+            if store.messages.mark_read(match_id, uid, read_through):
+                publish_read_receipt(match_id, uid, other_uid, read_through)
+            match_data['last_read_at'] = dict(match_data.get('last_read_at') or {}, **{uid: read_through})
+            return ''
+        
+        return event_stream(subscription, render, backlog, flush)
         
     except Exception as e:
-        print(f"Error in get_messages: {str(e)}")
+        print(f"Error in stream_messages: {str(e)}")
         return jsonify({"error": str(e)}), 400
 
 @messages_bp.route('/<match_id>', methods=['POST'])
 @token_required
+@user_required
 def send_message(current_user, match_id):
     """Send a message in a match."""
     try:
@@ -86,7 +306,7 @@ def send_message(current_user, match_id):
             return jsonify({"error": "Message content is required"}), 400
         
         # Verify match exists and user is part of it
-        match_doc = db.collection('matches').document(match_id).get()
+        match_doc = store.matches.get(match_id)
         if not match_doc.exists:
             return jsonify({"error": "Match not found"}), 404
         
@@ -97,28 +317,23 @@ def send_message(current_user, match_id):
         if not match_data.get('active', True):
             return jsonify({"error": "This match is no longer active"}), 400
         
-        # Create message document
-        message_data = {
-            'match_id': match_id,
-            'sender_uid': uid,
-            'content': data.get('content'),
-            'created_at': firestore.SERVER_TIMESTAMP,
-            'read': False,
-            'read_at': None,
-            'image_url': data.get('image_url')  # Optional image URL
-        }
-        
-        # Add message to Firestore
-        message_ref = db.collection('messages').add(message_data)
+        # Add message to Firestore, updating the match's conversation summary in the same write
+        other_uid = other_participant(match_data, uid)
+        message_id = store.messages.send(
+            match_id, uid, other_uid, data.get('content'), image_url=data.get('image_url')
+        )
         
-        # Update the last_message_at field in the match document
-        db.collection('matches').document(match_id).update({
-            'last_message_at': firestore.SERVER_TIMESTAMP
+        # Notify the recipient on whichever worker holds their event stream
+        publish_event(user_topic(other_uid), {
+            'type': 'message',
+            'match_id': match_id,
+            'message_id': message_id,
+            'sender_uid': uid
         })
         
         return jsonify({
             "message": "Message sent successfully",
-            "message_id": message_ref[1].id
+            "message_id": message_id
         }), 201
         
     except Exception as e:
@@ -132,7 +347,7 @@ def get_unread_count(current_user, match_id):
         uid = current_user['uid']
         
         # Verify match exists and user is part of it
-        match_doc = db.collection('matches').document(match_id).get()
+        match_doc = store.matches.get(match_id)
         if not match_doc.exists:
             return jsonify({"error": "Match not found"}), 404
         
@@ -140,19 +355,31 @@ def get_unread_count(current_user, match_id):
         if uid != match_data['user1_uid'] and uid != match_data['user2_uid']:
             return jsonify({"error": "Unauthorized"}), 403
         
-        # Count unread messages where user is not the sender
-        unread_query = db.collection('messages').where(
-            'match_id', '==', match_id
-        ).where(
-            'sender_uid', '!=', uid
-        ).where(
-            'read', '==', False
-        ).get()
+        return jsonify({
+            "unread_count": unread_count_for(match_id, match_data, uid)
+        }), 200
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+@messages_bp.route('/unread', methods=['GET'])
+@token_required
+def get_unread_counts(current_user):
+    """Get unread message counts for all of the current user's active matches in one call."""
+    try:
+        uid = current_user['uid']
+        
+        # One query for the matches, masked to what the counts need; no message documents are read
+        matches = store.matches.for_user(uid, fields=['unread_counts', 'last_read_at'])
         
-        unread_count = len(unread_query)
+        unread_counts = {
+            match_doc.id: unread_count_for(match_doc.id, match_doc.to_dict(), uid)
+            for match_doc, _ in matches
+        }
         
         return jsonify({
-            "unread_count": unread_count
+            "unread_counts": unread_counts,
+            "total": sum(unread_counts.values())
         }), 200
         
     except Exception as e:
@@ -161,84 +388,109 @@ def get_unread_count(current_user, match_id):
 @messages_bp.route('/conversations', methods=['GET'])
 @token_required
 def get_conversations(current_user):
-    """Get all active conversation matches for the current user with the most recent messages."""
+    """
+    Get all active conversation matches for the current user with the most
+    recent messages (only the fields named in `fields`, if given).
+    """
     try:
         uid = current_user['uid']
-        
-        # Get matches where user is user1 or user2
-        matches_as_user1 = db.collection('matches').where('user1_uid', '==', uid).where('active', '==', True).get()
-        matches_as_user2 = db.collection('matches').where('user2_uid', '==', uid).where('active', '==', True).get()
+        try:
+            fields = requested_fields()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
         conversations = []
-        processed_match_ids = set()  # Track processed match IDs to prevent duplicates
         
-        # Process all matches in a single loop
-        for match_query, is_user1 in [(matches_as_user1, True), (matches_as_user2, False)]:
-            for match_doc in match_query:
-                match_id = match_doc.id
+        since = request.args.get('since')
+        if since:
+            try:
+                sync_time = decode_sync_token(since)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            
+            # Delta sync: only matches changed after the client's token, including unmatched ones
+            matches = store.matches.changed_for_user(uid, sync_time, MAX_SYNC_CHANGES + 1)
+            if len(matches) > MAX_SYNC_CHANGES:
+                return jsonify({"error": "Too many changes since this sync token, reload the conversations"}), 410
+        else:
+            sync_time = EPOCH
+            
+            # All matches where user is user1 or user2
+            matches = store.matches.for_user(uid)
+        
+        # The next token covers every match returned
+        for match_doc, _ in matches:
+            sync_time = max(sync_time, match_sync_time(match_doc.to_dict()))
+        
+        # Load all the other users' public profiles in chunked batches instead of one read per match
+        profile_fields = None
+        if fields is not None:
+            profile_fields = [field for field in ('display_name', 'photos') if wants(fields, f'other_user.{field}')]
+        other_users = store.public_profiles.profiles([other_uid for _, other_uid in matches], fields=profile_fields)
+        
+        for match_doc, other_uid in matches:
+            match_id = match_doc.id
+            match_data = match_doc.to_dict()
+            other_user_data = other_users.get(other_uid)
+            
+            if other_user_data is not None:
+                
+                # Conversation summary kept on the match by send_message/get_messages
+                # (older matches need queries for it, skipped when it wasn't asked for)
+                unread_count = unread_count_for(match_id, match_data, uid) if wants(fields, 'unread_count') else None
+                if 'last_message' in match_data or not wants(fields, 'last_message'):
+                    last_message = match_data.get('last_message')
+                else:
+                    # Matches from before summaries were kept (see scripts/backfill_conversation_summaries.py)
+                    last_message = None
+                    last_message_snapshot = store.messages.last_for_match(match_id)
+                    if last_message_snapshot is not None:
+                        last_message = last_message_snapshot.to_dict()
+                        last_message['id'] = last_message_snapshot.id
                 
-                # Skip if we've already processed this match
-                if match_id in processed_match_ids:
-                    continue
-                    
-                processed_match_ids.add(match_id)
-                match_data = match_doc.to_dict()
+                if last_message:
+                    last_message['match_id'] = match_id
+                    if last_message.get('created_at'):
+                        last_message['created_at'] = last_message['created_at'].isoformat()
+                    if last_message.get('read_at'):
+                        last_message['read_at'] = last_message['read_at'].isoformat()
                 
-                # Get the other user's profile based on whether current user is user1 or user2
-                other_uid = match_data['user2_uid'] if is_user1 else match_data['user1_uid']
-                other_user_doc = db.collection('users').document(other_uid).get()
+                # How far the other user has read, for read receipts
+                other_read_through = read_watermark(match_data, other_uid)
                 
-                if other_user_doc.exists:
-                    other_user_data = other_user_doc.to_dict()
-                    
-                    # Get unread message count more efficiently
-                    unread_query = db.collection('messages').where('match_id', '==', match_id).where('sender_uid', '==', other_uid).where('read', '==', False).get()
-                    unread_count = len(unread_query)
-                    
-                    # Get last message if any
-                    last_message = None
-                    last_message_query = db.collection('messages').where('match_id', '==', match_id).order_by('created_at', direction=firestore.Query.DESCENDING).limit(1).get()
-                    if len(last_message_query) > 0:
-                        last_message_doc = last_message_query[0].to_dict()
-                        last_message_doc['id'] = last_message_query[0].id
-                        
-                        # Format timestamps
-                        if 'created_at' in last_message_doc and last_message_doc['created_at']:
-                            last_message_doc['created_at'] = last_message_doc['created_at'].isoformat()
-                        if 'read_at' in last_message_doc and last_message_doc['read_at']:
-                            last_message_doc['read_at'] = last_message_doc['read_at'].isoformat()
-                        
-                        last_message = last_message_doc
-                    
-                    # Format match timestamps
-                    last_message_at = None
-                    if match_data.get('last_message_at'):
-                        last_message_at = match_data['last_message_at'].isoformat()
-                    elif match_data.get('created_at'):
-                        last_message_at = match_data['created_at'].isoformat()
-                    
-                    # Create the other_user object with user profile data
-                    other_user = {
-                        'uid': other_uid,
-                        'display_name': other_user_data.get('display_name', ''),
-                        'photos': other_user_data.get('photos', [])
-                    }
-                    
-                    # Create the conversation object with necessary data
-                    conversation = {
-                        'match_id': match_id,
-                        'other_user': other_user,
-                        'last_message': last_message,
-                        'last_message_at': last_message_at,
-                        'unread_count': unread_count
-                    }
-                    
-                    conversations.append(conversation)
+                # Format match timestamps
+                last_message_at = None
+                if match_data.get('last_message_at'):
+                    last_message_at = match_data['last_message_at'].isoformat()
+                elif match_data.get('created_at'):
+                    last_message_at = match_data['created_at'].isoformat()
+                
+                # Create the other_user object with user profile data
+                other_user = {
+                    'uid': other_uid,
+                    'display_name': other_user_data.get('display_name', ''),
+                    'photos': absolute_photo_urls(other_user_data.get('photos', [])[:1])
+                }
+                
+                # Create the conversation object with necessary data
+                conversation = {
+                    'match_id': match_id,
+                    'other_user': other_user,
+                    'last_message': last_message,
+                    'last_message_at': last_message_at,
+                    'unread_count': unread_count,
+                    'other_last_read_at': other_read_through.isoformat() if other_read_through else None,
+                    'active': match_data.get('active', True)
+                }
+                
+                conversations.append(conversation)
         
         # Sort conversations by last message time (most recent first)
         conversations.sort(key=lambda x: x.get('last_message_at', '') or '', reverse=True)
         
-        return jsonify(conversations), 200
+        response = jsonify([select_fields(conversation, fields) for conversation in conversations])
+        response.headers['X-Sync-Token'] = encode_sync_token(sync_time)
+        return response, 200
         
     except Exception as e:
         print(f"Error in get_conversations: {str(e)}")
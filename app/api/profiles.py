@@ -1,14 +1,23 @@
 # app/api/profiles.py
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify
 from firebase_admin import firestore
-from app.utils.decorators import token_required
-from app.config.firebase import db
+from app.utils.decorators import token_required, user_required
+from app.data import store
+from app.data.repositories import photo_digest
+from app.discovery import get_buckets, get_deck_builder, get_index
+from app.discovery.buckets import BUCKET_FIELDS
+from app.discovery.decks import VIEWER_FIELDS as DECK_VIEWER_FIELDS, decode_deck_cursor, encode_deck_cursor
 from app.utils.image_analyzer import ImageAnalyzer
+from app.utils.geo import geohash_fields
+from app.utils.fields import requested_fields, select_fields
+from app.utils.helpers import absolute_photo_urls
 from PIL import Image
 import io
 import base64
 import logging
+import threading
+from collections import OrderedDict
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -18,6 +27,24 @@ image_analyzer = ImageAnalyzer(nsfw_detection_threshold=0.5, load_nsfw_model=Tru
 
 profiles_bp = Blueprint('profiles', __name__)
 
+# Profiles returned by discover_profiles per page (default and maximum)
+DISCOVER_LIMIT = 20
+MAX_DISCOVER_LIMIT = 50
+
+# Most UIDs get_user_profiles returns in one request
+MAX_BATCH_UIDS = 100
+
+# Longest side of the photos served to other users, in pixels
+THUMBNAIL_SIZE = 640
+
+# How long browsers may reuse a photo before revalidating it, in seconds
+PHOTO_MAX_AGE = 3600
+
+# Rendered thumbnails kept in this process, by photo digest (least recently used evicted)
+THUMBNAIL_CACHE_SIZE = 256
+_thumbnails = OrderedDict()
+_thumbnails_lock = threading.Lock()
+
 def check_base64_image_nsfw(base64_data):
     """
     Check a base64 encoded image for NSFW content
@@ -62,12 +89,16 @@ def check_base64_image_nsfw(base64_data):
 @profiles_bp.route('/', methods=['GET'])
 @token_required
 def get_profile(current_user):
-    """Get current user's profile."""
+    """Get current user's profile (only the fields named in `fields`, if given)."""
     try:
         uid = current_user['uid']
+        try:
+            fields = requested_fields()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
-        # Get user profile from Firestore
-        user_doc = db.collection('users').document(uid).get()
+        # Get user profile from Firestore, reading only the fields asked for
+        user_doc = store.users.get(uid, fields=fields)
         
         if not user_doc.exists:
             return jsonify({"error": "Profile not found"}), 404
@@ -78,13 +109,14 @@ def get_profile(current_user):
         if 'password' in user_data:
             del user_data['password']
         
-        return jsonify(user_data), 200
+        return jsonify(select_fields(user_data, fields)), 200
         
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
 @profiles_bp.route('/', methods=['PUT'])
 @token_required
+@user_required
 def update_profile(current_user):
     """Update current user's profile."""
     try:
@@ -149,11 +181,28 @@ def update_profile(current_user):
         # Filter out any fields that are not allowed
         update_data = {k: v for k, v in data.items() if k in allowed_fields}
         
+        # Keep the geohash used by discover in step with the location
+        if 'location' in update_data:
+            update_data.update(geohash_fields(update_data['location']))
+        
         # Add timestamp
         update_data['updated_at'] = firestore.SERVER_TIMESTAMP
         
         # Update the document
-        db.collection('users').document(uid).update(update_data)
+        store.users.update(uid, update_data)
+        
+        # Others' decks rank by shared interests; this worker's index sees the change right away
+        if 'interests' in update_data:
+            get_index().update_interests(uid, update_data['interests'])
+        
+        # Shared candidate lists this profile was in, or may have moved into, are out of date
+        if any(field in update_data for field in BUCKET_FIELDS):
+            get_buckets().invalidate(uid, update_data)
+        
+        # Re-rank the user's discover deck when what they are looking for changed
+        if any(field in update_data for field in DECK_VIEWER_FIELDS):
+            store.decks.invalidate(uid)
+            get_deck_builder().schedule(uid)
         
         return jsonify({
             "message": "Profile updated successfully",
@@ -173,44 +222,67 @@ def discover_profiles(current_user):
         # This is simplified
         uid = current_user['uid']
         
-        # Get current user's preferences
-        user_doc = db.collection('users').document(uid).get()
-        if not user_doc.exists:
+        # Get current user's preferences (photo-free fields loaded by token_required)
+        if not current_user.exists:
             return jsonify({"error": "User profile not found"}), 404
         
-        user_data = user_doc.to_dict()
-        preferences = user_data.get('preferences', {})
-        
-        # Get users that match preferences
-        # This is a very basic implementation
-        query = db.collection('users')
-        
-        # Don't show the current user
-        query = query.where('uid', '!=', uid)
-        
-        # For testing purposes, we'll make the filters more lenient
-        # Uncomment the following lines for production use
-        
-        # Only show profiles that have been completed
-        # query = query.where('profile_completed', '==', True)
-        
-        # Filter by gender preference only if it's not "all"
-        if 'gender' in preferences and preferences['gender'] != 'all' and preferences['gender'] != '':
-            query = query.where('gender', '==', preferences['gender'])
-            
-        # Get results
-        results = query.limit(20).get()
+        # Page size and optional cursor into the user's deck
+        try:
+            limit = int(request.args.get('limit', DISCOVER_LIMIT))
+        except ValueError:
+            return jsonify({"error": "limit must be an integer"}), 400
+        limit = max(1, min(limit, MAX_DISCOVER_LIMIT))
+        
+        position = 0
+        after = request.args.get('after')
+        if after:
+            try:
+                cursor_version, position = decode_deck_cursor(after)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+        
+        # Only these fields of each profile, if given (distance_km isn't stored)
+        try:
+            fields = requested_fields()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        profile_fields = None if fields is None else [field for field in fields if field != 'distance_km']
+        
+        # Profiles already liked or disliked (one document read)
+        seen = store.seen.get_set(uid)
+        
+        # Candidates were ranked ahead of time; only a user without a deck waits for one
+        builder = get_deck_builder()
+        deck = store.decks.get_deck(uid)
+        if deck is None:
+            deck = builder.build(uid, current_user, seen)
+        
+        # A cursor into an older deck starts over at the top of the current one
+        if after and cursor_version != deck['version']:
+            position = 0
+        
+        deck_uids = deck['uids']
+        picked = []
+        while position < len(deck_uids) and len(picked) < limit:
+            if deck_uids[position] not in seen:
+                picked.append((deck_uids[position], deck['distances'][position]))
+            position += 1
+        
+        remaining = sum(1 for deck_uid in deck_uids[position:] if deck_uid not in seen)
+        if builder.needs_rebuild(deck, remaining):
+            builder.schedule(uid)
+        
+        # Only the public profiles being returned are read; ones deleted since the deck was built drop out
+        public_profiles = store.public_profiles.profiles([deck_uid for deck_uid, _ in picked], fields=profile_fields)
+        results = [
+            (public_profiles[deck_uid], distance) for deck_uid, distance in picked
+            if deck_uid in public_profiles
+        ]
         
-        # Convert to list and remove sensitive information
         profiles = []
-        for doc in results:
-            profile = doc.to_dict()
-            
-            # Remove sensitive info
-            if 'password' in profile:
-                del profile['password']
-            if 'email' in profile:
-                del profile['email']
+        for profile, distance in results:
+            if distance is not None:
+                profile['distance_km'] = round(distance, 1)
             
             # Ensure all required fields exist
             if 'display_name' not in profile or not profile['display_name']:
@@ -229,42 +301,147 @@ def discover_profiles(current_user):
                 
             if 'bio' not in profile:
                 profile['bio'] = "This user hasn't added a bio yet."
-                
-            profiles.append(profile)
+            
+            profile['photos'] = absolute_photo_urls(profile['photos'])
+            profiles.append(select_fields(profile, fields))
         
         print(f"Returning {len(profiles)} profiles")
-        return jsonify(profiles), 200
+        response = jsonify(profiles)
+        
+        # Cursor for the next page of the deck
+        response.headers['X-Cursor-After'] = encode_deck_cursor(deck['version'], position)
+        response.headers['X-Has-More'] = 'true' if remaining else 'false'
+        return response, 200
         
     except Exception as e:
         print(f"Error in discover_profiles: {str(e)}")
         return jsonify({"error": str(e)}), 400
 
+@profiles_bp.route('/batch', methods=['GET'])
+@token_required
+def get_user_profiles(current_user):
+    """
+    Get several users' public profiles in one request.
+    
+    Query parameters:
+        uids: Comma-separated UIDs (at most MAX_BATCH_UIDS)
+        fields: Optional sparse fieldset, as for a single profile
+    
+    Returns a list in the order of `uids`, with an entry of the UID and an
+    error in place of each profile that doesn't exist.
+    """
+    try:
+        try:
+            fields = requested_fields()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        uids = list(dict.fromkeys(uid.strip() for uid in request.args.get('uids', '').split(',') if uid.strip()))
+        
+        if not uids:
+            return jsonify({"error": "uids is required"}), 400
+        if len(uids) > MAX_BATCH_UIDS:
+            return jsonify({"error": f"At most {MAX_BATCH_UIDS} uids per request"}), 400
+        
+        # One chunked get_all under the field mask
+        profiles = store.public_profiles.profiles(uids, fields=fields)
+        
+        results = []
+        for uid in uids:
+            profile_data = profiles.get(uid)
+            if profile_data is None:
+                results.append({"uid": uid, "error": "Profile not found"})
+                continue
+            
+            if 'photos' in profile_data:
+                profile_data['photos'] = absolute_photo_urls(profile_data['photos'])
+            results.append({**select_fields(profile_data, fields), "uid": uid})
+        
+        return jsonify(results), 200
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
 @profiles_bp.route('/<uid>', methods=['GET'])
 @token_required
 def get_user_profile(current_user, uid):
     """Get another user's profile by UID."""
     try:
-        # Check if profile exists
-        profile_doc = db.collection('users').document(uid).get()
+        try:
+            fields = requested_fields()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        # Other users only ever see the public profile
+        profile_data = store.public_profiles.profile(uid, fields=fields)
         
-        if not profile_doc.exists:
+        if profile_data is None:
             return jsonify({"error": "Profile not found"}), 404
         
-        profile_data = profile_doc.to_dict()
+        if 'photos' in profile_data:
+            profile_data['photos'] = absolute_photo_urls(profile_data['photos'])
+        return jsonify(select_fields(profile_data, fields)), 200
         
-        # Remove sensitive information
-        if 'password' in profile_data:
-            del profile_data['password']
-        if 'email' in profile_data:
-            del profile_data['email']
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+@profiles_bp.route('/<uid>/photos/<digest>', methods=['GET'])
+def get_profile_photo(uid, digest):
+    """
+    Serve a thumbnail of a photo stored inline on a profile, the URL public
+    profiles refer to it by. The digest names the photo's content (and can't
+    be guessed from the UID) and is the ETag. Browsers may keep the photo for
+    PHOTO_MAX_AGE seconds, but only privately: after that a revalidation reads
+    the profile, so a removed photo stops being served within the hour.
+    Rendered thumbnails are kept per process, so a photo is only decoded and
+    resized once.
+    """
+    try:
+        # The profile is read even on a cache hit, so removed photos stop being served
+        user_doc = store.users.get(uid, fields=['photos'])
+        photos = (user_doc.to_dict() or {}).get('photos') if user_doc.exists else None
+        photo = next((
+            photo for photo in photos or []
+            if isinstance(photo, str) and photo.startswith('data:') and photo_digest(photo) == digest
+        ), None)
+        
+        if photo is None:
+            return jsonify({"error": "Photo not found"}), 404
+        
+        cache_control = f'private, max-age={PHOTO_MAX_AGE}'
+        if request.if_none_match.contains(digest):
+            response = Response(status=304)
+            response.headers['Cache-Control'] = cache_control
+            response.set_etag(digest)
+            return response
+        
+        with _thumbnails_lock:
+            thumbnail = _thumbnails.get(digest)
+            if thumbnail is not None:
+                _thumbnails.move_to_end(digest)
+        
+        if thumbnail is None:
+            image = Image.open(io.BytesIO(base64.b64decode(photo.split(',', 1)[1])))
+            image.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+            output = io.BytesIO()
+            image.convert('RGB').save(output, format='JPEG', quality=85)
+            thumbnail = output.getvalue()
+            
+            with _thumbnails_lock:
+                _thumbnails[digest] = thumbnail
+                while len(_thumbnails) > THUMBNAIL_CACHE_SIZE:
+                    _thumbnails.popitem(last=False)
         
-        return jsonify(profile_data), 200
+        response = Response(thumbnail, mimetype='image/jpeg')
+        response.headers['Cache-Control'] = cache_control
+        response.set_etag(digest)
+        return response
         
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
 @profiles_bp.route('/photo', methods=['PUT'])
 @token_required
+@user_required
 def update_profile_photo(current_user):
     """Update a single photo in the user's profile."""
     try:
@@ -288,7 +465,7 @@ def update_profile_photo(current_user):
         print(f"Received single photo update. Photo length: {len(photo)}")
         
         # Get the current profile
-        user_doc = db.collection('users').document(uid).get()
+        user_doc = store.users.get(uid)
         if not user_doc.exists:
             return jsonify({"error": "User profile not found"}), 404
         
@@ -315,7 +492,7 @@ def update_profile_photo(current_user):
             return jsonify({"error": "Invalid photo update type"}), 400
         
         # Update the document with just the photos field
-        db.collection('users').document(uid).update({
+        store.users.update(uid, {
             'photos': user_data['photos'],
             'updated_at': firestore.SERVER_TIMESTAMP
         })
@@ -4,11 +4,11 @@
 from flask import Blueprint, request, jsonify, g
 from firebase_admin import firestore
 import datetime
-from app.utils.decorators import token_required
+from app.utils.decorators import token_required, user_required
+from app.data import store
 from functools import wraps
 
 ratings_bp = Blueprint('ratings', __name__)
-db = firestore.client()
 
 def limit_ratings(f):
     """
@@ -21,21 +21,17 @@ def limit_ratings(f):
         rated_uid = request.json.get('rated_uid')
         
         # Check if they've already rated this user
-        existing_rating = db.collection('ratings').where(
-            'rater_uid', '==', user_id).where(
-            'rated_uid', '==', rated_uid).limit(1).get()
+        existing_rating = store.ratings.find(user_id, rated_uid)
         
-        if len(existing_rating) > 0 and request.method == 'POST':
+        if existing_rating is not None and request.method == 'POST':
             return jsonify({
                 'error': 'You have already rated this user. Please update your existing rating instead.'
             }), 400
             
         # Check if they've had a match or conversation
-        matches = db.collection('matches').where(
-            'user1_uid', 'in', [user_id, rated_uid]).where(
-            'user2_uid', 'in', [user_id, rated_uid]).limit(1).get()
+        match = store.matches.find_between(user_id, rated_uid)
         
-        if len(matches) == 0:
+        if match is None:
             return jsonify({
                 'error': 'You can only rate users you have matched with.'
             }), 400
@@ -45,6 +41,7 @@ def limit_ratings(f):
 
 @ratings_bp.route('/api/ratings', methods=['POST'])
 @token_required
+@user_required
 @limit_ratings
 def rate_user(current_user):
     """Add a new rating for a user"""
@@ -80,8 +77,7 @@ def rate_user(current_user):
     }
     
     # Add rating to database
-    rating_ref = db.collection('ratings').document()
-    rating_ref.set(rating)
+    rating_id = store.ratings.add(rating)
     
     # Update user's average rating
     update_average_rating(data['rated_uid'])
@@ -89,7 +85,7 @@ def rate_user(current_user):
     return jsonify({
         'success': True,
         'message': 'Rating submitted successfully',
-        'rating_id': rating_ref.id
+        'rating_id': rating_id
     }), 201
 
 @ratings_bp.route('/api/ratings/<rated_uid>', methods=['GET'])
@@ -98,7 +94,7 @@ def get_user_ratings(current_user, rated_uid):
     """Get all ratings for a specific user"""
     try:
         # Get ratings for user
-        ratings = db.collection('ratings').where('rated_uid', '==', rated_uid).get()
+        ratings = store.ratings.for_rated(rated_uid)
         
         result = []
         for rating in ratings:
@@ -107,9 +103,8 @@ def get_user_ratings(current_user, rated_uid):
             
             # Get the rater's display name
             try:
-                rater_doc = db.collection('users').document(rating_data['rater_uid']).get()
-                if rater_doc.exists:
-                    rater_data = rater_doc.to_dict()
+                rater_data = store.public_profiles.profile(rating_data['rater_uid'])
+                if rater_data is not None:
                     rating_data['rater_display_name'] = rater_data.get('display_name', 'Anonymous')
                 else:
                     rating_data['rater_display_name'] = 'Anonymous'
@@ -129,6 +124,7 @@ def get_user_ratings(current_user, rated_uid):
 
 @ratings_bp.route('/api/ratings/<rating_id>', methods=['PUT'])
 @token_required
+@user_required
 def update_rating(current_user, rating_id):
     """Update an existing rating"""
     data = request.json
@@ -142,8 +138,7 @@ def update_rating(current_user, rating_id):
                 return jsonify({'error': f'Rating {field} must be between 1 and 5'}), 400
     
     # Check if rating exists and belongs to user
-    rating_ref = db.collection('ratings').document(rating_id)
-    rating = rating_ref.get()
+    rating = store.ratings.get(rating_id)
     
     if not rating.exists:
         return jsonify({'error': 'Rating not found'}), 404
@@ -159,7 +154,7 @@ def update_rating(current_user, rating_id):
             update_data[field] = data[field]
             
     update_data['updated_at'] = datetime.datetime.now()
-    rating_ref.update(update_data)
+    store.ratings.update(rating_id, update_data)
     
     # Update user's average rating
     update_average_rating(rating_data['rated_uid'])
@@ -174,8 +169,7 @@ def update_rating(current_user, rating_id):
 def delete_rating(current_user, rating_id):
     """Delete a rating"""
     # Check if rating exists and belongs to user
-    rating_ref = db.collection('ratings').document(rating_id)
-    rating = rating_ref.get()
+    rating = store.ratings.get(rating_id)
     
     if not rating.exists:
         return jsonify({'error': 'Rating not found'}), 404
@@ -188,7 +182,7 @@ def delete_rating(current_user, rating_id):
     rated_uid = rating_data['rated_uid']
     
     # Delete rating
-    rating_ref.delete()
+    store.ratings.delete(rating_id)
     
     # Update user's average rating
     update_average_rating(rated_uid)
@@ -202,18 +196,15 @@ def delete_rating(current_user, rating_id):
 @token_required
 def get_my_rating(current_user, rated_uid):
     """Get the current user's rating for a specific user"""
-    ratings = db.collection('ratings').where(
-        'rater_uid', '==', current_user['uid']).where(
-        'rated_uid', '==', rated_uid).limit(1).get()
+    rating = store.ratings.find(current_user['uid'], rated_uid)
     
-    if len(ratings) == 0:
+    if rating is None:
         return jsonify({
             'success': True,
             'exists': False,
             'rating': None
         })
     
-    rating = ratings[0]
     rating_data = rating.to_dict()
     rating_data['id'] = rating.id
     
@@ -231,24 +222,22 @@ def clear_all_ratings(current_user):
         uid = current_user['uid']
         
         # Get all ratings FROM this user (ratings they gave to others)
-        ratings_from_user = db.collection('ratings').where('rater_uid', '==', uid).stream()
+        ratings_from_user = store.ratings.stream_for_rater(uid)
         for rating in ratings_from_user:
             # Store the other user's ID before deleting to update their average
             rating_data = rating.to_dict()
             rated_uid = rating_data.get('rated_uid')
             
             # Delete the rating
-            rating.reference.delete()
+            store.ratings.delete(rating.id)
             
             # Update the other user's average rating
             if rated_uid:
                 update_average_rating(rated_uid)
         
         # Get all ratings TO this user (ratings they received)
-        ratings_to_user = db.collection('ratings').where('rated_uid', '==', uid).stream()
-        for rating in ratings_to_user:
-            # Delete the rating
-            rating.reference.delete()
+        ratings_to_user = store.ratings.stream_for_rated(uid)
+        store.ratings.delete_all(ratings_to_user)
         
         # Reset this user's average rating
         average_rating = {
@@ -261,9 +250,9 @@ def clear_all_ratings(current_user):
         }
         
         # Update user document with reset average rating
-        db.collection('users').document(uid).update({
+        store.users.update(uid, {
             'average_rating': average_rating,
-            'updated_at': datetime.datetime.now()
+            'updated_at': firestore.SERVER_TIMESTAMP
         })
         
         return jsonify({
@@ -277,7 +266,7 @@ def clear_all_ratings(current_user):
 def update_average_rating(user_id):
     """Calculate and update a user's average ratings"""
     # Get all ratings for the user
-    ratings = db.collection('ratings').where('rated_uid', '==', user_id).get()
+    ratings = store.ratings.for_rated(user_id)
     
     if len(ratings) == 0:
         # No ratings, set defaults
@@ -328,10 +317,11 @@ def update_average_rating(user_id):
             'rating_count': total_ratings
         }
     
-    # Update user document with the calculated average rating
-    db.collection('users').document(user_id).update({
+    # Update user document with the calculated average rating (stamped with server
+    # time, like every profile write, since the candidate index syncs on updated_at)
+    store.users.update(user_id, {
         'average_rating': average_rating,
-        'updated_at': datetime.datetime.now()
+        'updated_at': firestore.SERVER_TIMESTAMP
     })
     
     return average_rating 
\ No newline at end of file
@@ -1,4 +1,30 @@
 # app/config/development.py
 DEBUG = True
 TESTING = False
-SECRET_KEY = 'dev-secret-key'
\ No newline at end of file
+SECRET_KEY = 'dev-secret-key'
+
+# Verified-token cache (entries never outlive the token's own exp claim)
+TOKEN_CACHE_MAX_SIZE = 10000
+TOKEN_CACHE_TTL = 300
+
+# UIDs allowed on operator endpoints (token and event stats); tokens with an
+# `admin: true` custom claim are allowed too
+ADMIN_UIDS = []
+
+# Data backend: 'firestore' or 'memory'
+DATA_BACKEND = 'firestore'
+
+# Message streams (Server-Sent Events); see app/realtime for all limits
+STREAM_MAX_CONNECTIONS = 200
+STREAM_IDLE_TIMEOUT = 120
+
+# Notification event bus: 'local' for the single-process dev server;
+# set 'unix' when running several gunicorn workers so they share events
+EVENT_BUS = 'local'
+EVENT_BUS_SOCKET = '/tmp/lucent-events.sock'
+
+# Discover candidate index (see app/discovery for all settings)
+DISCOVERY_INDEX = True
+DISCOVERY_INDEX_REFRESH_INTERVAL = 5
+DISCOVERY_DECK_SIZE = 200
+DISCOVERY_DECK_LOW_WATERMARK = 40
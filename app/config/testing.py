@@ -10,4 +10,24 @@ TESTING = True
 SECRET_KEY = 'test_secret_key'
 
 # Firebase configuration - use test project or mock
-FIREBASE_CREDENTIALS_PATH = os.getenv('FIREBASE_CREDENTIALS_PATH', 'mock-credentials.json') 
\ No newline at end of file
+FIREBASE_CREDENTIALS_PATH = os.getenv('FIREBASE_CREDENTIALS_PATH', 'mock-credentials.json') 
+
+# Verified-token cache
+TOKEN_CACHE_MAX_SIZE = 100
+TOKEN_CACHE_TTL = 60
+
+# Run against the in-memory data backend - no Firebase project needed
+DATA_BACKEND = 'memory'
+
+# Keep message streams short-lived in tests
+STREAM_HEARTBEAT_INTERVAL = 0.05
+STREAM_IDLE_TIMEOUT = 0.3
+
+# Deliver notifications in-process
+EVENT_BUS = 'local'
+
+# Apply profile changes to the discover index on every request
+DISCOVERY_INDEX_REFRESH_INTERVAL = 0
+
+# Rebuild discover decks inline so tests see them right away
+DISCOVERY_DECK_BACKGROUND = False
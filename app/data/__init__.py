@@ -0,0 +1,50 @@
+# app/data/__init__.py
+
+"""
+Data access layer.
+
+Blueprints use `store` (e.g. `store.users.get(uid)`) instead of calling the
+Firestore client directly. The backend is chosen with the `DATA_BACKEND`
+config key:
+
+- 'firestore': the Firebase Admin Firestore client (default)
+- 'memory': a process-local MemoryClient, for tests and offline benchmarks
+"""
+
+from flask import current_app
+from werkzeug.local import LocalProxy
+
+from app.data.memory import MemoryClient
+from app.data.repositories import DataStore
+
+BACKEND_FIRESTORE = 'firestore'
+BACKEND_MEMORY = 'memory'
+
+
+def create_client(backend, **options):
+    """Create the client for a backend name."""
+    if backend == BACKEND_MEMORY:
+        return MemoryClient(latency=options.get('latency', 0.0))
+
+    if backend == BACKEND_FIRESTORE:
+        from app.config.firebase import db
+        return db
+
+    raise ValueError(f"Unknown data backend: {backend}")
+
+
+def init_app(app):
+    """Attach a DataStore for the configured backend to the app."""
+    backend = app.config.get('DATA_BACKEND', BACKEND_FIRESTORE)
+    client = create_client(backend, latency=app.config.get('MEMORY_BACKEND_LATENCY', 0.0))
+    app.extensions['data_store'] = DataStore(client, backend=backend)
+    return app.extensions['data_store']
+
+
+def get_store():
+    """Return the DataStore of the current app."""
+    return current_app.extensions['data_store']
+
+
+# Proxy to the current app's DataStore
+store = LocalProxy(get_store)
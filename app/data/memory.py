@@ -0,0 +1,821 @@
+# app/data/memory.py
+
+"""
+In-memory backend implementing the subset of the Firestore client API used
+by the app.
+
+It mirrors Firestore's query semantics closely enough to run the API, tests
+and load benchmarks offline: where filters (including on nested fields),
+order_by with implicit document-ID tie-breaking, limit/offset, query cursors,
+field masks, count() aggregations, batched writes, transactions (through
+`firestore.transactional`), the write sentinels (SERVER_TIMESTAMP,
+DELETE_FIELD, Increment, ArrayUnion, ArrayRemove) and query snapshot
+listeners (`on_snapshot`), which act as an in-process pub/sub.
+
+Every operation is counted like Firestore bills it (one read per returned
+document, at least one per query; one read per 1000 documents counted) and can optionally sleep for a simulated
+round-trip latency, so benchmarks can compare access patterns realistically.
+"""
+
+import copy
+import functools
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from google.api_core import exceptions as api_exceptions
+from google.cloud.firestore_v1 import transforms
+from google.cloud.firestore_v1.base_aggregation import AggregationResult
+from google.cloud.firestore_v1.watch import ChangeType, DocumentChange
+
+ASCENDING = 'ASCENDING'
+DESCENDING = 'DESCENDING'
+
+# Marker for fields that are absent from a document
+_MISSING = object()
+
+# Index entries covered by one billed read of an aggregation query
+_AGGREGATION_ENTRIES_PER_READ = 1000
+
+# Operators whose filter field also becomes the implicit first sort key
+_INEQUALITY_OPS = {'<', '<=', '>', '>=', '!=', 'not-in'}
+
+
+def _get_field(data, field_path):
+    """Return the value at a dotted field path, or _MISSING."""
+    value = data
+    for part in field_path.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def _set_field(data, field_path, value):
+    """Set the value at a dotted field path, creating maps as needed."""
+    parts = field_path.split('.')
+    target = data
+    for part in parts[:-1]:
+        if not isinstance(target.get(part), dict):
+            target[part] = {}
+        target = target[part]
+    target[parts[-1]] = value
+
+
+def _delete_field(data, field_path):
+    """Remove the value at a dotted field path if present."""
+    parts = field_path.split('.')
+    target = data
+    for part in parts[:-1]:
+        target = target.get(part)
+        if not isinstance(target, dict):
+            return
+    target.pop(parts[-1], None)
+
+
+def _apply_mask(data, field_paths):
+    """Return a copy of `data` restricted to the given field paths."""
+    if field_paths is None:
+        return copy.deepcopy(data)
+
+    masked = {}
+    for field_path in field_paths:
+        value = _get_field(data, field_path)
+        if value is not _MISSING:
+            _set_field(masked, field_path, copy.deepcopy(value))
+    return masked
+
+
+def _type_rank(value):
+    """Firestore's cross-type ordering: null < bool < number < time < string < bytes < array < map."""
+    if value is None:
+        return 0
+    if isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float)):
+        return 2
+    if isinstance(value, datetime):
+        return 3
+    if isinstance(value, str):
+        return 4
+    if isinstance(value, bytes):
+        return 5
+    if isinstance(value, (list, tuple)):
+        return 8
+    if isinstance(value, dict):
+        return 9
+    return 10
+
+
+def _normalize(value):
+    """Make datetimes comparable regardless of tz-awareness."""
+    if isinstance(value, datetime) and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def _compare(a, b):
+    """Three-way comparison following Firestore value ordering."""
+    rank_a, rank_b = _type_rank(a), _type_rank(b)
+    if rank_a != rank_b:
+        return -1 if rank_a < rank_b else 1
+
+    a, b = _normalize(a), _normalize(b)
+    if rank_a == 8:
+        for item_a, item_b in zip(a, b):
+            result = _compare(item_a, item_b)
+            if result:
+                return result
+        return (len(a) > len(b)) - (len(a) < len(b))
+    if rank_a in (9, 10):
+        a, b = repr(a), repr(b)
+    return (a > b) - (a < b)
+
+
+def _matches_filter(data, field_path, op, value):
+    """Evaluate a single where() clause against a document."""
+    field_value = _get_field(data, field_path)
+    if field_value is _MISSING:
+        return False
+
+    if op == '==':
+        return _type_rank(field_value) == _type_rank(value) and _compare(field_value, value) == 0
+    if op == '!=':
+        return field_value is not None and not (
+            _type_rank(field_value) == _type_rank(value) and _compare(field_value, value) == 0
+        )
+    if op == 'in':
+        return any(_matches_filter(data, field_path, '==', item) for item in value)
+    if op == 'not-in':
+        return field_value is not None and not any(
+            _matches_filter(data, field_path, '==', item) for item in value
+        )
+    if op == 'array_contains':
+        return isinstance(field_value, list) and any(
+            _type_rank(item) == _type_rank(value) and _compare(item, value) == 0 for item in field_value
+        )
+    if op == 'array_contains_any':
+        return any(_matches_filter(data, field_path, 'array_contains', item) for item in value)
+
+    # Range filters only match values of the same type
+    if _type_rank(field_value) != _type_rank(value):
+        return False
+    result = _compare(field_value, value)
+    if op == '<':
+        return result < 0
+    if op == '<=':
+        return result <= 0
+    if op == '>':
+        return result > 0
+    if op == '>=':
+        return result >= 0
+
+    raise ValueError(f"Unsupported operator: {op}")
+
+
+class MemoryStats:
+    """Operation counters, tallied the way Firestore bills them."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.document_reads = 0
+            self.document_writes = 0
+            self.queries = 0
+            self.round_trips = 0
+
+    def record(self, reads=0, writes=0, queries=0, round_trips=1):
+        with self._lock:
+            self.document_reads += reads
+            self.document_writes += writes
+            self.queries += queries
+            self.round_trips += round_trips
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'document_reads': self.document_reads,
+                'document_writes': self.document_writes,
+                'queries': self.queries,
+                'round_trips': self.round_trips
+            }
+
+
+class MemoryDocumentSnapshot:
+    """Read-only view of a document at the time it was read."""
+
+    def __init__(self, reference, data, create_time=None, update_time=None):
+        self.reference = reference
+        self._data = data
+        self.create_time = create_time
+        self.update_time = update_time
+
+    @property
+    def id(self):
+        return self.reference.id
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        if self._data is None:
+            return None
+        return copy.deepcopy(self._data)
+
+    def get(self, field_path):
+        if self._data is None:
+            return None
+        value = _get_field(self._data, field_path)
+        if value is _MISSING:
+            raise KeyError(field_path)
+        return copy.deepcopy(value)
+
+
+class MemoryDocumentReference:
+    """Reference to a single document in a MemoryClient collection."""
+
+    def __init__(self, client, collection_name, document_id):
+        self._client = client
+        self._collection_name = collection_name
+        self.id = document_id
+
+    @property
+    def path(self):
+        return f"{self._collection_name}/{self.id}"
+
+    @property
+    def parent(self):
+        return self._client.collection(self._collection_name)
+
+    def __eq__(self, other):
+        return isinstance(other, MemoryDocumentReference) and self.path == other.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+    def get(self, field_paths=None, transaction=None):
+        """Read the document, optionally restricted to a field mask (and as part of a transaction)."""
+        self._client._round_trip(reads=1)
+        snapshot = self._client._snapshot(self, field_paths)
+        if transaction is not None:
+            transaction._record_read(snapshot)
+        return snapshot
+
+    def create(self, document_data):
+        """Create the document, failing if it already exists."""
+        self._client._commit([('create', self, document_data, None)])
+
+    def set(self, document_data, merge=False):
+        """Replace (or merge into) the document."""
+        self._client._commit([('set', self, document_data, merge)])
+
+    def update(self, field_updates):
+        """Update fields by dotted path, failing if the document doesn't exist."""
+        self._client._commit([('update', self, field_updates, None)])
+
+    def delete(self):
+        """Delete the document (a no-op if it doesn't exist)."""
+        self._client._commit([('delete', self, None, None)])
+
+    def on_snapshot(self, callback):
+        """
+        Listen to the document, like `DocumentReference.on_snapshot`.
+
+        `callback(docs, changes, read_time)` gets a list with the document's
+        snapshot (empty while it doesn't exist), under the same rules as
+        `MemoryQuery.on_snapshot`.
+        """
+        return self._client._listen(_MemoryDocumentQuery(self), callback)
+
+
+class MemoryQuery:
+    """Immutable query over a MemoryClient collection."""
+
+    def __init__(self, client, collection_name, filters=(), orders=(), limit=None,
+                 offset=0, start=None, end=None, projection=None):
+        self._client = client
+        self._collection_name = collection_name
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._offset = offset
+        self._start = start  # (cursor, before) - before=True means start_at
+        self._end = end      # (cursor, before) - before=True means end_before
+        self._projection = projection
+
+    def _copy(self, **changes):
+        params = {
+            'filters': self._filters,
+            'orders': self._orders,
+            'limit': self._limit,
+            'offset': self._offset,
+            'start': self._start,
+            'end': self._end,
+            'projection': self._projection
+        }
+        params.update(changes)
+        return MemoryQuery(self._client, self._collection_name, **params)
+
+    def where(self, field_path, op_string, value):
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path, direction=ASCENDING):
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def offset(self, num_to_skip):
+        return self._copy(offset=num_to_skip)
+
+    def select(self, field_paths):
+        return self._copy(projection=list(field_paths))
+
+    def start_at(self, document_fields_or_snapshot):
+        return self._copy(start=(document_fields_or_snapshot, True))
+
+    def start_after(self, document_fields_or_snapshot):
+        return self._copy(start=(document_fields_or_snapshot, False))
+
+    def end_before(self, document_fields_or_snapshot):
+        return self._copy(end=(document_fields_or_snapshot, True))
+
+    def end_at(self, document_fields_or_snapshot):
+        return self._copy(end=(document_fields_or_snapshot, False))
+
+    def _effective_orders(self):
+        """Explicit orders, preceded by any inequality field Firestore would sort on."""
+        orders = list(self._orders)
+        if not orders:
+            for field_path, op, _ in self._filters:
+                if op in _INEQUALITY_OPS:
+                    orders.append((field_path, ASCENDING))
+                    break
+        return orders
+
+    def _sort_key(self, orders):
+        """Build a key function ordering (id, data) pairs like Firestore."""
+        tie_direction = orders[-1][1] if orders else ASCENDING
+
+        def compare(left, right):
+            for field_path, direction in orders:
+                result = _compare(_get_field(left[1], field_path), _get_field(right[1], field_path))
+                if result:
+                    return -result if direction == DESCENDING else result
+            result = (left[0] > right[0]) - (left[0] < right[0])
+            return -result if tie_direction == DESCENDING else result
+
+        return functools.cmp_to_key(compare)
+
+    def _cursor_position(self, orders, cursor, doc_id, data):
+        """Compare a document to a cursor: negative if it sorts before it."""
+        if isinstance(cursor, MemoryDocumentSnapshot):
+            values = [_get_field(cursor._data or {}, field) for field, _ in orders]
+            cursor_id = cursor.id
+        else:
+            values = [cursor.get(field, _MISSING) for field, _ in orders]
+            cursor_id = None
+
+        for (field_path, direction), value in zip(orders, values):
+            if value is _MISSING:
+                break
+            result = _compare(_get_field(data, field_path), value)
+            if result:
+                return -result if direction == DESCENDING else result
+
+        if cursor_id is None:
+            return 0
+        tie_direction = orders[-1][1] if orders else ASCENDING
+        result = (doc_id > cursor_id) - (doc_id < cursor_id)
+        return -result if tie_direction == DESCENDING else result
+
+    def _run(self):
+        """Evaluate the query and return [(doc_id, data, meta)] in result order."""
+        orders = self._effective_orders()
+        rows = []
+        for doc_id, (data, meta) in self._client._documents(self._collection_name).items():
+            if not all(_matches_filter(data, *clause) for clause in self._filters):
+                continue
+            # Documents missing an order_by field are excluded, as in Firestore
+            if any(_get_field(data, field) is _MISSING for field, _ in orders):
+                continue
+            rows.append((doc_id, data, meta))
+
+        rows.sort(key=self._sort_key(orders))
+
+        if self._start is not None:
+            cursor, inclusive = self._start
+            rows = [
+                row for row in rows
+                if (position := self._cursor_position(orders, cursor, row[0], row[1])) > 0
+                or (inclusive and position == 0)
+            ]
+        if self._end is not None:
+            cursor, exclusive = self._end
+            rows = [
+                row for row in rows
+                if (position := self._cursor_position(orders, cursor, row[0], row[1])) < 0
+                or (not exclusive and position == 0)
+            ]
+
+        rows = rows[self._offset:]
+        if self._limit is not None:
+            rows = rows[:self._limit]
+        return rows
+
+    def stream(self, transaction=None):
+        """Run the query and yield document snapshots."""
+        with self._client._lock:
+            snapshots = self._snapshots()
+        # An empty result still costs one read
+        self._client._round_trip(reads=max(1, len(snapshots)), queries=1)
+        return iter(snapshots)
+
+    def get(self, transaction=None):
+        """Run the query and return a list of document snapshots."""
+        return list(self.stream(transaction=transaction))
+
+    def count(self, alias=None):
+        """Return an aggregation query counting the results without fetching them."""
+        return MemoryAggregationQuery(self, alias or 'count')
+
+    def on_snapshot(self, callback):
+        """
+        Listen to the query's results.
+
+        `callback(docs, changes, read_time)` is called once with the current
+        results and then after every commit that changes them, like
+        `Query.on_snapshot`. Unlike Firestore it runs synchronously in the
+        writing thread, so it must not block.
+        """
+        return self._client._listen(self, callback)
+
+    def _snapshots(self):
+        """Evaluate the query without billing it (caller holds the client lock)."""
+        return [
+            MemoryDocumentSnapshot(
+                MemoryDocumentReference(self._client, self._collection_name, doc_id),
+                _apply_mask(data, self._projection),
+                meta['create_time'],
+                meta['update_time']
+            )
+            for doc_id, data, meta in self._run()
+        ]
+
+
+class _MemoryDocumentQuery(MemoryQuery):
+    """The single-document query behind `MemoryDocumentReference.on_snapshot`."""
+
+    def __init__(self, reference):
+        super().__init__(reference._client, reference._collection_name)
+        self._document_id = reference.id
+
+    def _run(self):
+        entry = self._client._documents(self._collection_name).get(self._document_id)
+        return [] if entry is None else [(self._document_id, *entry)]
+
+
+class MemoryAggregationQuery:
+    """A count() aggregation over a MemoryQuery, evaluated server-side."""
+
+    def __init__(self, query, alias):
+        self._query = query
+        self._alias = alias
+
+    def get(self, transaction=None):
+        """Return [[AggregationResult]] like `AggregationQuery.get`; no documents are returned."""
+        with self._query._client._lock:
+            count = len(self._query._run())
+        # Billed per batch of index entries counted, at least one read
+        reads = max(1, -(-count // _AGGREGATION_ENTRIES_PER_READ))
+        self._query._client._round_trip(reads=reads, queries=1)
+        return [[AggregationResult(alias=self._alias, value=count, read_time=datetime.now(timezone.utc))]]
+
+
+class MemoryCollectionReference(MemoryQuery):
+    """A collection is also the query that matches all of its documents."""
+
+    def __init__(self, client, collection_name):
+        super().__init__(client, collection_name)
+        self.id = collection_name
+
+    def document(self, document_id=None):
+        if document_id is None:
+            document_id = uuid.uuid4().hex[:20]
+        return MemoryDocumentReference(self._client, self._collection_name, document_id)
+
+    def add(self, document_data, document_id=None):
+        """Create a document with an auto-generated ID."""
+        reference = self.document(document_id)
+        reference.create(document_data)
+        return self._client._last_write_time, reference
+
+    def list_documents(self):
+        with self._client._lock:
+            ids = list(self._client._documents(self._collection_name))
+        return [self.document(doc_id) for doc_id in ids]
+
+
+class MemoryWatch:
+    """Snapshot listener returned by `MemoryQuery.on_snapshot`."""
+
+    def __init__(self, client, query, callback):
+        self._client = client
+        self._query = query
+        self._callback = callback
+        self._known = {}  # doc ID -> last delivered snapshot
+
+    def unsubscribe(self):
+        """Stop listening."""
+        self._client._unlisten(self)
+
+    def _diff(self):
+        """Return (docs, changes) since the last delivery (caller holds the client lock)."""
+        docs = self._query._snapshots()
+        changes = []
+        current = {}
+
+        for index, snapshot in enumerate(docs):
+            current[snapshot.id] = snapshot
+            previous = self._known.get(snapshot.id)
+            if previous is None:
+                changes.append(DocumentChange(ChangeType.ADDED, snapshot, -1, index))
+            elif previous.update_time != snapshot.update_time:
+                changes.append(DocumentChange(ChangeType.MODIFIED, snapshot, index, index))
+
+        for doc_id, snapshot in self._known.items():
+            if doc_id not in current:
+                changes.append(DocumentChange(ChangeType.REMOVED, snapshot, -1, -1))
+
+        self._known = current
+        return docs, changes
+
+
+class MemoryWriteBatch:
+    """Accumulates writes and applies them atomically on commit()."""
+
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def create(self, reference, document_data):
+        self._writes.append(('create', reference, document_data, None))
+        return self
+
+    def set(self, reference, document_data, merge=False):
+        self._writes.append(('set', reference, document_data, merge))
+        return self
+
+    def update(self, reference, field_updates):
+        self._writes.append(('update', reference, field_updates, None))
+        return self
+
+    def delete(self, reference):
+        self._writes.append(('delete', reference, None, None))
+        return self
+
+    def commit(self):
+        results = self._client._commit(self._writes)
+        self._writes = []
+        return results
+
+
+class MemoryTransaction(MemoryWriteBatch):
+    """
+    Transaction driven by `firestore.transactional`, like `Transaction`.
+
+    Concurrency is optimistic: documents read through the transaction are
+    remembered with their update time, and the commit fails with Aborted
+    (which `transactional` retries) if any of them changed in the meantime.
+    Writes are buffered and applied atomically with that check.
+    """
+
+    def __init__(self, client, max_attempts=5):
+        super().__init__(client)
+        self._max_attempts = max_attempts
+        self._read_only = False
+        self._id = None
+        self._reads = {}
+
+    def get(self, ref_or_query):
+        """Read a document as part of the transaction (queries are read but not checked)."""
+        return ref_or_query.get(transaction=self)
+
+    def _record_read(self, snapshot):
+        self._reads.setdefault(snapshot.reference.path, (snapshot.reference, snapshot.update_time))
+
+    def _clean_up(self):
+        self._writes = []
+        self._reads = {}
+        self._id = None
+
+    def _begin(self, retry_id=None):
+        self._id = uuid.uuid4().hex
+
+    def _rollback(self):
+        self._clean_up()
+
+    def _commit(self):
+        with self._client._lock:
+            for reference, update_time in self._reads.values():
+                entry = self._client._documents(reference._collection_name).get(reference.id)
+                if (entry[1]['update_time'] if entry is not None else None) != update_time:
+                    self._clean_up()
+                    raise api_exceptions.Aborted(f"Transaction read a document changed since: {reference.path}")
+            results = self._client._commit(self._writes) if self._writes else []
+        self._clean_up()
+        return results
+
+
+class MemoryClient:
+    """Process-local stand-in for `firestore.Client`."""
+
+    def __init__(self, latency=0.0):
+        # Simulated network latency per round trip, in seconds
+        self.latency = latency
+        self.stats = MemoryStats()
+        self._lock = threading.RLock()
+        self._collections = {}
+        self._last_timestamp = None
+        self._last_write_time = None
+        self._watches = []
+
+    # Public API
+
+    def collection(self, collection_name):
+        return MemoryCollectionReference(self, collection_name)
+
+    def batch(self):
+        return MemoryWriteBatch(self)
+
+    def transaction(self, max_attempts=5):
+        return MemoryTransaction(self, max_attempts=max_attempts)
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        """Read several documents in one round trip, like `Client.get_all`."""
+        references = list(references)
+        self._round_trip(reads=len(references))
+        for reference in references:
+            yield self._snapshot(reference, field_paths)
+
+    def reset(self):
+        """Drop all data and counters."""
+        with self._lock:
+            self._collections.clear()
+        self.stats.reset()
+
+    # Internals
+
+    def _documents(self, collection_name):
+        return self._collections.setdefault(collection_name, {})
+
+    def _listen(self, query, callback):
+        """Register a snapshot listener and deliver its initial snapshot."""
+        watch = MemoryWatch(self, query, callback)
+        with self._lock:
+            self._watches.append(watch)
+            docs, changes = watch._diff()
+            self.stats.record(reads=max(1, len(docs)), queries=1)
+            callback(docs, changes, self._now())
+        return watch
+
+    def _unlisten(self, watch):
+        with self._lock:
+            if watch in self._watches:
+                self._watches.remove(watch)
+
+    def _notify(self, collection_names):
+        """Deliver changes to listeners on the collections a commit touched."""
+        with self._lock:
+            for watch in list(self._watches):
+                if watch._query._collection_name not in collection_names:
+                    continue
+                docs, changes = watch._diff()
+                if changes:
+                    # Listeners are billed one read per changed document, with no round trip
+                    self.stats.record(reads=len(changes), round_trips=0)
+                    watch._callback(docs, changes, self._last_write_time)
+
+    def _round_trip(self, reads=0, writes=0, queries=0):
+        self.stats.record(reads=reads, writes=writes, queries=queries)
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _now(self):
+        """Server timestamp that strictly increases across writes."""
+        now = datetime.now(timezone.utc)
+        if self._last_timestamp is not None and now <= self._last_timestamp:
+            now = self._last_timestamp + timedelta(microseconds=1)
+        self._last_timestamp = now
+        return now
+
+    def _snapshot(self, reference, field_paths=None):
+        with self._lock:
+            entry = self._documents(reference._collection_name).get(reference.id)
+            if entry is None:
+                return MemoryDocumentSnapshot(reference, None)
+            data, meta = entry
+            return MemoryDocumentSnapshot(
+                reference, _apply_mask(data, field_paths), meta['create_time'], meta['update_time']
+            )
+
+    def _resolve(self, current, field_path, value, now):
+        """Resolve a write sentinel against the field's current value."""
+        if value is transforms.SERVER_TIMESTAMP:
+            return now
+        if isinstance(value, transforms.Increment):
+            existing = _get_field(current, field_path)
+            if not isinstance(existing, (int, float)) or isinstance(existing, bool):
+                existing = 0
+            return existing + value.value
+        if isinstance(value, transforms.ArrayUnion):
+            existing = _get_field(current, field_path)
+            existing = list(existing) if isinstance(existing, list) else []
+            for item in value.values:
+                if item not in existing:
+                    existing.append(item)
+            return existing
+        if isinstance(value, transforms.ArrayRemove):
+            existing = _get_field(current, field_path)
+            existing = list(existing) if isinstance(existing, list) else []
+            return [item for item in existing if item not in value.values]
+        return copy.deepcopy(value)
+
+    def _apply_fields(self, target, current, field_updates, now, prefix='', merge_maps=False):
+        """Write field values (resolving sentinels) into `target`."""
+        for key, value in field_updates.items():
+            field_path = f"{prefix}{key}"
+
+            if value is transforms.DELETE_FIELD:
+                _delete_field(target, field_path)
+            elif isinstance(value, dict):
+                # Maps are replaced unless merging; either way, write them key by key
+                # so sentinels nested inside them still resolve
+                if not (merge_maps and isinstance(_get_field(target, field_path), dict)):
+                    _set_field(target, field_path, {})
+                self._apply_fields(
+                    target, current, value, now, prefix=f"{field_path}.", merge_maps=merge_maps
+                )
+            else:
+                _set_field(target, field_path, self._resolve(current, field_path, value, now))
+
+    def _commit(self, writes):
+        """Validate and apply a list of writes atomically."""
+        with self._lock:
+            now = self._now()
+            staged = {}
+
+            def current_entry(reference):
+                key = (reference._collection_name, reference.id)
+                if key in staged:
+                    return staged[key]
+                return self._documents(reference._collection_name).get(reference.id)
+
+            for kind, reference, payload, merge in writes:
+                key = (reference._collection_name, reference.id)
+                entry = current_entry(reference)
+
+                if kind == 'delete':
+                    staged[key] = None
+                    continue
+
+                if kind == 'create' and entry is not None:
+                    raise api_exceptions.Conflict(f"Document already exists: {reference.path}")
+                if kind == 'update' and entry is None:
+                    raise api_exceptions.NotFound(f"No document to update: {reference.path}")
+
+                current = entry[0] if entry is not None else {}
+                meta = dict(entry[1]) if entry is not None else {'create_time': now}
+                meta['update_time'] = now
+
+                if kind == 'update':
+                    data = copy.deepcopy(current)
+                    self._apply_fields(data, current, payload, now)
+                elif kind == 'set' and merge:
+                    data = copy.deepcopy(current)
+                    self._apply_fields(data, current, payload, now, merge_maps=True)
+                else:
+                    data = {}
+                    self._apply_fields(data, {}, payload, now)
+
+                staged[key] = (data, meta)
+
+            for (collection_name, doc_id), entry in staged.items():
+                documents = self._documents(collection_name)
+                if entry is None:
+                    documents.pop(doc_id, None)
+                else:
+                    documents[doc_id] = entry
+
+            self._last_write_time = now
+
+            if self._watches:
+                self._notify({collection_name for collection_name, _ in staged})
+
+        self._round_trip(writes=len(writes))
+        return [now for _ in writes]
@@ -0,0 +1,923 @@
+# app/data/repositories.py
+
+"""
+Repositories for each Firestore collection used by the API.
+
+Repositories are written against the Firestore client API, so the same code
+runs on `firestore.Client` and on the in-memory `MemoryClient`. Single
+document reads go through the request identity map; writes invalidate it.
+Reads return document snapshots, as the Firestore client does.
+"""
+
+import hashlib
+import random
+import time
+
+from firebase_admin import firestore
+from google.api_core import exceptions as api_exceptions
+
+from app.discovery.seen import SeenSet
+from app.utils.fields import select_fields
+from app.utils.geo import geohash_query_ranges, haversine_km, valid_coordinates
+from app.utils.identity_map import get_document, get_documents, invalidate_document
+from app.utils.sync_token import as_utc
+
+# Firestore caps a write batch at 500 operations
+MAX_BATCH_SIZE = 500
+
+# Documents requested per get_all round trip
+GET_ALL_CHUNK_SIZE = 100
+
+# Values Firestore accepts in one 'in' filter
+IN_QUERY_LIMIT = 30
+
+# Characters of message content kept in a match's last_message summary
+LAST_MESSAGE_PREVIEW_LENGTH = 100
+
+# Profile fields other users see, copied to the profile's public_profiles document
+PUBLIC_PROFILE_FIELDS = [
+    'display_name', 'bio', 'age', 'gender', 'interests', 'height', 'education',
+    'job_title', 'drinking', 'smoking', 'looking_for', 'profile_completed', 'updated_at'
+]
+
+# Where photos stored inline (as data: URLs) on a profile are served from
+PROFILE_PHOTO_PATH = '/api/profiles/{uid}/photos/{digest}'
+
+
+def sample_key_fields():
+    """The `random_key` stored on a new profile, its place in UserRepository.sample_candidates order."""
+    return {'random_key': random.random()}
+
+
+def photo_digest(photo):
+    """Content hash naming an inline photo in its PROFILE_PHOTO_PATH."""
+    return hashlib.sha256(photo.encode('utf-8')).hexdigest()[:16]
+
+
+def photo_reference(uid, photo):
+    """How a public profile refers to a photo: its URL, or the path serving it for an inline data: URL."""
+    if photo.startswith('data:'):
+        return PROFILE_PHOTO_PATH.format(uid=uid, digest=photo_digest(photo))
+    return photo
+
+
+def public_profile_fields(uid, data):
+    """The public_profiles fields for the given (possibly partial) profile fields."""
+    public = {field: data[field] for field in PUBLIC_PROFILE_FIELDS if field in data}
+    if 'location' in data:
+        # The place, never the coordinates
+        location = data['location'] if isinstance(data['location'], dict) else {}
+        public['location'] = {'city': location.get('city'), 'country': location.get('country')}
+    if 'photos' in data:
+        photos = data['photos'] if isinstance(data['photos'], list) else []
+        public['photos'] = [photo_reference(uid, photo) for photo in photos if isinstance(photo, str)]
+    return public
+
+
+def public_profile(uid, data):
+    """
+    The complete public_profiles document for a profile. Only complete ones
+    carry `uid`; updates merge fields without it.
+    """
+    return dict(public_profile_fields(uid, data), uid=uid)
+
+
+def count(query):
+    """Count a query's results with a server-side aggregation, without fetching them."""
+    return int(query.count().get()[0][0].value)
+
+
+class Repository:
+    """Base repository over a single collection."""
+
+    collection_name = None
+
+    def __init__(self, client):
+        self.client = client
+
+    @property
+    def collection(self):
+        return self.client.collection(self.collection_name)
+
+    def document(self, doc_id=None):
+        """Return a reference to a document (auto-ID if doc_id is None)."""
+        return self.collection.document(doc_id)
+
+    def get(self, doc_id, fields=None):
+        """Read a document snapshot, optionally under a field mask."""
+        return get_document(self.client, self.collection_name, doc_id, field_paths=fields)
+
+    def get_many(self, doc_ids, fields=None):
+        """Read several documents with chunked get_all calls, keyed by ID."""
+        return get_documents(
+            self.client, self.collection_name, doc_ids,
+            field_paths=fields, chunk_size=GET_ALL_CHUNK_SIZE
+        )
+
+    def add(self, data):
+        """Create a document with an auto-generated ID and return the ID."""
+        _, doc_ref = self.collection.add(data)
+        return doc_ref.id
+
+    def set(self, doc_id, data, merge=False):
+        """Create or overwrite a document."""
+        self.document(doc_id).set(data, merge=merge)
+        invalidate_document(self.collection_name, doc_id)
+
+    def update(self, doc_id, data):
+        """Update fields of an existing document."""
+        self.document(doc_id).update(data)
+        invalidate_document(self.collection_name, doc_id)
+
+    def delete(self, doc_id):
+        """Delete a document."""
+        self.document(doc_id).delete()
+        invalidate_document(self.collection_name, doc_id)
+
+    def delete_all(self, snapshots):
+        """Delete the given documents in batches and return how many were deleted."""
+        deleted = 0
+        batch = self.client.batch()
+        pending = 0
+
+        for snapshot in snapshots:
+            batch.delete(snapshot.reference)
+            invalidate_document(self.collection_name, snapshot.id)
+            pending += 1
+            deleted += 1
+
+            if pending == MAX_BATCH_SIZE:
+                batch.commit()
+                batch = self.client.batch()
+                pending = 0
+
+        if pending:
+            batch.commit()
+        return deleted
+
+
+class UserRepository(Repository):
+    """User profiles, keyed by Firebase Auth UID."""
+
+    collection_name = 'users'
+
+    def _public_document(self, doc_id):
+        return self.client.collection(PublicProfileRepository.collection_name).document(doc_id)
+
+    def set(self, doc_id, data, merge=False):
+        """
+        Create or overwrite a profile, giving it a random sampling key if it
+        has none, and write its public profile in the same batch.
+        """
+        if not merge and 'random_key' not in data:
+            data = dict(data, **sample_key_fields())
+
+        batch = self.client.batch()
+        batch.set(self.document(doc_id), data, merge=merge)
+        if merge:
+            batch.set(self._public_document(doc_id), public_profile_fields(doc_id, data), merge=True)
+        else:
+            batch.set(self._public_document(doc_id), public_profile(doc_id, data))
+        batch.commit()
+        invalidate_document(self.collection_name, doc_id)
+        invalidate_document(PublicProfileRepository.collection_name, doc_id)
+
+    def update(self, doc_id, data):
+        """Update fields of an existing profile, merging the public ones into its public profile in the same batch."""
+        batch = self.client.batch()
+        batch.update(self.document(doc_id), data)
+        public = public_profile_fields(doc_id, data)
+        if public:
+            batch.set(self._public_document(doc_id), public, merge=True)
+        batch.commit()
+        invalidate_document(self.collection_name, doc_id)
+        invalidate_document(PublicProfileRepository.collection_name, doc_id)
+
+    def delete(self, doc_id):
+        """Delete a profile and its public profile."""
+        batch = self.client.batch()
+        batch.delete(self.document(doc_id))
+        batch.delete(self._public_document(doc_id))
+        batch.commit()
+        invalidate_document(self.collection_name, doc_id)
+        invalidate_document(PublicProfileRepository.collection_name, doc_id)
+
+    def sample_candidates(self, gender=None, limit=20):
+        """
+        Return up to `limit` profiles from a uniformly random point of the
+        `random_key` order, wrapping around past the last one, optionally
+        filtered by gender (needs the users (gender, random_key) index).
+
+        Every call starts somewhere else, so reads spread evenly over all
+        profiles instead of always hitting the first ones by UID, and
+        `limit` bounds the documents read. Profiles without a random_key are
+        never returned (see scripts/backfill_random_keys.py).
+        """
+        query = self.collection
+        if gender:
+            query = query.where('gender', '==', gender)
+
+        start = random.random()
+        docs = list(query.where('random_key', '>=', start).order_by('random_key').limit(limit).get())
+        if len(docs) < limit:
+            docs += query.where('random_key', '<', start).order_by('random_key').limit(limit - len(docs)).get()
+        return docs
+
+    def stream_all(self, fields=None):
+        """Stream every profile, optionally under a field mask."""
+        query = self.collection
+        if fields is not None:
+            query = query.select(fields)
+        return query.stream()
+
+    def changed_since(self, since, limit, fields=None, after=None):
+        """
+        Return profiles updated after `since`, ordered by `updated_at` then ID.
+
+        `after` is the last snapshot of the previous page; paging from it
+        (rather than from its `updated_at`) keeps profiles that share a
+        timestamp with it.
+        """
+        query = self.collection.where('updated_at', '>', since).order_by('updated_at')
+        if fields is not None:
+            query = query.select(fields)
+        if after is not None:
+            query = query.start_after(after)
+        return query.limit(limit).get()
+
+    def nearby_candidates(self, latitude, longitude, radius_km, gender=None):
+        """
+        Return (snapshot, distance_km) pairs for profiles within `radius_km`, nearest first.
+
+        Runs one `geohash` range query per cell covering the circle (at most
+        nine, needs the users (gender, geohash) index when filtering by
+        gender), so the documents read scale with the number of profiles
+        near the point rather than with all users. Cells overshoot the
+        circle; results are filtered by exact haversine distance. Profiles
+        without a geohash are never returned (see scripts/backfill_geohashes.py).
+        """
+        results = []
+        for start, end in geohash_query_ranges(latitude, longitude, radius_km):
+            query = self.collection
+            if gender:
+                query = query.where('gender', '==', gender)
+            query = query.where('geohash', '>=', start).where('geohash', '<', end)
+
+            for doc in query.get():
+                coordinates = valid_coordinates(doc.to_dict().get('location'))
+                if coordinates is None:
+                    continue
+                distance = haversine_km(latitude, longitude, *coordinates)
+                if distance <= radius_km:
+                    results.append((doc, distance))
+
+        results.sort(key=lambda result: result[1])
+        return results
+
+
+class PublicProfileRepository(Repository):
+    """
+    Read model of what other users see of a profile: the display fields and
+    photo references, never contact details, coordinates or inline photo
+    data, so every document is small and about the same size.
+
+    UserRepository writes it in the same batch as the profile. Profiles from
+    before the projection (see scripts/backfill_public_profiles.py) have no
+    document, or one holding only fields merged in by updates (without
+    `uid`); those are rebuilt from the profile when read.
+    """
+
+    collection_name = 'public_profiles'
+
+    def __init__(self, client, users):
+        super().__init__(client)
+        self.users = users
+
+    def profile(self, uid, fields=None):
+        """Return a user's public profile as a dict, or None if they have no profile."""
+        return self.profiles([uid], fields=fields).get(uid)
+
+    def profiles(self, uids, fields=None):
+        """
+        Return public profiles as dicts keyed by UID (users without a profile
+        left out), with only `uid` and the given field paths if there are any.
+        """
+        uids = list(dict.fromkeys(uids))
+        # `uid` tells complete documents apart
+        mask = None if fields is None else list(dict.fromkeys(['uid', *fields]))
+        docs = self.get_many(uids, fields=mask)
+
+        profiles = {}
+        missing = []
+        for uid in uids:
+            doc = docs.get(uid)
+            data = doc.to_dict() if doc is not None and doc.exists else None
+            if data and data.get('uid'):
+                profiles[uid] = data
+            else:
+                missing.append(uid)
+
+        if missing:
+            users = self.users.get_many(missing)
+            rebuilt = {
+                uid: public_profile(uid, users[uid].to_dict())
+                for uid in missing if users.get(uid) is not None and users[uid].exists
+            }
+            self.save_many(rebuilt)
+            profiles.update({uid: select_fields(data, mask) for uid, data in rebuilt.items()})
+        return profiles
+
+    def save_many(self, profiles):
+        """Write complete public profiles ({uid: public_profile}) in batches."""
+        batch = self.client.batch()
+        pending = 0
+        for uid, data in profiles.items():
+            batch.set(self.document(uid), data)
+            invalidate_document(self.collection_name, uid)
+            pending += 1
+
+            if pending == MAX_BATCH_SIZE:
+                batch.commit()
+                batch = self.client.batch()
+                pending = 0
+
+        if pending:
+            batch.commit()
+        return len(profiles)
+
+
+class LikeRepository(Repository):
+    """Likes from one user to another."""
+
+    collection_name = 'likes'
+
+    def like(self, liker_uid, target_uid):
+        """Record a like and return its ID."""
+        return self.add({
+            'liker_uid': liker_uid,
+            'target_uid': target_uid,
+            'created_at': firestore.SERVER_TIMESTAMP
+        })
+
+    def has_liked(self, liker_uid, target_uid):
+        """Whether `liker_uid` has liked `target_uid`."""
+        likes = self.collection.where(
+            'liker_uid', '==', liker_uid
+        ).where(
+            'target_uid', '==', target_uid
+        ).limit(1).get()
+        return len(likes) > 0
+
+    def delete_from(self, liker_uid):
+        """Delete every like made by a user."""
+        return self.delete_all(self.collection.where('liker_uid', '==', liker_uid).stream())
+
+    def stream_since(self, since=None):
+        """Stream (liker_uid, target_uid, created_at) of every like, or of likes created after `since`, oldest first."""
+        query = self.collection
+        if since is not None:
+            query = query.where('created_at', '>', since)
+        query = query.order_by('created_at').select(['liker_uid', 'target_uid', 'created_at'])
+        return query.stream()
+
+
+class DislikeRepository(Repository):
+    """Dislikes from one user to another."""
+
+    collection_name = 'dislikes'
+
+    def dislike(self, disliker_uid, target_uid):
+        """Record a dislike and return its ID."""
+        return self.add({
+            'disliker_uid': disliker_uid,
+            'target_uid': target_uid,
+            'created_at': firestore.SERVER_TIMESTAMP
+        })
+
+    def delete_from(self, disliker_uid):
+        """Delete every dislike made by a user."""
+        return self.delete_all(self.collection.where('disliker_uid', '==', disliker_uid).stream())
+
+
+class SeenRepository(Repository):
+    """
+    One document per user (keyed by UID) with the SeenSet of profiles they
+    liked or disliked, so discover can leave them out with a single read.
+    """
+
+    collection_name = 'seen'
+
+    def __init__(self, client, likes, dislikes):
+        super().__init__(client)
+        self.likes = likes
+        self.dislikes = dislikes
+
+    def get_set(self, uid):
+        """Read a user's SeenSet, building it from their likes and dislikes if they have none yet."""
+        doc = self.get(uid)
+        if not doc.exists:
+            return self.rebuild(uid)
+        return SeenSet.from_dict(doc.to_dict())
+
+    def rebuild(self, uid):
+        """Recompute a user's SeenSet from the likes and dislikes collections and save it."""
+        targets = [
+            doc.get('target_uid')
+            for doc in self.likes.collection.where('liker_uid', '==', uid).select(['target_uid']).stream()
+        ]
+        targets += [
+            doc.get('target_uid')
+            for doc in self.dislikes.collection.where('disliker_uid', '==', uid).select(['target_uid']).stream()
+        ]
+        seen = SeenSet(targets)
+        self.save(uid, seen)
+        return seen
+
+    def save(self, uid, seen):
+        self.set(uid, {**seen.to_dict(), 'updated_at': firestore.SERVER_TIMESTAMP})
+
+    def add(self, uid, target_uid):
+        """
+        Record a swipe (after the like/dislike itself is written). A filter
+        that outgrew its capacity is rebuilt larger from the collections.
+
+        The set is re-read in a transaction, so two swipes saved at the same
+        instant retry instead of dropping one of them.
+        """
+        seen_ref = self.document(uid)
+
+        @firestore.transactional
+        def record(transaction):
+            doc = seen_ref.get(transaction=transaction)
+            if not doc.exists:
+                return None
+            seen = SeenSet.from_dict(doc.to_dict())
+            if seen.add(target_uid) and not seen.over_capacity:
+                transaction.set(seen_ref, {**seen.to_dict(), 'updated_at': firestore.SERVER_TIMESTAMP})
+            return seen
+
+        seen = record(self.client.transaction())
+        # Without a set yet (or one that outgrew its filter) the collections, which hold this swipe, are the record
+        if seen is None or seen.over_capacity:
+            return self.rebuild(uid)
+        return seen
+
+    def swiped_among(self, uid, target_uids):
+        """The UIDs among `target_uids` the user liked or disliked, from the collections themselves."""
+        swiped = set()
+        for start in range(0, len(target_uids), IN_QUERY_LIMIT):
+            chunk = target_uids[start:start + IN_QUERY_LIMIT]
+            for collection, swiper_field in ((self.likes.collection, 'liker_uid'), (self.dislikes.collection, 'disliker_uid')):
+                query = collection.where(swiper_field, '==', uid).where('target_uid', 'in', chunk)
+                swiped.update(doc.get('target_uid') for doc in query.select(['target_uid']).stream())
+        return swiped
+
+    def confirm_hits(self, uid, seen, hit_uids):
+        """
+        Check profiles a Bloom filter `seen` hides against the likes and
+        dislikes collections. Those the user never swiped on are saved as
+        cleared, so the set stops hiding them; returns the updated set.
+        """
+        if seen.is_exact or not hit_uids:
+            return seen
+        cleared = set(hit_uids) - self.swiped_among(uid, list(hit_uids))
+        if not cleared:
+            return seen
+
+        seen_ref = self.document(uid)
+
+        @firestore.transactional
+        def save_cleared(transaction):
+            current = SeenSet.from_dict(seen_ref.get(transaction=transaction).to_dict())
+            # A swipe since `seen` was read could be one of them: leave it to the next check
+            if current.is_exact or current.count != seen.count or current.num_bits != seen.num_bits:
+                return None
+            current.cleared |= cleared
+            transaction.update(seen_ref, {'cleared': sorted(current.cleared)})
+            return current
+
+        return save_cleared(self.client.transaction()) or seen
+
+    def clear(self, uid):
+        """Forget every swipe of a user."""
+        self.save(uid, SeenSet())
+
+
+class DeckRepository(Repository):
+    """
+    One document per user (keyed by UID) with their ranked queue of discover
+    candidates, built by app.discovery.decks.DeckBuilder.
+    """
+
+    collection_name = 'decks'
+
+    def get_deck(self, uid):
+        """Return a user's deck ({version, uids, distances}), or None if they have none."""
+        doc = self.get(uid)
+        if not doc.exists:
+            return None
+        return doc.to_dict()
+
+    def save(self, uid, hits):
+        """Store (uid, distance_km) pairs as a user's deck under a new version and return it."""
+        deck = {
+            'version': int(time.time() * 1000),  # Build time in milliseconds
+            'uids': [hit_uid for hit_uid, _ in hits],
+            'distances': [distance for _, distance in hits]
+        }
+        self.set(uid, dict(deck, built_at=firestore.SERVER_TIMESTAMP))
+        return deck
+
+    def invalidate(self, uid):
+        """Drop a user's deck (the next discover builds a new one)."""
+        self.delete(uid)
+
+
+class RecommendationRepository(Repository):
+    """
+    One document per user (keyed by UID) with the users collaborative
+    filtering recommends to them, written by scripts/compute_recommendations.py.
+    """
+
+    collection_name = 'recommendations'
+
+    def boosts(self, uid):
+        """A user's recommended UIDs mapped to scores scaled to (0, 1] (empty without any)."""
+        doc = self.get(uid)
+        if not doc.exists:
+            return {}
+        data = doc.to_dict()
+        scores = data.get('scores') or []
+        top = max(scores, default=0)
+        if top <= 0:
+            return {}
+        return {rec_uid: score / top for rec_uid, score in zip(data.get('uids') or [], scores)}
+
+    def save_many(self, recommendations):
+        """Write (uid, recommended_uids, scores) lists in batches; returns how many were written."""
+        written = 0
+        batch = self.client.batch()
+        pending = 0
+
+        for uid, rec_uids, scores in recommendations:
+            batch.set(self.document(uid), {
+                'uids': rec_uids,
+                'scores': scores,
+                'computed_at': firestore.SERVER_TIMESTAMP
+            })
+            invalidate_document(self.collection_name, uid)
+            pending += 1
+            written += 1
+
+            if pending == MAX_BATCH_SIZE:
+                batch.commit()
+                batch = self.client.batch()
+                pending = 0
+
+        if pending:
+            batch.commit()
+        return written
+
+
+def pair_key(uid_a, uid_b):
+    """
+    Deterministic key for a pair of users, independent of order.
+
+    The first UID is length-prefixed, so no two pairs share a key whatever
+    characters UIDs contain.
+    """
+    first, second = sorted([uid_a, uid_b])
+    return f'{len(first)}:{first}:{second}'
+
+
+def participant_fields(user1_uid, user2_uid):
+    """The `participants` and `pair_key` fields stored on a match."""
+    return {
+        'participants': sorted([user1_uid, user2_uid]),
+        'pair_key': pair_key(user1_uid, user2_uid)
+    }
+
+
+class MatchRepository(Repository):
+    """
+    Mutual likes between two users.
+
+    A match's document ID is the `pair_key` of its two users, so a pair can
+    only ever have one match and finding it is a single document read. Each
+    match also carries a sorted `participants` array, so a user's matches are
+    one array_contains query. Matches created before these existed are
+    migrated by scripts/backfill_match_participants.py.
+    """
+
+    collection_name = 'matches'
+
+    def create(self, user1_uid, user2_uid):
+        """
+        Create the active match between two users.
+
+        Returns:
+            Tuple of (match_id, created). `created` is False if the pair
+            already had a match (e.g. both liked each other at once), which
+            is left as it was.
+        """
+        match_id = pair_key(user1_uid, user2_uid)
+        try:
+            self.document(match_id).create({
+                'user1_uid': user1_uid,
+                'user2_uid': user2_uid,
+                **participant_fields(user1_uid, user2_uid),
+                'created_at': firestore.SERVER_TIMESTAMP,
+                'last_message_at': None,
+                'last_message': None,
+                'unread_counts': {user1_uid: 0, user2_uid: 0},
+                'last_read_at': {user1_uid: None, user2_uid: None},
+                'active': True,
+                'updated_at': firestore.SERVER_TIMESTAMP
+            })
+        except api_exceptions.Conflict:
+            # AlreadyExists on Firestore
+            return match_id, False
+        finally:
+            invalidate_document(self.collection_name, match_id)
+        return match_id, True
+
+    def for_user(self, uid, active=True, fields=None):
+        """Return (snapshot, other_uid) pairs for every match the user is part of."""
+        query = self.collection.where(
+            'participants', 'array_contains', uid
+        ).where(
+            'active', '==', active
+        )
+        if fields is not None:
+            # The pairing below needs both user fields
+            query = query.select(list(dict.fromkeys(['user1_uid', 'user2_uid', *fields])))
+        return self._with_other_uid(query.get(), uid)
+
+    def changed_for_user(self, uid, since, limit):
+        """
+        Return (snapshot, other_uid) pairs for the user's matches updated after `since`.
+
+        Inactive matches are included so clients can drop unmatched
+        conversations. Results are ordered by `updated_at`.
+        """
+        matches = self.collection.where(
+            'participants', 'array_contains', uid
+        ).where(
+            'updated_at', '>', since
+        ).order_by('updated_at').limit(limit).get()
+        return self._with_other_uid(matches, uid)
+
+    @staticmethod
+    def _with_other_uid(matches, uid):
+        results = []
+        for match_doc in matches:
+            match_data = match_doc.to_dict()
+            other_uid = match_data['user2_uid'] if match_data['user1_uid'] == uid else match_data['user1_uid']
+            results.append((match_doc, other_uid))
+        return results
+
+    def find_between(self, uid_a, uid_b):
+        """Return the match between two users (in either order), or None."""
+        match_doc = self.get(pair_key(uid_a, uid_b))
+        return match_doc if match_doc.exists else None
+
+    def deactivate(self, match_id, initiated_by):
+        """Mark a match as inactive."""
+        self.update(match_id, {
+            'active': False,
+            'unmatch_initiated_by': initiated_by,
+            'unmatched_at': firestore.SERVER_TIMESTAMP,
+            'updated_at': firestore.SERVER_TIMESTAMP
+        })
+
+
+class MessageRepository(Repository):
+    """Messages exchanged within a match."""
+
+    collection_name = 'messages'
+
+    def send(self, match_id, sender_uid, recipient_uid, content, image_url=None):
+        """
+        Store a new message and return its ID.
+
+        The match's conversation summary (last message preview and the
+        recipient's unread counter) is updated in the same batch, so the two
+        can never disagree.
+        """
+        message_ref = self.document()
+        match_ref = self.client.collection(MatchRepository.collection_name).document(match_id)
+
+        batch = self.client.batch()
+        batch.set(message_ref, {
+            'match_id': match_id,
+            'sender_uid': sender_uid,
+            'content': content,
+            'created_at': firestore.SERVER_TIMESTAMP,
+            'image_url': image_url,  # Optional image URL
+            'updated_at': firestore.SERVER_TIMESTAMP
+        })
+        batch.update(match_ref, {
+            'last_message': {
+                'id': message_ref.id,
+                'sender_uid': sender_uid,
+                'content': content[:LAST_MESSAGE_PREVIEW_LENGTH],
+                'created_at': firestore.SERVER_TIMESTAMP,
+                'image_url': image_url
+            },
+            'last_message_at': firestore.SERVER_TIMESTAMP,
+            f'unread_counts.{recipient_uid}': firestore.Increment(1),
+            'updated_at': firestore.SERVER_TIMESTAMP
+        })
+        batch.commit()
+
+        invalidate_document(MatchRepository.collection_name, match_id)
+        return message_ref.id
+
+    def page(self, match_id, limit, before=None, after=None):
+        """
+        Return one page of a match's messages, oldest first.
+
+        Without a cursor this is the newest `limit` messages. `before` and
+        `after` are message snapshots: the page then holds the `limit`
+        messages just older or just newer than that message. Reads are
+        bounded by `limit` whatever the length of the conversation (needs
+        the messages (match_id, created_at) indexes in firestore.indexes.json).
+
+        Returns:
+            (snapshots, has_more) where has_more says whether further
+            messages exist in the direction that was paged
+        """
+        query = self.collection.where('match_id', '==', match_id)
+
+        if after is not None:
+            query = query.order_by('created_at').start_after(after)
+        else:
+            query = query.order_by('created_at', direction=firestore.Query.DESCENDING)
+            if before is not None:
+                query = query.start_after(before)
+
+        # One extra document tells us whether there is another page
+        snapshots = list(query.limit(limit + 1).get())
+        has_more = len(snapshots) > limit
+        snapshots = snapshots[:limit]
+
+        if after is None:
+            snapshots.reverse()
+        return snapshots, has_more
+
+    def changed_since(self, match_id, since, limit):
+        """Return messages in a match created or updated after `since`, ordered by `updated_at`."""
+        return self.collection.where(
+            'match_id', '==', match_id
+        ).where(
+            'updated_at', '>', since
+        ).order_by('updated_at').limit(limit).get()
+
+    def count_unread(self, match_id, sender_uid, read_through=None):
+        """
+        Count a match's messages from `sender_uid` that the recipient hasn't read.
+
+        With the recipient's read watermark these are the messages created
+        after it (needs the messages (match_id, sender_uid, created_at)
+        index); without one, the `read` flags older messages carry decide.
+        Counted server-side, so no message documents are downloaded.
+        """
+        query = self.collection.where(
+            'match_id', '==', match_id
+        ).where(
+            'sender_uid', '==', sender_uid
+        )
+        if read_through is not None:
+            query = query.where('created_at', '>', read_through)
+        else:
+            query = query.where('read', '==', False)
+        return count(query)
+
+    def last_for_match(self, match_id):
+        """Return the most recent message in a match, or None."""
+        messages = self.collection.where(
+            'match_id', '==', match_id
+        ).order_by(
+            'created_at', direction=firestore.Query.DESCENDING
+        ).limit(1).get()
+        return messages[0] if messages else None
+
+    def mark_read(self, match_id, reader_uid, read_through):
+        """
+        Move the reader's read watermark forward to `read_through`.
+
+        Every message sent to the reader up to that time counts as read, so
+        this is one write to the match however many messages it covers. The
+        reader's unread counter is recounted (server-side) from the messages
+        after the new watermark. The match is re-read in a transaction, so
+        overlapping reads and a message sent meanwhile (whose batch also
+        writes the match) retry instead of overwriting each other, and a
+        watermark never moves backward.
+
+        Returns:
+            Whether the watermark moved.
+        """
+        match_ref = self.client.collection(MatchRepository.collection_name).document(match_id)
+
+        @firestore.transactional
+        def move_watermark(transaction):
+            match_data = match_ref.get(transaction=transaction).to_dict()
+            if match_data is None:
+                return False
+            previous = (match_data.get('last_read_at') or {}).get(reader_uid)
+            if previous is not None and as_utc(previous) >= as_utc(read_through):
+                return False
+
+            sender_uid = match_data['user2_uid'] if reader_uid == match_data['user1_uid'] else match_data['user1_uid']
+            transaction.update(match_ref, {
+                f'last_read_at.{reader_uid}': read_through,
+                f'unread_counts.{reader_uid}': self.count_unread(match_id, sender_uid, read_through),
+                'updated_at': firestore.SERVER_TIMESTAMP
+            })
+            return True
+
+        moved = move_watermark(self.client.transaction())
+        invalidate_document(MatchRepository.collection_name, match_id)
+        return moved
+
+    def summarize(self, match_id, participant_uids):
+        """
+        Rebuild a match's conversation summary from its messages.
+
+        Read watermarks and unread counts are taken from the per-message
+        `read` flags older messages carry. Used to backfill matches created
+        before summaries and watermarks were kept; it reads every message of
+        the match, so the request path never calls this.
+        """
+        messages = sorted(
+            self.collection.where('match_id', '==', match_id).get(),
+            key=lambda snapshot: snapshot.get('created_at')
+        )
+
+        last_message = None
+        if messages:
+            last_data = messages[-1].to_dict()
+            last_message = {
+                'id': messages[-1].id,
+                'sender_uid': last_data.get('sender_uid'),
+                'content': (last_data.get('content') or '')[:LAST_MESSAGE_PREVIEW_LENGTH],
+                'created_at': last_data.get('created_at'),
+                'image_url': last_data.get('image_url')
+            }
+
+        last_read_at = {}
+        unread_counts = {}
+        for uid in participant_uids:
+            received = [m.to_dict() for m in messages if m.get('sender_uid') != uid]
+            read = [m['created_at'] for m in received if m.get('read')]
+            last_read_at[uid] = read[-1] if read else None
+            unread_counts[uid] = sum(1 for m in received if not m.get('read'))
+
+        return {
+            'last_message': last_message,
+            'unread_counts': unread_counts,
+            'last_read_at': last_read_at
+        }
+
+
+class RatingRepository(Repository):
+    """Ratings one user gives another after matching."""
+
+    collection_name = 'ratings'
+
+    def find(self, rater_uid, rated_uid):
+        """Return the rating `rater_uid` gave `rated_uid`, or None."""
+        ratings = self.collection.where(
+            'rater_uid', '==', rater_uid).where(
+            'rated_uid', '==', rated_uid).limit(1).get()
+        return ratings[0] if ratings else None
+
+    def for_rated(self, rated_uid):
+        """Return every rating a user has received."""
+        return self.collection.where('rated_uid', '==', rated_uid).get()
+
+    def stream_for_rater(self, rater_uid):
+        """Stream every rating a user has given."""
+        return self.collection.where('rater_uid', '==', rater_uid).stream()
+
+    def stream_for_rated(self, rated_uid):
+        """Stream every rating a user has received."""
+        return self.collection.where('rated_uid', '==', rated_uid).stream()
+
+
+class DataStore:
+    """All repositories, bound to one backend client."""
+
+    def __init__(self, client, backend='firestore'):
+        self.client = client
+        self.backend = backend
+        self.users = UserRepository(client)
+        self.public_profiles = PublicProfileRepository(client, self.users)
+        self.likes = LikeRepository(client)
+        self.dislikes = DislikeRepository(client)
+        self.seen = SeenRepository(client, self.likes, self.dislikes)
+        self.decks = DeckRepository(client)
+        self.recommendations = RecommendationRepository(client)
+        self.matches = MatchRepository(client)
+        self.messages = MessageRepository(client)
+        self.ratings = RatingRepository(client)
@@ -0,0 +1,99 @@
+# app/discovery/__init__.py
+
+"""
+Candidate selection for discover.
+
+`init_app` attaches a CandidateIndex over the app's users; discover searches
+it instead of querying Firestore per request. Settings come from config:
+
+- DISCOVERY_INDEX: use the in-memory index (False falls back to the
+  geohash range queries in UserRepository.nearby_candidates)
+- DISCOVERY_INDEX_REFRESH_INTERVAL: seconds between incremental refreshes
+  from changed profiles
+- DISCOVERY_INDEX_REBUILD_INTERVAL: seconds between full rebuilds, which
+  also drop deleted profiles
+- DISCOVER_COMPLETED_ONLY: only show profiles with profile_completed set
+- DISCOVERY_RANK_POOL: nearest compatible candidates ranked by shared
+  interests (interests.py) when a deck is built
+- DISCOVERY_RECOMMENDATION_WEIGHT: weight of a collaborative-filtering
+  recommendation (recommendations.py, 0 to 1) against interest similarity
+  (0 to 1) when ranking; 0 ignores recommendations
+- DISCOVERY_DECK_SIZE: candidates ranked ahead of time per user (decks.py)
+- DISCOVERY_DECK_LOW_WATERMARK: unswiped candidates left in a full deck
+  below which it is rebuilt
+- DISCOVERY_DECK_MAX_AGE: seconds after which a deck is rebuilt anyway
+- DISCOVERY_DECK_BACKGROUND: rebuild decks on worker threads (False
+  rebuilds them inline, for tests)
+- DISCOVERY_DECK_WORKERS: deck builder threads
+- DISCOVERY_SEEN_CONFIRM_LIMIT: profiles hidden by a Bloom filter seen set
+  (seen.py) checked against the likes and dislikes per deck build; 0
+  trusts the filter
+- DISCOVERY_BUCKET_TTL: seconds the candidates of a preference bucket
+  (buckets.py) are shared between deck builds without the index; 0 queries
+  for every build. The index already serves every viewer from one shared
+  scan of `users`, so buckets are only the DISCOVERY_INDEX = False fallback
+- DISCOVERY_BUCKET_MAX: buckets kept per process (without the index)
+- DISCOVERY_SAMPLE_READ_BUDGET: without the index, profiles read from a
+  random point of `users` for viewers without a location or distance
+  limit, instead of a deck's worth of the first ones by UID (the index
+  samples its rows by the same `random_key` order)
+"""
+
+from flask import current_app
+
+from app.discovery.buckets import BucketCache
+from app.discovery.columnar import CandidateIndex
+from app.discovery.decks import DeckBuilder
+
+DEFAULT_SETTINGS = {
+    'DISCOVERY_INDEX': True,
+    'DISCOVERY_INDEX_REFRESH_INTERVAL': 5,
+    'DISCOVERY_INDEX_REBUILD_INTERVAL': 3600,
+    'DISCOVER_COMPLETED_ONLY': False,
+    'DISCOVERY_RANK_POOL': 5000,
+    'DISCOVERY_RECOMMENDATION_WEIGHT': 0.5,
+    'DISCOVERY_DECK_SIZE': 200,
+    'DISCOVERY_DECK_LOW_WATERMARK': 40,
+    'DISCOVERY_DECK_MAX_AGE': 3600,
+    'DISCOVERY_DECK_BACKGROUND': True,
+    'DISCOVERY_DECK_WORKERS': 2,
+    'DISCOVERY_SEEN_CONFIRM_LIMIT': 200,
+    'DISCOVERY_BUCKET_TTL': 60,
+    'DISCOVERY_BUCKET_MAX': 1000,
+    'DISCOVERY_SAMPLE_READ_BUDGET': 700
+}
+
+
+def init_app(app, store):
+    """Attach a CandidateIndex over the store's users (built on first use), a BucketCache (used without the index) and a DeckBuilder to the app."""
+    for key, value in DEFAULT_SETTINGS.items():
+        app.config.setdefault(key, value)
+
+    app.extensions['candidate_index'] = CandidateIndex(
+        store.users,
+        refresh_interval=app.config['DISCOVERY_INDEX_REFRESH_INTERVAL'],
+        rebuild_interval=app.config['DISCOVERY_INDEX_REBUILD_INTERVAL']
+    )
+    app.extensions['candidate_buckets'] = BucketCache(
+        ttl=app.config['DISCOVERY_BUCKET_TTL'],
+        max_buckets=app.config['DISCOVERY_BUCKET_MAX']
+    )
+    app.extensions['deck_builder'] = DeckBuilder(
+        app, store, app.extensions['candidate_index'], app.extensions['candidate_buckets']
+    )
+    return app.extensions['candidate_index']
+
+
+def get_index():
+    """Return the CandidateIndex of the current app."""
+    return current_app.extensions['candidate_index']
+
+
+def get_deck_builder():
+    """Return the DeckBuilder of the current app."""
+    return current_app.extensions['deck_builder']
+
+
+def get_buckets():
+    """Return the BucketCache of the current app."""
+    return current_app.extensions['candidate_buckets']
@@ -0,0 +1,277 @@
+# app/discovery/buckets.py
+
+"""
+Shared candidate lists for discover, cached by preference bucket.
+
+Without the candidate index (DISCOVERY_INDEX = False), ranking a deck starts
+with Firestore queries for the profiles around the viewer. Viewers in the
+same area looking for the same gender, at a similar age window and distance,
+get almost the same results, so those queries run once per bucket and their
+results are shared. A bucket is:
+
+- the viewer's gender preference ('all' and unset are the same bucket)
+- their age window, widened to multiples of AGE_BAND years
+- the geohash cell of CELL_PRECISION characters they are in
+- their distance_max, rounded up to a multiple of DISTANCE_BAND km
+
+A located bucket holds every profile of that gender, with an age in the
+widened window (or none), within the rounded distance plus the cell's
+half-diagonal of the cell's center, so it contains the circle of every
+viewer mapped to it. Viewers without a location or distance limit share a
+bucket per gender and age window holding a random sample of profiles.
+Each viewer's exact age window and distance, and their swipes, are applied
+on top, and the bucket's InterestIndex scores its rows for ranking.
+
+Buckets expire DISCOVERY_BUCKET_TTL seconds after they were loaded. A profile
+update that changes its age, gender, location or interests drops the
+buckets the profile is in and those it may have moved into; that only
+reaches this process, so other workers pick the change up on expiry.
+Concurrent misses on one bucket wait for a single load.
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from app.discovery.columnar import UNKNOWN, _age
+from app.discovery.interests import InterestIndex
+from app.discovery.seen import uid_hashes
+from app.utils.geo import EARTH_RADIUS_KM, decode_geohash_bounds, encode_geohash, haversine_km, valid_coordinates
+
+# Bucket granularity: years of age window, geohash characters (cells of about 39 x 20 km), km of distance
+AGE_BAND = 5
+CELL_PRECISION = 4
+DISTANCE_BAND = 25
+
+# Profile fields that decide which buckets a profile is in, and those its ranking uses too
+MEMBERSHIP_FIELDS = ['age', 'gender', 'location']
+BUCKET_FIELDS = MEMBERSHIP_FIELDS + ['interests']
+
+
+def bucket_key(viewer):
+    """The (gender, age_low, age_high, cell, radius_km) bucket of a viewer's profile."""
+    preferences = viewer.get('preferences') or {}
+    gender = preferences.get('gender')
+    if gender in ('all', ''):
+        gender = None
+
+    age_min = _age(preferences.get('age_min'))
+    age_max = _age(preferences.get('age_max'))
+    age_low = None if age_min == UNKNOWN else age_min // AGE_BAND * AGE_BAND
+    age_high = None if age_max == UNKNOWN else -(-age_max // AGE_BAND) * AGE_BAND
+
+    cell = radius = None
+    coordinates = valid_coordinates(viewer.get('location'))
+    distance_max = preferences.get('distance_max')
+    if coordinates and isinstance(distance_max, (int, float)) and distance_max > 0:
+        cell = encode_geohash(*coordinates, CELL_PRECISION)
+        radius = math.ceil(distance_max / DISTANCE_BAND) * DISTANCE_BAND
+    return gender, age_low, age_high, cell, radius
+
+
+def cell_circle(cell):
+    """(latitude, longitude, reach_km): a geohash cell's center and the distance to its farthest corner."""
+    south, west, north, east = decode_geohash_bounds(cell)
+    latitude, longitude = (south + north) / 2, (west + east) / 2
+    # The corner nearer the equator, where the cell is widest, is the farthest
+    corner = south if abs(south) < abs(north) else north
+    return latitude, longitude, haversine_km(latitude, longitude, corner, west)
+
+
+def load_bucket(users, key, sample_size):
+    """
+    Query the (snapshot, distance_km or None) pairs of a bucket from the
+    UserRepository; unlocated buckets are a random sample of `sample_size` profiles.
+    """
+    gender, _, _, cell, radius = key
+    if cell is None:
+        return [(doc, None) for doc in users.sample_candidates(gender=gender, limit=sample_size)]
+    latitude, longitude, reach = cell_circle(cell)
+    return users.nearby_candidates(latitude, longitude, radius + reach, gender=gender)
+
+
+class Bucket:
+    """The candidates of one bucket, in columns for filtering per viewer."""
+
+    def __init__(self, key, results, expires_at):
+        """
+        Args:
+            key: The bucket_key the results were loaded for
+            results: (snapshot, distance_km or None) pairs from load_bucket
+            expires_at: time.monotonic() after which the bucket is reloaded
+        """
+        self.key = key
+        self.expires_at = expires_at
+        gender, age_low, age_high, cell, radius = key
+        if cell is not None:
+            self.latitude, self.longitude, reach = cell_circle(cell)
+            self.radius = radius + reach
+
+        self.uids = []
+        self.interests = InterestIndex()
+        ages, lat, lon, hashes = [], [], [], []
+        for doc, _ in results:
+            data = doc.to_dict() or {}
+            age = _age(data.get('age'))
+            if age != UNKNOWN and ((age_low is not None and age < age_low) or (age_high is not None and age > age_high)):
+                continue
+            coordinates = valid_coordinates(data.get('location')) or (np.nan, np.nan)
+
+            self.interests.update(doc.id, data.get('interests'), slot=len(self.uids))
+            self.uids.append(doc.id)
+            ages.append(age)
+            lat.append(coordinates[0])
+            lon.append(coordinates[1])
+            hashes.append(uid_hashes(doc.id))
+
+        self.members = set(self.uids)
+        self.age = np.array(ages, dtype=np.int16)
+        self.lat = np.radians(np.array(lat, dtype=np.float64))
+        self.lon = np.radians(np.array(lon, dtype=np.float64))
+        hashes = np.array(hashes, dtype=np.uint64).reshape(-1, 2)
+        self.hash1, self.hash2 = hashes[:, 0], hashes[:, 1]
+
+    def __len__(self):
+        return len(self.uids)
+
+    def admits(self, changes):
+        """
+        Whether a profile with these field values could belong in the bucket
+        (fields missing from `changes` could be anything).
+        """
+        gender, age_low, age_high, cell, _ = self.key
+        if gender is not None and 'gender' in changes and changes['gender'] != gender:
+            return False
+        if 'age' in changes:
+            age = _age(changes['age'])
+            if age != UNKNOWN and ((age_low is not None and age < age_low) or (age_high is not None and age > age_high)):
+                return False
+        if cell is not None and 'location' in changes:
+            coordinates = valid_coordinates(changes['location'])
+            if coordinates is None or haversine_km(self.latitude, self.longitude, *coordinates) > self.radius:
+                return False
+        return True
+
+    def candidates(self, viewer_uid, viewer, seen=None):
+        """
+        Return (rows, distances) of the candidates left for one viewer: within
+        their exact age window (unknown ages kept) and distance, not the viewer
+        and not in their SeenSet, nearest first. Distances are None in
+        unlocated buckets.
+        """
+        preferences = viewer.get('preferences') or {}
+        mask = np.ones(len(self.uids), dtype=bool)
+
+        age_min = _age(preferences.get('age_min'))
+        age_max = _age(preferences.get('age_max'))
+        known_age = self.age != UNKNOWN
+        if age_min != UNKNOWN:
+            mask &= ~known_age | (self.age >= age_min)
+        if age_max != UNKNOWN:
+            mask &= ~known_age | (self.age <= age_max)
+
+        if viewer_uid in self.members:
+            mask[self.uids.index(viewer_uid)] = False
+        if seen is not None and len(seen):
+            if seen.is_exact:
+                mask &= np.fromiter((uid not in seen.uids for uid in self.uids), dtype=bool, count=len(self.uids))
+            else:
+                mask &= ~seen.contains_hashes(self.hash1, self.hash2)
+
+        rows = np.flatnonzero(mask)
+        if self.key[3] is None:
+            return rows, [None] * len(rows)
+
+        # Located buckets were keyed by the viewer's location and distance_max
+        latitude, longitude = valid_coordinates(viewer.get('location'))
+        lat, lon = np.radians(latitude), np.radians(longitude)
+        a = (np.sin((self.lat[rows] - lat) / 2) ** 2
+             + np.cos(lat) * np.cos(self.lat[rows]) * np.sin((self.lon[rows] - lon) / 2) ** 2)
+        distances = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+        keep = distances <= preferences['distance_max']
+        rows, distances = rows[keep], distances[keep]
+        order = np.argsort(distances, kind='stable')
+        return rows[order], [float(distance) for distance in distances[order]]
+
+
+class BucketCache:
+    """Buckets by key, loaded on a miss and kept for `ttl` seconds (least recently used evicted past `max_buckets`)."""
+
+    def __init__(self, ttl=60, max_buckets=1000):
+        self.ttl = ttl
+        self.max_buckets = max_buckets
+        self.hits = 0
+        self.loads = 0
+        self._buckets = OrderedDict()
+        self._loading = {}      # Key -> lock held while the bucket loads
+        self._generation = 0    # Bumped by every invalidation
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._buckets)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._buckets
+
+    def _fresh(self, key):
+        bucket = self._buckets.get(key)
+        if bucket is None or bucket.expires_at <= time.monotonic():
+            return None
+        self._buckets.move_to_end(key)
+        self.hits += 1
+        return bucket
+
+    def get(self, key, load):
+        """Return the bucket for `key`, calling `load()` for its results if it is missing or expired."""
+        with self._lock:
+            bucket = self._fresh(key)
+            if bucket is not None:
+                return bucket
+            loading = self._loading.setdefault(key, threading.Lock())
+
+        with loading:
+            with self._lock:
+                bucket = self._fresh(key)
+                if bucket is not None:
+                    return bucket
+                generation = self._generation
+
+            bucket = Bucket(key, load(), time.monotonic() + self.ttl)
+
+            with self._lock:
+                self.loads += 1
+                self._loading.pop(key, None)
+                # Results read before an invalidation may already be out of date
+                if generation == self._generation:
+                    self._buckets[key] = bucket
+                    self._buckets.move_to_end(key)
+                    while len(self._buckets) > self.max_buckets:
+                        self._buckets.popitem(last=False)
+        return bucket
+
+    def invalidate(self, uid, changes):
+        """
+        Drop the buckets a profile is in and, when `changes` (the updated
+        fields) touch MEMBERSHIP_FIELDS, those it may now belong in.
+        """
+        membership = any(field in changes for field in MEMBERSHIP_FIELDS)
+        with self._lock:
+            self._generation += 1
+            stale = [
+                key for key, bucket in self._buckets.items()
+                if uid in bucket.members or (membership and bucket.admits(changes))
+            ]
+            for key in stale:
+                del self._buckets[key]
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._buckets.clear()
@@ -0,0 +1,420 @@
+# app/discovery/columnar.py
+
+"""
+Process-local columnar snapshot of discoverable users.
+
+Discover needs a handful of fields from every profile (age, gender,
+location, preferences, completion) to decide who is compatible with whom.
+Firestore can only filter on one of them per query, so the index keeps them
+in NumPy arrays, one row per user, and evaluates every filter over the whole
+population at once:
+
+- the viewer's gender and age preferences against each candidate, and each
+  candidate's preferences against the viewer (bidirectional)
+- haversine distance against the viewer's and the candidate's distance_max
+
+The index is built from one masked scan of `users` and then refreshed
+incrementally from profiles whose `updated_at` (a server timestamp) moved
+past the newest change already applied. One thread at a time builds or
+refreshes; the others keep searching the current rows meanwhile. Interests,
+which don't fit a column, go to an InterestIndex
+(`interests`) kept in step with the rows. Deleted profiles linger until the
+next periodic rebuild; discover reads the final profiles anyway, so they are
+never returned.
+"""
+
+import random
+import threading
+import time
+
+import numpy as np
+
+from app.discovery.interests import InterestIndex
+from app.discovery.seen import uid_hashes
+from app.utils.geo import EARTH_RADIUS_KM, valid_coordinates
+from app.utils.sync_token import EPOCH, as_utc
+
+# Profile fields the index is built from (never the photos)
+INDEX_FIELDS = ['age', 'gender', 'location', 'preferences', 'profile_completed', 'interests', 'random_key', 'updated_at']
+
+# Changed profiles fetched per refresh query
+REFRESH_PAGE_SIZE = 1000
+
+# Column sentinels: unknown age/gender, and open-ended preferences
+UNKNOWN = -1
+ANY_GENDER = 0
+NO_AGE_LIMIT_MIN = 0
+NO_AGE_LIMIT_MAX = np.iinfo(np.int16).max
+
+_INITIAL_CAPACITY = 1024
+
+
+def _age(value):
+    """An age column value from a profile field."""
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+        return UNKNOWN
+    return int(min(value, NO_AGE_LIMIT_MAX))
+
+
+def _random_key(value, uid_hash):
+    """A random_key column value: the profile's sampling key, else one derived from its UID hash."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool) and 0 <= value < 1:
+        return float(value)
+    return uid_hash / 2.0 ** 64
+
+
+def _is_any_gender(value):
+    return value in (None, '', 'all')
+
+
+class CandidateIndex:
+    """Columnar store of the discover-relevant fields of every user."""
+
+    COLUMNS = {
+        'age': (np.int16, UNKNOWN),
+        'gender': (np.int16, UNKNOWN),
+        'lat': (np.float64, np.nan),        # Radians, NaN without a location
+        'lon': (np.float64, np.nan),
+        'age_min': (np.int16, NO_AGE_LIMIT_MIN),
+        'age_max': (np.int16, NO_AGE_LIMIT_MAX),
+        'pref_gender': (np.int16, ANY_GENDER),
+        'distance_max': (np.float32, np.inf),
+        'completed': (np.bool_, False),
+        'live': (np.bool_, False),          # False for removed rows
+        'hash1': (np.uint64, 0),            # uid_hashes of the UID, for Bloom filter seen sets
+        'hash2': (np.uint64, 0),
+        'random_key': (np.float64, 0.0)     # Sampling order for viewers without a location
+    }
+
+    def __init__(self, users=None, refresh_interval=5, rebuild_interval=3600):
+        """
+        Args:
+            users: UserRepository the index loads from (None for an index
+                filled only through `load_columns`/`upsert`, as in benchmarks)
+            refresh_interval: Seconds between incremental refreshes
+            rebuild_interval: Seconds between full rebuilds (drops deleted profiles)
+        """
+        self.users = users
+        self.refresh_interval = refresh_interval
+        self.rebuild_interval = rebuild_interval
+        self._lock = threading.RLock()
+        self._update_lock = threading.Lock()  # One build or refresh at a time
+        self._gender_codes = {}
+        self.interests = InterestIndex()
+        self._reset(0)
+        self._synced_at = None  # updated_at of the newest change applied; None before the first build
+        self._refreshed_at = 0.0
+        self._built_at = 0.0
+
+    def __len__(self):
+        with self._lock:
+            return int(self._columns['live'][:self._size].sum())
+
+    def _reset(self, capacity):
+        self._uids = []
+        self._rows = {}
+        self._size = 0
+        self._columns = {
+            name: np.full(max(capacity, _INITIAL_CAPACITY), default, dtype=dtype)
+            for name, (dtype, default) in self.COLUMNS.items()
+        }
+
+    def _grow(self, needed):
+        capacity = len(self._columns['live'])
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for name, (dtype, default) in self.COLUMNS.items():
+            column = np.full(capacity, default, dtype=dtype)
+            column[:self._size] = self._columns[name][:self._size]
+            self._columns[name] = column
+
+    def gender_code(self, gender, create=False):
+        """Small integer code for a gender string (UNKNOWN if not known and not created)."""
+        if not isinstance(gender, str) or not gender:
+            return UNKNOWN
+        code = self._gender_codes.get(gender)
+        if code is None and create:
+            code = self._gender_codes[gender] = len(self._gender_codes) + 1
+        return UNKNOWN if code is None else code
+
+    def _row_values(self, data):
+        """Column values for one profile."""
+        preferences = data.get('preferences') or {}
+        coordinates = valid_coordinates(data.get('location'))
+        pref_gender = preferences.get('gender')
+        distance_max = preferences.get('distance_max')
+        age_min = _age(preferences.get('age_min'))
+        age_max = _age(preferences.get('age_max'))
+
+        return {
+            'age': _age(data.get('age')),
+            'gender': self.gender_code(data.get('gender'), create=True),
+            'lat': np.radians(coordinates[0]) if coordinates else np.nan,
+            'lon': np.radians(coordinates[1]) if coordinates else np.nan,
+            'age_min': NO_AGE_LIMIT_MIN if age_min == UNKNOWN else age_min,
+            'age_max': NO_AGE_LIMIT_MAX if age_max == UNKNOWN else age_max,
+            'pref_gender': ANY_GENDER if _is_any_gender(pref_gender) else self.gender_code(pref_gender, create=True),
+            'distance_max': distance_max if isinstance(distance_max, (int, float)) and distance_max > 0 else np.inf,
+            'completed': bool(data.get('profile_completed')),
+            'live': True
+        }
+
+    def upsert(self, uid, data):
+        """Add or replace a user's row from their profile fields."""
+        with self._lock:
+            values = self._row_values(data)
+            row = self._rows.get(uid)
+            if row is None:
+                self._grow(self._size + 1)
+                row = self._size
+                self._rows[uid] = row
+                self._uids.append(uid)
+                self._size += 1
+                self._columns['hash1'][row], self._columns['hash2'][row] = uid_hashes(uid)
+            for name, value in values.items():
+                self._columns[name][row] = value
+            self._columns['random_key'][row] = _random_key(data.get('random_key'), int(self._columns['hash1'][row]))
+            self.interests.update(uid, data.get('interests'), slot=row)
+
+    def update_interests(self, uid, interests):
+        """Apply a user's new interests ahead of the next refresh (users not indexed yet wait for it)."""
+        with self._lock:
+            row = self._rows.get(uid)
+            if row is not None:
+                self.interests.update(uid, interests, slot=row)
+
+    def remove(self, uid):
+        """Drop a user from search results."""
+        with self._lock:
+            row = self._rows.get(uid)
+            if row is not None:
+                self._columns['live'][row] = False
+            self.interests.remove(uid)
+
+    def load_columns(self, uids, genders=None, interests=None, **columns):
+        """
+        Replace the index with prebuilt columns (used for bulk loads and benchmarks).
+
+        `genders` maps gender strings to the codes used in the `gender` and
+        `pref_gender` columns, and `interests` holds each user's interests
+        array; columns not given take their defaults.
+        """
+        with self._lock:
+            self._gender_codes = dict(genders or {})
+            self.interests = InterestIndex()
+            self._reset(len(uids))
+            self._grow(len(uids))
+            self._uids = list(uids)
+            self._rows = {uid: row for row, uid in enumerate(self._uids)}
+            self._size = len(self._uids)
+            for name, values in columns.items():
+                self._columns[name][:self._size] = values
+            if 'live' not in columns:
+                self._columns['live'][:self._size] = True
+            if 'hash1' not in columns:
+                hashes = np.array([uid_hashes(uid) for uid in self._uids], dtype=np.uint64).reshape(-1, 2)
+                self._columns['hash1'][:self._size] = hashes[:, 0]
+                self._columns['hash2'][:self._size] = hashes[:, 1]
+            if 'random_key' not in columns:
+                self._columns['random_key'][:self._size] = self._columns['hash1'][:self._size] / 2.0 ** 64
+            for row, user_interests in enumerate(interests or []):
+                self.interests.update(self._uids[row], user_interests, slot=row)
+
+    def build(self):
+        """Load every user with one masked scan."""
+        with self._update_lock:
+            self._build()
+
+    def _build(self):
+        """build() for a caller holding the update lock."""
+        synced_at = EPOCH
+        rows = []
+        for doc in self.users.stream_all(fields=INDEX_FIELDS):
+            data = doc.to_dict() or {}
+            rows.append((doc.id, data))
+            if data.get('updated_at'):
+                synced_at = max(synced_at, as_utc(data['updated_at']))
+
+        with self._lock:
+            self._gender_codes = {}
+            self.interests = InterestIndex()
+            self._reset(len(rows))
+            for uid, data in rows:
+                self.upsert(uid, data)
+            self._synced_at = synced_at
+            self._built_at = self._refreshed_at = time.monotonic()
+        print(f"Candidate index built with {len(rows)} users")
+
+    def refresh(self):
+        """Apply profiles changed since the last build or refresh; returns how many."""
+        with self._update_lock:
+            if self._synced_at is None:
+                self._build()
+                return len(self)
+            return self._refresh()
+
+    def _refresh(self):
+        """refresh() of a built index, for a caller holding the update lock."""
+        since = self._synced_at
+        applied = 0
+        after = None
+        while True:
+            changed = self.users.changed_since(since, REFRESH_PAGE_SIZE, fields=INDEX_FIELDS, after=after)
+            with self._lock:
+                for doc in changed:
+                    data = doc.to_dict() or {}
+                    self.upsert(doc.id, data)
+                    self._synced_at = max(self._synced_at, as_utc(data['updated_at']))
+            applied += len(changed)
+            if len(changed) < REFRESH_PAGE_SIZE:
+                break
+            # The next page starts after this one's last profile, not its timestamp, so ties aren't skipped
+            after = changed[-1]
+
+        self._refreshed_at = time.monotonic()
+        return applied
+
+    def ensure_fresh(self):
+        """Build, rebuild or refresh the index when its intervals have passed."""
+        now = time.monotonic()
+        rebuild = self._synced_at is None or now - self._built_at >= self.rebuild_interval
+        if not rebuild and now - self._refreshed_at < self.refresh_interval:
+            return
+
+        # While another thread updates the index, search the rows it has (only the first build is waited for)
+        if not self._update_lock.acquire(blocking=self._synced_at is None):
+            return
+        try:
+            now = time.monotonic()
+            if self._synced_at is None or now - self._built_at >= self.rebuild_interval:
+                self._build()
+            elif now - self._refreshed_at >= self.refresh_interval:
+                self._refresh()
+        finally:
+            self._update_lock.release()
+
+    def _unseen(self, rows, seen):
+        """The rows whose users are not in the viewer's SeenSet."""
+        if seen is None or not len(seen):
+            return rows
+        if seen.is_exact:
+            swiped = [self._rows[uid] for uid in seen.uids if uid in self._rows]
+            return rows[~np.isin(rows, swiped)]
+        members = seen.contains_hashes(self._columns['hash1'][rows], self._columns['hash2'][rows])
+        return rows[~members]
+
+    def search(self, viewer_uid, viewer, limit, completed_only=False, seen=None, rank_pool=None, boosts=None):
+        """
+        Return up to `limit` (uid, distance_km) pairs of users compatible with the viewer.
+
+        `viewer` is the viewer's profile (age, gender, location, preferences,
+        interests).
+        Candidates must satisfy the viewer's gender, age and distance
+        preferences, and the viewer must satisfy theirs; unknown ages and
+        locations are not held against anyone except that a distance limit
+        needs a location. Users in `seen` (the viewer's SeenSet) are left
+        out. With a viewer location results are nearest first and carry
+        their distance; otherwise (distance None) they are sampled from a
+        random point of the `random_key` order, wrapping around, so viewers
+        without a location don't all get the same candidates. With
+        `rank_pool`, that many of those candidates are reordered by how
+        similar their interests are to the viewer's (keeping the order among
+        equal scores) before the first `limit` are taken. `boosts` maps UIDs
+        to scores added to the interest score (recommendations); boosted
+        candidates that pass the filters are ranked even outside the pool.
+        """
+        preferences = viewer.get('preferences') or {}
+        viewer_age = _age(viewer.get('age'))
+        coordinates = valid_coordinates(viewer.get('location'))
+        distance_max = preferences.get('distance_max')
+        if not isinstance(distance_max, (int, float)) or distance_max <= 0:
+            distance_max = None
+
+        with self._lock:
+            n = self._size
+            c = {name: column[:n] for name, column in self._columns.items()}
+
+            mask = c['live'].copy()
+            if completed_only:
+                mask &= c['completed']
+            viewer_row = self._rows.get(viewer_uid)
+            if viewer_row is not None:
+                mask[viewer_row] = False
+
+            # The viewer's preferences...
+            pref_gender = preferences.get('gender')
+            if not _is_any_gender(pref_gender):
+                gender = self.gender_code(pref_gender)
+                # A gender nobody has matches no one, not everyone without a gender
+                mask &= (c['gender'] == gender) if gender != UNKNOWN else False
+
+            age_min = _age(preferences.get('age_min'))
+            age_max = _age(preferences.get('age_max'))
+            known_age = c['age'] != UNKNOWN
+            if age_min != UNKNOWN:
+                mask &= ~known_age | (c['age'] >= age_min)
+            if age_max != UNKNOWN:
+                mask &= ~known_age | (c['age'] <= age_max)
+
+            # ...and the candidates' preferences about the viewer
+            viewer_gender = self.gender_code(viewer.get('gender'))
+            mask &= (c['pref_gender'] == ANY_GENDER) | ((c['pref_gender'] == viewer_gender) & (viewer_gender != UNKNOWN))
+            if viewer_age != UNKNOWN:
+                mask &= (c['age_min'] <= viewer_age) & (c['age_max'] >= viewer_age)
+
+            rows = self._unseen(np.flatnonzero(mask), seen)
+            pool = max(limit, rank_pool or 0)
+
+            boost = None
+            if boosts:
+                boost = np.zeros(n)
+                for boosted_uid, value in boosts.items():
+                    row = self._rows.get(boosted_uid)
+                    if row is not None:
+                        boost[row] = value
+
+            if coordinates is None:
+                # Distance from a random point of the random_key order, wrapping around
+                order_keys = (c['random_key'][rows] - random.random()) % 1.0
+                distances = np.full(len(rows), np.nan)
+            else:
+                # Distances only for the rows still in the running
+                lat = np.radians(coordinates[0])
+                lon = np.radians(coordinates[1])
+                cand_lat = c['lat'][rows]
+                a = (np.sin((cand_lat - lat) / 2) ** 2
+                     + np.cos(lat) * np.cos(cand_lat) * np.sin((c['lon'][rows] - lon) / 2) ** 2)
+                distances = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+                located = ~np.isnan(distances)
+                keep = ~located | (distances <= c['distance_max'][rows])
+                if distance_max is not None:
+                    keep &= located & (distances <= distance_max)
+                rows, distances = rows[keep], distances[keep]
+
+                # Nearest first; unlocated candidates last
+                order_keys = np.where(np.isnan(distances), np.inf, distances)
+
+            if len(rows) > pool:
+                top = np.argpartition(order_keys, pool - 1)[:pool]
+                if boost is not None:
+                    top = np.union1d(top, np.flatnonzero(boost[rows] > 0))
+            else:
+                top = np.arange(len(rows))
+            top = top[np.argsort(order_keys[top], kind='stable')]
+            rows, distances = rows[top], distances[top]
+
+            # Rows double as interest slots, so the pool is scored without UID lookups
+            if rank_pool or boost is not None:
+                scores = self.interests.score_slots(viewer.get('interests'), rows) if rank_pool else np.zeros(len(rows))
+                if boost is not None:
+                    scores += boost[rows]
+                order = np.argsort(-scores, kind='stable')
+                rows, distances = rows[order], distances[order]
+
+            return [
+                (self._uids[row], None if np.isnan(distance) else float(distance))
+                for row, distance in zip(rows[:limit], distances[:limit])
+            ]
@@ -0,0 +1,187 @@
+# app/discovery/decks.py
+
+"""
+Precomputed discovery decks.
+
+Ranking candidates (the index search, or the geohash queries without it) is
+the expensive part of discover, so it runs ahead of time: the DeckBuilder
+stores a ranked queue of up to DISCOVERY_DECK_SIZE candidate UIDs per user
+in one `decks` document, and discover pages through it with a cursor,
+reading only the deck and the profiles it returns.
+
+A deck is rebuilt in the background when a full deck has fewer than
+DISCOVERY_DECK_LOW_WATERMARK unswiped candidates left past the cursor, when
+it is older than DISCOVERY_DECK_MAX_AGE seconds, and when the user changes
+what they are looking for (profile preferences, location, age, gender or
+interests) or clears their swipes. Only a user without any deck has one built
+while they wait.
+
+Cursors are "<version>.<position>"; a cursor from an older version of the
+deck starts over at the top of the new one, where profiles swiped since are
+skipped through the seen set.
+
+When the seen set is a Bloom filter, the DISCOVERY_SEEN_CONFIRM_LIMIT
+best-ranked profiles it hides are checked against the likes and dislikes
+before ranking (see seen.py), so a false positive doesn't keep a profile
+out of the deck.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.discovery.buckets import Bucket, bucket_key, load_bucket
+from app.discovery.interests import rank_by_interest
+
+# Profile fields that decide who is in a user's deck
+VIEWER_FIELDS = ['age', 'gender', 'location', 'preferences', 'interests']
+
+
+def encode_deck_cursor(version, position):
+    """Cursor for the deck entries after `position`."""
+    return f"{version}.{position}"
+
+
+def decode_deck_cursor(cursor):
+    """
+    Return (version, position) from a deck cursor.
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    version, _, position = (cursor or '').partition('.')
+    if not version.isdigit() or not position.isdigit():
+        raise ValueError("Invalid cursor")
+    return int(version), int(position)
+
+
+class DeckBuilder:
+    """Builds and stores each user's ranked queue of discover candidates."""
+
+    def __init__(self, app, store, index, buckets=None):
+        """
+        Args:
+            app: Flask app whose config holds the DISCOVERY_* settings (read
+                at build time, so it works from background threads)
+            store: DataStore the decks, users and seen sets live in
+            index: CandidateIndex to rank with when DISCOVERY_INDEX is set
+            buckets: BucketCache sharing candidate queries between users
+                without the index (None queries for every build)
+        """
+        self.config = app.config
+        self.store = store
+        self.index = index
+        self.buckets = buckets
+        self._executor = None
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def rank(self, uid, viewer, seen, limit):
+        """
+        Return up to `limit` (uid, distance_km or None) pairs for the viewer,
+        best first: the DISCOVERY_RANK_POOL nearest compatible candidates
+        (plus any recommended ones), ordered by how similar their interests
+        are to the viewer's plus their recommendation score.
+        """
+        pool = max(limit, self.config['DISCOVERY_RANK_POOL'])
+
+        # Collaborative-filtering recommendations (recommendations.py) move candidates up
+        weight = self.config['DISCOVERY_RECOMMENDATION_WEIGHT']
+        boosts = {}
+        if weight:
+            boosts = {rec_uid: weight * score for rec_uid, score in self.store.recommendations.boosts(uid).items()}
+
+        if self.config['DISCOVERY_INDEX']:
+            # Gender, age and distance preferences checked both ways over the in-memory index
+            self.index.ensure_fresh()
+            return self.index.search(
+                uid, viewer, limit,
+                completed_only=self.config['DISCOVER_COMPLETED_ONLY'],
+                seen=seen,
+                rank_pool=self.config['DISCOVERY_RANK_POOL'],
+                boosts=boosts
+            )
+
+        # Without the index, candidates come from the viewer's preference bucket (buckets.py),
+        # shared with everyone in it; profile_completed isn't filtered on yet, to keep testing lenient
+        key = bucket_key(viewer)
+
+        def load():
+            return load_bucket(self.store.users, key, self.config['DISCOVERY_SAMPLE_READ_BUDGET'])
+
+        if self.buckets is not None and self.config['DISCOVERY_BUCKET_TTL'] > 0:
+            bucket = self.buckets.get(key, load)
+        else:
+            bucket = Bucket(key, load(), 0)
+
+        rows, distances = bucket.candidates(uid, viewer, seen)
+        rows, distances = rows[:pool], distances[:pool]
+        hits = [(bucket.uids[row], distance) for row, distance in zip(rows, distances)]
+        # Interest weights come from the bucket's profiles, without the index
+        scores = bucket.interests.score_slots(viewer.get('interests'), rows)
+        scores += [boosts.get(hit_uid, 0.0) for hit_uid, _ in hits]
+        return rank_by_interest(hits, scores, limit)
+
+    def build(self, uid, viewer=None, seen=None):
+        """Rank candidates for a user, store them as their deck and return the deck."""
+        if viewer is None:
+            viewer_doc = self.store.users.get(uid, fields=VIEWER_FIELDS)
+            if not viewer_doc.exists:
+                return None
+            viewer = viewer_doc.to_dict()
+        if seen is None:
+            seen = self.store.seen.get_set(uid)
+
+        if not seen.is_exact and self.config['DISCOVERY_SEEN_CONFIRM_LIMIT']:
+            # Bloom filter hits that would rank best may be false positives: check them first
+            hidden = self.rank(uid, viewer, seen.hits(), self.config['DISCOVERY_SEEN_CONFIRM_LIMIT'])
+            seen = self.store.seen.confirm_hits(uid, seen, [hit_uid for hit_uid, _ in hidden])
+
+        hits = self.rank(uid, viewer, seen, self.config['DISCOVERY_DECK_SIZE'])
+        return self.store.decks.save(uid, hits)
+
+    def schedule(self, uid):
+        """Rebuild a user's deck off the request path (inline when DISCOVERY_DECK_BACKGROUND is off)."""
+        if not self.config['DISCOVERY_DECK_BACKGROUND']:
+            self._build_quietly(uid)
+            return
+
+        with self._lock:
+            if uid in self._pending:
+                return
+            self._pending.add(uid)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.config['DISCOVERY_DECK_WORKERS'], thread_name_prefix='deck-builder'
+                )
+        self._executor.submit(self._build_pending, uid)
+
+    def _build_pending(self, uid):
+        try:
+            self._build_quietly(uid)
+        finally:
+            with self._lock:
+                self._pending.discard(uid)
+
+    def _build_quietly(self, uid):
+        try:
+            self.build(uid)
+        except Exception as e:
+            print(f"Error building discover deck for {uid}: {str(e)}")
+
+    def needs_rebuild(self, deck, remaining):
+        """
+        Whether a deck with `remaining` unswiped entries past the cursor
+        should be rebuilt. A deck that came out short already held every
+        compatible profile, so it is only rebuilt once it is too old.
+        """
+        if time.time() - deck['version'] / 1000 > self.config['DISCOVERY_DECK_MAX_AGE']:
+            return True
+        full = len(deck['uids']) >= self.config['DISCOVERY_DECK_SIZE']
+        return full and remaining < self.config['DISCOVERY_DECK_LOW_WATERMARK']
+
+    def shutdown(self):
+        """Stop the background workers (waiting for builds in progress)."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
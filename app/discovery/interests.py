@@ -0,0 +1,186 @@
+# app/discovery/interests.py
+
+"""
+Inverted index over profile interests, and similarity scoring for discover.
+
+Interests are free-form tags, so they are normalized (lowercased, with runs
+of whitespace collapsed) before indexing. The index maps each tag to the set
+of users listing it, which gives every tag's document frequency, and keeps
+each user's tag IDs in a row of a padded matrix for batched scoring.
+
+Two users are compared with a weighted Jaccard similarity over their tag
+sets, each tag weighted by its inverse document frequency:
+
+    sum(idf(t) for t in shared) / sum(idf(t) for t in either)
+
+so sharing a rare interest counts for more than sharing a common one.
+Scoring a batch of candidates gathers their rows into one matrix and sums
+the weights per candidate with NumPy, without a Python loop over tags.
+"""
+
+import threading
+from itertools import repeat
+
+import numpy as np
+
+# Padding in a user's row of tag IDs
+NO_TAG = -1
+
+_INITIAL_SLOTS = 1024
+_INITIAL_WIDTH = 8
+
+
+def normalize_interest(value):
+    """The indexed form of an interest tag (None if it isn't a non-empty string)."""
+    if not isinstance(value, str):
+        return None
+    return ' '.join(value.lower().split()) or None
+
+
+def normalize_interests(values):
+    """The distinct normalized tags of an interests array."""
+    if not isinstance(values, (list, tuple)):
+        return []
+    return sorted({tag for tag in map(normalize_interest, values) if tag})
+
+
+class InterestIndex:
+    """
+    Interest tag -> user IDs, with IDF-weighted Jaccard scoring.
+
+    Each user's tags live in one row (slot) of a matrix. The CandidateIndex
+    passes its own row numbers as slots, so it can score rows it has just
+    filtered without looking their UIDs up; otherwise slots are assigned in
+    order.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._tag_ids = {}      # Normalized tag -> tag ID
+        self._postings = []     # Tag ID -> set of UIDs listing it
+        self._slots = {}        # UID -> row of _tags, for users with interests
+        self._next_slot = 0
+        # One row of tag IDs per slot, padded with NO_TAG (grows in both directions as needed)
+        self._tags = np.full((_INITIAL_SLOTS, _INITIAL_WIDTH), NO_TAG, dtype=np.int32)
+        self._idf = None        # Cached weights by tag ID, dropped on every change
+
+    def __len__(self):
+        """Number of users with at least one interest."""
+        with self._lock:
+            return len(self._slots)
+
+    def _tag_id(self, tag):
+        tag_id = self._tag_ids.get(tag)
+        if tag_id is None:
+            tag_id = self._tag_ids[tag] = len(self._postings)
+            self._postings.append(set())
+        return tag_id
+
+    def _grow(self, slots, width):
+        rows, columns = self._tags.shape
+        if slots <= rows and width <= columns:
+            return
+        while rows < slots:
+            rows *= 2
+        tags = np.full((rows, max(columns, width)), NO_TAG, dtype=np.int32)
+        tags[:self._tags.shape[0], :columns] = self._tags
+        self._tags = tags
+
+    def update(self, uid, interests, slot=None):
+        """Replace a user's interests (an interests array as stored on the profile)."""
+        with self._lock:
+            previous = self._slots.get(uid)
+            self.remove(uid)
+            tag_ids = [self._tag_id(tag) for tag in normalize_interests(interests)]
+            if not tag_ids:
+                return
+            if slot is None:
+                slot = previous
+            if slot is None:
+                slot = self._next_slot
+            self._next_slot = max(self._next_slot, slot + 1)
+
+            for tag_id in tag_ids:
+                self._postings[tag_id].add(uid)
+            self._grow(slot + 1, len(tag_ids))
+            self._tags[slot, :len(tag_ids)] = tag_ids
+            self._slots[uid] = slot
+            self._idf = None
+
+    def remove(self, uid):
+        """Drop a user from the index."""
+        with self._lock:
+            slot = self._slots.pop(uid, None)
+            if slot is None:
+                return
+            for tag_id in self._tags[slot]:
+                if tag_id != NO_TAG:
+                    self._postings[tag_id].discard(uid)
+            self._tags[slot] = NO_TAG
+            self._idf = None
+
+    def users_with(self, interest):
+        """The UIDs of users listing an interest."""
+        with self._lock:
+            tag_id = self._tag_ids.get(normalize_interest(interest))
+            return set() if tag_id is None else set(self._postings[tag_id])
+
+    def _weights(self):
+        """
+        Smoothed IDF of every tag, log((N + 1) / (df + 1)) + 1, with a
+        trailing 0 that NO_TAG (-1) padding picks up.
+        """
+        if self._idf is None:
+            df = np.fromiter((len(users) for users in self._postings), dtype=np.float64, count=len(self._postings))
+            self._idf = np.append(np.log((len(self._slots) + 1) / (df + 1)) + 1, 0.0)
+        return self._idf
+
+    def score(self, interests, candidate_uids):
+        """
+        Similarity of an interests array to each candidate's interests.
+
+        Returns a float64 array aligned with `candidate_uids`, from 0 (nothing
+        in common, or no interests on either side) to 1 (the same tags).
+        """
+        with self._lock:
+            slots = np.fromiter(
+                map(self._slots.get, candidate_uids, repeat(-1)), dtype=np.int64, count=len(candidate_uids)
+            )
+            return self.score_slots(interests, slots)
+
+    def score_slots(self, interests, slots):
+        """`score` for candidates given by slot (-1 for a candidate without interests)."""
+        n = len(slots)
+        with self._lock:
+            tags = normalize_interests(interests)
+            if not tags or not n:
+                return np.zeros(n)
+
+            weights = self._weights()
+            known = [self._tag_ids[tag] for tag in tags if tag in self._tag_ids]
+            # Tags nobody else lists weigh as much as a tag with df 0
+            unknown_weight = (len(tags) - len(known)) * (np.log(len(self._slots) + 1) + 1)
+            viewer_total = weights[known].sum() + unknown_weight
+
+            in_range = (slots >= 0) & (slots < len(self._tags))
+            candidate_tags = self._tags[np.where(in_range, slots, 0)]
+            candidate_tags[~in_range] = NO_TAG
+
+        candidate_weights = weights[candidate_tags]
+        in_viewer = np.zeros(len(weights), dtype=bool)
+        in_viewer[known] = True
+        shared = (candidate_weights * in_viewer[candidate_tags]).sum(axis=1)
+        union = viewer_total + candidate_weights.sum(axis=1) - shared
+        return np.divide(shared, union, out=np.zeros(n), where=union > 0)
+
+
+def rank_by_interest(hits, scores, limit):
+    """
+    The best `limit` of (uid, distance_km or None) hits: highest interest
+    score first, nearest first among equal scores, unlocated ones last.
+    """
+    if not hits:
+        return []
+    distances = np.array([np.inf if distance is None else distance for _, distance in hits])
+    order = np.lexsort((distances, -np.asarray(scores)))[:limit]
+    return [hits[i] for i in order]
@@ -0,0 +1,274 @@
+# app/discovery/recommendations.py
+
+"""
+Collaborative-filtering recommendations from the like graph.
+
+Likes are implicit feedback: a sparse binary matrix A with one row per liker
+and one column per liked user (a "target"). The model is a rank-k truncated
+SVD, A ~ U diag(s) V^T, computed with a randomized range finder and a few
+power iterations, using only sparse products with A (NumPy, no SciPy). A
+liker's affinity for every target is then the row of U diag(s) V^T, which
+scores targets liked by people who like what they like.
+
+Refreshing the model is incremental between full fits: new likes are added
+to the matrix, likers and targets the model hasn't seen are folded in
+(u = a V / s for a liker's row a, v = a^T U / s for a target's column), and
+only the likers with new likes get new recommendation lists. A full fit
+(`scripts/compute_recommendations.py --full`) re-learns the factors and also
+drops deleted likes.
+
+Per-user lists of the TOP_K best targets not already liked are written to
+the `recommendations` collection, where discover's deck builder reads them
+and blends them into its ranking (app/discovery/decks.py).
+"""
+
+from datetime import datetime
+
+import numpy as np
+
+from app.utils.sync_token import as_utc
+
+# Rank of the factorization, extra random directions for the range finder, and power iterations
+FACTORS = 32
+OVERSAMPLES = 8
+POWER_ITERATIONS = 2
+
+# Targets kept per liker, and likers scored per matrix product
+TOP_K = 100
+SCORE_BATCH = 256
+
+
+def sparse_dot(rows, cols, n_rows, dense):
+    """A @ dense for the binary matrix with ones at (rows, cols), A being n_rows tall."""
+    out = np.empty((n_rows, dense.shape[1]), dtype=np.float32)
+    for j in range(dense.shape[1]):
+        out[:, j] = np.bincount(rows, weights=dense[cols, j], minlength=n_rows)
+    return out
+
+
+class LikeGraph:
+    """Deduplicated (liker, target) pairs, with UIDs numbered in order of appearance."""
+
+    def __init__(self):
+        self.liker_uids = []
+        self.target_uids = []
+        self._liker_ids = {}
+        self._target_ids = {}
+        self._keys = np.empty(0, dtype=np.int64)  # liker_id << 32 | target_id, sorted
+
+    @property
+    def rows(self):
+        return (self._keys >> 32).astype(np.int64)
+
+    @property
+    def cols(self):
+        return (self._keys & 0xFFFFFFFF).astype(np.int64)
+
+    def __len__(self):
+        return len(self._keys)
+
+    @staticmethod
+    def _ids(uids, id_map, uid_list):
+        ids = np.empty(len(uids), dtype=np.int64)
+        for i, uid in enumerate(uids):
+            uid_id = id_map.get(uid)
+            if uid_id is None:
+                uid_id = id_map[uid] = len(uid_list)
+                uid_list.append(uid)
+            ids[i] = uid_id
+        return ids
+
+    def liker_id(self, uid):
+        return self._liker_ids.get(uid)
+
+    def target_id(self, uid):
+        return self._target_ids.get(uid)
+
+    def add(self, liker_uids, target_uids):
+        """Add likes; returns the liker IDs that gained a like they didn't have."""
+        rows = self._ids(liker_uids, self._liker_ids, self.liker_uids)
+        cols = self._ids(target_uids, self._target_ids, self.target_uids)
+        keys = np.unique((rows << 32) | cols)
+        positions = np.searchsorted(self._keys, keys)
+        known = positions < len(self._keys)
+        known[known] = self._keys[positions[known]] == keys[known]
+        new_keys = keys[~known]
+        if len(new_keys):
+            self._keys = np.union1d(self._keys, new_keys)
+        return np.unique(new_keys >> 32)
+
+    def liked(self, liker_ids):
+        """Target IDs liked by each of the given likers."""
+        rows = self._keys >> 32
+        starts = np.searchsorted(rows, liker_ids, side='left')
+        ends = np.searchsorted(rows, liker_ids, side='right')
+        cols = self._keys & 0xFFFFFFFF
+        return [cols[start:end] for start, end in zip(starts, ends)]
+
+    def to_arrays(self):
+        return {
+            'liker_uids': np.array(self.liker_uids, dtype=str),
+            'target_uids': np.array(self.target_uids, dtype=str),
+            'keys': self._keys
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        graph = cls()
+        graph.liker_uids = [str(uid) for uid in arrays['liker_uids']]
+        graph.target_uids = [str(uid) for uid in arrays['target_uids']]
+        graph._liker_ids = {uid: i for i, uid in enumerate(graph.liker_uids)}
+        graph._target_ids = {uid: i for i, uid in enumerate(graph.target_uids)}
+        graph._keys = arrays['keys'].astype(np.int64)
+        return graph
+
+
+class RecommendationModel:
+    """Truncated SVD of the like matrix, refreshed by folding in new likers and targets."""
+
+    def __init__(self, graph, user_factors, singular_values, item_factors, synced_at=None):
+        self.graph = graph
+        self.user_factors = user_factors        # U, one row per liker
+        self.singular_values = singular_values  # s
+        self.item_factors = item_factors        # V, one row per target
+        self.synced_at = synced_at              # created_at of the newest like applied
+
+    @classmethod
+    def fit(cls, graph, factors=FACTORS, seed=0, synced_at=None):
+        """Factorize the like matrix from scratch."""
+        rows, cols = graph.rows, graph.cols
+        n_likers, n_targets = len(graph.liker_uids), len(graph.target_uids)
+        rank = max(1, min(factors, n_likers, n_targets))
+        width = min(rank + OVERSAMPLES, n_likers, n_targets)
+
+        # Range finder: an orthonormal basis for A @ (random directions), sharpened by power iterations
+        rng = np.random.default_rng(seed)
+        basis, _ = np.linalg.qr(sparse_dot(rows, cols, n_likers, rng.standard_normal((n_targets, width)).astype(np.float32)))
+        for _ in range(POWER_ITERATIONS):
+            back, _ = np.linalg.qr(sparse_dot(cols, rows, n_targets, basis))
+            basis, _ = np.linalg.qr(sparse_dot(rows, cols, n_likers, back))
+
+        # SVD of the small projection B = basis^T A (width x n_targets)
+        projected = sparse_dot(cols, rows, n_targets, basis).T
+        small_u, singular_values, vt = np.linalg.svd(projected, full_matrices=False)
+        user_factors = (basis @ small_u[:, :rank]).astype(np.float32)
+        return cls(graph, user_factors, singular_values[:rank].astype(np.float32), vt[:rank].T.astype(np.float32), synced_at)
+
+    def refresh(self, liker_uids, target_uids):
+        """
+        Add likes without refitting: likers with new likes are folded in
+        again from everything they liked, and new targets from everyone who
+        liked them. Returns the IDs of likers with new likes.
+        """
+        n_likers, n_targets = len(self.graph.liker_uids), len(self.graph.target_uids)
+        changed = self.graph.add(liker_uids, target_uids)
+        rank = len(self.singular_values)
+        scale = np.divide(1, self.singular_values, out=np.zeros(rank, dtype=np.float32), where=self.singular_values > 0)
+
+        rows, cols = self.graph.rows, self.graph.cols
+        self.user_factors = np.vstack([
+            self.user_factors, np.zeros((len(self.graph.liker_uids) - n_likers, rank), dtype=np.float32)
+        ])
+
+        # u = a V / s over the targets the model knows...
+        if len(changed):
+            affected = np.isin(rows, changed) & (cols < n_targets)
+            folded = np.zeros((len(changed), rank), dtype=np.float32)
+            np.add.at(folded, np.searchsorted(changed, rows[affected]), self.item_factors[cols[affected]])
+            self.user_factors[changed] = folded * scale
+
+        # ...then v = a^T U / s for targets it doesn't
+        new_targets = len(self.graph.target_uids) - n_targets
+        if new_targets:
+            fresh = cols >= n_targets
+            folded = np.zeros((new_targets, rank), dtype=np.float32)
+            np.add.at(folded, cols[fresh] - n_targets, self.user_factors[rows[fresh]])
+            self.item_factors = np.vstack([self.item_factors, folded * scale])
+
+        return changed
+
+    def recommend(self, liker_ids, top_k=TOP_K):
+        """
+        Yield (liker_uid, target_uids, scores) with each liker's best `top_k`
+        targets they haven't liked, best first (positive scores only).
+        """
+        weighted_users = self.user_factors * self.singular_values
+        item_factors_t = np.ascontiguousarray(self.item_factors.T)
+        liker_ids = np.asarray(liker_ids, dtype=np.int64)
+
+        for start in range(0, len(liker_ids), SCORE_BATCH):
+            batch = liker_ids[start:start + SCORE_BATCH]
+            scores = weighted_users[batch] @ item_factors_t
+            for i, (liker_id, liked) in enumerate(zip(batch, self.graph.liked(batch))):
+                row = scores[i]
+                row[liked] = -np.inf
+                liker_uid = self.graph.liker_uids[liker_id]
+                self_id = self.graph.target_id(liker_uid)
+                if self_id is not None:
+                    row[self_id] = -np.inf
+
+                k = min(top_k, len(row))
+                top = np.argpartition(-row, k - 1)[:k] if k < len(row) else np.arange(len(row))
+                top = top[np.argsort(-row[top], kind='stable')]
+                top = top[row[top] > 0]
+                yield liker_uid, [self.graph.target_uids[t] for t in top], [float(row[t]) for t in top]
+
+    def save(self, path):
+        """Write the model (graph, factors and sync point) to an .npz file."""
+        np.savez(
+            path,
+            user_factors=self.user_factors,
+            singular_values=self.singular_values,
+            item_factors=self.item_factors,
+            synced_at=np.array(self.synced_at.isoformat() if self.synced_at else ''),
+            **self.graph.to_arrays()
+        )
+
+    @classmethod
+    def load(cls, path):
+        """Read a model written by `save`."""
+        with np.load(path) as arrays:
+            synced_at = str(arrays['synced_at'])
+            return cls(
+                LikeGraph.from_arrays(arrays),
+                arrays['user_factors'],
+                arrays['singular_values'],
+                arrays['item_factors'],
+                datetime.fromisoformat(synced_at) if synced_at else None
+            )
+
+
+def refresh_recommendations(store, model=None, factors=FACTORS):
+    """
+    Bring recommendations up to date from the `likes` collection.
+
+    Without a model every like is read and factorized and every liker gets
+    a new list; with one, only likes newer than its sync point are read and
+    folded in, and only their likers' lists are rewritten. Returns the model
+    (None while there are no likes) and the number of lists written.
+    """
+    since = model.synced_at if model is not None else None
+    liker_uids, target_uids = [], []
+    for doc in store.likes.stream_since(since):
+        like = doc.to_dict() or {}
+        if like.get('liker_uid') and like.get('target_uid'):
+            liker_uids.append(like['liker_uid'])
+            target_uids.append(like['target_uid'])
+        if like.get('created_at'):
+            created_at = as_utc(like['created_at'])
+            since = created_at if since is None else max(since, created_at)
+
+    if model is None:
+        graph = LikeGraph()
+        graph.add(liker_uids, target_uids)
+        if not len(graph):
+            return None, 0
+        model = RecommendationModel.fit(graph, factors=factors, synced_at=since)
+        liker_ids = np.arange(len(graph.liker_uids))
+    else:
+        liker_ids = model.refresh(liker_uids, target_uids)
+        model.synced_at = since
+
+    written = store.recommendations.save_many(model.recommend(liker_ids))
+    print(f"Recommendations: {len(liker_uids)} likes read, {written} lists written")
+    return model, written
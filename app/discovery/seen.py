@@ -0,0 +1,199 @@
+# app/discovery/seen.py
+
+"""
+Compact set of the profiles a user has already swiped on.
+
+Discover has to leave out everyone the viewer liked or disliked. Querying
+`likes` and `dislikes` on every request costs a read per swipe, so each user
+keeps one small `seen` document instead:
+
+- up to EXACT_LIMIT swiped UIDs are stored as a plain list (exact)
+- past that, the list is folded into a Bloom filter sized for BLOOM_CAPACITY
+  entries at FALSE_POSITIVE_RATE
+
+A Bloom filter never misses a swiped profile, but can hide a profile that
+was never swiped. It is sized so that at most FALSE_POSITIVE_RATE of
+unswiped profiles are hits while it holds up to `capacity` entries (at least
+twice the swipes it was built from, so a new filter runs well under the
+rate); tests/test_discovery.py checks the rate at full capacity. Hits are
+checked against the exact record, the likes/dislikes collections, when a
+deck is built: the best-ranked profiles the filter hides (up to
+DISCOVERY_SEEN_CONFIRM_LIMIT, see decks.py) are looked up there, and those
+never swiped are saved in the set as `cleared`, which membership tests skip.
+Confirming only costs reads for hits that would otherwise have been
+returned, never for the whole swipe history. Once the filter holds more
+entries than it was sized for, it is rebuilt larger from the collections
+(and the cleared list starts over); clearing likes starts over with an exact
+list. The collections are also used when a user has no `seen` document yet.
+
+Bit positions come from a 128-bit BLAKE2b digest of the UID split
+into two 64-bit halves (double hashing), so the same UID maps to the same
+bits in every process, and the candidate index can test a whole column of
+precomputed hashes at once.
+"""
+
+import hashlib
+import math
+
+import numpy as np
+
+# Swiped UIDs kept as an exact list before switching to a Bloom filter
+EXACT_LIMIT = 500
+
+# Entries a new Bloom filter is sized for (at least this many), and its target false-positive rate
+BLOOM_CAPACITY = 2000
+FALSE_POSITIVE_RATE = 0.01
+
+_UINT64_MASK = (1 << 64) - 1
+
+
+def uid_hashes(uid):
+    """The two 64-bit hashes a UID's Bloom filter positions are derived from."""
+    digest = hashlib.blake2b(uid.encode('utf-8'), digest_size=16).digest()
+    h1 = int.from_bytes(digest[:8], 'little')
+    h2 = int.from_bytes(digest[8:], 'little') | 1  # Odd, so every step moves
+    return h1, h2
+
+
+def bloom_size(capacity, false_positive_rate=FALSE_POSITIVE_RATE):
+    """(num_bits, num_hashes) of a Bloom filter holding `capacity` entries at the given rate."""
+    num_bits = math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2)
+    num_bits = 8 * math.ceil(num_bits / 8)
+    num_hashes = max(1, round(num_bits / capacity * math.log(2)))
+    return num_bits, num_hashes
+
+
+class SeenSet:
+    """The UIDs one user has swiped on: an exact list, or a Bloom filter past EXACT_LIMIT."""
+
+    def __init__(self, uids=None):
+        """Start from the given UIDs, as a Bloom filter if there are more than EXACT_LIMIT."""
+        self.uids = set(uids or [])     # None once the set is a Bloom filter
+        self.cleared = set()            # Bloom filter hits confirmed never swiped
+        self.bits = None
+        self.num_bits = 0
+        self.num_hashes = 0
+        self.capacity = 0
+        self.count = len(self.uids)
+        if self.count > EXACT_LIMIT:
+            self._to_bloom(self.count)
+
+    @classmethod
+    def from_dict(cls, data):
+        """Load a set from its `seen` document (an empty set for None)."""
+        seen = cls()
+        if not data:
+            return seen
+        if data.get('mode') == 'bloom':
+            seen.uids = None
+            seen.bits = bytearray(data['bits'])
+            seen.num_bits = data['num_bits']
+            seen.num_hashes = data['num_hashes']
+            seen.capacity = data['capacity']
+            seen.count = data.get('count', 0)
+            seen.cleared = set(data.get('cleared') or [])
+        else:
+            seen.uids = set(data.get('uids') or [])
+            seen.count = len(seen.uids)
+        return seen
+
+    def to_dict(self):
+        """The fields of the set's `seen` document."""
+        if self.is_exact:
+            return {'mode': 'exact', 'uids': sorted(self.uids), 'count': self.count}
+        return {
+            'mode': 'bloom',
+            'bits': bytes(self.bits),
+            'num_bits': self.num_bits,
+            'num_hashes': self.num_hashes,
+            'capacity': self.capacity,
+            'count': self.count,
+            'cleared': sorted(self.cleared)
+        }
+
+    @property
+    def is_exact(self):
+        return self.uids is not None
+
+    @property
+    def over_capacity(self):
+        """Whether a Bloom filter holds more entries than it was sized for (and should be rebuilt)."""
+        return not self.is_exact and self.count > self.capacity
+
+    def __len__(self):
+        return self.count
+
+    def _positions(self, uid):
+        h1, h2 = uid_hashes(uid)
+        return [((h1 + i * h2) & _UINT64_MASK) % self.num_bits for i in range(self.num_hashes)]
+
+    def _to_bloom(self, count):
+        """Fold the exact list into a Bloom filter sized for at least twice `count` entries."""
+        uids = self.uids
+        self.capacity = max(BLOOM_CAPACITY, 2 * count)
+        self.num_bits, self.num_hashes = bloom_size(self.capacity)
+        self.bits = bytearray(self.num_bits // 8)
+        self.uids = None
+        self.cleared = set()
+        self.count = 0
+        for uid in uids:
+            self.add(uid)
+
+    def __contains__(self, uid):
+        if self.is_exact:
+            return uid in self.uids
+        if uid in self.cleared:
+            return False
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(uid))
+
+    def add(self, uid):
+        """Add a UID; returns False if it was (or, for a Bloom filter, may have been) in the set already."""
+        if uid in self:
+            return False
+        if self.is_exact:
+            self.uids.add(uid)
+            self.count += 1
+            if self.count > EXACT_LIMIT:
+                self._to_bloom(self.count)
+            return True
+        for position in self._positions(uid):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.cleared.discard(uid)
+        self.count += 1
+        return True
+
+    def contains_hashes(self, h1, h2):
+        """
+        Membership of many UIDs at once, given NumPy uint64 arrays of their
+        `uid_hashes`; only for Bloom filters (exact sets are looked up by UID).
+        """
+        bits = np.frombuffer(bytes(self.bits), dtype=np.uint8)
+        members = np.ones(len(h1), dtype=bool)
+        for i in range(self.num_hashes):
+            # uint64 arithmetic wraps like the & _UINT64_MASK in _positions
+            positions = (h1 + np.uint64(i) * h2) % np.uint64(self.num_bits)
+            shifts = (positions & np.uint64(7)).astype(np.uint8)
+            members &= ((bits[positions >> np.uint64(3)] >> shifts) & 1).astype(bool)
+        if self.cleared:
+            cleared = np.array([uid_hashes(uid)[0] for uid in self.cleared], dtype=np.uint64)
+            members &= ~np.isin(h1, cleared)
+        return members
+
+    def hits(self):
+        """The profiles a Bloom filter hides, as a set that hides everyone else (to rank them)."""
+        return _BloomHits(self)
+
+
+class _BloomHits:
+    """Inverse of a Bloom filter SeenSet: only its unconfirmed hits pass the candidate filters."""
+
+    is_exact = False
+
+    def __init__(self, seen):
+        self.seen = seen
+
+    def __len__(self):
+        return len(self.seen)
+
+    def contains_hashes(self, h1, h2):
+        return ~self.seen.contains_hashes(h1, h2)
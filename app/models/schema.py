@@ -22,6 +22,8 @@ USER_SCHEMA = {
         'city': 'string',               # City name
         'country': 'string'             # Country name
     },
+    'geohash': 'string',                # Geohash of location (app/utils/geo.py), for distance-based discovery
+    'random_key': 'number',             # Uniform random in [0, 1), set on creation, for sampling discover candidates
     'preferences': {                    # Dating preferences
         'age_min': 'number',            # Minimum age preference
         'age_max': 'number',            # Maximum age preference
@@ -33,6 +35,31 @@ USER_SCHEMA = {
     'updated_at': 'timestamp'           # When profile was last updated
 }
 
+# Public Profiles Collection (what other users see, kept by UserRepository writes)
+# Collection: 'public_profiles'
+PUBLIC_PROFILE_SCHEMA = {
+    # Document ID: User UID
+    'uid': 'string',                    # Set once the document was built from the whole profile
+    'display_name': 'string',           # Copied from the profile (PUBLIC_PROFILE_FIELDS)...
+    'bio': 'string',
+    'age': 'number',
+    'gender': 'string',
+    'interests': ['string'],
+    'height': 'number',
+    'education': 'string',
+    'job_title': 'string',
+    'drinking': 'string',
+    'smoking': 'string',
+    'looking_for': 'string',
+    'profile_completed': 'boolean',
+    'updated_at': 'timestamp',          # ...up to here
+    'location': {                       # The place only, never the coordinates
+        'city': 'string',
+        'country': 'string'
+    },
+    'photos': ['string']                # Photo URLs; inline photos as /api/profiles/{uid}/photos/{digest}
+}
+
 # Likes Collection
 # Collection: 'likes'
 LIKE_SCHEMA = {
@@ -51,15 +78,55 @@ DISLIKE_SCHEMA = {
     'created_at': 'timestamp'           # When dislike was created
 }
 
+# Seen Collection (profiles each user has swiped on, for discover)
+# Collection: 'seen'
+SEEN_SCHEMA = {
+    # Document ID: User UID
+    'mode': 'string',                   # 'exact' (uids list) or 'bloom' (Bloom filter), see app/discovery/seen.py
+    'uids': 'array',                    # Liked/disliked UIDs (exact mode, up to 500)
+    'bits': 'bytes',                    # Bloom filter bits (bloom mode)
+    'num_bits': 'number',               # Bloom filter size in bits (bloom mode)
+    'num_hashes': 'number',             # Bit positions per UID (bloom mode)
+    'capacity': 'number',               # Entries the filter was sized for; rebuilt from likes/dislikes past it
+    'count': 'number',                  # UIDs added
+    'cleared': 'array',                 # Filter hits checked against likes/dislikes and never swiped (bloom mode)
+    'updated_at': 'timestamp'           # When the set was last written
+}
+
+# Decks Collection (discover candidates ranked ahead of time)
+# Collection: 'decks'
+DECK_SCHEMA = {
+    # Document ID: User UID
+    'version': 'number',                # Build time in milliseconds; discover cursors carry it
+    'uids': 'array',                    # Candidate UIDs, best first (up to DISCOVERY_DECK_SIZE)
+    'distances': 'array',               # Distance in km to each candidate (null without locations)
+    'built_at': 'timestamp'             # When the deck was built
+}
+
+# Recommendations Collection (collaborative filtering over likes, for discover)
+# Collection: 'recommendations'
+RECOMMENDATION_SCHEMA = {
+    # Document ID: User UID
+    'uids': 'array',                    # Recommended UIDs, best first (up to 100)
+    'scores': 'array',                  # Score of each recommendation
+    'computed_at': 'timestamp'          # When scripts/compute_recommendations.py wrote the list
+}
+
 # Matches Collection
 # Collection: 'matches'
 MATCH_SCHEMA = {
-    # Document ID: Auto-generated
+    # Document ID: pair_key of the two UIDs
     'user1_uid': 'string',              # UID of first user
     'user2_uid': 'string',              # UID of second user
+    'participants': 'array',            # Sorted [user1_uid, user2_uid], for array_contains lookups
+    'pair_key': 'string',               # repositories.pair_key of the sorted UIDs (also the document ID)
     'created_at': 'timestamp',          # When match was created
     'active': 'boolean',                # Whether match is active
     'last_message_at': 'timestamp',     # When last message was sent (for sorting)
+    'last_message': 'map',              # Summary of the last message: id, sender_uid, content preview, created_at, image_url
+    'unread_counts': 'map',             # Unread message count per participant UID
+    'last_read_at': 'map',              # Read watermark per participant UID: messages sent to them up to this time are read
+    'updated_at': 'timestamp',          # Last change to the match or its messages (for delta sync)
     'unmatch_initiated_by': 'string',   # UID of user who initiated unmatch (if applicable)
     'unmatched_at': 'timestamp'         # When match was deactivated (if applicable)
 }
@@ -72,9 +139,10 @@ MESSAGE_SCHEMA = {
     'sender_uid': 'string',             # UID of user who sent the message
     'content': 'string',                # Text content of the message
     'created_at': 'timestamp',          # When message was sent
-    'read': 'boolean',                  # Whether message has been read
-    'read_at': 'timestamp',             # When message was read (if applicable)
-    'image_url': 'string'               # Optional URL if message contains an image
+    'read': 'boolean',                  # Legacy: whether message has been read (now the match's last_read_at)
+    'read_at': 'timestamp',             # Legacy: when message was read
+    'image_url': 'string',              # Optional URL if message contains an image
+    'updated_at': 'timestamp'           # When message was sent or last changed (for delta sync)
 }
 
 # Subscription Collection (for premium features)
@@ -0,0 +1,85 @@
+# app/realtime/__init__.py
+
+"""
+Push delivery of message changes and notifications over Server-Sent Events.
+
+`init_app` attaches a MatchEventHub bound to the app's data backend (the
+stream endpoint in `app.api.messages` subscribes to it) and an event bus for
+per-user notifications (new messages, new matches) that have to reach the
+worker holding the user's stream (`app.api.events`). Settings come from
+config:
+
+- EVENT_BUS: 'local' (single process) or 'unix' (gunicorn workers sharing
+  a Unix-socket broker)
+- EVENT_BUS_SOCKET: socket path of the broker for 'unix'
+
+- STREAM_MAX_CONNECTIONS: open streams per process
+- STREAM_MAX_PER_MATCH: open streams per match
+- STREAM_QUEUE_SIZE: undelivered events buffered per stream
+- STREAM_HEARTBEAT_INTERVAL: seconds between keep-alive comments
+- STREAM_IDLE_TIMEOUT: seconds without events before a stream is closed
+- STREAM_MAX_DURATION: seconds before any stream is closed (clients
+  reconnect and re-authenticate)
+"""
+
+from flask import current_app
+
+from app.realtime.bus import BUS_LOCAL, create_bus
+from app.realtime.hub import MatchEventHub, StreamLimitError
+
+DEFAULT_SETTINGS = {
+    'EVENT_BUS': BUS_LOCAL,
+    'EVENT_BUS_SOCKET': None,
+    'STREAM_MAX_CONNECTIONS': 1000,
+    'STREAM_MAX_PER_MATCH': 10,
+    'STREAM_QUEUE_SIZE': 100,
+    'STREAM_HEARTBEAT_INTERVAL': 15,
+    'STREAM_IDLE_TIMEOUT': 120,
+    'STREAM_MAX_DURATION': 600
+}
+
+
+def init_app(app, client):
+    """Attach a MatchEventHub for the given backend client and an event bus to the app."""
+    for key, value in DEFAULT_SETTINGS.items():
+        app.config.setdefault(key, value)
+
+    app.extensions['event_hub'] = MatchEventHub(
+        client,
+        max_connections=app.config['STREAM_MAX_CONNECTIONS'],
+        max_per_match=app.config['STREAM_MAX_PER_MATCH'],
+        queue_size=app.config['STREAM_QUEUE_SIZE']
+    )
+    app.extensions['event_bus'] = create_bus(
+        app.config['EVENT_BUS'],
+        path=app.config['EVENT_BUS_SOCKET']
+    )
+    return app.extensions['event_hub']
+
+
+def get_hub():
+    """Return the MatchEventHub of the current app."""
+    return current_app.extensions['event_hub']
+
+
+def get_bus():
+    """Return the event bus of the current app."""
+    return current_app.extensions['event_bus']
+
+
+def user_topic(uid):
+    """Event bus topic for notifications addressed to one user."""
+    return f"user:{uid}"
+
+
+def publish_event(topic, event):
+    """
+    Publish an event on the app's bus.
+
+    Notifications are best-effort, so a failure is logged and never fails
+    the request that triggered it.
+    """
+    try:
+        get_bus().publish(topic, event)
+    except Exception as e:
+        print(f"Error publishing event to {topic}: {str(e)}")
@@ -0,0 +1,209 @@
+# app/realtime/broker.py
+
+"""
+Unix-socket event broker for fan-out across worker processes on one host.
+
+Workers connect with `UnixSocketEventBus` and exchange newline-delimited
+JSON frames:
+
+- {"op": "sub", "topic": ...} / {"op": "unsub", "topic": ...}
+- {"op": "pub", "topic": ..., "event": {...}}
+- broker to worker: {"op": "event", "topic": ..., "event": {...}}
+
+Delivery is at-most-once: every connection has a bounded send queue, and
+events for a connection whose queue is full are dropped and counted rather
+than slowing down the publisher or the other workers.
+
+Normally one of the workers hosts the broker in a background thread (see
+`UnixSocketEventBus`); it can also be run on its own:
+
+    python -m app.realtime.broker --socket /tmp/lucent-events.sock
+"""
+
+import argparse
+import json
+import os
+import queue
+import socket
+import threading
+
+DEFAULT_SOCKET_PATH = '/tmp/lucent-events.sock'
+
+
+class _Connection:
+    """A connected worker: its topics and its bounded send queue."""
+
+    def __init__(self, sock, queue_size):
+        self.sock = sock
+        self.topics = set()
+        self.outbox = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+
+
+class EventBroker:
+    """Routes published events to the connections subscribed to their topic."""
+
+    def __init__(self, path=DEFAULT_SOCKET_PATH, queue_size=1000):
+        self.path = path
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._connections = set()
+        self._server = None
+        self._published = 0
+        self._delivered = 0
+        self._dropped = 0
+
+    def start(self):
+        """
+        Bind the socket and serve in daemon threads.
+
+        A socket file left behind by a dead broker is replaced.
+
+        Raises:
+            OSError: If another live broker already owns the socket
+        """
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            server.bind(self.path)
+        except OSError:
+            if _is_live(self.path):
+                server.close()
+                raise
+            os.unlink(self.path)
+            server.bind(self.path)
+
+        server.listen()
+        self._server = server
+        threading.Thread(target=self._accept_loop, name='event-broker', daemon=True).start()
+        return self
+
+    def stop(self):
+        """Close the socket and every connection."""
+        if self._server is not None:
+            server, self._server = self._server, None
+            _close(server)
+        with self._lock:
+            connections = list(self._connections)
+            self._connections.clear()
+        for connection in connections:
+            _close(connection.sock)
+
+    def stats(self):
+        """Return routing counters, topic subscriptions and per-connection queue depth."""
+        with self._lock:
+            return {
+                'connections': len(self._connections),
+                'subscriptions': sum(len(c.topics) for c in self._connections),
+                'published': self._published,
+                'delivered': self._delivered,
+                'dropped': self._dropped,
+                'queue_depths': [c.outbox.qsize() for c in self._connections]
+            }
+
+    def _accept_loop(self):
+        while self._server is not None:
+            try:
+                sock, _ = self._server.accept()
+            except OSError:
+                return
+
+            connection = _Connection(sock, self.queue_size)
+            with self._lock:
+                self._connections.add(connection)
+            threading.Thread(target=self._read_loop, args=(connection,), daemon=True).start()
+            threading.Thread(target=self._write_loop, args=(connection,), daemon=True).start()
+
+    def _read_loop(self, connection):
+        try:
+            for line in connection.sock.makefile('r', encoding='utf-8'):
+                try:
+                    frame = json.loads(line)
+                except ValueError:
+                    continue
+
+                op = frame.get('op')
+                if op == 'sub':
+                    with self._lock:
+                        connection.topics.add(frame['topic'])
+                elif op == 'unsub':
+                    with self._lock:
+                        connection.topics.discard(frame['topic'])
+                elif op == 'pub':
+                    self._route(frame['topic'], frame.get('event'))
+        except OSError:
+            pass
+        finally:
+            with self._lock:
+                self._connections.discard(connection)
+            _close(connection.sock)
+
+            # Wake the writer if it is idle; a busy one exits on its next failed send
+            try:
+                connection.outbox.put_nowait(None)
+            except queue.Full:
+                pass
+
+    def _write_loop(self, connection):
+        while True:
+            data = connection.outbox.get()
+            if data is None:
+                return
+            try:
+                connection.sock.sendall(data)
+            except OSError:
+                return
+
+    def _route(self, topic, event):
+        data = (json.dumps({'op': 'event', 'topic': topic, 'event': event}) + '\n').encode()
+        with self._lock:
+            self._published += 1
+            targets = [c for c in self._connections if topic in c.topics]
+
+        for connection in targets:
+            try:
+                connection.outbox.put_nowait(data)
+                delivered, dropped = 1, 0
+            except queue.Full:
+                connection.dropped += 1
+                delivered, dropped = 0, 1
+            with self._lock:
+                self._delivered += delivered
+                self._dropped += dropped
+
+
+def _is_live(path):
+    """Whether a broker is accepting connections on `path`."""
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+        return True
+    except OSError:
+        return False
+    finally:
+        probe.close()
+
+
+def _close(sock):
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+    sock.close()
+
+
+def main():
+    """Run a standalone broker until interrupted."""
+    parser = argparse.ArgumentParser(description='Run the Unix-socket event broker')
+    parser.add_argument('--socket', default=os.getenv('EVENT_BUS_SOCKET', DEFAULT_SOCKET_PATH))
+    args = parser.parse_args()
+
+    EventBroker(args.socket).start()
+    print(f"Event broker listening on {args.socket}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
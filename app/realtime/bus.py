@@ -0,0 +1,260 @@
+# app/realtime/bus.py
+
+"""
+Event bus for notifications that must reach every worker process.
+
+Handlers publish an event once (`bus.publish(topic, event)`); every process
+with a subscriber on the topic delivers it. Two implementations:
+
+- LocalEventBus: in-process only, for the dev server and tests
+- UnixSocketEventBus: connects to an EventBroker over a Unix socket so
+  gunicorn workers on one host share events. The first worker that finds
+  no broker hosts one in a background thread; if that worker exits, the
+  others reconnect and one of them takes over.
+
+Delivery is at-most-once: events published while disconnected, or that
+don't fit a bounded queue, are dropped and counted in `stats()`. Subscriber
+callbacks run on the bus's reader thread and must not block.
+"""
+
+import json
+import os
+import queue
+import socket
+import threading
+import time
+
+from app.realtime.broker import DEFAULT_SOCKET_PATH, EventBroker
+
+BUS_LOCAL = 'local'
+BUS_UNIX = 'unix'
+
+
+class EventBus:
+    """Topic-based publish/subscribe with local fan-out to callbacks."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}  # topic -> list of callbacks
+        self._counters = {'published': 0, 'delivered': 0, 'dropped': 0}
+
+    def publish(self, topic, event):
+        """Publish an event (a JSON-serializable dict) to a topic."""
+        raise NotImplementedError
+
+    def subscribe(self, topic, callback):
+        """Call `callback(topic, event)` for every event on `topic`."""
+        with self._lock:
+            callbacks = self._subscribers.setdefault(topic, [])
+            first = not callbacks
+            callbacks.append(callback)
+        if first:
+            self._topic_added(topic)
+
+    def unsubscribe(self, topic, callback):
+        """Stop calling `callback` for `topic`."""
+        with self._lock:
+            callbacks = self._subscribers.get(topic, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+            last = topic in self._subscribers and not callbacks
+            if last:
+                del self._subscribers[topic]
+        if last:
+            self._topic_removed(topic)
+
+    def stats(self):
+        """Return delivery counters and subscription counts."""
+        with self._lock:
+            return dict(
+                self._counters,
+                topics=len(self._subscribers),
+                subscribers=sum(len(c) for c in self._subscribers.values())
+            )
+
+    def close(self):
+        """Release any connections held by the bus."""
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def _dispatch(self, topic, event):
+        """Deliver an event to this process's callbacks for the topic."""
+        with self._lock:
+            callbacks = list(self._subscribers.get(topic, []))
+        for callback in callbacks:
+            callback(topic, event)
+        self._count('delivered', len(callbacks))
+
+    def _topic_added(self, topic):
+        pass
+
+    def _topic_removed(self, topic):
+        pass
+
+
+class LocalEventBus(EventBus):
+    """Delivers events synchronously within the current process."""
+
+    def publish(self, topic, event):
+        self._count('published')
+        self._dispatch(topic, event)
+
+
+class UnixSocketEventBus(EventBus):
+    """Shares events between processes through an EventBroker on a Unix socket."""
+
+    def __init__(self, path=DEFAULT_SOCKET_PATH, queue_size=1000, reconnect_delay=0.5):
+        super().__init__()
+        self.path = path
+        self.reconnect_delay = reconnect_delay
+        self._counters.update(reconnects=0)
+        self._outbox = queue.Queue(maxsize=queue_size)
+        self._sock = None
+        self._pid = None
+        self._broker = None
+        self._start_lock = threading.Lock()
+        self._closed = False
+
+    def publish(self, topic, event):
+        self._ensure_started()
+        self._count('published')
+        self._send({'op': 'pub', 'topic': topic, 'event': event})
+
+    def stats(self):
+        stats = super().stats()
+        stats['connected'] = self._sock is not None
+        stats['outbox_depth'] = self._outbox.qsize()
+        stats['hosts_broker'] = self._broker is not None
+        if self._broker is not None:
+            stats['broker'] = self._broker.stats()
+        return stats
+
+    def close(self):
+        self._closed = True
+        sock, self._sock = self._sock, None
+        if sock is not None:
+            # shutdown() also wakes the reader blocked on this socket
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+        if self._broker is not None:
+            self._broker.stop()
+            self._broker = None
+
+    def _topic_added(self, topic):
+        # A fresh connection subscribes to every current topic itself
+        if self._ensure_started():
+            return
+        self._send({'op': 'sub', 'topic': topic})
+
+    def _topic_removed(self, topic):
+        self._send({'op': 'unsub', 'topic': topic})
+
+    def _send(self, frame):
+        """Queue a frame for the writer thread; drop it if disconnected or backed up."""
+        if self._sock is None:
+            self._count('dropped')
+            return
+        try:
+            self._outbox.put_nowait((json.dumps(frame) + '\n').encode())
+        except queue.Full:
+            self._count('dropped')
+
+    def _ensure_started(self):
+        """
+        Connect on first use in each process (connections don't survive a fork).
+
+        Returns True if this call started the bus.
+        """
+        if self._pid == os.getpid():
+            return False
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return False
+            self._pid = os.getpid()
+            self._sock = None
+            self._broker = None
+            self._connect()
+            threading.Thread(target=self._read_loop, name='event-bus-reader', daemon=True).start()
+            threading.Thread(target=self._write_loop, name='event-bus-writer', daemon=True).start()
+            return True
+
+    def _connect(self):
+        """Connect to the broker, hosting one first if none is running."""
+        for attempt in range(2):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self.path)
+            except OSError:
+                sock.close()
+                if attempt == 0:
+                    try:
+                        self._broker = EventBroker(self.path).start()
+                    except OSError:
+                        # Another worker started one first
+                        pass
+                continue
+
+            # Re-subscribe this process's topics on the new connection
+            with self._lock:
+                topics = list(self._subscribers)
+            for topic in topics:
+                sock.sendall((json.dumps({'op': 'sub', 'topic': topic}) + '\n').encode())
+            self._sock = sock
+            return True
+        return False
+
+    def _read_loop(self):
+        while not self._closed:
+            sock = self._sock
+            if sock is None:
+                time.sleep(self.reconnect_delay)
+                if not self._closed and self._connect():
+                    self._count('reconnects')
+                continue
+
+            try:
+                for line in sock.makefile('r', encoding='utf-8'):
+                    try:
+                        frame = json.loads(line)
+                    except ValueError:
+                        continue
+                    if frame.get('op') == 'event':
+                        self._dispatch(frame['topic'], frame.get('event'))
+            except OSError:
+                pass
+
+            # Connection lost: events published until we reconnect are dropped
+            if self._sock is sock:
+                self._sock = None
+            sock.close()
+
+    def _write_loop(self):
+        while not self._closed:
+            data = self._outbox.get()
+            sock = self._sock
+            if sock is None:
+                self._count('dropped')
+                continue
+            try:
+                sock.sendall(data)
+            except OSError:
+                self._count('dropped')
+
+
+def create_bus(kind, **options):
+    """Create the event bus for a config name ('local' or 'unix')."""
+    if kind == BUS_LOCAL:
+        return LocalEventBus()
+
+    if kind == BUS_UNIX:
+        return UnixSocketEventBus(
+            path=options.get('path') or DEFAULT_SOCKET_PATH,
+            queue_size=options.get('queue_size', 1000)
+        )
+
+    raise ValueError(f"Unknown event bus: {kind}")
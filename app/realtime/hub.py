@@ -0,0 +1,143 @@
+# app/realtime/hub.py
+
+"""
+Fan-out of message and match changes to streaming subscribers.
+
+Each match with at least one open stream has exactly one pair of snapshot
+listeners: one on messages of that match changed after the first
+subscriber's watermark, and one on the match document itself, which holds
+the participants' read watermarks.
+Watermarks are sync-token times, i.e. Firestore commit times, never this
+server's clock, so skew can't hide a message written as a stream opens.
+Every subscriber only gets changes after its own watermark (it replays
+anything older it is missing) in its own bounded queue; the listener callback
+only enqueues, so a slow client can never stall the listener or the other
+subscribers. A subscriber whose queue fills up is flagged as overflowed and
+should be disconnected (it can resume from its last event ID).
+
+The same code runs on Firestore, where `on_snapshot` starts a watch stream,
+and on the in-memory backend, where `on_snapshot` is an in-process pub/sub.
+"""
+
+import threading
+
+from google.cloud.firestore_v1.watch import ChangeType
+
+from app.realtime.subscription import Subscription
+from app.utils.sync_token import as_utc
+
+
+class StreamLimitError(Exception):
+    """Raised when opening a stream would exceed a connection limit."""
+
+
+class _MatchChannel:
+    """The shared listener and subscribers of one match."""
+
+    def __init__(self):
+        # Replaced, never mutated, so the listener thread can iterate it without a lock
+        self.subscribers = frozenset()
+        self.watches = ()
+
+    def on_snapshot(self, docs, changes, read_time):
+        for change in changes:
+            if change.type == ChangeType.REMOVED:
+                continue
+            updated_at = (change.document.to_dict() or {}).get('updated_at')
+            for subscription in self.subscribers:
+                if updated_at is not None and as_utc(updated_at) > subscription.since:
+                    subscription.publish(change.document)
+
+
+class MatchEventHub:
+    """Multiplexes match streams onto one set of snapshot listeners per match."""
+
+    def __init__(self, client, max_connections=1000, max_per_match=10, queue_size=100):
+        self.client = client
+        self.max_connections = max_connections
+        self.max_per_match = max_per_match
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._channels = {}
+        self._connections = 0
+
+    def subscribe(self, match_id, since):
+        """
+        Open a subscription to changes to a match and its messages after `since`.
+
+        Queued items are document snapshots, of a message or of the match
+        (told apart by `snapshot.reference.parent.id`).
+
+        `since` is the subscriber's watermark: the time of the client's sync
+        token, or the match's own last change. Changes made before the
+        subscription opened may be missing (the listener may be older, or
+        newer), so the caller replays changes after `since` once subscribed.
+
+        Raises:
+            StreamLimitError: If the server or the match has too many open streams
+        """
+        with self._lock:
+            if self._connections >= self.max_connections:
+                raise StreamLimitError("Too many open streams, try again later")
+
+            channel = self._channels.get(match_id)
+            if channel is not None and len(channel.subscribers) >= self.max_per_match:
+                raise StreamLimitError("Too many open streams for this match")
+
+            subscription = Subscription(self.queue_size, on_close=self.unsubscribe)
+            subscription.match_id = match_id
+            subscription.since = as_utc(since)
+            self._connections += 1
+
+            if channel is None:
+                channel = _MatchChannel()
+                channel.subscribers = frozenset([subscription])
+                self._channels[match_id] = channel
+                channel.watches = self._listen(match_id, channel, subscription.since)
+            else:
+                channel.subscribers = channel.subscribers | {subscription}
+
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Remove a subscription, stopping the match's listeners when it was the last one."""
+        watches = ()
+        with self._lock:
+            channel = self._channels.get(subscription.match_id)
+            if channel is None or subscription not in channel.subscribers:
+                return
+
+            channel.subscribers = channel.subscribers - {subscription}
+            self._connections -= 1
+
+            if not channel.subscribers:
+                del self._channels[subscription.match_id]
+                watches = channel.watches
+
+        for watch in watches:
+            watch.unsubscribe()
+
+    def stats(self):
+        """Return open connection and listener counts."""
+        with self._lock:
+            return {
+                'connections': self._connections,
+                'listeners': len(self._channels),
+                'max_connections': self.max_connections,
+                'max_per_match': self.max_per_match
+            }
+
+    def _listen(self, match_id, channel, since):
+        """Start the snapshot listeners for a match and its messages changed after `since`."""
+        query = self.client.collection('messages').where(
+            'match_id', '==', match_id
+        ).where(
+            'updated_at', '>', since
+        )
+        message_watch = query.on_snapshot(channel.on_snapshot)
+        try:
+            match_watch = self.client.collection('matches').document(match_id).on_snapshot(channel.on_snapshot)
+        except Exception:
+            message_watch.unsubscribe()
+            raise
+        return (message_watch, match_watch)
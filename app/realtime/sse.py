@@ -0,0 +1,73 @@
+# app/realtime/sse.py
+
+"""Server-Sent Events response helpers shared by the streaming endpoints."""
+
+import time
+
+from flask import Response, current_app, stream_with_context
+
+# How long EventSource waits before reconnecting, in milliseconds
+RETRY_MS = 3000
+
+
+def format_event(event, data, event_id=None):
+    """Format one SSE event; `data` must already be serialized."""
+    lines = []
+    if event_id:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {data}")
+    return '\n'.join(lines) + '\n\n'
+
+
+def event_stream(subscription, render, backlog=(), flush=None):
+    """
+    Build an SSE response that relays a subscription's events.
+
+    `render(item)` turns a queued item into formatted SSE text. Items in
+    `backlog` are sent first. Events are relayed in batches: the backlog,
+    then whatever is queued at once; `flush()`, if given, is called after
+    each batch and returns SSE text to send (or ''). Keep-alive comments are sent every
+    STREAM_HEARTBEAT_INTERVAL seconds; the stream ends after
+    STREAM_IDLE_TIMEOUT seconds without events, after STREAM_MAX_DURATION
+    seconds, or when the subscriber's queue overflows. The subscription is
+    always closed when the stream ends.
+    """
+    heartbeat = current_app.config['STREAM_HEARTBEAT_INTERVAL']
+    idle_timeout = current_app.config['STREAM_IDLE_TIMEOUT']
+    max_duration = current_app.config['STREAM_MAX_DURATION']
+
+    def generate():
+        try:
+            yield f"retry: {RETRY_MS}\n\n"
+
+            for item in backlog:
+                yield render(item)
+            if flush is not None:
+                yield flush()
+
+            opened_at = last_event_at = time.monotonic()
+            while not subscription.overflowed:
+                now = time.monotonic()
+                if now - opened_at >= max_duration or now - last_event_at >= idle_timeout:
+                    break
+
+                item = subscription.get(timeout=min(heartbeat, idle_timeout - (now - last_event_at)))
+                if item is None:
+                    yield ": keep-alive\n\n"
+                    continue
+
+                yield render(item)
+                while (item := subscription.get(timeout=0)) is not None:
+                    yield render(item)
+                if flush is not None:
+                    yield flush()
+                last_event_at = time.monotonic()
+        finally:
+            subscription.close()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
@@ -0,0 +1,34 @@
+# app/realtime/subscription.py
+
+"""Bounded per-client event queue shared by the event hub and the event bus."""
+
+import queue
+
+
+class Subscription:
+    """One client's queue of pending events."""
+
+    def __init__(self, queue_size, on_close=None):
+        self.overflowed = False
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._on_close = on_close
+
+    def publish(self, item):
+        """Enqueue an event without blocking; a full queue flags the subscriber as overflowed."""
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout):
+        """Return the next event, or None after `timeout` seconds."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        """Stop receiving events (idempotent)."""
+        if self._on_close is not None:
+            on_close, self._on_close = self._on_close, None
+            on_close(self)
@@ -1,10 +1,32 @@
 # app/utils/decorators.py
 
 from functools import wraps
-from flask import request, jsonify
+from flask import request, jsonify, current_app
 from firebase_admin import auth, exceptions
-import json
-import base64
+from app.utils.lazy_user import LazyUser
+from app.utils.stream_token import verify_stream_token
+from app.utils.token_cache import token_cache
+from app.utils.token_verifier import (
+    TOKEN_TYPE_CUSTOM, classify_token, verify_custom_token, verification_stats
+)
+
+def _verify_token(token):
+    """Verify a bearer token and return its claims, or None if it is invalid."""
+    # Route the token to the right verifier instead of failing over on exceptions
+    token_type, _ = classify_token(token)
+    stats = verification_stats[token_type]
+    
+    try:
+        with stats.time():
+            if token_type == TOKEN_TYPE_CUSTOM:
+                # Tokens minted by /login and /get-test-token are checked locally
+                return verify_custom_token(token)
+            
+            # ID tokens (and anything unrecognised) go to Firebase Auth
+            return auth.verify_id_token(token)
+    except Exception as e:
+        print(f"Error verifying {token_type} token: {e}")
+        return None
 
 def token_required(f):
     """Decorator to check for valid Firebase token."""
@@ -26,47 +48,22 @@ def token_required(f):
         try:
             uid = None
             
-            # Try to verify as ID token first
-            try:
-                decoded_token = auth.verify_id_token(token)
-                uid = decoded_token['uid']
-            except Exception as e:
-                # If verification fails, try to extract uid from custom token
-                # Custom token format: header.payload.signature
-                try:
-                    # Split token into parts
-                    token_parts = token.split('.')
-                    if len(token_parts) >= 2:
-                        # Get the payload part (second part)
-                        payload = token_parts[1]
-                        
-                        # Add padding if needed
-                        payload += '=' * ((4 - len(payload) % 4) % 4)
-                        
-                        # Decode from base64
-                        decoded_bytes = base64.b64decode(payload)
-                        decoded_str = decoded_bytes.decode('utf-8')
-                        
-                        # Parse JSON
-                        payload_data = json.loads(decoded_str)
-                        
-                        # Extract uid
-                        if 'uid' in payload_data:
-                            uid = payload_data['uid']
-                except Exception as jwt_error:
-                    print(f"Error extracting from token: {jwt_error}")
+            # Reuse claims from an earlier verification of the same token
+            claims = token_cache.get(token)
             
-            if not uid:
-                return jsonify({'message': 'Could not extract user ID from token'}), 401
+            if claims is None:
+                claims = _verify_token(token)
+                if claims and claims.get('uid'):
+                    token_cache.set(token, claims)
             
-            # Get user data from Firestore
-            from app.config.firebase import db
-            user_doc = db.collection('users').document(uid).get()
+            if claims:
+                uid = claims.get('uid')
             
-            if not user_doc.exists:
-                return jsonify({'message': 'User not found!'}), 404
+            if not uid:
+                return jsonify({'message': 'Could not extract user ID from token'}), 401
             
-            current_user = user_doc.to_dict()
+            # The user document is only fetched if a handler reads more than the uid
+            current_user = LazyUser(uid, claims)
             
         except Exception as e:
             return jsonify({'message': f'Token is invalid! {str(e)}'}), 401
@@ -76,3 +73,69 @@ def token_required(f):
         
     return decorated
 
+def stream_token_required(f):
+    """
+    Decorator for event stream endpoints.
+    
+    Accepts a `?stream_token=` from /api/auth/stream-token, since EventSource
+    can't send headers, and otherwise falls back to the bearer token.
+    """
+    bearer_protected = token_required(f)
+    
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        stream_token = request.args.get('stream_token')
+        if not stream_token:
+            return bearer_protected(*args, **kwargs)
+        
+        try:
+            uid = verify_stream_token(stream_token)
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 401
+        
+        return f(current_user=LazyUser(uid, {'uid': uid}), *args, **kwargs)
+        
+    return decorated
+
+def user_required(f):
+    """
+    Decorator for endpoints that write on the current user's behalf; goes
+    under @token_required.
+    
+    A valid token can outlive its user document. Only the UID is needed to
+    write, so without this a deleted user could keep liking, messaging and
+    editing; it costs the one masked read of the user document.
+    """
+    @wraps(f)
+    def decorated(current_user, *args, **kwargs):
+        if not current_user.exists:
+            return jsonify({'message': 'User not found!'}), 404
+        
+        return f(current_user=current_user, *args, **kwargs)
+        
+    return decorated
+
+def admin_required(f):
+    """
+    Decorator for operator-only endpoints; goes under @token_required.
+    
+    Admins are the UIDs in the ADMIN_UIDS config list and users whose token
+    carries an `admin: true` custom claim: at the top level of an ID token,
+    or under `claims` in a custom token (where create_custom_token puts
+    developer claims).
+    """
+    @wraps(f)
+    def decorated(current_user, *args, **kwargs):
+        claims = current_user.claims
+        developer_claims = claims.get('claims') if isinstance(claims.get('claims'), dict) else {}
+        is_admin = (
+            current_user['uid'] in current_app.config.get('ADMIN_UIDS', [])
+            or claims.get('admin') is True
+            or developer_claims.get('admin') is True
+        )
+        if not is_admin:
+            return jsonify({'message': 'Admin access required!'}), 403
+        
+        return f(current_user=current_user, *args, **kwargs)
+        
+    return decorated
@@ -0,0 +1,62 @@
+# app/utils/fields.py
+
+"""
+Sparse fieldsets: the `fields` query parameter.
+
+`?fields=display_name,photos` asks for only those fields of each object in a
+response, with dots naming fields inside objects (`other_user.display_name`).
+Endpoints turn the selection into Firestore field masks for the documents
+they read, so fields nobody asked for (inline photos above all) are neither
+fetched nor encoded, and trim the objects they build with `select_fields`.
+"""
+
+import re
+
+from flask import request
+
+# Most field paths one request can select
+MAX_FIELDS = 50
+
+_FIELD_PATH = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)*$')
+
+
+def requested_fields():
+    """
+    Return the field paths in the request's `fields` parameter, or None without one.
+
+    Raises:
+        ValueError: If the parameter is empty, too long or has a malformed path
+    """
+    value = request.args.get('fields')
+    if value is None:
+        return None
+
+    fields = list(dict.fromkeys(field.strip() for field in value.split(',') if field.strip()))
+    if not fields or len(fields) > MAX_FIELDS or not all(_FIELD_PATH.match(field) for field in fields):
+        raise ValueError("Invalid fields")
+    return fields
+
+
+def wants(fields, name):
+    """Whether a selection (None for everything) includes the field `name`, or part of it."""
+    if fields is None:
+        return True
+    return any(field == name or field.startswith(name + '.') or name.startswith(field + '.') for field in fields)
+
+
+def nested_fields(fields, name):
+    """The paths a selection asks for inside the field `name` (None for all of it)."""
+    if fields is None or name in fields:
+        return None
+    return [field[len(name) + 1:] for field in fields if field.startswith(name + '.')]
+
+
+def select_fields(data, fields):
+    """A copy of `data` with only the selected field paths (`data` itself for None)."""
+    if fields is None or not isinstance(data, dict):
+        return data
+    selected = {}
+    for name in dict.fromkeys(field.split('.', 1)[0] for field in fields):
+        if name in data:
+            selected[name] = select_fields(data[name], nested_fields(fields, name))
+    return selected
@@ -0,0 +1,160 @@
+# app/utils/geo.py
+
+"""
+Geohash encoding and radius queries for distance-based discovery.
+
+A profile's `location` is indexed by a `geohash` string: nearby points share
+a prefix, so the profiles inside a cell are one range query on `geohash`.
+A radius is covered by the cell containing the center and its eight
+neighbours, at the finest precision whose cells are still at least as large
+as the radius. Results of the range queries are a superset of the circle and
+are filtered exactly with the haversine distance.
+"""
+
+import math
+
+# Characters of geohash stored on each profile (cells of about 5 m)
+GEOHASH_PRECISION = 9
+
+EARTH_RADIUS_KM = 6371.0088
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+# Kilometres per degree of latitude, and of longitude at the equator
+_KM_PER_DEGREE_LAT = 110.574
+_KM_PER_DEGREE_LON = 111.320
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    """Encode a coordinate as a geohash of `precision` characters."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True  # Bits alternate between longitude and latitude, longitude first
+
+    while len(chars) < precision:
+        value, value_range = (longitude, lon_range) if even else (latitude, lat_range)
+        mid = (value_range[0] + value_range[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            value_range[0] = mid
+        else:
+            bits <<= 1
+            value_range[1] = mid
+        even = not even
+
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+
+    return ''.join(chars)
+
+
+def decode_geohash_bounds(geohash):
+    """Return (south, west, north, east) of a geohash cell in degrees."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+
+    for char in geohash:
+        bits = _BASE32.index(char)
+        for shift in range(4, -1, -1):
+            value_range = lon_range if even else lat_range
+            mid = (value_range[0] + value_range[1]) / 2
+            if bits >> shift & 1:
+                value_range[0] = mid
+            else:
+                value_range[1] = mid
+            even = not even
+
+    return lat_range[0], lon_range[0], lat_range[1], lon_range[1]
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two coordinates in kilometres."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = math.radians(lat2 - lat1)
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def valid_coordinates(location):
+    """Return (latitude, longitude) from a location map, or None if missing or out of range."""
+    if not isinstance(location, dict):
+        return None
+
+    latitude = location.get('latitude')
+    longitude = location.get('longitude')
+    if isinstance(latitude, bool) or isinstance(longitude, bool):
+        return None
+    if not isinstance(latitude, (int, float)) or not isinstance(longitude, (int, float)):
+        return None
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return None
+    return float(latitude), float(longitude)
+
+
+def _cell_size_degrees(precision):
+    """(height, width) of a geohash cell in degrees."""
+    total_bits = 5 * precision
+    lon_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def _query_precision(latitude, radius_km):
+    """The finest precision whose cells are at least `radius_km` across at this latitude (0 if none)."""
+    cos_lat = max(math.cos(math.radians(latitude)), 1e-6)
+    precision = 0
+    for candidate in range(1, GEOHASH_PRECISION + 1):
+        height, width = _cell_size_degrees(candidate)
+        if height * _KM_PER_DEGREE_LAT < radius_km or width * _KM_PER_DEGREE_LON * cos_lat < radius_km:
+            break
+        precision = candidate
+    return precision
+
+
+def geohash_query_ranges(latitude, longitude, radius_km):
+    """
+    Return sorted (start, end) geohash ranges covering a circle.
+
+    Each range selects `start <= geohash < end`. Ranges are the center cell
+    and its neighbours at one precision, merged where adjacent, so there are
+    at most nine. A radius wider than the largest cells is one range over
+    every geohash.
+    """
+    precision = _query_precision(latitude, radius_km)
+    if precision == 0:
+        return [(_BASE32[0], '~')]
+    height, width = _cell_size_degrees(precision)
+
+    prefixes = set()
+    for d_lat in (-height, 0, height):
+        lat = min(max(latitude + d_lat, -90.0), 90.0)
+        for d_lon in (-width, 0, width):
+            lon = (longitude + d_lon + 180.0) % 360.0 - 180.0
+            prefixes.add(encode_geohash(lat, lon, precision))
+
+    ranges = []
+    for prefix in sorted(prefixes):
+        # The next cell at this precision, or past every extension of a last cell
+        if prefix[-1] != _BASE32[-1]:
+            end = prefix[:-1] + _BASE32[_BASE32.index(prefix[-1]) + 1]
+        else:
+            end = prefix + '~'
+        if ranges and ranges[-1][1] == prefix:
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((prefix, end))
+    return ranges
+
+
+def geohash_fields(location):
+    """The `geohash` field stored alongside a profile's location (None if it has no valid coordinates)."""
+    coordinates = valid_coordinates(location)
+    return {'geohash': encode_geohash(*coordinates) if coordinates else None}
@@ -1,14 +1,23 @@
 # app/utils/helpers.py
 
+
 def format_timestamp(timestamp):
     """Format a Firestore timestamp to ISO format."""
     if timestamp:
         return timestamp.isoformat()
     return None
 
+
 def calculate_age(birth_date):
     """Calculate age from birth date."""
     from datetime import datetime
     today = datetime.now()
     age = today.year - birth_date.year - ((today.month, today.day) < (birth_date.month, birth_date.day))
-    return age
\ No newline at end of file
+    return age
+
+
+def absolute_photo_urls(photos):
+    """Photo references from a public profile as URLs, the served paths resolved against this API's root."""
+    from flask import request
+    root = request.url_root.rstrip('/')
+    return [root + photo if photo.startswith('/') else photo for photo in photos or []]
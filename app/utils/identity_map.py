@@ -0,0 +1,124 @@
+# app/utils/identity_map.py
+
+"""
+Request-scoped identity map for Firestore document reads.
+
+Every `get_document` call within one request returns the snapshot that was
+already loaded for the same document instead of issuing another read. The
+map lives on `flask.g`, so it is discarded when the request ends and never
+serves data across requests. `get_documents` does the same for batched
+reads and only fetches the documents that aren't in the map yet.
+
+A snapshot loaded with a field mask only satisfies later reads whose mask is
+a subset of it; a full snapshot satisfies any read.
+"""
+
+from flask import g, has_app_context
+
+
+def _get_map():
+    """Return the identity map for the current request, creating it if needed."""
+    if not has_app_context():
+        return None
+
+    if not hasattr(g, '_document_identity_map'):
+        g._document_identity_map = {}
+        g._document_reads_saved = 0
+    return g._document_identity_map
+
+
+def _covers(entry, wanted):
+    """Whether a cached (snapshot, loaded_fields) entry satisfies a read of `wanted`."""
+    _, loaded_fields = entry
+    return loaded_fields is None or (wanted is not None and wanted <= loaded_fields)
+
+
+def get_document(db, collection, doc_id, field_paths=None):
+    """
+    Read a document, reusing a snapshot already loaded in this request.
+
+    Args:
+        db: Firestore client to read from on a miss
+        collection: Collection name
+        doc_id: Document ID
+        field_paths: Optional list of fields to fetch (Firestore field mask)
+
+    Returns:
+        The document snapshot
+    """
+    identity_map = _get_map()
+    key = (collection, doc_id)
+    wanted = frozenset(field_paths) if field_paths else None
+
+    # A full snapshot covers any mask; a masked one only covers its subsets
+    if identity_map is not None and key in identity_map and _covers(identity_map[key], wanted):
+        g._document_reads_saved += 1
+        return identity_map[key][0]
+
+    doc_ref = db.collection(collection).document(doc_id)
+    if field_paths:
+        snapshot = doc_ref.get(field_paths=list(field_paths))
+    else:
+        snapshot = doc_ref.get()
+
+    if identity_map is not None:
+        identity_map[key] = (snapshot, wanted)
+    return snapshot
+
+
+def get_documents(db, collection, doc_ids, field_paths=None, chunk_size=100):
+    """
+    Read several documents with chunked `get_all` calls.
+
+    Documents already in the identity map are not fetched again; the rest
+    are loaded `chunk_size` at a time, one round trip per chunk.
+
+    Args:
+        db: Firestore client to read from on a miss
+        collection: Collection name
+        doc_ids: Document IDs (duplicates are read once)
+        field_paths: Optional list of fields to fetch (Firestore field mask)
+        chunk_size: Maximum number of documents per `get_all` call
+
+    Returns:
+        Dict of document ID to snapshot (missing documents have exists=False)
+    """
+    identity_map = _get_map()
+    wanted = frozenset(field_paths) if field_paths else None
+
+    snapshots = {}
+    missing = []
+    for doc_id in dict.fromkeys(doc_ids):
+        entry = identity_map.get((collection, doc_id)) if identity_map is not None else None
+        if entry is not None and _covers(entry, wanted):
+            g._document_reads_saved += 1
+            snapshots[doc_id] = entry[0]
+        else:
+            missing.append(doc_id)
+
+    collection_ref = db.collection(collection)
+    for start in range(0, len(missing), chunk_size):
+        refs = [collection_ref.document(doc_id) for doc_id in missing[start:start + chunk_size]]
+        kwargs = {'field_paths': list(field_paths)} if field_paths else {}
+
+        # get_all doesn't preserve request order, so key results by ID
+        for snapshot in db.get_all(refs, **kwargs):
+            snapshots[snapshot.id] = snapshot
+            if identity_map is not None:
+                identity_map[(collection, snapshot.id)] = (snapshot, wanted)
+
+    return snapshots
+
+
+def invalidate_document(collection, doc_id):
+    """Drop a document from the identity map after it has been written."""
+    identity_map = _get_map()
+    if identity_map is not None:
+        identity_map.pop((collection, doc_id), None)
+
+
+def reads_saved():
+    """Return the number of reads served from the identity map in this request."""
+    if not has_app_context():
+        return 0
+    return getattr(g, '_document_reads_saved', 0)
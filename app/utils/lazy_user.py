@@ -0,0 +1,79 @@
+# app/utils/lazy_user.py
+
+"""
+Lazily loaded `current_user` passed to handlers by `token_required`.
+
+Most handlers only need `current_user['uid']`, which is known from the
+verified token. The `users/{uid}` document is fetched on first access to any
+other field, with a field mask that leaves out the (potentially megabytes of
+base64) `photos` array.
+"""
+
+from collections.abc import Mapping
+
+# Fields fetched for current_user - photos are deliberately left out
+CURRENT_USER_FIELDS = [
+    'uid', 'email', 'display_name', 'profile_completed', 'bio', 'age',
+    'gender', 'interests', 'location', 'preferences', 'height', 'education',
+    'job_title', 'drinking', 'smoking', 'looking_for', 'average_rating',
+    'created_at', 'updated_at'
+]
+
+
+class LazyUser(Mapping):
+    """Read-only mapping over the current user's document, loaded on demand."""
+
+    def __init__(self, uid, claims=None):
+        self._uid = uid
+        self._claims = claims or {}
+        self._data = None
+        self._exists = None
+
+    def _load(self):
+        """Fetch the masked user document once."""
+        if self._data is None:
+            from app.data import store
+            user_doc = store.users.get(self._uid, fields=CURRENT_USER_FIELDS)
+
+            self._exists = bool(user_doc.exists)
+            self._data = (user_doc.to_dict() or {}) if self._exists else {}
+            self._data['uid'] = self._uid
+        return self._data
+
+    @property
+    def loaded(self):
+        """Whether the user document has been fetched."""
+        return self._data is not None
+
+    @property
+    def claims(self):
+        """The verified token's claims."""
+        return self._claims
+
+    @property
+    def exists(self):
+        """Whether the user document exists (fetches it if needed)."""
+        self._load()
+        return self._exists
+
+    def __getitem__(self, key):
+        # Answer from the verified token when we can
+        if key == 'uid':
+            return self._uid
+        if key == 'email' and self._data is None and self._claims.get('email'):
+            return self._claims['email']
+        return self._load()[key]
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __len__(self):
+        return len(self._load())
+
+    def to_dict(self):
+        """Return a plain dict copy of the loaded fields."""
+        return dict(self._load())
+
+    def __repr__(self):
+        state = 'loaded' if self.loaded else 'unloaded'
+        return f"<LazyUser uid={self._uid!r} {state}>"
@@ -0,0 +1,61 @@
+# app/utils/metrics.py
+
+"""Lightweight in-process counters for hot-path instrumentation."""
+
+import threading
+import time
+from contextlib import contextmanager
+
+
+class LatencyStats:
+    """Thread-safe call counter with cumulative and peak latency."""
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self.count = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def record(self, seconds, error=False):
+        """Record a single call that took `seconds`."""
+        with self._lock:
+            self.count += 1
+            if error:
+                self.errors += 1
+            self.total_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+
+    @contextmanager
+    def time(self):
+        """Context manager that records the wrapped block's duration."""
+        start = time.perf_counter()
+        error = False
+        try:
+            yield
+        except Exception:
+            error = True
+            raise
+        finally:
+            self.record(time.perf_counter() - start, error=error)
+
+    def reset(self):
+        """Reset all counters."""
+        with self._lock:
+            self.count = 0
+            self.errors = 0
+            self.total_seconds = 0.0
+            self.max_seconds = 0.0
+
+    def stats(self):
+        """Return counters with latencies in milliseconds."""
+        with self._lock:
+            avg = self.total_seconds / self.count if self.count else 0.0
+            return {
+                'count': self.count,
+                'errors': self.errors,
+                'avg_ms': round(avg * 1000, 3),
+                'max_ms': round(self.max_seconds * 1000, 3),
+                'total_ms': round(self.total_seconds * 1000, 3)
+            }
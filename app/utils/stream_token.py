@@ -0,0 +1,43 @@
+# app/utils/stream_token.py
+
+"""
+Short-lived tokens for opening event streams.
+
+Browsers' EventSource can't send an Authorization header, so clients first
+exchange their bearer token for a stream token at /api/auth/stream-token and
+pass it as `?stream_token=`. A stream token is signed with SECRET_KEY, names
+one user and expires after STREAM_TOKEN_LIFETIME seconds; it only opens
+streams, which are read-only. Query strings end up in access logs, hence the
+short lifetime.
+"""
+
+from flask import current_app
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+# Seconds a stream token can be used to open (or reopen) a stream
+STREAM_TOKEN_LIFETIME = 300
+
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt='stream-token')
+
+
+def issue_stream_token(uid):
+    """Return a stream token for `uid`."""
+    return _serializer().dumps({'uid': uid})
+
+
+def verify_stream_token(token):
+    """
+    Return the UID a stream token was issued to.
+
+    Raises:
+        ValueError: If the token is malformed, forged or expired
+    """
+    try:
+        payload = _serializer().loads(token, max_age=STREAM_TOKEN_LIFETIME)
+    except BadSignature:
+        raise ValueError("Invalid or expired stream token")
+    if not isinstance(payload, dict) or not payload.get('uid'):
+        raise ValueError("Invalid stream token")
+    return payload['uid']
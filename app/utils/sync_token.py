@@ -0,0 +1,44 @@
+# app/utils/sync_token.py
+
+"""
+Opaque sync tokens for delta polling.
+
+A sync token wraps the `updated_at` timestamp of the newest change a client
+has seen. Clients pass it back as `?since=` and only get items whose
+`updated_at` is later. Server timestamps are commit times, so any write that
+was not visible when a token was issued is strictly later than the token.
+"""
+
+import base64
+from datetime import datetime, timezone
+
+# Token for clients that have seen nothing yet
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def as_utc(timestamp):
+    """Return a timezone-aware UTC datetime (naive values are taken as UTC)."""
+    if timestamp.tzinfo is None:
+        return timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.astimezone(timezone.utc)
+
+
+def encode_sync_token(timestamp):
+    """Encode a timestamp as a sync token."""
+    iso = as_utc(timestamp).isoformat()
+    return base64.urlsafe_b64encode(iso.encode()).decode().rstrip('=')
+
+
+def decode_sync_token(token):
+    """
+    Decode a sync token back to its UTC timestamp.
+
+    Raises:
+        ValueError: If the token is malformed
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        iso = base64.urlsafe_b64decode(padded.encode()).decode()
+        return as_utc(datetime.fromisoformat(iso))
+    except (TypeError, UnicodeDecodeError, ValueError, base64.binascii.Error):
+        raise ValueError("Invalid sync token")
@@ -0,0 +1,112 @@
+# app/utils/token_cache.py
+
+"""
+Process-wide cache of verified token claims.
+
+Tokens are keyed by their SHA-256 digest so raw bearer tokens are never kept
+in memory longer than the request that carried them. Entries expire after the
+configured TTL or at the token's own ``exp`` claim, whichever comes first.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+# Defaults used when the app config doesn't override them
+DEFAULT_MAX_SIZE = 10000
+DEFAULT_TTL_SECONDS = 300
+
+
+def hash_token(token):
+    """Return the cache key for a raw bearer token."""
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+class TokenCache:
+    """Bounded LRU cache of verified token claims with TTL-aware expiry."""
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, ttl=DEFAULT_TTL_SECONDS, clock=time.time):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()  # token hash -> (expires_at, claims)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, token):
+        """Return cached claims for a token, or None if absent or expired."""
+        key = hash_token(token)
+        now = self._clock()
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, claims = entry
+            if expires_at <= now:
+                # Expired entries are dropped on access
+                del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return claims
+
+    def set(self, token, claims):
+        """Cache verified claims, never beyond the token's own expiry."""
+        now = self._clock()
+        expires_at = now + self.ttl
+
+        token_exp = claims.get('exp') if isinstance(claims, dict) else None
+        if isinstance(token_exp, (int, float)):
+            expires_at = min(expires_at, token_exp)
+
+        # Nothing to cache if the token is already expired
+        if expires_at <= now:
+            return
+
+        key = hash_token(token)
+        with self._lock:
+            self._entries[key] = (expires_at, claims)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, token):
+        """Remove a single token from the cache."""
+        with self._lock:
+            self._entries.pop(hash_token(token), None)
+
+    def clear(self):
+        """Remove all entries and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self):
+        """Return hit/miss counters and current size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+# Shared cache used by the token_required decorator
+token_cache = TokenCache()
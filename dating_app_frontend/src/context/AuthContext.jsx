@@ -81,6 +81,9 @@ export const AuthProvider = ({ children }) => {
       if (response.data && response.data.token) {
         // Store token in localStorage
         localStorage.setItem('authToken', response.data.token);
+        if (response.data.refresh_token) {
+          localStorage.setItem('refreshToken', response.data.refresh_token);
+        }
         
         try {
           // Get the current Firebase auth instance
@@ -142,6 +145,7 @@ export const AuthProvider = ({ children }) => {
     try {
       await firebaseSignOut(auth);
       localStorage.removeItem('authToken');
+      localStorage.removeItem('refreshToken');
       setCurrentUser(null);
       setUserProfile(null);
     } catch (error) {
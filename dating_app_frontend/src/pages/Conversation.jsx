@@ -17,11 +17,12 @@ import {
   MenuList,
   MenuItem,
   Alert,
-  AlertIcon
+  AlertIcon,
+  Button
 } from '@chakra-ui/react';
 import { useParams, useNavigate } from 'react-router-dom';
 import { FaArrowLeft, FaPaperPlane, FaEllipsisV } from 'react-icons/fa';
-import { messagesAPI, matchesAPI, profilesAPI } from '../services/api';
+import { authAPI, messagesAPI, matchesAPI, profilesAPI } from '../services/api';
 import { useAuth } from '../context/AuthContext';
 
 const Conversation = () => {
@@ -36,23 +37,72 @@ const Conversation = () => {
   const [loading, setLoading] = useState(true);
   const [sending, setSending] = useState(false);
   const [error, setError] = useState(null);
+  const [olderCursor, setOlderCursor] = useState(null);
+  const [hasOlder, setHasOlder] = useState(false);
+  const [loadingOlder, setLoadingOlder] = useState(false);
   
   const messagesEndRef = useRef(null);
+  const syncTokenRef = useRef(null);
+  const keepScrollRef = useRef(false);
+  const streamRef = useRef(null);
   
-  // Fetch conversation details and messages
+  // Fetch conversation details and messages, then follow changes on the message stream
   useEffect(() => {
-    fetchData();
+    let closed = false;
+    let reconnectTimer = null;
+    syncTokenRef.current = null;
     
-    // Set up polling for new messages
+    const openStream = async () => {
+      try {
+        const response = await authAPI.getStreamToken();
+        if (closed) return;
+        
+        // Resume from the last change we have; the stream replays anything newer
+        const source = messagesAPI.openStream(matchId, response.data.stream_token, syncTokenRef.current);
+        source.addEventListener('message', (event) => {
+          if (event.lastEventId) syncTokenRef.current = event.lastEventId;
+          mergeMessages([JSON.parse(event.data)]);
+        });
+        source.addEventListener('read', (event) => {
+          markReadThrough(JSON.parse(event.data).last_read_at);
+        });
+        source.onerror = () => {
+          // Reconnect with a fresh stream token; poll in the meantime
+          source.close();
+          streamRef.current = null;
+          if (!closed) reconnectTimer = setTimeout(openStream, 5000);
+        };
+        streamRef.current = source;
+      } catch (err) {
+        console.error('Error opening message stream:', err);
+        if (!closed) reconnectTimer = setTimeout(openStream, 30000);
+      }
+    };
+    
+    fetchData().then(() => {
+      if (!closed) openStream();
+    });
+    
+    // Poll for new messages only while the stream is down
     const pollInterval = setInterval(() => {
-      fetchMessages(false);
+      if (!streamRef.current) fetchMessages(false);
     }, 10000); // Poll every 10 seconds
     
-    return () => clearInterval(pollInterval);
+    return () => {
+      closed = true;
+      clearInterval(pollInterval);
+      clearTimeout(reconnectTimer);
+      streamRef.current?.close();
+      streamRef.current = null;
+    };
   }, [matchId]);
   
-  // Scroll to bottom when messages change
+  // Scroll to bottom when messages change (not when older ones are prepended)
   useEffect(() => {
+    if (keepScrollRef.current) {
+      keepScrollRef.current = false;
+      return;
+    }
     scrollToBottom();
   }, [messages]);
   
@@ -79,12 +129,29 @@ const Conversation = () => {
     try {
       if (showLoading) setLoading(true);
       
-      const response = await messagesAPI.getMessages(matchId);
+      // Polls only ask for what changed since the last response
+      const since = showLoading ? null : syncTokenRef.current;
+      const response = await messagesAPI.getMessages(matchId, since ? { since } : undefined);
+      syncTokenRef.current = response.headers['x-sync-token'] || null;
+      const otherLastReadAt = response.headers['x-other-last-read-at'];
       
-      if (response.data) {
+      if (response.data && since) {
+        if (response.data.length > 0) {
+          mergeMessages(response.data);
+        }
+        // Deltas only hold changed messages; reads of ours come as the other user's watermark
+        if (otherLastReadAt) markReadThrough(otherLastReadAt);
+      } else if (response.data) {
         setMessages(response.data);
+        // Only the newest page is loaded; older ones come from loadOlderMessages
+        setOlderCursor(response.headers['x-cursor-before'] || null);
+        setHasOlder(response.headers['x-has-more'] === 'true');
       }
     } catch (err) {
+      // The sync token is too old; reload the conversation on the next poll
+      if (err.response?.status === 410) {
+        syncTokenRef.current = null;
+      }
       console.error('Error fetching messages:', err);
       if (showLoading) {
         setError('Could not load messages. Please try again.');
@@ -94,6 +161,56 @@ const Conversation = () => {
     }
   };
   
+  // Merge changed messages into the current list by ID
+  const mergeMessages = (changed) => {
+    setMessages(prev => {
+      const byId = new Map(prev.map(msg => [msg.id, msg]));
+      changed.forEach(msg => byId.set(msg.id, msg));
+      return Array.from(byId.values()).sort(
+        (a, b) => new Date(a.created_at).getTime() - new Date(b.created_at).getTime()
+      );
+    });
+  };
+  
+  // The other user has read our messages up to `lastReadAt`
+  const markReadThrough = (lastReadAt) => {
+    const readThrough = new Date(lastReadAt).getTime();
+    setMessages(prev => prev.map(msg => (
+      msg.sender_uid === currentUser?.uid && !msg.read && new Date(msg.created_at).getTime() <= readThrough
+        ? { ...msg, read: true }
+        : msg
+    )));
+  };
+  
+  const loadOlderMessages = async () => {
+    if (!olderCursor || loadingOlder) return;
+    try {
+      setLoadingOlder(true);
+      const response = await messagesAPI.getMessages(matchId, { before: olderCursor });
+      
+      if (response.data) {
+        keepScrollRef.current = true;
+        setMessages(prev => {
+          const ids = new Set(prev.map(msg => msg.id));
+          return [...response.data.filter(msg => !ids.has(msg.id)), ...prev];
+        });
+        setOlderCursor(response.headers['x-cursor-before'] || olderCursor);
+        setHasOlder(response.headers['x-has-more'] === 'true');
+      }
+    } catch (err) {
+      console.error('Error loading older messages:', err);
+      toast({
+        title: 'Error',
+        description: 'Could not load older messages',
+        status: 'error',
+        duration: 3000,
+        isClosable: true,
+      });
+    } finally {
+      setLoadingOlder(false);
+    }
+  };
+  
   const fetchMatchDetails = async () => {
     try {
       const response = await matchesAPI.getMatches();
@@ -317,6 +434,14 @@ const Conversation = () => {
         display="flex"
         flexDirection="column"
       >
+        {hasOlder && (
+          <Flex justify="center" mb={4}>
+            <Button size="sm" variant="ghost" onClick={loadOlderMessages} isLoading={loadingOlder}>
+              Load older messages
+            </Button>
+          </Flex>
+        )}
+        
         {Object.keys(messageGroups).map(date => (
           <VStack key={date} align="stretch" spacing={4} mb={6}>
             {/* Date Header */}
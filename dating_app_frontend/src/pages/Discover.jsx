@@ -311,8 +311,8 @@ const Discover = () => {
     try {
       setLoading(true);
       
-      // First get all matches
-      const response = await matchesAPI.getMatches();
+      // First get all matches (only their IDs are needed)
+      const response = await matchesAPI.getMatches({ fields: 'match_id' });
       
       if (response.data && Array.isArray(response.data)) {
         // Unmatch all existing matches
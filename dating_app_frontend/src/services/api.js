@@ -39,9 +39,29 @@ api.interceptors.response.use(
     return response;
   },
   async (error) => {
+    const request = error.config;
+    const refreshToken = localStorage.getItem('refreshToken');
+    
+    // Tokens expire after an hour: trade the refresh token for a new one and retry once
+    if (error.response && error.response.status === 401 && refreshToken && request && !request._retried
+        && request.url !== '/api/auth/refresh') {
+      request._retried = true;
+      try {
+        const response = await api.post('/api/auth/refresh', { refresh_token: refreshToken });
+        localStorage.setItem('authToken', response.data.token);
+        localStorage.setItem('refreshToken', response.data.refresh_token);
+        request.headers.Authorization = `Bearer ${response.data.token}`;
+        api.defaults.headers.common['Authorization'] = `Bearer ${response.data.token}`;
+        return api(request);
+      } catch (refreshError) {
+        // Fall through to signing out
+      }
+    }
+    
     if (error.response && error.response.status === 401) {
       // Token expired, clear local storage
       localStorage.removeItem('authToken');
+      localStorage.removeItem('refreshToken');
       
       // Redirect to login page
       window.location.href = '/login';
@@ -55,31 +75,44 @@ export const authAPI = {
   register: (userData) => api.post('/api/auth/register', userData),
   login: (credentials) => api.post('/api/auth/login', credentials),
   getCurrentUser: () => api.get('/api/auth/me'),
+  getStreamToken: () => api.post('/api/auth/stream-token'),
+};
+
+// EventSource can't send the Authorization header, so streams take a short-lived stream token
+const openEventSource = (path, params) => {
+  const query = new URLSearchParams(
+    Object.entries(params).filter(([, value]) => value != null)
+  ).toString();
+  return new EventSource(`${api.defaults.baseURL}${path}?${query}`);
 };
 
 // Profiles API
 export const profilesAPI = {
   getProfile: () => api.get('/api/profiles/'),
   updateProfile: (data) => api.put('/api/profiles/', data),
-  discoverProfiles: () => api.get('/api/profiles/discover'),
+  discoverProfiles: (params) => api.get('/api/profiles/discover', { params }),
   getUserProfile: (uid) => api.get(`/api/profiles/${uid}`),
+  getUserProfiles: (uids, params) => api.get('/api/profiles/batch', { params: { ...params, uids: uids.join(',') } }),
 };
 
 // Matches API
 export const matchesAPI = {
   likeProfile: (uid) => api.post(`/api/matches/like/${uid}`),
   dislikeProfile: (uid) => api.post(`/api/matches/dislike/${uid}`),
-  getMatches: () => api.get('/api/matches/matches'),
+  getMatches: (params) => api.get('/api/matches/matches', { params }),
   unmatch: (matchId) => api.post(`/api/matches/unmatch/${matchId}`),
   clearAllLikes: () => api.post('/api/matches/clear-likes'),
 };
 
 // Messages API
 export const messagesAPI = {
-  getMessages: (matchId) => api.get(`/api/messages/${matchId}`),
+  getMessages: (matchId, params) => api.get(`/api/messages/${matchId}`, { params }),
   sendMessage: (matchId, content) => api.post(`/api/messages/${matchId}`, { content }),
   getUnreadCount: (matchId) => api.get(`/api/messages/${matchId}/unread`),
+  getUnreadCounts: () => api.get('/api/messages/unread'),
   getConversations: () => api.get('/api/messages/conversations'),
+  openStream: (matchId, streamToken, since) =>
+    openEventSource(`/api/messages/${matchId}/stream`, { stream_token: streamToken, since }),
 };
 
 // Ratings API
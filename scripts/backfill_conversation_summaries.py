@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Script to backfill conversation summaries (last_message, unread_counts, last_read_at) on matches in Firestore
+"""
+
+import sys
+
+# Makes the app package importable and loads the environment, so it comes first
+from common import initialize_firebase
+
+from app.data.repositories import DataStore, MAX_BATCH_SIZE
+
+# Backfill conversation summaries
+def backfill_conversation_summaries(db):
+    """Write last_message, unread_counts and last_read_at on every match that doesn't have them yet"""
+
+    store = DataStore(db)
+    matches = store.matches.collection.get()
+
+    updated_count = 0
+    batch = db.batch()
+    pending = 0
+
+    for match in matches:
+        match_data = match.to_dict()
+        if 'unread_counts' in match_data and 'last_read_at' in match_data:
+            continue
+
+        summary = store.messages.summarize(
+            match.id, [match_data['user1_uid'], match_data['user2_uid']]
+        )
+
+        # Matches that already keep a summary only need their read watermarks
+        if 'unread_counts' in match_data:
+            summary = {'last_read_at': summary['last_read_at']}
+        print(f"Updating match {match.id} with: {summary}")
+        batch.update(match.reference, summary)
+        pending += 1
+        updated_count += 1
+
+        if pending == MAX_BATCH_SIZE:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+
+    if pending:
+        batch.commit()
+
+    print(f"Backfilled {updated_count} matches out of {len(matches)} total")
+    return updated_count
+
+def main():
+    """Main function to backfill conversation summaries"""
+
+    # Initialize Firebase
+    db = initialize_firebase()
+    if not db:
+        print("Failed to initialize Firebase. Exiting.")
+        sys.exit(1)
+
+    # Backfill conversation summaries
+    backfill_conversation_summaries(db)
+
+    print("Done!")
+
+if __name__ == "__main__":
+    main()
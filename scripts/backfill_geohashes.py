@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Script to backfill the geohash of profile locations in Firestore
+"""
+
+import sys
+
+# Makes the app package importable and loads the environment, so it comes first
+from common import initialize_firebase
+
+from app.data.repositories import MAX_BATCH_SIZE
+from app.utils.geo import geohash_fields
+
+# Backfill geohashes
+def backfill_geohashes(db):
+    """Write the geohash of every profile whose location has coordinates but no (or a stale) geohash"""
+
+    users = db.collection('users').select(['location', 'geohash']).get()
+
+    updated_count = 0
+    batch = db.batch()
+    pending = 0
+
+    for user in users:
+        user_data = user.to_dict()
+        fields = geohash_fields(user_data.get('location'))
+        if fields['geohash'] is None or user_data.get('geohash') == fields['geohash']:
+            continue
+
+        print(f"Updating user {user.id} with: {fields}")
+        batch.update(user.reference, fields)
+        pending += 1
+        updated_count += 1
+
+        if pending == MAX_BATCH_SIZE:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+
+    if pending:
+        batch.commit()
+
+    print(f"Backfilled {updated_count} users out of {len(users)} total")
+    return updated_count
+
+def main():
+    """Main function to backfill geohashes"""
+
+    # Initialize Firebase
+    db = initialize_firebase()
+    if not db:
+        print("Failed to initialize Firebase. Exiting.")
+        sys.exit(1)
+
+    # Backfill geohashes
+    backfill_geohashes(db)
+
+    print("Done!")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Script to backfill the participants array and pair key on matches in Firestore,
+and to move matches to their pair key document ID
+"""
+
+import sys
+
+# Makes the app package importable and loads the environment, so it comes first
+from common import initialize_firebase
+
+from app.data.repositories import MAX_BATCH_SIZE, DataStore, pair_key, participant_fields
+
+# Re-point a match's messages at its new document ID
+def move_messages(db, old_id, new_id):
+    """Set match_id to new_id on every message of old_id, a batch at a time"""
+
+    moved = 0
+    while True:
+        messages = db.collection('messages').where('match_id', '==', old_id).limit(MAX_BATCH_SIZE).get()
+        if not messages:
+            return moved
+
+        batch = db.batch()
+        for message in messages:
+            batch.update(message.reference, {'match_id': new_id})
+        batch.commit()
+        moved += len(messages)
+
+# Backfill participants and pair keys
+def backfill_match_participants(db):
+    """
+    Write participants and pair_key on every match that doesn't have them (or
+    has an old-format pair_key), and move matches stored under another document
+    ID to their pair key (with their messages)
+    """
+
+    matches = db.collection('matches').get()
+
+    updated_count = 0
+    merged_count = 0
+    batch = db.batch()
+    pending = 0
+
+    for match in matches:
+        match_data = match.to_dict()
+        fields = participant_fields(match_data['user1_uid'], match_data['user2_uid'])
+        match_id = pair_key(match_data['user1_uid'], match_data['user2_uid'])
+
+        if match.id != match_id:
+            target = db.collection('matches').document(match_id)
+            merge = target.get().exists
+            if merge:
+                print(f"Merging match {match.id} into {match_id}")
+                merged_count += 1
+            else:
+                print(f"Moving match {match.id} to {match_id}")
+                target.set({**match_data, **fields})
+            moved = move_messages(db, match.id, match_id)
+            print(f"  moved {moved} messages")
+            if merge:
+                # The pair was matched twice: rebuild the kept match's summary
+                # from the combined messages
+                target.update(DataStore(db).messages.summarize(
+                    match_id, [match_data['user1_uid'], match_data['user2_uid']]
+                ))
+            match.reference.delete()
+            updated_count += 1
+            continue
+
+        if all(match_data.get(field) == value for field, value in fields.items()):
+            continue
+
+        print(f"Updating match {match.id} with: {fields}")
+        batch.update(match.reference, fields)
+        pending += 1
+        updated_count += 1
+
+        if pending == MAX_BATCH_SIZE:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+
+    if pending:
+        batch.commit()
+
+    print(f"Backfilled {updated_count} matches out of {len(matches)} total ({merged_count} merged)")
+    return updated_count
+
+def main():
+    """Main function to backfill match participants"""
+
+    # Initialize Firebase
+    db = initialize_firebase()
+    if not db:
+        print("Failed to initialize Firebase. Exiting.")
+        sys.exit(1)
+
+    # Backfill participants and pair keys
+    backfill_match_participants(db)
+
+    print("Done!")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Script to build the public_profiles document of every profile in Firestore
+"""
+
+import sys
+
+# Makes the app package importable and loads the environment, so it comes first
+from common import initialize_firebase
+
+from app.data.repositories import MAX_BATCH_SIZE, public_profile
+
+# Backfill public profiles
+def backfill_public_profiles(db):
+    """Write the public profile of every user from their profile, replacing any there is"""
+
+    users = db.collection('users').stream()
+
+    updated_count = 0
+    batch = db.batch()
+    pending = 0
+
+    for user in users:
+        batch.set(db.collection('public_profiles').document(user.id), public_profile(user.id, user.to_dict()))
+        pending += 1
+        updated_count += 1
+
+        if pending == MAX_BATCH_SIZE:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+
+    if pending:
+        batch.commit()
+
+    print(f"Backfilled {updated_count} public profiles")
+    return updated_count
+
+def main():
+    """Main function to backfill public profiles"""
+
+    # Initialize Firebase
+    db = initialize_firebase()
+    if not db:
+        print("Failed to initialize Firebase. Exiting.")
+        sys.exit(1)
+
+    # Backfill public profiles
+    backfill_public_profiles(db)
+
+    print("Done!")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Script to give every profile in Firestore the random sampling key discover samples by
+"""
+
+import sys
+
+# Makes the app package importable and loads the environment, so it comes first
+from common import initialize_firebase
+
+from app.data.repositories import MAX_BATCH_SIZE, sample_key_fields
+
+# Backfill random keys
+def backfill_random_keys(db):
+    """Write a random_key on every profile that doesn't have one"""
+
+    users = db.collection('users').select(['random_key']).get()
+
+    updated_count = 0
+    batch = db.batch()
+    pending = 0
+
+    for user in users:
+        if isinstance(user.to_dict().get('random_key'), (int, float)):
+            continue
+
+        fields = sample_key_fields()
+        print(f"Updating user {user.id} with: {fields}")
+        batch.update(user.reference, fields)
+        pending += 1
+        updated_count += 1
+
+        if pending == MAX_BATCH_SIZE:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+
+    if pending:
+        batch.commit()
+
+    print(f"Backfilled {updated_count} users out of {len(users)} total")
+    return updated_count
+
+def main():
+    """Main function to backfill random keys"""
+
+    # Initialize Firebase
+    db = initialize_firebase()
+    if not db:
+        print("Failed to initialize Firebase. Exiting.")
+        sys.exit(1)
+
+    # Backfill random keys
+    backfill_random_keys(db)
+
+    print("Done!")
+
+if __name__ == "__main__":
+    main()
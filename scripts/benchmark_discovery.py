@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Script to benchmark discover's candidate filtering and interest ranking over synthetic populations
+
+    python scripts/benchmark_discovery.py --sizes 100000 1000000 --searches 50 --pool 5000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# Allow importing the app package when run from the scripts directory
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.discovery.columnar import CandidateIndex
+
+GENDERS = {'male': 1, 'female': 2, 'non-binary': 3}
+
+# Interest tags drawn with a long tail, as real interests are
+INTERESTS = [f'interest_{i}' for i in range(300)]
+INTEREST_WEIGHTS = 1.0 / np.arange(1, len(INTERESTS) + 1)
+INTEREST_WEIGHTS /= INTEREST_WEIGHTS.sum()
+
+# Synthetic users are spread over a box around the continental US
+LAT_RANGE = (25.0, 49.0)
+LON_RANGE = (-124.0, -67.0)
+
+def synthetic_index(size, rng):
+    """Build an index of `size` random profiles"""
+    ages = rng.integers(18, 70, size)
+    age_min = np.maximum(18, ages - rng.integers(2, 10, size))
+    age_max = ages + rng.integers(2, 15, size)
+
+    counts = rng.integers(3, 9, size)
+    tags = rng.choice(len(INTERESTS), counts.sum(), p=INTEREST_WEIGHTS)
+
+    index = CandidateIndex()
+    index.load_columns(
+        [f'user_{i}' for i in range(size)],
+        genders=GENDERS,
+        age=ages,
+        gender=rng.choice([1, 2, 3], size, p=[0.48, 0.48, 0.04]),
+        lat=np.radians(rng.uniform(*LAT_RANGE, size)),
+        lon=np.radians(rng.uniform(*LON_RANGE, size)),
+        age_min=age_min,
+        age_max=age_max,
+        pref_gender=rng.choice([0, 1, 2], size, p=[0.2, 0.4, 0.4]),
+        distance_max=rng.choice([10, 25, 50, 100, 250], size),
+        completed=rng.random(size) < 0.9,
+        interests=[[INTERESTS[tag] for tag in user_tags] for user_tags in np.split(tags, np.cumsum(counts)[:-1])]
+    )
+    return index
+
+def random_interests(rng):
+    """Three to eight random interest tags"""
+    return list(rng.choice(INTERESTS, int(rng.integers(3, 9)), replace=False, p=INTEREST_WEIGHTS))
+
+def random_viewer(rng):
+    """A random viewer profile"""
+    age = int(rng.integers(20, 50))
+    return {
+        'age': age,
+        'gender': str(rng.choice(['male', 'female'])),
+        'location': {
+            'latitude': float(rng.uniform(*LAT_RANGE)),
+            'longitude': float(rng.uniform(*LON_RANGE))
+        },
+        'preferences': {
+            'age_min': age - 5,
+            'age_max': age + 5,
+            'gender': str(rng.choice(['male', 'female', 'all'])),
+            'distance_max': int(rng.choice([25, 50, 100, 250]))
+        },
+        'interests': random_interests(rng)
+    }
+
+def benchmark(size, searches, pool, rng):
+    """Time building an index of `size` profiles, and searching it and ranking `pool` candidates `searches` times"""
+    start = time.perf_counter()
+    index = synthetic_index(size, rng)
+    build_seconds = time.perf_counter() - start
+
+    timings = []
+    rank_timings = []
+    results = []
+    for _ in range(searches):
+        viewer = random_viewer(rng)
+        start = time.perf_counter()
+        hits = index.search(None, viewer, 20, completed_only=True)
+        timings.append((time.perf_counter() - start) * 1000)
+        results.append(len(hits))
+
+        # Interest ranking of a full candidate pool, as search(rank_pool=...) does for a deck build
+        rows = rng.choice(size, min(pool, size), replace=False)
+        start = time.perf_counter()
+        scores = index.interests.score_slots(viewer['interests'], rows)
+        np.argsort(-scores, kind='stable')
+        rank_timings.append((time.perf_counter() - start) * 1000)
+
+    timings = np.array(timings)
+    rank_timings = np.array(rank_timings)
+    print(
+        f"{size:>9,} profiles: build {build_seconds:6.2f} s | search "
+        f"median {np.median(timings):7.2f} ms, p95 {np.percentile(timings, 95):7.2f} ms, "
+        f"max {timings.max():7.2f} ms | {np.mean(results):.1f} results on average | "
+        f"ranking {min(pool, size):,} by interest median {np.median(rank_timings):6.2f} ms, "
+        f"p95 {np.percentile(rank_timings, 95):6.2f} ms"
+    )
+
+def main():
+    """Main function to run the discovery benchmark"""
+    parser = argparse.ArgumentParser(description='Benchmark the discover candidate index')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--searches', type=int, default=50)
+    parser.add_argument('--pool', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    for size in args.sizes:
+        benchmark(size, args.searches, args.pool, rng)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Script to benchmark collaborative-filtering recommendations on synthetic like graphs
+
+    python scripts/benchmark_recommendations.py --likes 1000000 5000000 --users 200000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# Allow importing the app package when run from the scripts directory
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.discovery.recommendations import TOP_K, LikeGraph, RecommendationModel
+
+# Synthetic users fall into taste clusters and mostly like within their own
+CLUSTERS = 50
+IN_CLUSTER = 0.8
+
+def synthetic_likes(likes, users, rng):
+    """`likes` (liker, target) index pairs with clustered tastes and skewed popularity"""
+    cluster = rng.integers(0, CLUSTERS, users)
+    members = [np.flatnonzero(cluster == c) for c in range(CLUSTERS)]
+    popularity = [1.0 / np.arange(1, len(m) + 1) ** 0.8 for m in members]
+    popularity = [p / p.sum() for p in popularity]
+
+    likers = rng.integers(0, users, likes)
+    targets = np.empty(likes, dtype=np.int64)
+    same = rng.random(likes) < IN_CLUSTER
+    targets[~same] = rng.integers(0, users, (~same).sum())
+    for c in range(CLUSTERS):
+        chosen = np.flatnonzero(same & (cluster[likers] == c))
+        targets[chosen] = rng.choice(members[c], len(chosen), p=popularity[c])
+    return likers, targets
+
+def benchmark(likes, users, refresh_likes, scored, rng):
+    """Time building, fitting, refreshing and scoring a model over `likes` synthetic likes"""
+    likers, targets = synthetic_likes(likes + refresh_likes, users, rng)
+    uids = np.array([f'user_{i}' for i in range(users)])
+
+    # Hold out the last likes for the incremental refresh
+    start = time.perf_counter()
+    graph = LikeGraph()
+    graph.add(list(uids[likers[:likes]]), list(uids[targets[:likes]]))
+    graph_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    model = RecommendationModel.fit(graph)
+    fit_seconds = time.perf_counter() - start
+
+    # How often a held-out like is among the liker's recommendations, before folding it in
+    held_likers = [graph.liker_id(uid) for uid in uids[likers[likes:]]]
+    held = [(liker_id, uids[target]) for liker_id, target in zip(held_likers, targets[likes:]) if liker_id is not None]
+    sample = held[:1000]
+    start = time.perf_counter()
+    recommended = {uid: set(recs) for uid, recs, _ in model.recommend([liker_id for liker_id, _ in sample])}
+    score_seconds = time.perf_counter() - start
+    hits = sum(target in recommended[graph.liker_uids[liker_id]] for liker_id, target in sample)
+
+    start = time.perf_counter()
+    changed = model.refresh(list(uids[likers[likes:]]), list(uids[targets[likes:]]))
+    for _ in model.recommend(changed[:scored]):
+        pass
+    refresh_seconds = time.perf_counter() - start
+
+    print(
+        f"{likes:>10,} likes, {len(graph.liker_uids):,} likers x {len(graph.target_uids):,} targets: "
+        f"graph {graph_seconds:5.1f} s | fit {fit_seconds:5.1f} s | "
+        f"top-{TOP_K} for {len(sample):,} likers {score_seconds:5.2f} s, held-out hit rate {hits / max(len(sample), 1):.1%} | "
+        f"refresh with {refresh_likes:,} likes and rescoring {min(scored, len(changed)):,} likers {refresh_seconds:5.2f} s"
+    )
+
+def main():
+    """Main function to run the recommendations benchmark"""
+    parser = argparse.ArgumentParser(description='Benchmark collaborative-filtering recommendations')
+    parser.add_argument('--likes', type=int, nargs='+', default=[1000000, 5000000])
+    parser.add_argument('--users', type=int, default=200000)
+    parser.add_argument('--refresh-likes', type=int, default=10000)
+    parser.add_argument('--scored', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    for likes in args.likes:
+        benchmark(likes, args.users, args.refresh_likes, args.scored, rng)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+"""
+Setup shared by the maintenance scripts: importing this makes the app package
+importable from the scripts directory and loads the environment
+"""
+
+import os
+import sys
+from dotenv import load_dotenv
+
+# Allow importing the app package when run from the scripts directory
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Load environment variables
+load_dotenv()
+
+# Initialize Firebase
+def initialize_firebase():
+    """Return the app's Firestore client (importing the app package initializes Firebase)."""
+    from app.config.firebase import db
+    return db
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Script to compute collaborative-filtering recommendations from the likes in Firestore
+
+    python scripts/compute_recommendations.py --full     # refactorize every like
+    python scripts/compute_recommendations.py            # fold in likes since the last run
+
+The model is kept in an .npz file between runs (--model); incremental runs
+need it, and fall back to a full run without it.
+"""
+
+import argparse
+import os
+import sys
+
+# Makes the app package importable and loads the environment, so it comes first
+from common import initialize_firebase
+
+from app.data.repositories import DataStore
+from app.discovery.recommendations import RecommendationModel, refresh_recommendations
+
+# Compute recommendations
+def compute_recommendations(db, model_path, full=False):
+    """Refresh recommendations, incrementally from the saved model unless `full` or there is none"""
+
+    model = None
+    if not full and os.path.exists(model_path):
+        model = RecommendationModel.load(model_path)
+        print(f"Loaded model with {len(model.graph)} likes, synced at {model.synced_at}")
+    else:
+        print("Computing recommendations from every like")
+
+    model, written = refresh_recommendations(DataStore(db), model)
+    if model is not None:
+        model.save(model_path)
+        print(f"Saved model with {len(model.graph)} likes to {model_path}")
+    return written
+
+def main():
+    """Main function to compute recommendations"""
+    parser = argparse.ArgumentParser(description='Compute discover recommendations from likes')
+    parser.add_argument('--model', default='recommendations_model.npz')
+    parser.add_argument('--full', action='store_true', help='refactorize instead of folding in new likes')
+    args = parser.parse_args()
+
+    # Initialize Firebase
+    db = initialize_firebase()
+    if not db:
+        print("Failed to initialize Firebase. Exiting.")
+        sys.exit(1)
+
+    compute_recommendations(db, args.model, full=args.full)
+
+    print("Done!")
+
+if __name__ == "__main__":
+    main()
@@ -3,37 +3,17 @@
 Script to create test profiles with stock images in the Lucent Dating App
 """
 
-import os
 import sys
 import json
 import random
 import datetime
-import firebase_admin
-from firebase_admin import credentials, firestore, auth
-from dotenv import load_dotenv
+from firebase_admin import firestore, auth
 
-# Load environment variables
-load_dotenv()
+# Makes the app package importable and loads the environment, so it comes first
+from common import initialize_firebase
 
-# Initialize Firebase
-def initialize_firebase():
-    """Initialize Firebase with credentials."""
-    try:
-        # This file should be downloaded from Firebase Console > Project Settings > Service Accounts
-        cred_path = os.getenv('FIREBASE_CREDENTIALS_PATH')
-        
-        # Initialize Firebase with credentials
-        cred = credentials.Certificate(cred_path)
-        firebase_admin.initialize_app(cred)
-        
-        # Get Firestore database instance
-        db = firestore.client()
-        
-        print("Firebase initialized successfully")
-        return db
-    except Exception as e:
-        print(f"Error initializing Firebase: {e}")
-        return None
+from app.data.repositories import DataStore
+from app.utils.geo import geohash_fields
 
 # Test profile data
 MALE_PROFILES = [
@@ -287,6 +267,7 @@ def create_test_profiles(db):
     
     print("Starting to create test profiles...")
     
+    store = DataStore(db)
     # Combine male and female profiles
     all_profiles = MALE_PROFILES + FEMALE_PROFILES
     successful_creations = 0
@@ -318,13 +299,14 @@ def create_test_profiles(db):
             user_data['profile_completed'] = True
             user_data['created_at'] = firestore.SERVER_TIMESTAMP
             user_data['updated_at'] = firestore.SERVER_TIMESTAMP
+            user_data.update(geohash_fields(user_data.get('location')))
             
             # Remove password before storing
             if 'password' in user_data:
                 del user_data['password']
             
-            # Add user to Firestore collection
-            db.collection('users').document(uid).set(user_data)
+            # Add user to Firestore collection (with its random_key and public profile)
+            store.users.set(uid, user_data)
             
             print(f"Successfully created profile for {display_name}")
             successful_creations += 1
@@ -3,34 +3,10 @@
 Script to standardize capitalization and formatting of profile details in Firestore
 """
 
-import os
 import sys
-import firebase_admin
-from firebase_admin import credentials, firestore
-from dotenv import load_dotenv
 
-# Load environment variables
-load_dotenv()
-
-# Initialize Firebase
-def initialize_firebase():
-    """Initialize Firebase with credentials."""
-    try:
-        # This file should be downloaded from Firebase Console > Project Settings > Service Accounts
-        cred_path = os.getenv('FIREBASE_CREDENTIALS_PATH')
-        
-        # Initialize Firebase with credentials
-        cred = credentials.Certificate(cred_path)
-        firebase_admin.initialize_app(cred)
-        
-        # Get Firestore database instance
-        db = firestore.client()
-        
-        print("Firebase initialized successfully")
-        return db
-    except Exception as e:
-        print(f"Error initializing Firebase: {e}")
-        return None
+# Makes the app package importable and loads the environment, so it comes first
+from common import initialize_firebase
 
 # Standardize profile details
 def standardize_profile_details(db):
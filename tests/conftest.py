@@ -13,6 +13,7 @@ from datetime import datetime
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from app import create_app
+from app.utils.token_cache import token_cache
 
 @pytest.fixture
 def app():
@@ -21,6 +22,9 @@ def app():
     app.config.update({
         'TESTING': True,
     })
+    
+    # Don't let verified tokens leak between tests
+    token_cache.clear()
     return app
 
 @pytest.fixture
@@ -28,6 +32,20 @@ def client(app):
     """A test client for the app."""
     return app.test_client()
 
+@pytest.fixture
+def store(app):
+    """The in-memory data store behind the test app."""
+    return app.extensions['data_store']
+
+@pytest.fixture
+def seed(store):
+    """Write a document straight into the in-memory backend."""
+    def _seed(collection, doc_id, data):
+        data = {k: v for k, v in data.items() if k != 'id'}
+        store.client.collection(collection).document(doc_id).set(data)
+        return doc_id
+    return _seed
+
 @pytest.fixture
 def firebase_mock():
     """Mock Firebase functionality for testing."""
@@ -40,46 +58,8 @@ def firebase_mock():
         'email': 'test@example.com'
     }
     
-    # Create mock for Firestore
-    firestore_mock = MagicMock()
-    
-    # Create a mock firestore.SERVER_TIMESTAMP
-    firestore_mock.SERVER_TIMESTAMP = datetime.now()
-    
-    # Create document reference mocks
-    doc_ref_mock = MagicMock()
-    doc_ref_mock.get.return_value = MagicMock(
-        exists=True,
-        to_dict=lambda: {
-            'uid': 'test_user_123',
-            'email': 'test@example.com',
-            'display_name': 'Test User',
-            'profile_completed': True
-        }
-    )
-    
-    # Create collection reference mocks
-    collection_ref_mock = MagicMock()
-    collection_ref_mock.document.return_value = doc_ref_mock
-    
-    # Create Firestore client mock
-    db_mock = MagicMock()
-    db_mock.collection.return_value = collection_ref_mock
-    
-    # Configure the where method to return a query that behaves correctly
-    query_mock = MagicMock()
-    query_mock.where.return_value = query_mock
-    query_mock.limit.return_value = query_mock
-    query_mock.order_by.return_value = query_mock
-    query_mock.get.return_value = []
-    
-    # Set the collection method to return the query mock
-    db_mock.collection.return_value.where = MagicMock(return_value=query_mock)
-    
     return {
-        'auth': auth_mock,
-        'firestore': firestore_mock,
-        'db': db_mock
+        'auth': auth_mock
     }
 
 @pytest.fixture
@@ -120,6 +100,8 @@ def match_data():
         'id': 'match_123',
         'user1_uid': 'test_user_123',
         'user2_uid': 'test_user_456',
+        'participants': ['test_user_123', 'test_user_456'],
+        'pair_key': '13:test_user_123:test_user_456',
         'created_at': datetime.now(),
         'active': True,
         'last_message_at': None
@@ -6,8 +6,7 @@ import json
 from unittest.mock import patch
 
 @patch('app.api.auth.auth')
-@patch('app.api.auth.db')
-def test_register_success(db_mock, auth_mock, client, firebase_mock):
+def test_register_success(auth_mock, client, firebase_mock, store):
     """Test successful user registration."""
     # Configure mocks
     auth_mock.create_user.return_value = firebase_mock['auth'].create_user.return_value
@@ -39,6 +38,12 @@ def test_register_success(db_mock, auth_mock, client, firebase_mock):
         password='password123',
         display_name='New User'
     )
+    
+    # Verify the profile document was created
+    user_doc = store.users.get('test_user_123')
+    assert user_doc.exists
+    assert user_doc.to_dict()['email'] == 'newuser@example.com'
+    assert user_doc.to_dict()['profile_completed'] is False
 
 @patch('app.api.auth.auth')
 def test_register_missing_data(auth_mock, client):
@@ -115,19 +120,17 @@ def test_verify_token_missing_token(auth_mock, client):
     auth_mock.verify_id_token.assert_not_called()
 
 @patch('app.utils.decorators.auth')
-@patch('app.config.firebase.db')
-def test_get_current_user(db_mock, auth_mock, client, firebase_mock, auth_token):
+def test_get_current_user(auth_mock, client, firebase_mock, auth_token, seed):
     """Test getting current user info."""
     # Configure mocks
     auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
     
-    # Mock database response
-    db_mock.collection().document().get.return_value.exists = True
-    db_mock.collection().document().get.return_value.to_dict.return_value = {
+    # Seed the user document
+    seed('users', 'test_user_123', {
         'uid': 'test_user_123',
         'email': 'test@example.com',
         'display_name': 'Test User'
-    }
+    })
     
     # Send request
     response = client.get(
@@ -143,6 +146,47 @@ def test_get_current_user(db_mock, auth_mock, client, firebase_mock, auth_token)
     assert 'display_name' in response_data
     assert response_data['uid'] == 'test_user_123'
 
+@patch('app.utils.decorators.auth')
+def test_get_current_user_deleted(auth_mock, client, firebase_mock, auth_token, store, seed):
+    """Test that a valid token for a user whose document is gone gets a 404."""
+    auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
+    seed('users', 'test_user_123', {'uid': 'test_user_123', 'email': 'test@example.com'})
+    
+    assert client.get('/api/auth/me', headers={'Authorization': auth_token}).status_code == 200
+    
+    # The token's claims stay cached, but the user document is loaded on each request
+    store.users.delete('test_user_123')
+    response = client.get('/api/auth/me', headers={'Authorization': auth_token})
+    
+    assert response.status_code == 404
+    assert json.loads(response.data) == {'message': 'User not found!'}
+    assert auth_mock.verify_id_token.call_count == 1
+
+@pytest.mark.parametrize('method,path,body', [
+    ('post', '/api/matches/like/test_user_456', None),
+    ('post', '/api/matches/dislike/test_user_456', None),
+    ('post', '/api/messages/match_123', {'content': 'Hello'}),
+    ('put', '/api/profiles/', {'bio': 'Still here?'}),
+    ('put', '/api/profiles/photo', {'index': 0, 'photo': 'https://example.com/p.jpg'}),
+    ('post', '/api/ratings', {'rated_uid': 'test_user_456', 'overall': 5, 'personality': 5,
+                              'reliability': 5, 'communication': 5, 'authenticity': 5}),
+])
+@patch('app.utils.decorators.auth')
+def test_deleted_user_cannot_write(auth_mock, client, firebase_mock, auth_token, match_data, store, seed, method, path, body):
+    """Test that a valid token whose user document is gone can't like, message, edit or rate."""
+    auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
+    seed('users', 'test_user_456', {'uid': 'test_user_456', 'display_name': 'Other User'})
+    seed('matches', 'match_123', match_data)
+    
+    response = getattr(client, method)(path, headers={'Authorization': auth_token}, json=body)
+    
+    assert response.status_code == 404
+    assert json.loads(response.data) == {'message': 'User not found!'}
+    assert store.likes.collection.get() == []
+    assert store.dislikes.collection.get() == []
+    assert store.messages.collection.get() == []
+    assert not store.users.get('test_user_123').exists
+
 @patch('app.utils.decorators.auth')
 def test_get_current_user_no_token(auth_mock, client):
     """Test getting current user without token."""
@@ -152,4 +196,199 @@ def test_get_current_user_no_token(auth_mock, client):
     # Check response
     assert response.status_code == 401
     response_data = json.loads(response.data)
-    assert 'message' in response_data 
\ No newline at end of file
+    assert 'message' in response_data 
+
+def _make_custom_token(private_key, issuer, uid='test_user_123', audience=None, expires_in=3600, claims=None):
+    """Sign a token shaped like the ones Firebase Admin mints."""
+    import time
+    import jwt
+    from app.utils.token_verifier import CUSTOM_TOKEN_AUDIENCE
+    
+    now = int(time.time())
+    payload = {
+        'iss': issuer,
+        'sub': issuer,
+        'aud': audience or CUSTOM_TOKEN_AUDIENCE,
+        'uid': uid,
+        'iat': now,
+        'exp': now + expires_in
+    }
+    if claims:
+        # create_custom_token nests developer claims
+        payload['claims'] = claims
+    return jwt.encode(payload, private_key, algorithm='RS256')
+
+@pytest.fixture
+def signing_key():
+    """An RSA key pair standing in for the service-account key."""
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+def test_classify_token(signing_key):
+    """Test that tokens are routed by their unverified claims."""
+    import jwt
+    from app.utils.token_verifier import (
+        classify_token, TOKEN_TYPE_ID, TOKEN_TYPE_CUSTOM, TOKEN_TYPE_UNKNOWN
+    )
+    
+    custom_token = _make_custom_token(signing_key, 'svc@example.iam.gserviceaccount.com')
+    id_token = jwt.encode(
+        {'iss': 'https://securetoken.google.com/lucent', 'aud': 'lucent', 'sub': 'test_user_123'},
+        signing_key, algorithm='RS256'
+    )
+    
+    assert classify_token(custom_token)[0] == TOKEN_TYPE_CUSTOM
+    assert classify_token(id_token)[0] == TOKEN_TYPE_ID
+    assert classify_token('mocked_token_123')[0] == TOKEN_TYPE_UNKNOWN
+
+def test_verify_custom_token_rejects_wrong_key(signing_key):
+    """Test that custom tokens must be signed by the service account."""
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from app.utils.token_verifier import verify_custom_token
+    
+    issuer = 'svc@example.iam.gserviceaccount.com'
+    token = _make_custom_token(signing_key, issuer)
+    assert verify_custom_token(token, signing_key.public_key(), issuer)['uid'] == 'test_user_123'
+    
+    other_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    with pytest.raises(Exception):
+        verify_custom_token(token, other_key.public_key(), issuer)
+
+@patch('app.utils.token_verifier.get_service_account_key')
+@patch('app.utils.decorators.auth')
+def test_custom_token_skips_id_token_verification(auth_mock, key_mock, client, signing_key, seed):
+    """Test that custom tokens go straight to local verification."""
+    issuer = 'svc@example.iam.gserviceaccount.com'
+    key_mock.return_value = (signing_key.public_key(), issuer)
+    token = _make_custom_token(signing_key, issuer)
+    
+    seed('users', 'test_user_123', {
+        'uid': 'test_user_123',
+        'email': 'test@example.com',
+        'display_name': 'Test User'
+    })
+    
+    response = client.get('/api/auth/me', headers={'Authorization': f'Bearer {token}'})
+    
+    assert response.status_code == 200
+    assert json.loads(response.data)['uid'] == 'test_user_123'
+    auth_mock.verify_id_token.assert_not_called()
+
+@patch('app.utils.token_verifier.get_service_account_key')
+@patch('app.utils.decorators.auth')
+def test_forged_custom_token_rejected(auth_mock, key_mock, client, signing_key):
+    """Test that a custom token signed with another key is refused."""
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    
+    issuer = 'svc@example.iam.gserviceaccount.com'
+    key_mock.return_value = (signing_key.public_key(), issuer)
+    forger_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    token = _make_custom_token(forger_key, issuer)
+    
+    response = client.get('/api/auth/me', headers={'Authorization': f'Bearer {token}'})
+    
+    assert response.status_code == 401
+    auth_mock.verify_id_token.assert_not_called()
+
+def test_lazy_user_uid_does_not_read(app, store):
+    """Test that current_user['uid'] is answered from the token alone."""
+    from app.utils.lazy_user import LazyUser
+    
+    with app.test_request_context():
+        user = LazyUser('test_user_123', {'uid': 'test_user_123'})
+        
+        assert user['uid'] == 'test_user_123'
+        assert not user.loaded
+        assert store.client.stats.document_reads == 0
+
+def test_lazy_user_fetches_without_photos(app, store, seed):
+    """Test that other fields are fetched once, under a field mask."""
+    from app.utils.lazy_user import LazyUser
+    
+    seed('users', 'test_user_123', {
+        'uid': 'test_user_123',
+        'display_name': 'Test User',
+        'preferences': {'gender': 'female'},
+        'photos': ['data:image/jpeg;base64,AAAA']
+    })
+    
+    with app.test_request_context():
+        user = LazyUser('test_user_123', {'uid': 'test_user_123'})
+        
+        assert user.get('display_name') == 'Test User'
+        assert user.get('preferences') == {'gender': 'female'}
+        assert user.get('photos') is None
+        assert store.client.stats.document_reads == 1
+
+@patch('app.api.auth.requests')
+@patch('app.api.auth.auth')
+def test_refresh_token(auth_mock, requests_mock, client, firebase_mock, monkeypatch):
+    """Test exchanging a refresh token for a new custom token."""
+    monkeypatch.setenv('FIREBASE_WEB_API_KEY', 'test_api_key')
+    auth_mock.create_custom_token.return_value = firebase_mock['auth'].create_custom_token.return_value
+    requests_mock.post.return_value.status_code = 200
+    requests_mock.post.return_value.json.return_value = {
+        'user_id': 'test_user_123',
+        'id_token': 'new_id_token',
+        'refresh_token': 'rotated_refresh_token'
+    }
+
+    response = client.post('/api/auth/refresh', json={'refresh_token': 'old_refresh_token'})
+
+    assert response.status_code == 200
+    assert json.loads(response.data) == {
+        'uid': 'test_user_123',
+        'token': 'mocked_token_123',
+        'refresh_token': 'rotated_refresh_token',
+        'expires_in': 3600
+    }
+    assert requests_mock.post.call_args.kwargs['data'] == {
+        'grant_type': 'refresh_token',
+        'refresh_token': 'old_refresh_token'
+    }
+    auth_mock.create_custom_token.assert_called_once_with('test_user_123')
+
+    # Revoked or unknown refresh tokens are a 401, so the client signs in again
+    requests_mock.post.return_value.status_code = 400
+    requests_mock.post.return_value.json.return_value = {'error': {'message': 'TOKEN_EXPIRED'}}
+    response = client.post('/api/auth/refresh', json={'refresh_token': 'old_refresh_token'})
+    assert response.status_code == 401
+    assert client.post('/api/auth/refresh', json={}).status_code == 400
+
+@patch('app.utils.decorators.auth')
+def test_stats_endpoints_require_admin(auth_mock, app, client):
+    """Test that token and event bus stats are only served to admins."""
+    auth_mock.verify_id_token.return_value = {'uid': 'test_user_123'}
+    for path in ('/api/auth/token-stats', '/api/events/stats'):
+        assert client.get(path, headers={'Authorization': 'Bearer user_token'}).status_code == 403
+    
+    app.config['ADMIN_UIDS'] = ['test_user_123']
+    response = client.get('/api/auth/token-stats', headers={'Authorization': 'Bearer user_token'})
+    assert response.status_code == 200
+    assert 'cache' in json.loads(response.data)
+    
+    # An admin custom claim works without being listed
+    app.config['ADMIN_UIDS'] = []
+    auth_mock.verify_id_token.return_value = {'uid': 'operator', 'admin': True}
+    assert client.get('/api/events/stats', headers={'Authorization': 'Bearer admin_token'}).status_code == 200
+
+@patch('app.utils.token_verifier.get_service_account_key')
+def test_custom_token_admin_claim(key_mock, client, signing_key):
+    """Test that the admin claim of a custom token is read from its developer claims."""
+    issuer = 'svc@example.iam.gserviceaccount.com'
+    key_mock.return_value = (signing_key.public_key(), issuer)
+    
+    token = _make_custom_token(signing_key, issuer, uid='operator', claims={'admin': True})
+    assert client.get('/api/events/stats', headers={'Authorization': f'Bearer {token}'}).status_code == 200
+    
+    token = _make_custom_token(signing_key, issuer, uid='someone', claims={'role': 'user'})
+    assert client.get('/api/events/stats', headers={'Authorization': f'Bearer {token}'}).status_code == 403
+
+def test_startup_requires_service_account_key():
+    """Test that the app refuses to start on Firestore when custom tokens couldn't be verified."""
+    from app import create_app
+    
+    with patch('app.config.testing.DATA_BACKEND', 'firestore'), \
+            patch('app.get_service_account_key', return_value=(None, None)):
+        with pytest.raises(RuntimeError):
+            create_app('testing')
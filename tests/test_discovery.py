@@ -0,0 +1,505 @@
+"""
+Tests for the columnar candidate index and the other discover building blocks.
+"""
+import pytest
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+import numpy as np
+
+from app.api.ratings import update_average_rating
+from app.data.memory import MemoryClient
+from app.data.repositories import DataStore
+from app.discovery import get_buckets, get_deck_builder
+from app.discovery.buckets import bucket_key
+from app.discovery.columnar import CandidateIndex
+from app.discovery.interests import InterestIndex
+from app.discovery.seen import EXACT_LIMIT, FALSE_POSITIVE_RATE, SeenSet, uid_hashes
+from app.utils.geo import geohash_fields
+
+SAN_FRANCISCO = {'latitude': 37.7749, 'longitude': -122.4194}
+OAKLAND = {'latitude': 37.8044, 'longitude': -122.2712}
+LOS_ANGELES = {'latitude': 34.0522, 'longitude': -118.2437}
+
+VIEWER = {
+    'age': 28,
+    'gender': 'male',
+    'location': SAN_FRANCISCO,
+    'preferences': {'age_min': 25, 'age_max': 35, 'gender': 'female', 'distance_max': 50}
+}
+
+
+def profile(**fields):
+    return dict({'gender': 'female', 'age': 30, 'location': OAKLAND, 'updated_at': datetime.now(timezone.utc)}, **fields)
+
+@pytest.fixture
+def users():
+    return DataStore(MemoryClient(), backend='memory').users
+
+def test_search_checks_preferences_both_ways(users):
+    """Test that candidates must fit the viewer's preferences and the viewer theirs."""
+    users.set('viewer', dict(VIEWER, updated_at=datetime.now(timezone.utc)))
+    users.set('match', profile())
+    users.set('wrong_gender', profile(gender='male'))
+    users.set('too_old', profile(age=40))
+    users.set('too_far', profile(location=LOS_ANGELES))
+    users.set('wants_women', profile(preferences={'gender': 'female'}))
+    users.set('wants_older', profile(preferences={'age_min': 30}))
+    users.set('wants_closer', profile(preferences={'distance_max': 5}))
+    users.set('no_location', profile(location=None))
+    users.set('unknown_age', profile(age=None))
+
+    index = CandidateIndex(users)
+    index.build()
+
+    hits = index.search('viewer', VIEWER, 20)
+    assert sorted(uid for uid, _ in hits) == ['match', 'unknown_age']
+    assert all(10 < distance < 20 for _, distance in hits)
+
+    # Without a location there is no distance limit, and no distances
+    viewer = dict(VIEWER, location=None)
+    hits = dict(index.search('viewer', viewer, 20))
+    assert 'too_far' in hits and 'no_location' in hits
+    assert set(hits.values()) == {None}
+
+def test_search_for_unindexed_gender_matches_no_one(users):
+    """Test that preferring a gender no profile has doesn't match the profiles without a gender."""
+    users.set('viewer', dict(VIEWER, updated_at=datetime.now(timezone.utc)))
+    users.set('match', profile())
+    users.set('no_gender', profile(gender=None))
+
+    index = CandidateIndex(users)
+    index.build()
+
+    viewer = dict(VIEWER, preferences=dict(VIEWER['preferences'], gender='nonbinary'))
+    assert index.search('viewer', viewer, 20) == []
+    assert [uid for uid, _ in index.search('viewer', VIEWER, 20)] == ['match']
+
+def test_search_samples_unlocated_viewers_by_random_key(users):
+    """Test that viewers without a location get candidates from a random point of the random_key order."""
+    for i in range(10):
+        users.set(f'user_{i}', profile(random_key=(9 - i) / 10))
+    viewer = dict(VIEWER, location=None, preferences={'gender': 'female'})
+
+    index = CandidateIndex(users)
+    index.build()
+
+    with patch('app.discovery.columnar.random.random', return_value=0.75):
+        assert [uid for uid, _ in index.search('viewer', viewer, 4)] == ['user_1', 'user_0', 'user_9', 'user_8']
+        assert [uid for uid, _ in index.search('viewer', viewer, 2, rank_pool=4)] == ['user_1', 'user_0']
+    with patch('app.discovery.columnar.random.random', return_value=0.05):
+        assert [uid for uid, _ in index.search('viewer', viewer, 2)] == ['user_8', 'user_7']
+
+def test_search_returns_nearest_first(users):
+    """Test that results are limited to the nearest candidates."""
+    users.set('viewer', dict(VIEWER, updated_at=datetime.now(timezone.utc)))
+    for i in range(10):
+        users.set(f'user_{i}', profile(location={'latitude': 37.7749 + 0.01 * (10 - i), 'longitude': -122.4194}))
+
+    index = CandidateIndex(users)
+    index.build()
+
+    assert [uid for uid, _ in index.search('viewer', VIEWER, 3)] == ['user_9', 'user_8', 'user_7']
+
+def test_refresh_applies_changed_profiles(users):
+    """Test that refresh only reads profiles updated since the last build."""
+    users.set('match', profile())
+    index = CandidateIndex(users)
+    index.build()
+    assert len(index) == 1
+
+    users.set('new_user', profile())
+    users.set('match', profile(gender='male'))
+    users.client.stats.reset()
+
+    assert index.refresh() == 2
+    assert users.client.stats.document_reads == 2
+    assert [uid for uid, _ in index.search('viewer', VIEWER, 20)] == ['new_user']
+
+def test_refresh_pages_through_profiles_sharing_a_timestamp(users):
+    """Test that a refresh spanning several pages doesn't skip profiles written at the same instant."""
+    users.set('match', profile())
+    index = CandidateIndex(users)
+    index.build()
+
+    updated_at = datetime.now(timezone.utc)
+    for i in range(5):
+        users.set(f'user_{i}', profile(updated_at=updated_at))
+
+    with patch('app.discovery.columnar.REFRESH_PAGE_SIZE', 2):
+        assert index.refresh() == 5
+    assert len(index) == 6
+
+def test_rating_updates_reach_the_index(app, store):
+    """Test that rating writes stamp profiles with server time, so a refresh picks them up."""
+    store.users.set('match', profile())
+    index = CandidateIndex(store.users)
+    index.build()
+
+    with app.app_context():
+        update_average_rating('match')
+
+    assert store.users.get('match').get('updated_at').tzinfo is not None
+    assert index.refresh() == 1
+
+def test_one_thread_builds_the_index(users):
+    """Test that concurrent first searches wait for a single build."""
+    users.set('match', profile())
+    index = CandidateIndex(users)
+
+    stream_all = users.stream_all
+    builds = []
+
+    def slow_stream_all(**kwargs):
+        builds.append(kwargs)
+        time.sleep(0.1)
+        return stream_all(**kwargs)
+
+    with patch.object(users, 'stream_all', side_effect=slow_stream_all):
+        threads = [threading.Thread(target=index.ensure_fresh) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert len(builds) == 1
+    assert len(index) == 1
+
+@patch('app.utils.decorators.auth')
+def test_discover_uses_mutual_preferences(auth_mock, client, firebase_mock, auth_token, user_data, seed):
+    """Test that discover leaves out candidates whose own preferences exclude the user."""
+    auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
+
+    seed('users', 'test_user_123', dict(user_data, updated_at=datetime.now(timezone.utc)))
+    seed('users', 'likes_men', profile(display_name='Likes Men', preferences={'gender': 'male'}))
+    seed('users', 'likes_women', profile(display_name='Likes Women', preferences={'gender': 'female'}))
+    seed('users', 'too_young', profile(display_name='Too Young', age=21))
+
+    response = client.get('/api/profiles/discover', headers={'Authorization': auth_token})
+
+    assert response.status_code == 200
+    assert [p['display_name'] for p in json.loads(response.data)] == ['Likes Men']
+
+def test_seen_set_folds_into_bloom_filter():
+    """Test that a seen set past EXACT_LIMIT becomes a Bloom filter that still holds every swipe."""
+    seen = SeenSet()
+    swiped = [f'swiped_{i}' for i in range(EXACT_LIMIT + 100)]
+    for uid in swiped:
+        seen.add(uid)
+
+    assert not seen.is_exact
+    loaded = SeenSet.from_dict(seen.to_dict())
+    assert all(uid in loaded for uid in swiped)
+
+    # Few false positives, and the vectorized check agrees with the scalar one
+    others = [f'other_{i}' for i in range(5000)]
+    false_positives = sum(uid in loaded for uid in others)
+    assert false_positives < 0.03 * len(others)
+
+    hashes = np.array([uid_hashes(uid) for uid in swiped + others], dtype=np.uint64)
+    members = loaded.contains_hashes(hashes[:, 0], hashes[:, 1])
+    assert list(members) == [uid in loaded for uid in swiped + others]
+
+def test_bloom_filter_false_positive_rate_at_capacity():
+    """Test that a filter filled to the capacity it was sized for hides at most FALSE_POSITIVE_RATE of unswiped profiles."""
+    seen = SeenSet([f'swiped_{i}' for i in range(EXACT_LIMIT + 1)])
+    swiped = [f'swiped_{i}' for i in range(seen.capacity)]
+    for uid in swiped:
+        seen.add(uid)
+    assert not seen.over_capacity
+
+    others = np.array([uid_hashes(f'other_{i}') for i in range(100000)], dtype=np.uint64)
+    rate = seen.contains_hashes(others[:, 0], others[:, 1]).mean()
+
+    # Sampling error on 100k probes is about 0.03 percentage points
+    assert rate <= FALSE_POSITIVE_RATE * 1.1
+
+@pytest.mark.parametrize('swipes', [1, EXACT_LIMIT + 1])
+def test_search_leaves_out_seen_profiles(users, swipes):
+    """Test that profiles in the viewer's seen set are left out, as a list and as a Bloom filter."""
+    users.set('viewer', dict(VIEWER, updated_at=datetime.now(timezone.utc)))
+    users.set('liked', profile())
+    users.set('match', profile())
+
+    index = CandidateIndex(users)
+    index.build()
+
+    seen = SeenSet(['liked'] + [f'elsewhere_{i}' for i in range(swipes - 1)])
+    assert seen.is_exact == (swipes == 1)
+    assert [uid for uid, _ in index.search('viewer', VIEWER, 20, seen=seen)] == ['match']
+
+def test_deck_build_confirms_bloom_filter_hits(app, store):
+    """Test that profiles a Bloom filter hides by mistake are cleared against the likes and put in the deck."""
+    store.users.set('viewer', dict(VIEWER, updated_at=datetime.now(timezone.utc)))
+    store.users.set('swiped', profile())
+    store.users.set('lookalike', profile())
+    store.likes.like('viewer', 'swiped')
+
+    seen = SeenSet(['swiped'] + [f'elsewhere_{i}' for i in range(EXACT_LIMIT)])
+    # Make 'lookalike' a false positive
+    for position in seen._positions('lookalike'):
+        seen.bits[position >> 3] |= 1 << (position & 7)
+    assert 'lookalike' in seen
+    store.seen.save('viewer', seen)
+
+    with app.app_context():
+        deck = get_deck_builder().build('viewer')
+
+    assert deck['uids'] == ['lookalike']
+    seen = store.seen.get_set('viewer')
+    assert seen.cleared == {'lookalike'}
+    assert 'lookalike' not in seen and 'swiped' in seen
+
+    # Swiping on it later hides it for good
+    seen = store.seen.add('viewer', 'lookalike')
+    assert 'lookalike' in seen and not seen.cleared
+    assert 'lookalike' in store.seen.get_set('viewer')
+
+def test_concurrent_swipes_are_both_recorded(store):
+    """Test that a swipe saved while another is being recorded makes it retry instead of dropping one."""
+    store.seen.save('viewer', SeenSet(['first']))
+
+    from_dict = SeenSet.from_dict
+    calls = []
+
+    def from_dict_then_swipe(data):
+        calls.append(data)
+        if len(calls) == 1:
+            store.seen.add('viewer', 'meanwhile')
+        return from_dict(data)
+
+    with patch('app.data.repositories.SeenSet.from_dict', side_effect=from_dict_then_swipe):
+        store.seen.add('viewer', 'second')
+
+    assert set(store.seen.get_set('viewer').uids) == {'first', 'meanwhile', 'second'}
+
+@patch('app.utils.decorators.auth')
+def test_discover_leaves_out_swiped_profiles(auth_mock, client, firebase_mock, auth_token, user_data, store, seed):
+    """Test that liked and disliked profiles stay out of discover until likes are cleared."""
+    auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
+
+    seed('users', 'test_user_123', dict(user_data, updated_at=datetime.now(timezone.utc)))
+    for uid in ['liked', 'disliked', 'fresh']:
+        seed('users', uid, profile(display_name=uid))
+    headers = {'Authorization': auth_token}
+
+    assert client.post('/api/matches/like/liked', headers=headers).status_code == 200
+    assert client.post('/api/matches/dislike/disliked', headers=headers).status_code == 200
+
+    response = client.get('/api/profiles/discover', headers=headers)
+    assert [p['display_name'] for p in json.loads(response.data)] == ['fresh']
+
+    # The swipes are one small document, without querying likes or dislikes
+    store.client.stats.reset()
+    assert len(store.seen.get_set('test_user_123')) == 2
+    assert store.client.stats.document_reads == 1
+    assert store.client.stats.queries == 0
+
+    client.post('/api/matches/clear-likes', headers=headers)
+    response = client.get('/api/profiles/discover', headers=headers)
+    assert sorted(p['display_name'] for p in json.loads(response.data)) == ['disliked', 'fresh', 'liked']
+
+@patch('app.utils.decorators.auth')
+def test_discover_pages_through_the_deck(auth_mock, client, firebase_mock, auth_token, user_data, store, seed):
+    """Test that discover serves pages of a precomputed deck without ranking again."""
+    auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
+
+    seed('users', 'test_user_123', dict(user_data, updated_at=datetime.now(timezone.utc)))
+    for i in range(5):
+        store.users.set(f'user_{i}', profile(display_name=f'user_{i}'))
+    headers = {'Authorization': auth_token}
+
+    first = client.get('/api/profiles/discover?limit=2', headers=headers)
+    assert first.headers['X-Has-More'] == 'true'
+
+    # Later pages only read the seen set, the deck and the profiles returned
+    store.client.stats.reset()
+    second = client.get(f"/api/profiles/discover?limit=2&after={first.headers['X-Cursor-After']}", headers=headers)
+    assert store.client.stats.queries == 0
+    assert store.client.stats.document_reads == 1 + 2 + 2
+    third = client.get(f"/api/profiles/discover?limit=2&after={second.headers['X-Cursor-After']}", headers=headers)
+    assert third.headers['X-Has-More'] == 'false'
+
+    pages = [[p['display_name'] for p in json.loads(r.data)] for r in (first, second, third)]
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert sorted(sum(pages, [])) == [f'user_{i}' for i in range(5)]
+
+    # A cursor into a deck that has since been rebuilt starts over
+    store.decks.save('test_user_123', [('user_4', None)])
+    response = client.get(f"/api/profiles/discover?after={second.headers['X-Cursor-After']}", headers=headers)
+    assert [p['display_name'] for p in json.loads(response.data)] == ['user_4']
+
+    response = client.get('/api/profiles/discover?after=nonsense', headers=headers)
+    assert response.status_code == 400
+
+@patch('app.utils.decorators.auth')
+def test_changing_preferences_rebuilds_the_deck(auth_mock, client, firebase_mock, auth_token, user_data, store, seed):
+    """Test that a preference change re-ranks the user's deck."""
+    auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
+
+    seed('users', 'test_user_123', dict(user_data, updated_at=datetime.now(timezone.utc)))
+    seed('users', 'woman', profile(display_name='woman'))
+    seed('users', 'man', profile(display_name='man', gender='male'))
+    headers = {'Authorization': auth_token}
+
+    response = client.get('/api/profiles/discover', headers=headers)
+    assert [p['display_name'] for p in json.loads(response.data)] == ['woman']
+
+    preferences = dict(user_data['preferences'], gender='male')
+    client.put('/api/profiles/', json={'preferences': preferences}, headers=headers)
+    assert store.decks.get_deck('test_user_123')['uids'] == ['man']
+
+    response = client.get('/api/profiles/discover', headers=headers)
+    assert [p['display_name'] for p in json.loads(response.data)] == ['man']
+
+def test_deck_builder_rebuilds_in_the_background(app, store):
+    """Test that scheduled deck builds run on worker threads."""
+    app.config['DISCOVERY_DECK_BACKGROUND'] = True
+    store.users.set('viewer', dict(VIEWER, updated_at=datetime.now(timezone.utc)))
+    store.users.set('match', profile())
+
+    with app.app_context():
+        builder = get_deck_builder()
+        builder.schedule('viewer')
+        builder.shutdown()
+
+    assert store.decks.get_deck('viewer')['uids'] == ['match']
+
+def test_interest_scores_weigh_rare_interests_more():
+    """Test that interests are normalized and that sharing a rare interest scores higher."""
+    interests = InterestIndex()
+    interests.update('common', ['Hiking'])
+    interests.update('rare', ['  Rock   CLIMBING '])
+    interests.update('both', ['hiking', 'rock climbing'])
+    interests.update('none', ['chess'])
+    for i in range(10):
+        interests.update(f'hiker_{i}', ['hiking'])
+
+    assert interests.users_with('ROCK climbing') == {'rare', 'both'}
+
+    scores = interests.score(['hiking', 'rock climbing'], ['both', 'rare', 'common', 'none', 'unknown'])
+    assert scores[0] == pytest.approx(1.0)
+    assert scores[1] > scores[2] > 0
+    assert list(scores[3:]) == [0, 0]
+
+    # Changing interests replaces the old ones
+    interests.update('rare', ['chess'])
+    assert interests.users_with('rock climbing') == {'both'}
+
+def test_search_ranks_pool_by_interests(users):
+    """Test that rank_pool reorders the nearest candidates by shared interests."""
+    viewer = dict(VIEWER, interests=['Jazz'])
+    users.set('viewer', dict(viewer, updated_at=datetime.now(timezone.utc)))
+    for i in range(5):
+        users.set(f'user_{i}', profile(location={'latitude': 37.7749 + 0.01 * i, 'longitude': -122.4194}))
+    users.set('user_4', profile(location={'latitude': 37.8149, 'longitude': -122.4194}, interests=['jazz']))
+
+    index = CandidateIndex(users)
+    index.build()
+
+    assert [uid for uid, _ in index.search('viewer', viewer, 2)] == ['user_0', 'user_1']
+    assert [uid for uid, _ in index.search('viewer', viewer, 2, rank_pool=5)] == ['user_4', 'user_0']
+    assert [uid for uid, _ in index.search('viewer', viewer, 2, rank_pool=3)] == ['user_0', 'user_1']
+
+    index.update_interests('user_0', ['jazz', 'opera'])
+    assert [uid for uid, _ in index.search('viewer', viewer, 2, rank_pool=5)] == ['user_4', 'user_0']
+    index.update_interests('user_1', ['Jazz'])
+    assert [uid for uid, _ in index.search('viewer', viewer, 2, rank_pool=5)] == ['user_1', 'user_4']
+
+@patch('app.utils.decorators.auth')
+def test_deck_ranks_shared_interests_first(auth_mock, client, firebase_mock, auth_token, user_data, store, seed):
+    """Test that a deck puts candidates with shared interests ahead of nearer ones, and follows interest updates."""
+    auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
+
+    seed('users', 'test_user_123', dict(user_data, interests=['Hiking'], updated_at=datetime.now(timezone.utc)))
+    seed('users', 'near', profile(display_name='near', location=SAN_FRANCISCO, interests=['chess']))
+    seed('users', 'far', profile(display_name='far', interests=['hiking', 'chess']))
+    headers = {'Authorization': auth_token}
+
+    response = client.get('/api/profiles/discover', headers=headers)
+    assert [p['display_name'] for p in json.loads(response.data)] == ['far', 'near']
+
+    client.put('/api/profiles/', json={'interests': ['Chess']}, headers=headers)
+    response = client.get('/api/profiles/discover', headers=headers)
+    assert [p['display_name'] for p in json.loads(response.data)] == ['near', 'far']
+
+def test_bucket_key_groups_similar_preferences():
+    """Test that viewers nearby with similar preferences share a bucket, and others don't."""
+    neighbour = dict(VIEWER, location={'latitude': 37.7849, 'longitude': -122.4094},
+                     preferences={'age_min': 26, 'age_max': 34, 'gender': 'female', 'distance_max': 40})
+    assert bucket_key(neighbour) == bucket_key(VIEWER) == ('female', 25, 35, '9q8y', 50)
+
+    assert bucket_key(dict(VIEWER, location=LOS_ANGELES)) != bucket_key(VIEWER)
+    assert bucket_key(dict(VIEWER, preferences=dict(VIEWER['preferences'], gender='all')))[0] is None
+    assert bucket_key({'preferences': {'gender': 'female'}}) == ('female', None, None, None, None)
+
+def located(**fields):
+    """A profile() with the geohash the queries used without the index need."""
+    data = profile(**fields)
+    return dict(data, **geohash_fields(data['location']))
+
+def test_deck_builds_share_bucket_queries(app, store):
+    """Test that deck builds without the index share one bucket's queries and filter it per viewer."""
+    app.config['DISCOVERY_INDEX'] = False
+    store.users.set('viewer', dict(VIEWER, **geohash_fields(SAN_FRANCISCO)))
+    nearby = {'latitude': 37.7849, 'longitude': -122.4094}
+    store.users.set('neighbour', dict(VIEWER, location=nearby, preferences=dict(VIEWER['preferences'], age_max=31)))
+    store.users.set('young', located(age=29, location=SAN_FRANCISCO))
+    store.users.set('old', located(age=34))
+    store.users.set('man', located(gender='male'))
+    store.users.set('far', located(location=LOS_ANGELES))
+
+    with app.app_context():
+        builder = get_deck_builder()
+        assert builder.build('viewer')['uids'] == ['young', 'old']
+
+        store.client.stats.reset()
+        assert builder.build('neighbour', seen=SeenSet())['uids'] == ['young']
+        # Only the neighbour's own documents were read: the bucket was reused
+        assert store.client.stats.queries == 0
+        assert (get_buckets().loads, get_buckets().hits) == (1, 1)
+
+@patch('app.utils.decorators.auth')
+def test_profile_updates_invalidate_buckets(auth_mock, client, user_data, seed, app):
+    """Test that a profile moving into a bucket drops it, so the next deck build sees the profile."""
+    app.config['DISCOVERY_INDEX'] = False
+    seed('users', 'test_user_123', dict(user_data, **geohash_fields(user_data['location'])))
+    seed('users', 'other_user_123', located(location=LOS_ANGELES))
+    seed('users', 'bystander', located(age=30, location=LOS_ANGELES))
+
+    with app.app_context():
+        builder = get_deck_builder()
+        assert builder.build('test_user_123')['uids'] == []
+        key = bucket_key(user_data)
+        assert key in get_buckets()
+
+        # A profile far away that doesn't move leaves the bucket alone
+        auth_mock.verify_id_token.return_value = {'uid': 'bystander'}
+        client.put('/api/profiles/', json={'age': 31, 'location': LOS_ANGELES}, headers={'Authorization': 'Bearer bystander_token'})
+        assert key in get_buckets()
+
+        auth_mock.verify_id_token.return_value = {'uid': 'other_user_123'}
+        client.put('/api/profiles/', json={'location': OAKLAND}, headers={'Authorization': 'Bearer moving_token'})
+        assert key not in get_buckets()
+        assert builder.build('test_user_123')['uids'] == ['other_user_123']
+
+def test_sample_candidates_wraps_around_from_a_random_point(users):
+    """Test that samples start at a random sampling key, wrap around, and stay within the read budget."""
+    users.set('new', {'gender': 'female'})
+    assert 0 <= users.get('new').to_dict()['random_key'] < 1
+    users.delete('new')
+
+    for i in range(10):
+        users.set(f'user_{i}', {'gender': 'female' if i % 2 else 'male', 'random_key': i / 10})
+
+    with patch('app.data.repositories.random.random', return_value=0.75):
+        assert [doc.id for doc in users.sample_candidates(limit=4)] == ['user_8', 'user_9', 'user_0', 'user_1']
+        assert [doc.id for doc in users.sample_candidates(gender='female', limit=3)] == ['user_9', 'user_1', 'user_3']
+        assert len(users.sample_candidates(limit=20)) == 10
+
+        users.client.stats.reset()
+        users.sample_candidates(limit=5)
+        assert users.client.stats.document_reads == 5
@@ -0,0 +1,50 @@
+"""
+Tests for geohash encoding and radius coverage.
+"""
+import math
+import random
+
+from app.utils.geo import decode_geohash_bounds, encode_geohash, geohash_query_ranges, haversine_km, valid_coordinates
+
+
+def test_encode_geohash():
+    """Test encoding against known geohashes."""
+    assert encode_geohash(57.64911, 10.40744, 11) == 'u4pruydqqvj'
+    assert encode_geohash(37.7749, -122.4194, 5) == '9q8yy'
+
+def test_decode_geohash_bounds():
+    """Test that a decoded cell contains the points encoded into it."""
+    south, west, north, east = decode_geohash_bounds('9q8y')
+    assert south <= 37.7749 < north and west <= -122.4194 < east
+    assert (north - south, east - west) == (180 / 2 ** 10, 360 / 2 ** 10)
+    assert decode_geohash_bounds('') == (-90.0, -180.0, 90.0, 180.0)
+
+def test_haversine_km():
+    """Test great-circle distances."""
+    assert haversine_km(37.7749, -122.4194, 37.7749, -122.4194) == 0
+    assert 555 < haversine_km(37.7749, -122.4194, 34.0522, -118.2437) < 562
+
+def test_query_ranges_cover_the_radius():
+    """Test that every point inside the circle falls in one of the ranges."""
+    rng = random.Random(7)
+    for _ in range(300):
+        latitude, longitude = rng.uniform(-70, 70), rng.uniform(-179, 179)
+        radius = rng.choice([1, 10, 50, 200])
+        ranges = geohash_query_ranges(latitude, longitude, radius)
+        assert len(ranges) <= 9
+
+        for _ in range(10):
+            bearing, distance = rng.uniform(0, 2 * math.pi), rng.uniform(0, radius)
+            point_lat = latitude + distance / 110.574 * math.cos(bearing)
+            point_lon = longitude + distance / (111.32 * math.cos(math.radians(latitude))) * math.sin(bearing)
+            if abs(point_lon) > 180 or haversine_km(latitude, longitude, point_lat, point_lon) > radius:
+                continue
+            geohash = encode_geohash(point_lat, point_lon)
+            assert any(start <= geohash < end for start, end in ranges)
+
+def test_valid_coordinates():
+    """Test that only numeric, in-range coordinates are accepted."""
+    assert valid_coordinates({'latitude': 1, 'longitude': 2}) == (1.0, 2.0)
+    assert valid_coordinates({'latitude': 91, 'longitude': 0}) is None
+    assert valid_coordinates({'latitude': '1', 'longitude': 2}) is None
+    assert valid_coordinates(None) is None
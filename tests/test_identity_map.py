@@ -0,0 +1,88 @@
+"""
+Tests for the request-scoped document identity map.
+"""
+import pytest
+from unittest.mock import MagicMock
+
+from app.data.memory import MemoryClient
+from app.utils.identity_map import get_document, get_documents, invalidate_document, reads_saved
+
+
+def test_repeated_reads_are_served_from_map(app):
+    """Test that a document is read once per request."""
+    db_mock = MagicMock()
+
+    with app.test_request_context():
+        first = get_document(db_mock, 'matches', 'match_123')
+        second = get_document(db_mock, 'matches', 'match_123')
+
+        assert first is second
+        assert reads_saved() == 1
+        db_mock.collection().document().get.assert_called_once()
+
+def test_full_snapshot_covers_masked_reads(app):
+    """Test that a full read satisfies later field-masked reads."""
+    db_mock = MagicMock()
+
+    with app.test_request_context():
+        get_document(db_mock, 'users', 'test_user_123')
+        get_document(db_mock, 'users', 'test_user_123', field_paths=['display_name'])
+
+        assert reads_saved() == 1
+
+def test_masked_snapshot_does_not_cover_wider_reads(app):
+    """Test that a masked read never hides fields from a later full read."""
+    db_mock = MagicMock()
+
+    with app.test_request_context():
+        get_document(db_mock, 'users', 'test_user_123', field_paths=['display_name'])
+        get_document(db_mock, 'users', 'test_user_123')
+
+        assert reads_saved() == 0
+        assert db_mock.collection().document().get.call_count == 2
+
+def test_invalidate_forces_fresh_read(app):
+    """Test that written documents are re-read."""
+    db_mock = MagicMock()
+
+    with app.test_request_context():
+        get_document(db_mock, 'matches', 'match_123')
+        invalidate_document('matches', 'match_123')
+        get_document(db_mock, 'matches', 'match_123')
+
+        assert reads_saved() == 0
+        assert db_mock.collection().document().get.call_count == 2
+
+def test_map_is_request_scoped(app):
+    """Test that snapshots are never shared across requests."""
+    db_mock = MagicMock()
+
+    with app.test_request_context():
+        get_document(db_mock, 'matches', 'match_123')
+
+    with app.test_request_context():
+        get_document(db_mock, 'matches', 'match_123')
+        assert reads_saved() == 0
+
+    assert db_mock.collection().document().get.call_count == 2
+
+def test_get_documents_reads_in_chunks(app):
+    """Test that batched reads take one round trip per chunk and skip mapped documents."""
+    client = MemoryClient()
+    for i in range(5):
+        client.collection('users').document(f'user_{i}').set({'display_name': f'User {i}', 'email': 'x'})
+    client.stats.reset()
+
+    with app.test_request_context():
+        get_document(client, 'users', 'user_0')
+        snapshots = get_documents(
+            client, 'users', [f'user_{i}' for i in range(5)] + ['missing'],
+            field_paths=['display_name'], chunk_size=2
+        )
+
+        # user_0 came from the map; the other 5 IDs took 3 chunks
+        assert reads_saved() == 1
+        assert client.stats.round_trips == 1 + 3
+        assert snapshots['user_3'].to_dict() == {'display_name': 'User 3'}
+        assert snapshots['user_0'].to_dict()['email'] == 'x'
+        assert not snapshots['missing'].exists
@@ -5,97 +5,56 @@ import pytest
 import json
 from unittest.mock import patch, MagicMock
 
+from app.data.repositories import pair_key, participant_fields
+
 @patch('app.utils.decorators.auth')
-@patch('app.config.firebase.db')
-@patch('app.api.matches.db')
-@patch('app.api.matches.firestore')
-def test_like_profile(firestore_mock, matches_db_mock, decorator_db_mock, auth_mock, client, firebase_mock, auth_token):
+def test_like_profile(auth_mock, client, firebase_mock, auth_token, store, seed):
     """Test liking a profile."""
     # Configure mocks
     auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
-    firestore_mock.SERVER_TIMESTAMP = firebase_mock['firestore'].SERVER_TIMESTAMP
-    
-    # Mock target user document
-    target_user_doc = MagicMock()
-    target_user_doc.exists = True
-    
-    # Configure db mocks for authentication
-    decorator_db_mock.collection().document().get.return_value.exists = True
-    decorator_db_mock.collection().document().get.return_value.to_dict.return_value = {
-        'uid': 'test_user_123'
-    }
-    
-    # Configure match db mocks
-    matches_db_mock.collection().document().get.return_value = target_user_doc
-    
-    # No mutual likes yet (empty query result)
-    matches_db_mock.collection().where().where().limit().get.return_value = []
-    
-    # Mock the add operation (for like)
-    add_mock = MagicMock()
-    matches_db_mock.collection().add.return_value = (add_mock, MagicMock())
-    
+
+    # Seed the current and target users
+    seed('users', 'test_user_123', {'uid': 'test_user_123'})
+    seed('users', 'target_user_456', {'uid': 'target_user_456'})
+
     # Send request
     response = client.post(
         '/api/matches/like/target_user_456',
         headers={'Authorization': auth_token}
     )
-    
+
     # Check response
     assert response.status_code == 200
     response_data = json.loads(response.data)
     assert 'message' in response_data
     assert 'is_match' in response_data
     assert response_data['is_match'] is False
-    
-    # Verify Firestore calls
-    matches_db_mock.collection().document().get.assert_called_once()
-    matches_db_mock.collection().add.assert_called_once()
+
+    # Verify the like was stored and no match was created
+    likes = store.likes.collection.get()
+    assert len(likes) == 1
+    assert likes[0].to_dict()['liker_uid'] == 'test_user_123'
+    assert likes[0].to_dict()['target_uid'] == 'target_user_456'
+    assert store.matches.collection.get() == []
 
 @patch('app.utils.decorators.auth')
-@patch('app.config.firebase.db')
-@patch('app.api.matches.db')
-@patch('app.api.matches.firestore')
-def test_like_profile_creates_match(firestore_mock, matches_db_mock, decorator_db_mock, auth_mock, client, firebase_mock, auth_token):
+def test_like_profile_creates_match(auth_mock, client, firebase_mock, auth_token, store, seed):
     """Test liking a profile that creates a match."""
     # Configure mocks
     auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
-    firestore_mock.SERVER_TIMESTAMP = firebase_mock['firestore'].SERVER_TIMESTAMP
-    
-    # Mock target user document
-    target_user_doc = MagicMock()
-    target_user_doc.exists = True
-    
-    # Configure db mocks for authentication
-    decorator_db_mock.collection().document().get.return_value.exists = True
-    decorator_db_mock.collection().document().get.return_value.to_dict.return_value = {
-        'uid': 'test_user_123'
-    }
-    
-    # Configure match db mocks
-    matches_db_mock.collection().document().get.return_value = target_user_doc
-    
-    # Create a mutual like (non-empty query result)
-    mutual_like_mock = MagicMock()
-    matches_db_mock.collection().where().where().limit().get.return_value = [mutual_like_mock]
-    
-    # Mock the add operations
-    like_add_mock = MagicMock()
-    match_add_mock = MagicMock()
-    match_id_mock = MagicMock()
-    match_id_mock.id = 'match_123'
-    
-    matches_db_mock.collection().add.side_effect = [
-        (like_add_mock, MagicMock()),  # First add (like)
-        (MagicMock(), match_id_mock)   # Second add (match)
-    ]
-    
+
+    seed('users', 'test_user_123', {'uid': 'test_user_123'})
+    seed('users', 'target_user_456', {'uid': 'target_user_456'})
+
+    # The target user already liked the current user
+    seed('likes', 'like_1', {'liker_uid': 'target_user_456', 'target_uid': 'test_user_123'})
+
     # Send request
     response = client.post(
         '/api/matches/like/target_user_456',
         headers={'Authorization': auth_token}
     )
-    
+
     # Check response
     assert response.status_code == 200
     response_data = json.loads(response.data)
@@ -103,148 +62,235 @@ def test_like_profile_creates_match(firestore_mock, matches_db_mock, decorator_d
     assert 'is_match' in response_data
     assert response_data['is_match'] is True
     assert 'match_id' in response_data
-    assert response_data['match_id'] == 'match_123'
-    
-    # Verify Firestore calls
-    matches_db_mock.collection().document().get.assert_called_once()
-    assert matches_db_mock.collection().add.call_count == 2
+
+    # Verify the match document
+    match_doc = store.matches.get(response_data['match_id'])
+    assert match_doc.exists
+    assert match_doc.to_dict()['active'] is True
+    assert match_doc.to_dict()['participants'] == ['target_user_456', 'test_user_123']
+    assert len(store.likes.collection.get()) == 2
+
+    # The match is keyed by the pair, so it's found in either order without a query
+    assert match_doc.id == pair_key('test_user_123', 'target_user_456')
+    store.client.stats.reset()
+    assert store.matches.find_between('test_user_123', 'target_user_456').id == match_doc.id
+    assert store.matches.find_between('target_user_456', 'test_user_123').id == match_doc.id
+    assert store.matches.find_between('test_user_123', 'someone_else') is None
+    assert store.client.stats.queries == 0
+
+    # Liking again returns the same match without creating another
+    response = client.post(
+        '/api/matches/like/target_user_456',
+        headers={'Authorization': auth_token}
+    )
+    assert json.loads(response.data)['match_id'] == match_doc.id
+    assert len(store.matches.collection.get()) == 1
+
+def test_match_is_created_once_per_pair(store):
+    """Test that a second create for the same pair (e.g. simultaneous mutual likes) keeps the first match."""
+    match_id, created = store.matches.create('user_a', 'user_b')
+    assert created is True
+    store.matches.deactivate(match_id, 'user_a')
+
+    assert store.matches.create('user_b', 'user_a') == (match_id, False)
+    assert len(store.matches.collection.get()) == 1
+    assert store.matches.get(match_id).to_dict()['active'] is False
 
 @patch('app.utils.decorators.auth')
-@patch('app.config.firebase.db')
-@patch('app.api.matches.db')
-@patch('app.api.matches.firestore')
-def test_dislike_profile(firestore_mock, matches_db_mock, decorator_db_mock, auth_mock, client, firebase_mock, auth_token):
+def test_like_profile_user_not_found(auth_mock, client, firebase_mock, auth_token, store, seed):
+    """Test liking a profile that doesn't exist."""
+    auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
+    seed('users', 'test_user_123', {'uid': 'test_user_123'})
+
+    response = client.post(
+        '/api/matches/like/missing_user',
+        headers={'Authorization': auth_token}
+    )
+
+    assert response.status_code == 404
+    assert store.likes.collection.get() == []
+
+@patch('app.utils.decorators.auth')
+def test_dislike_profile(auth_mock, client, firebase_mock, auth_token, store, seed):
     """Test disliking a profile."""
     # Configure mocks
     auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
-    firestore_mock.SERVER_TIMESTAMP = firebase_mock['firestore'].SERVER_TIMESTAMP
-    
-    # Configure db mocks for authentication
-    decorator_db_mock.collection().document().get.return_value.exists = True
-    decorator_db_mock.collection().document().get.return_value.to_dict.return_value = {
-        'uid': 'test_user_123'
-    }
-    
-    # Mock the add operation
-    add_mock = MagicMock()
-    matches_db_mock.collection().add.return_value = (add_mock, MagicMock())
-    
+    seed('users', 'test_user_123', {'display_name': 'Test User'})
+
     # Send request
     response = client.post(
         '/api/matches/dislike/target_user_456',
         headers={'Authorization': auth_token}
     )
-    
+
     # Check response
     assert response.status_code == 200
     response_data = json.loads(response.data)
     assert 'message' in response_data
-    
-    # Verify Firestore calls
-    matches_db_mock.collection().add.assert_called_once()
+
+    # Verify the dislike was stored
+    dislikes = store.dislikes.collection.get()
+    assert len(dislikes) == 1
+    assert dislikes[0].to_dict()['disliker_uid'] == 'test_user_123'
 
 @patch('app.utils.decorators.auth')
-@patch('app.config.firebase.db')
-@patch('app.api.matches.db')
-def test_get_matches(matches_db_mock, decorator_db_mock, auth_mock, client, firebase_mock, auth_token, match_data):
+def test_get_matches(auth_mock, client, firebase_mock, auth_token, match_data, seed):
     """Test getting user's matches."""
     # Configure mocks
     auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
-    
-    # Configure db mocks for authentication
-    decorator_db_mock.collection().document().get.return_value.exists = True
-    decorator_db_mock.collection().document().get.return_value.to_dict.return_value = {
-        'uid': 'test_user_123'
-    }
-    
-    # Mock matches as user1
-    match_doc1 = MagicMock()
-    match_doc1.id = 'match_123'
-    match_doc1.to_dict.return_value = match_data
-    
-    # Mock matches as user2
-    match_doc2 = MagicMock()
-    match_doc2.id = 'match_456'
-    match_doc2.to_dict.return_value = {
-        'user1_uid': 'test_user_456',
+
+    # Match as user1
+    seed('matches', 'match_123', match_data)
+
+    # Match as user2
+    seed('matches', 'match_456', {
+        'user1_uid': 'test_user_789',
         'user2_uid': 'test_user_123',
+        **participant_fields('test_user_789', 'test_user_123'),
         'created_at': match_data['created_at'],
         'active': True
-    }
-    
-    # Mock the other user's profile
-    other_user_doc = MagicMock()
-    other_user_doc.exists = True
-    other_user_doc.to_dict.return_value = {
+    })
+
+    # Inactive matches are not listed
+    seed('matches', 'match_789', {
+        'user1_uid': 'test_user_123',
+        'user2_uid': 'test_user_789',
+        **participant_fields('test_user_123', 'test_user_789'),
+        'created_at': match_data['created_at'],
+        'active': False
+    })
+
+    # The other users' profiles
+    seed('users', 'test_user_456', {
         'uid': 'test_user_456',
         'display_name': 'Other User',
         'photos': ['photo1.jpg']
-    }
-    
-    # Configure match db mocks
-    matches_db_mock.collection().where().where().get.side_effect = [
-        [match_doc1],  # First call (matches as user1)
-        [match_doc2]   # Second call (matches as user2)
-    ]
-    
-    matches_db_mock.collection().document().get.return_value = other_user_doc
-    
+    })
+    seed('users', 'test_user_789', {
+        'uid': 'test_user_789',
+        'display_name': 'Third User',
+        'photos': ['photo2.jpg']
+    })
+
     # Send request
     response = client.get(
         '/api/matches/matches',
         headers={'Authorization': auth_token}
     )
-    
+
     # Check response
     assert response.status_code == 200
     response_data = json.loads(response.data)
     assert isinstance(response_data, list)
     assert len(response_data) == 2
-    
+
     # Check match data
-    assert 'id' in response_data[0]
-    assert 'match_profile' in response_data[0]
-    assert 'id' in response_data[1]
-    assert 'match_profile' in response_data[1]
+    assert 'match_id' in response_data[0]
+    assert 'display_name' in response_data[0]
+    assert 'match_id' in response_data[1]
+    assert 'display_name' in response_data[1]
+    assert {m['match_id'] for m in response_data} == {'match_123', 'match_456'}
+
+@patch('app.utils.decorators.auth')
+def test_get_matches_batches_profile_reads(auth_mock, client, firebase_mock, auth_token, store, seed):
+    """Test that match profiles are loaded in chunks rather than one read per match."""
+    auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
+
+    for i in range(150):
+        seed('matches', f'match_{i}', {
+            'user1_uid': 'test_user_123',
+            'user2_uid': f'other_user_{i}',
+            **participant_fields('test_user_123', f'other_user_{i}'),
+            'created_at': i,
+            'active': True
+        })
+        store.users.set(f'other_user_{i}', {
+            'uid': f'other_user_{i}',
+            'display_name': f'User {i}',
+            'email': f'user{i}@example.com',
+            'photos': ['first.jpg', 'second.jpg']
+        })
+    store.client.stats.reset()
+
+    response = client.get(
+        '/api/matches/matches',
+        headers={'Authorization': auth_token}
+    )
+
+    assert response.status_code == 200
+    response_data = json.loads(response.data)
+    assert len(response_data) == 150
+    assert response_data[0]['display_name'] == 'User 149'
+    assert response_data[0]['photos'] == ['first.jpg']
+
+    # One match query plus two get_all chunks
+    assert store.client.stats.round_trips == 3
 
 @patch('app.utils.decorators.auth')
-@patch('app.config.firebase.db')
-@patch('app.api.matches.db')
-@patch('app.api.matches.firestore')
-def test_unmatch(firestore_mock, matches_db_mock, decorator_db_mock, auth_mock, client, firebase_mock, auth_token, match_data):
+def test_get_matches_returns_requested_fields(auth_mock, client, firebase_mock, auth_token, store, seed):
+    """Test that ?fields= trims the match listing and the profile fields read for it."""
+    auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
+    seed('matches', 'match_1', {
+        **participant_fields('test_user_123', 'other_user'),
+        'user1_uid': 'test_user_123',
+        'user2_uid': 'other_user',
+        'created_at': 1,
+        'active': True
+    })
+    store.users.set('other_user', {'uid': 'other_user', 'display_name': 'Other', 'bio': 'Hi', 'photos': ['a.jpg', 'b.jpg']})
+
+    with patch.object(store.public_profiles, 'get_many', wraps=store.public_profiles.get_many) as get_many:
+        response = client.get('/api/matches/matches?fields=user_uid,display_name', headers={'Authorization': auth_token})
+
+    assert json.loads(response.data) == [{'user_uid': 'other_user', 'display_name': 'Other'}]
+    assert get_many.call_args.kwargs['fields'] == ['uid', 'display_name']
+
+@patch('app.utils.decorators.auth')
+def test_unmatch(auth_mock, client, firebase_mock, auth_token, match_data, store, seed):
     """Test unmatching from a user."""
     # Configure mocks
     auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
-    firestore_mock.SERVER_TIMESTAMP = firebase_mock['firestore'].SERVER_TIMESTAMP
-    
-    # Configure db mocks for authentication
-    decorator_db_mock.collection().document().get.return_value.exists = True
-    decorator_db_mock.collection().document().get.return_value.to_dict.return_value = {
-        'uid': 'test_user_123'
-    }
-    
-    # Mock match document
-    match_doc = MagicMock()
-    match_doc.exists = True
-    match_doc.to_dict.return_value = match_data
-    
-    # Configure match db mocks
-    matches_db_mock.collection().document().get.return_value = match_doc
-    
+
+    seed('matches', 'match_123', match_data)
+
     # Send request
     response = client.post(
         '/api/matches/unmatch/match_123',
         headers={'Authorization': auth_token}
     )
-    
+
     # Check response
     assert response.status_code == 200
     response_data = json.loads(response.data)
     assert 'message' in response_data
-    
-    # Verify Firestore update
-    matches_db_mock.collection().document().update.assert_called_once_with({
-        'active': False,
-        'unmatch_initiated_by': 'test_user_123',
-        'unmatched_at': firestore_mock.SERVER_TIMESTAMP
-    }) 
\ No newline at end of file
+
+    # Verify the match was deactivated
+    match = store.matches.get('match_123').to_dict()
+    assert match['active'] is False
+    assert match['unmatch_initiated_by'] == 'test_user_123'
+    assert match['unmatched_at'] is not None
+
+@patch('app.utils.decorators.auth')
+def test_clear_likes(auth_mock, client, firebase_mock, auth_token, store, seed):
+    """Test that only likes and dislikes from the current user are cleared."""
+    auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
+
+    seed('likes', 'like_1', {'liker_uid': 'test_user_123', 'target_uid': 'test_user_456'})
+    seed('likes', 'like_2', {'liker_uid': 'test_user_456', 'target_uid': 'test_user_123'})
+    seed('dislikes', 'dislike_1', {'disliker_uid': 'test_user_123', 'target_uid': 'test_user_789'})
+
+    response = client.post(
+        '/api/matches/clear-likes',
+        headers={'Authorization': auth_token}
+    )
+
+    assert response.status_code == 200
+    assert [like.id for like in store.likes.collection.get()] == ['like_2']
+    assert store.dislikes.collection.get() == []
+    assert len(store.seen.get_set('test_user_123')) == 0
+
+def test_pair_key_is_unambiguous():
+    """Test that pair keys ignore order and don't collide for UIDs containing separators."""
+    assert pair_key('user_b', 'user_a') == pair_key('user_a', 'user_b')
+    assert pair_key('a_b', 'c') != pair_key('a', 'b_c')
+    assert pair_key('a:b', 'c') != pair_key('a', 'b:c')
@@ -4,143 +4,103 @@ Tests for messaging endpoints.
 import pytest
 import json
 from unittest.mock import patch, MagicMock
-from datetime import datetime
+from datetime import datetime, timedelta
 
 @patch('app.utils.decorators.auth')
-@patch('app.config.firebase.db')
-@patch('app.api.messages.db')
-def test_get_messages(messages_db_mock, decorator_db_mock, auth_mock, client, firebase_mock, auth_token, match_data, message_data):
+def test_get_messages(auth_mock, client, firebase_mock, auth_token, match_data, message_data, store, seed):
     """Test getting messages for a match."""
     # Configure mocks
     auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
-    
-    # Configure db mocks for authentication
-    decorator_db_mock.collection().document().get.return_value.exists = True
-    decorator_db_mock.collection().document().get.return_value.to_dict.return_value = {
-        'uid': 'test_user_123'
-    }
-    
-    # Mock match document
-    match_doc = MagicMock()
-    match_doc.exists = True
-    match_doc.to_dict.return_value = match_data
-    
-    # Mock messages query results
-    message_doc1 = MagicMock()
-    message_doc1.id = 'message_123'
-    message_doc1.to_dict.return_value = message_data
-    
-    message_doc2 = MagicMock()
-    message_doc2.id = 'message_456'
-    message_doc2.to_dict.return_value = {
+
+    seed('matches', 'match_123', match_data)
+    seed('messages', 'message_123', message_data)
+    seed('messages', 'message_456', {
         'match_id': 'match_123',
         'sender_uid': 'test_user_456',
         'content': 'Hello back!',
-        'created_at': datetime.now(),
+        'created_at': message_data['created_at'] + timedelta(seconds=1),
         'read': False,
         'read_at': None
-    }
-    
-    # Configure messages db mocks
-    messages_db_mock.collection().document().get.return_value = match_doc
-    messages_db_mock.collection().where().order_by().get.return_value = [message_doc1, message_doc2]
-    
-    # Mock the batch for marking messages as read
-    batch_mock = MagicMock()
-    messages_db_mock.batch.return_value = batch_mock
-    
-    # Return empty list for unread messages to simplify test
-    messages_db_mock.collection().where().where().where().get.return_value = []
-    
+    })
+
+    # Messages from other matches are not returned
+    seed('messages', 'message_789', {
+        'match_id': 'match_999',
+        'sender_uid': 'test_user_456',
+        'content': 'Wrong match',
+        'created_at': message_data['created_at'],
+        'read': False,
+        'read_at': None
+    })
+
+    store.client.stats.reset()
+
     # Send request
     response = client.get(
         '/api/messages/match_123',
         headers={'Authorization': auth_token}
     )
-    
+
     # Check response
     assert response.status_code == 200
     response_data = json.loads(response.data)
     assert isinstance(response_data, list)
     assert len(response_data) == 2
-    
+
     # Check message data
     assert response_data[0]['id'] == 'message_123'
     assert response_data[0]['content'] == message_data['content']
     assert response_data[1]['id'] == 'message_456'
     assert response_data[1]['sender_uid'] == 'test_user_456'
 
+    # Messages from the other user are marked as read, our own are not
+    assert response_data[1]['read'] is True
+    assert response_data[0]['read'] is False
+
+    # Reading moved our watermark on the match: one write, no message updated
+    match = store.matches.get('match_123').to_dict()
+    assert match['last_read_at']['test_user_123'] == message_data['created_at'] + timedelta(seconds=1)
+    assert match['unread_counts']['test_user_123'] == 0
+    assert store.client.stats.document_writes == 1
+
 @patch('app.utils.decorators.auth')
-@patch('app.config.firebase.db')
-@patch('app.api.messages.db')
-def test_get_messages_unauthorized(messages_db_mock, decorator_db_mock, auth_mock, client, firebase_mock, auth_token):
+def test_get_messages_unauthorized(auth_mock, client, firebase_mock, auth_token, seed):
     """Test getting messages when user is not part of the match."""
     # Configure mocks
     auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
-    
-    # Configure db mocks for authentication
-    decorator_db_mock.collection().document().get.return_value.exists = True
-    decorator_db_mock.collection().document().get.return_value.to_dict.return_value = {
-        'uid': 'test_user_123'
-    }
-    
-    # Mock match document - user is not part of this match
-    match_doc = MagicMock()
-    match_doc.exists = True
-    match_doc.to_dict.return_value = {
+
+    # Match document - user is not part of this match
+    seed('matches', 'match_123', {
         'user1_uid': 'other_user_1',
         'user2_uid': 'other_user_2',
         'active': True
-    }
-    
-    # Configure messages db mocks
-    messages_db_mock.collection().document().get.return_value = match_doc
-    
+    })
+
     # Send request
     response = client.get(
         '/api/messages/match_123',
         headers={'Authorization': auth_token}
     )
-    
+
     # Check response - should be unauthorized
     assert response.status_code == 403
     response_data = json.loads(response.data)
     assert 'error' in response_data
 
 @patch('app.utils.decorators.auth')
-@patch('app.config.firebase.db')
-@patch('app.api.messages.db')
-@patch('app.api.messages.firestore')
-def test_send_message(firestore_mock, messages_db_mock, decorator_db_mock, auth_mock, client, firebase_mock, auth_token, match_data):
+def test_send_message(auth_mock, client, firebase_mock, auth_token, match_data, store, seed):
     """Test sending a message in a match."""
     # Configure mocks
     auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
-    firestore_mock.SERVER_TIMESTAMP = firebase_mock['firestore'].SERVER_TIMESTAMP
-    
-    # Configure db mocks for authentication
-    decorator_db_mock.collection().document().get.return_value.exists = True
-    decorator_db_mock.collection().document().get.return_value.to_dict.return_value = {
-        'uid': 'test_user_123'
-    }
-    
-    # Mock match document
-    match_doc = MagicMock()
-    match_doc.exists = True
-    match_doc.to_dict.return_value = match_data
-    
-    # Mock message add operation
-    message_doc_mock = MagicMock()
-    message_doc_mock.id = 'message_123'
-    messages_db_mock.collection().add.return_value = (MagicMock(), message_doc_mock)
-    
-    # Configure messages db mocks
-    messages_db_mock.collection().document().get.return_value = match_doc
-    
+
+    seed('users', 'test_user_123', {'display_name': 'Test User'})
+    seed('matches', 'match_123', match_data)
+
     # Test data
     message_data = {
         'content': 'Hello, this is a test message'
     }
-    
+
     # Send request
     response = client.post(
         '/api/messages/match_123',
@@ -148,51 +108,49 @@ def test_send_message(firestore_mock, messages_db_mock, decorator_db_mock, auth_
         data=json.dumps(message_data),
         content_type='application/json'
     )
-    
+
     # Check response
     assert response.status_code == 201
     response_data = json.loads(response.data)
     assert 'message' in response_data
     assert 'message_id' in response_data
-    assert response_data['message_id'] == 'message_123'
-    
-    # Verify Firestore calls
-    messages_db_mock.collection().add.assert_called_once()
-    messages_db_mock.collection().document().update.assert_called_once()
+
+    # Verify the message and the match's last_message_at
+    stored = store.messages.get(response_data['message_id']).to_dict()
+    assert stored['content'] == 'Hello, this is a test message'
+    assert stored['sender_uid'] == 'test_user_123'
+    assert store.matches.get('match_123').to_dict()['last_message_at'] is not None
 
 @patch('app.utils.decorators.auth')
-@patch('app.config.firebase.db')
-@patch('app.api.messages.db')
-def test_get_unread_count(messages_db_mock, decorator_db_mock, auth_mock, client, firebase_mock, auth_token, match_data):
+def test_get_unread_count(auth_mock, client, firebase_mock, auth_token, match_data, seed):
     """Test getting unread message count."""
     # Configure mocks
     auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
-    
-    # Configure db mocks for authentication
-    decorator_db_mock.collection().document().get.return_value.exists = True
-    decorator_db_mock.collection().document().get.return_value.to_dict.return_value = {
-        'uid': 'test_user_123'
-    }
-    
-    # Mock match document
-    match_doc = MagicMock()
-    match_doc.exists = True
-    match_doc.to_dict.return_value = match_data
-    
-    # Mock unread messages query
-    unread_msg1 = MagicMock()
-    unread_msg2 = MagicMock()
-    
-    # Configure messages db mocks
-    messages_db_mock.collection().document().get.return_value = match_doc
-    messages_db_mock.collection().where().where().where().get.return_value = [unread_msg1, unread_msg2]
-    
+
+    seed('matches', 'match_123', match_data)
+
+    # Two unread messages from the other user, one already read, one of our own
+    now = datetime.now()
+    for i, (sender, read) in enumerate([
+        ('test_user_456', False),
+        ('test_user_456', False),
+        ('test_user_456', True),
+        ('test_user_123', False)
+    ]):
+        seed('messages', f'message_{i}', {
+            'match_id': 'match_123',
+            'sender_uid': sender,
+            'content': f'Message {i}',
+            'created_at': now + timedelta(seconds=i),
+            'read': read
+        })
+
     # Send request
     response = client.get(
         '/api/messages/match_123/unread',
         headers={'Authorization': auth_token}
     )
-    
+
     # Check response
     assert response.status_code == 200
     response_data = json.loads(response.data)
@@ -200,17 +158,413 @@ def test_get_unread_count(messages_db_mock, decorator_db_mock, auth_mock, client
     assert response_data['unread_count'] == 2
 
 @patch('app.utils.decorators.auth')
-@patch('app.config.firebase.db')
-def test_get_conversations(db_mock, auth_mock, client, firebase_mock, auth_token):
+def test_get_conversations(auth_mock, client, firebase_mock, auth_token, match_data, seed):
     """Test getting all conversations with message counts."""
-    # Skip this test due to timestamp serialization issues
-    # 
-    # NOTE: This test is currently skipped because of serialization issues with timestamp objects.
-    # The 'get_conversations' endpoint calls isoformat() on timestamp objects, but our mocks currently
-    # provide string timestamps. To fix this in the future:
-    # 1. Create proper mock objects with isoformat() methods
-    # 2. Ensure the timestamps used match what Firestore would return
-    # 3. Address the sort key logic in the get_conversations endpoint
-    pytest.skip("Skipping test_get_conversations due to timestamp serialization issues")
-    
-    # The rest of the test would go here, but we're skipping it for now 
\ No newline at end of file
+    auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
+
+    seed('matches', 'match_123', match_data)
+    seed('users', 'test_user_456', {
+        'uid': 'test_user_456',
+        'display_name': 'Other User',
+        'photos': ['photo1.jpg']
+    })
+
+    now = datetime.now()
+    seed('messages', 'message_1', {
+        'match_id': 'match_123',
+        'sender_uid': 'test_user_456',
+        'content': 'First',
+        'created_at': now,
+        'read': False
+    })
+    seed('messages', 'message_2', {
+        'match_id': 'match_123',
+        'sender_uid': 'test_user_456',
+        'content': 'Latest',
+        'created_at': now + timedelta(seconds=1),
+        'read': False
+    })
+
+    response = client.get(
+        '/api/messages/conversations',
+        headers={'Authorization': auth_token}
+    )
+
+    assert response.status_code == 200
+    response_data = json.loads(response.data)
+    assert len(response_data) == 1
+
+    conversation = response_data[0]
+    assert conversation['match_id'] == 'match_123'
+    assert conversation['other_user']['display_name'] == 'Other User'
+    assert conversation['last_message']['content'] == 'Latest'
+    assert conversation['unread_count'] == 2
+
+@patch('app.utils.decorators.auth')
+def test_send_message_updates_conversation_summary(auth_mock, client, firebase_mock, auth_token, match_data, store, seed):
+    """Test that sending and reading messages keep the match summary in sync."""
+    auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
+
+    seed('users', 'test_user_123', {'display_name': 'Test User'})
+    seed('matches', 'match_123', dict(match_data, last_message=None, unread_counts={'test_user_123': 0, 'test_user_456': 0}))
+
+    response = client.post(
+        '/api/messages/match_123',
+        headers={'Authorization': auth_token},
+        data=json.dumps({'content': 'x' * 150}),
+        content_type='application/json'
+    )
+    assert response.status_code == 201
+    message_id = json.loads(response.data)['message_id']
+
+    match = store.matches.get('match_123').to_dict()
+    assert match['unread_counts'] == {'test_user_123': 0, 'test_user_456': 1}
+    assert match['last_message']['id'] == message_id
+    assert match['last_message']['sender_uid'] == 'test_user_123'
+    assert match['last_message']['content'] == 'x' * 100
+    assert match['last_message']['created_at'] == match['last_message_at']
+
+    # The recipient reading the conversation resets their counter
+    auth_mock.verify_id_token.return_value = {'uid': 'test_user_456'}
+    response = client.get('/api/messages/match_123', headers={'Authorization': 'Bearer other_token'})
+    assert response.status_code == 200
+    assert store.matches.get('match_123').to_dict()['unread_counts']['test_user_456'] == 0
+
+@patch('app.utils.decorators.auth')
+def test_get_conversations_reads_no_messages(auth_mock, client, firebase_mock, auth_token, match_data, store, seed):
+    """Test that conversations are built from match summaries without message queries."""
+    auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
+
+    store.users.set('test_user_456', {'uid': 'test_user_456', 'display_name': 'Other User'})
+    seed('matches', 'match_123', dict(match_data, last_message=None, unread_counts={'test_user_123': 0, 'test_user_456': 0}))
+
+    # Other user sends two messages
+    for content in ['First', 'Latest']:
+        store.messages.send('match_123', 'test_user_456', 'test_user_123', content)
+    store.client.stats.reset()
+
+    response = client.get(
+        '/api/messages/conversations',
+        headers={'Authorization': auth_token}
+    )
+
+    assert response.status_code == 200
+    conversation = json.loads(response.data)[0]
+    assert conversation['last_message']['content'] == 'Latest'
+    assert conversation['last_message']['sender_uid'] == 'test_user_456'
+    assert conversation['unread_count'] == 2
+
+    # One match query and one profile batch; no message reads
+    assert store.client.stats.round_trips == 2
+
+@patch('app.utils.decorators.auth')
+def test_get_conversations_returns_requested_fields(auth_mock, client, firebase_mock, auth_token, match_data, store, seed):
+    """Test that ?fields= trims conversations, down to fields inside other_user."""
+    auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
+
+    store.users.set('test_user_456', {'uid': 'test_user_456', 'display_name': 'Other User', 'photos': ['a.jpg']})
+    seed('matches', 'match_123', match_data)
+    store.client.stats.reset()
+
+    response = client.get(
+        '/api/messages/conversations?fields=match_id,other_user.display_name',
+        headers={'Authorization': auth_token}
+    )
+
+    assert json.loads(response.data) == [{'match_id': 'match_123', 'other_user': {'display_name': 'Other User'}}]
+    # The match has no summary, but the last message wasn't asked for: no message queries
+    assert store.client.stats.queries == 1
+
+@patch('app.utils.decorators.auth')
+def test_get_unread_count_uses_match_counter(auth_mock, client, firebase_mock, auth_token, match_data, store, seed):
+    """Test that the unread endpoint reads the counter on the match."""
+    auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
+
+    seed('matches', 'match_123', dict(match_data, unread_counts={'test_user_123': 3, 'test_user_456': 0}))
+    store.client.stats.reset()
+
+    response = client.get(
+        '/api/messages/match_123/unread',
+        headers={'Authorization': auth_token}
+    )
+
+    assert response.status_code == 200
+    assert json.loads(response.data)['unread_count'] == 3
+    assert store.client.stats.queries == 0
+
+@patch('app.utils.decorators.auth')
+def test_get_unread_count_with_partial_counters(auth_mock, client, firebase_mock, auth_token, match_data, message_data, seed):
+    """Test that a legacy match holding only the other user's counter still counts the user's unread messages."""
+    auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
+
+    seed('matches', 'match_123', dict(match_data, unread_counts={'test_user_456': 1}))
+    seed('messages', 'message_123', dict(message_data, sender_uid='test_user_456'))
+
+    response = client.get('/api/messages/match_123/unread', headers={'Authorization': auth_token})
+
+    assert json.loads(response.data)['unread_count'] == 1
+
+def test_mark_read_keeps_concurrent_sends(match_data, store, seed):
+    """Test that overlapping reads and sends keep the unread counter and watermark right."""
+    seed('matches', 'match_123', dict(match_data, unread_counts={'test_user_123': 0, 'test_user_456': 0}))
+
+    def read_through(message_id):
+        return store.messages.get(message_id).get('created_at')
+
+    def unread():
+        return store.matches.get('match_123').to_dict()['unread_counts']['test_user_123']
+
+    first = store.messages.send('match_123', 'test_user_456', 'test_user_123', 'First')
+    second = store.messages.send('match_123', 'test_user_456', 'test_user_123', 'Second')
+    assert unread() == 2
+
+    # The poll and the stream both read through the same message with the same old match data
+    assert store.messages.mark_read('match_123', 'test_user_123', read_through(second))
+    assert not store.messages.mark_read('match_123', 'test_user_123', read_through(second))
+    assert unread() == 0
+
+    # A later message is unread; an older read (out of order) doesn't move the watermark back
+    store.messages.send('match_123', 'test_user_456', 'test_user_123', 'Third')
+    assert not store.messages.mark_read('match_123', 'test_user_123', read_through(first))
+    assert unread() == 1
+    assert store.matches.get('match_123').to_dict()['last_read_at']['test_user_123'] == read_through(second)
+
+def test_mark_read_retries_when_a_message_arrives(match_data, store, seed):
+    """Test that a send committed while the watermark moves makes the transaction retry with it counted."""
+    seed('matches', 'match_123', dict(match_data, unread_counts={'test_user_123': 0, 'test_user_456': 0}))
+    first = store.messages.send('match_123', 'test_user_456', 'test_user_123', 'First')
+    read_through = store.messages.get(first).get('created_at')
+
+    count_unread = store.messages.count_unread
+    count_unread_calls = []
+
+    def count_then_send(*args):
+        count_unread_calls.append(args)
+        result = count_unread(*args)
+        if len(count_unread_calls) == 1:
+            store.messages.send('match_123', 'test_user_456', 'test_user_123', 'Meanwhile')
+        return result
+
+    with patch.object(store.messages, 'count_unread', side_effect=count_then_send):
+        store.messages.mark_read('match_123', 'test_user_123', read_through)
+
+    assert len(count_unread_calls) == 2
+    assert store.matches.get('match_123').to_dict()['unread_counts']['test_user_123'] == 1
+
+@patch('app.utils.decorators.auth')
+def test_get_messages_paginates(auth_mock, client, firebase_mock, auth_token, match_data, store, seed):
+    """Test paging through messages with before/after cursors."""
+    auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
+
+    seed('matches', 'match_123', match_data)
+    now = datetime.now()
+    for i in range(7):
+        seed('messages', f'message_{i}', {
+            'match_id': 'match_123',
+            'sender_uid': 'test_user_123',
+            'content': f'Message {i}',
+            'created_at': now + timedelta(seconds=i),
+            'read': False
+        })
+    store.client.stats.reset()
+
+    # Newest page first, in ascending order
+    response = client.get('/api/messages/match_123?limit=3', headers={'Authorization': auth_token})
+    assert response.status_code == 200
+    assert [m['id'] for m in json.loads(response.data)] == ['message_4', 'message_5', 'message_6']
+    assert response.headers['X-Cursor-Before'] == 'message_4'
+    assert response.headers['X-Has-More'] == 'true'
+
+    # Only the page (plus one look-ahead document) was read
+    assert store.client.stats.document_reads == 1 + 4
+
+    # Older pages
+    response = client.get('/api/messages/match_123?limit=3&before=message_4', headers={'Authorization': auth_token})
+    assert [m['id'] for m in json.loads(response.data)] == ['message_1', 'message_2', 'message_3']
+
+    response = client.get('/api/messages/match_123?limit=3&before=message_1', headers={'Authorization': auth_token})
+    assert [m['id'] for m in json.loads(response.data)] == ['message_0']
+    assert response.headers['X-Has-More'] == 'false'
+
+    # Newer messages after a cursor
+    response = client.get('/api/messages/match_123?limit=3&after=message_4', headers={'Authorization': auth_token})
+    assert [m['id'] for m in json.loads(response.data)] == ['message_5', 'message_6']
+    assert response.headers['X-Cursor-After'] == 'message_6'
+    assert response.headers['X-Has-More'] == 'false'
+
+    # Cursors must belong to the match
+    seed('messages', 'message_other', {'match_id': 'match_999', 'created_at': now})
+    response = client.get('/api/messages/match_123?before=message_other', headers={'Authorization': auth_token})
+    assert response.status_code == 400
+
+@patch('app.utils.decorators.auth')
+def test_get_messages_since_sync_token(auth_mock, client, firebase_mock, auth_token, match_data, store, seed):
+    """Test that polling with a sync token only returns changes."""
+    auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
+
+    seed('matches', 'match_123', dict(match_data, unread_counts={'test_user_123': 0, 'test_user_456': 0}))
+    store.messages.send('match_123', 'test_user_456', 'test_user_123', 'Hi')
+
+    # The first load marks the message as read by moving the match's watermark;
+    # no message changed, so the next poll returns nothing but a new token
+    response = client.get('/api/messages/match_123', headers={'Authorization': auth_token})
+    assert [m['read'] for m in json.loads(response.data)] == [True]
+    token = response.headers['X-Sync-Token']
+    response = client.get(f'/api/messages/match_123?since={token}', headers={'Authorization': auth_token})
+    assert json.loads(response.data) == []
+    assert response.headers['X-Sync-Token'] != token
+    token = response.headers['X-Sync-Token']
+
+    # Nothing changed: an empty response costs only the match read
+    store.client.stats.reset()
+    response = client.get(f'/api/messages/match_123?since={token}', headers={'Authorization': auth_token})
+    assert response.status_code == 200
+    assert json.loads(response.data) == []
+    assert response.headers['X-Sync-Token'] == token
+    assert store.client.stats.document_reads == 1
+    assert store.client.stats.queries == 0
+
+    # A new message shows up on its own
+    message_id = store.messages.send('match_123', 'test_user_456', 'test_user_123', 'Still there?')
+    response = client.get(f'/api/messages/match_123?since={token}', headers={'Authorization': auth_token})
+    assert [m['id'] for m in json.loads(response.data)] == [message_id]
+    assert response.headers['X-Sync-Token'] != token
+
+    response = client.get('/api/messages/match_123?since=not-a-token', headers={'Authorization': auth_token})
+    assert response.status_code == 400
+
+@patch('app.utils.decorators.auth')
+def test_get_messages_since_carries_read_receipts(auth_mock, client, firebase_mock, auth_token, match_data, store, seed):
+    """Test that deltas tell the sender how far the other user has read, though no message changed."""
+    auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
+
+    seed('matches', 'match_123', dict(match_data, unread_counts={'test_user_123': 0, 'test_user_456': 0}))
+    message_id = store.messages.send('match_123', 'test_user_123', 'test_user_456', 'Hi')
+    sent_at = store.messages.get(message_id).get('created_at')
+
+    response = client.get('/api/messages/match_123', headers={'Authorization': auth_token})
+    assert [m['read'] for m in json.loads(response.data)] == [False]
+    assert 'X-Other-Last-Read-At' not in response.headers
+    token = response.headers['X-Sync-Token']
+
+    store.messages.mark_read('match_123', 'test_user_456', sent_at)
+
+    response = client.get(f'/api/messages/match_123?since={token}', headers={'Authorization': auth_token})
+    assert json.loads(response.data) == []
+    assert response.headers['X-Other-Last-Read-At'] == sent_at.isoformat()
+
+    # Still there on a poll where nothing changed at all
+    token = response.headers['X-Sync-Token']
+    response = client.get(f'/api/messages/match_123?since={token}', headers={'Authorization': auth_token})
+    assert response.headers['X-Other-Last-Read-At'] == sent_at.isoformat()
+
+@patch('app.utils.decorators.auth')
+def test_get_conversations_since_sync_token(auth_mock, client, firebase_mock, auth_token, store, seed):
+    """Test that conversation polls only return changed matches."""
+    auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
+
+    seed('users', 'test_user_456', {'uid': 'test_user_456', 'display_name': 'Other User'})
+    seed('users', 'test_user_789', {'uid': 'test_user_789', 'display_name': 'Third User'})
+    first_match, _ = store.matches.create('test_user_123', 'test_user_456')
+    second_match, _ = store.matches.create('test_user_123', 'test_user_789')
+
+    response = client.get('/api/messages/conversations', headers={'Authorization': auth_token})
+    assert len(json.loads(response.data)) == 2
+    token = response.headers['X-Sync-Token']
+
+    # Idle poll
+    store.client.stats.reset()
+    response = client.get(f'/api/messages/conversations?since={token}', headers={'Authorization': auth_token})
+    assert json.loads(response.data) == []
+    assert response.headers['X-Sync-Token'] == token
+    assert store.client.stats.round_trips == 1
+
+    # A message in one match and an unmatch in the other
+    store.messages.send(first_match, 'test_user_456', 'test_user_123', 'Hello')
+    store.matches.deactivate(second_match, 'test_user_789')
+
+    response = client.get(f'/api/messages/conversations?since={token}', headers={'Authorization': auth_token})
+    changed = {c['match_id']: c for c in json.loads(response.data)}
+    assert changed[first_match]['unread_count'] == 1
+    assert changed[first_match]['active'] is True
+    assert changed[second_match]['active'] is False
+
+@patch('app.utils.decorators.auth')
+def test_reading_a_conversation_costs_one_write(auth_mock, client, firebase_mock, auth_token, match_data, store, seed, app):
+    """Test that opening a conversation moves one read watermark instead of updating each message."""
+    auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
+
+    seed('matches', 'match_123', dict(match_data, unread_counts={'test_user_123': 0, 'test_user_456': 0}))
+    for i in range(300):
+        store.messages.send('match_123', 'test_user_456', 'test_user_123', f'Message {i}')
+
+    receipts = []
+    app.extensions['event_bus'].subscribe('user:test_user_456', lambda topic, event: receipts.append(event))
+    store.client.stats.reset()
+
+    response = client.get('/api/messages/match_123', headers={'Authorization': auth_token})
+    assert response.status_code == 200
+    assert all(m['read'] for m in json.loads(response.data))
+    assert store.client.stats.document_writes == 1
+
+    # The counter was reset in the same write and the sender got a read receipt
+    response = client.get('/api/messages/match_123/unread', headers={'Authorization': auth_token})
+    assert json.loads(response.data)['unread_count'] == 0
+    assert [r['type'] for r in receipts] == ['read']
+    assert receipts[0]['reader_uid'] == 'test_user_123'
+
+    # Older pages are already covered by the watermark
+    before = json.loads(client.get('/api/messages/match_123?limit=1', headers={'Authorization': auth_token}).data)[0]['id']
+    store.client.stats.reset()
+    response = client.get(f'/api/messages/match_123?before={before}', headers={'Authorization': auth_token})
+    assert all(m['read'] for m in json.loads(response.data))
+    assert store.client.stats.document_writes == 0
+
+@patch('app.utils.decorators.auth')
+def test_get_unread_counts_for_all_matches(auth_mock, client, firebase_mock, auth_token, match_data, store, seed):
+    """Test the bulk unread endpoint, counting older matches server-side."""
+    auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
+
+    # A match with a counter and one from before counters were kept
+    seed('matches', 'match_123', dict(match_data, unread_counts={'test_user_123': 4, 'test_user_456': 0}))
+    seed('matches', 'match_legacy', dict(
+        match_data, user2_uid='test_user_789',
+        participants=['test_user_123', 'test_user_789'], pair_key='13:test_user_123:test_user_789'
+    ))
+    now = datetime.now()
+    for i, read in enumerate([False, False, True]):
+        seed('messages', f'message_{i}', {
+            'match_id': 'match_legacy',
+            'sender_uid': 'test_user_789',
+            'content': f'Message {i}',
+            'created_at': now + timedelta(seconds=i),
+            'read': read
+        })
+    store.client.stats.reset()
+
+    response = client.get('/api/messages/unread', headers={'Authorization': auth_token})
+
+    assert response.status_code == 200
+    response_data = json.loads(response.data)
+    assert response_data['unread_counts'] == {'match_123': 4, 'match_legacy': 2}
+    assert response_data['total'] == 6
+
+    # The matches query plus one count aggregation: no message documents were read
+    assert store.client.stats.queries == 2
+    assert store.client.stats.document_reads == 2 + 1
+
+def test_count_aggregation_bills_per_thousand_entries(store):
+    """Test that the in-memory count() returns the count and bills like Firestore."""
+    batch = store.client.batch()
+    for i in range(1500):
+        batch.set(store.messages.document(f'message_{i}'), {'match_id': 'match_123'})
+    batch.commit()
+    store.client.stats.reset()
+
+    query = store.messages.collection.where('match_id', '==', 'match_123')
+    result = query.count(alias='total').get()
+
+    assert result[0][0].alias == 'total'
+    assert result[0][0].value == 1500
+    assert store.client.stats.document_reads == 2
+    assert store.client.stats.queries == 1
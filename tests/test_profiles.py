@@ -2,90 +2,66 @@
 Tests for profile endpoints.
 """
 import pytest
+import base64
+import io
 import json
 from unittest.mock import patch, MagicMock
 
+from PIL import Image
+
+from app.utils.geo import geohash_fields
+
 @patch('app.utils.decorators.auth')
-@patch('app.config.firebase.db')
-@patch('app.api.profiles.db')
-def test_get_profile(profiles_db_mock, decorator_db_mock, auth_mock, client, firebase_mock, auth_token, user_data):
+def test_get_profile(auth_mock, client, firebase_mock, auth_token, user_data, seed):
     """Test getting user profile."""
     # Configure mocks
     auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
-    
-    # Mock document retrieval
-    doc_mock = MagicMock()
-    doc_mock.exists = True
-    doc_mock.to_dict.return_value = user_data
-    
-    # Configure db mocks
-    decorator_db_mock.collection().document().get.return_value.exists = True
-    decorator_db_mock.collection().document().get.return_value.to_dict.return_value = user_data
-    profiles_db_mock.collection().document().get.return_value = doc_mock
-    
+
+    seed('users', 'test_user_123', user_data)
+
     # Send request
     response = client.get(
         '/api/profiles/',
         headers={'Authorization': auth_token}
     )
-    
+
     # Check response
     assert response.status_code == 200
     response_data = json.loads(response.data)
     assert response_data == user_data
 
 @patch('app.utils.decorators.auth')
-@patch('app.config.firebase.db')
-@patch('app.api.profiles.db')
-def test_get_profile_not_found(profiles_db_mock, decorator_db_mock, auth_mock, client, firebase_mock, auth_token):
+def test_get_profile_not_found(auth_mock, client, firebase_mock, auth_token):
     """Test getting non-existent profile."""
     # Configure mocks
     auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
-    
-    # Mock document retrieval - profile doesn't exist
-    doc_mock = MagicMock()
-    doc_mock.exists = False
-    
-    # Configure db mocks
-    decorator_db_mock.collection().document().get.return_value.exists = True
-    decorator_db_mock.collection().document().get.return_value.to_dict.return_value = {
-        'uid': 'test_user_123'
-    }
-    profiles_db_mock.collection().document().get.return_value = doc_mock
-    
-    # Send request
+
+    # Send request - no profile document exists
     response = client.get(
         '/api/profiles/',
         headers={'Authorization': auth_token}
     )
-    
+
     # Check response
     assert response.status_code == 404
     response_data = json.loads(response.data)
     assert 'error' in response_data
 
 @patch('app.utils.decorators.auth')
-@patch('app.config.firebase.db')
-@patch('app.api.profiles.db')
-@patch('app.api.profiles.firestore')
-def test_update_profile(firestore_mock, profiles_db_mock, decorator_db_mock, auth_mock, client, firebase_mock, auth_token, user_data):
+def test_update_profile(auth_mock, client, firebase_mock, auth_token, user_data, store, seed):
     """Test updating user profile."""
     # Configure mocks
     auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
-    firestore_mock.SERVER_TIMESTAMP = firebase_mock['firestore'].SERVER_TIMESTAMP
-    
-    # Configure db mocks
-    decorator_db_mock.collection().document().get.return_value.exists = True
-    decorator_db_mock.collection().document().get.return_value.to_dict.return_value = {
-        'uid': 'test_user_123'
-    }
-    
+
+    seed('users', 'test_user_123', user_data)
+
     # Test data
     update_data = {
         'bio': 'Updated bio',
-        'interests': ['coding', 'hiking', 'travel']
+        'interests': ['coding', 'hiking', 'travel'],
+        'email': 'not-allowed@example.com'
     }
-    
+
     # Send request
     response = client.put(
         '/api/profiles/',
@@ -93,7 +69,7 @@ def test_update_profile(firestore_mock, profiles_db_mock, decorator_db_mock, aut
         data=json.dumps(update_data),
         content_type='application/json'
     )
-    
+
     # Check response
     assert response.status_code == 200
     response_data = json.loads(response.data)
@@ -101,120 +77,304 @@ def test_update_profile(firestore_mock, profiles_db_mock, decorator_db_mock, aut
     assert 'updated_fields' in response_data
     assert 'bio' in response_data['updated_fields']
     assert 'interests' in response_data['updated_fields']
-    
-    # Verify Firestore update
-    profiles_db_mock.collection().document().update.assert_called_once()
+
+    # Verify the stored profile
+    stored = store.users.get('test_user_123').to_dict()
+    assert stored['bio'] == 'Updated bio'
+    assert stored['interests'] == ['coding', 'hiking', 'travel']
+    assert stored['email'] == user_data['email']
+    assert stored['updated_at'] is not None
+
+@patch('app.utils.decorators.auth')
+def test_update_profile_location_sets_geohash(auth_mock, client, firebase_mock, auth_token, user_data, store, seed):
+    """Test that a location update keeps the profile's geohash in step."""
+    auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
+
+    seed('users', 'test_user_123', user_data)
+
+    response = client.put(
+        '/api/profiles/',
+        headers={'Authorization': auth_token},
+        data=json.dumps({'location': {'latitude': 57.64911, 'longitude': 10.40744, 'city': 'Hirtshals'}}),
+        content_type='application/json'
+    )
+    assert response.status_code == 200
+    assert store.users.get('test_user_123').to_dict()['geohash'] == 'u4pruydqq'
+
+    # A location without coordinates clears it
+    client.put(
+        '/api/profiles/',
+        headers={'Authorization': auth_token},
+        data=json.dumps({'location': {'city': 'Somewhere'}}),
+        content_type='application/json'
+    )
+    assert store.users.get('test_user_123').to_dict()['geohash'] is None
 
 @patch('app.utils.decorators.auth')
-@patch('app.config.firebase.db')
-@patch('app.api.profiles.db')
-def test_discover_profiles(profiles_db_mock, decorator_db_mock, auth_mock, client, firebase_mock, auth_token, user_data):
+def test_discover_profiles(auth_mock, client, firebase_mock, auth_token, user_data, seed):
     """Test discovering potential matches."""
     # Configure mocks
     auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
-    
-    # Mock user document
-    user_doc_mock = MagicMock()
-    user_doc_mock.exists = True
-    user_doc_mock.to_dict.return_value = user_data
-    
-    # Mock discover query results
-    result_mock1 = MagicMock()
-    result_mock1.to_dict.return_value = {
+
+    # Current user prefers women
+    seed('users', 'test_user_123', user_data)
+
+    # Oakland, Palo Alto and Los Angeles; the user is in San Francisco with a 50 km limit
+    oakland = {'latitude': 37.8044, 'longitude': -122.2712}
+    palo_alto = {'latitude': 37.4419, 'longitude': -122.1430}
+    los_angeles = {'latitude': 34.0522, 'longitude': -118.2437}
+
+    seed('users', 'other_user_1', {
         'uid': 'other_user_1',
         'display_name': 'Other User 1',
         'gender': 'female',
         'age': 27,
-        'bio': 'I love travel and coffee'
-    }
-    
-    result_mock2 = MagicMock()
-    result_mock2.to_dict.return_value = {
+        'bio': 'I love travel and coffee',
+        'email': 'other1@example.com',
+        'password': 'secret',
+        'location': oakland,
+        **geohash_fields(oakland)
+    })
+    seed('users', 'other_user_2', {
         'uid': 'other_user_2',
         'display_name': 'Other User 2',
         'gender': 'female',
         'age': 29,
-        'bio': 'Hiking and photography'
-    }
-    
-    # Configure db mocks
-    decorator_db_mock.collection().document().get.return_value.exists = True
-    decorator_db_mock.collection().document().get.return_value.to_dict.return_value = {
-        'uid': 'test_user_123'
-    }
-    
-    profiles_db_mock.collection().document().get.return_value = user_doc_mock
-    
-    # Configure the query chain
-    query_mock = MagicMock()
-    query_mock.where.return_value = query_mock
-    query_mock.limit.return_value = query_mock
-    query_mock.get.return_value = [result_mock1, result_mock2]
-    
-    profiles_db_mock.collection().where.return_value = query_mock
-    
+        'bio': 'Hiking and photography',
+        'location': palo_alto,
+        **geohash_fields(palo_alto)
+    })
+    seed('users', 'other_user_3', {
+        'uid': 'other_user_3',
+        'display_name': 'Other User 3',
+        'gender': 'male',
+        'age': 30,
+        'location': oakland,
+        **geohash_fields(oakland)
+    })
+    seed('users', 'other_user_4', {
+        'uid': 'other_user_4',
+        'display_name': 'Other User 4',
+        'gender': 'female',
+        'age': 26,
+        'location': los_angeles,
+        **geohash_fields(los_angeles)
+    })
+
     # Send request
     response = client.get(
         '/api/profiles/discover',
         headers={'Authorization': auth_token}
     )
-    
+
     # Check response
     assert response.status_code == 200
     response_data = json.loads(response.data)
     assert isinstance(response_data, list)
     assert len(response_data) == 2
-    
-    # Check profiles have expected data
+
+    # Check profiles have expected data, nearest first
     assert response_data[0]['uid'] == 'other_user_1'
     assert response_data[1]['uid'] == 'other_user_2'
-    
+    assert 10 < response_data[0]['distance_km'] < response_data[1]['distance_km'] < 50
+
     # Check that sensitive data is removed
     assert 'password' not in response_data[0]
     assert 'email' not in response_data[0]
 
 @patch('app.utils.decorators.auth')
-@patch('app.config.firebase.db')
-@patch('app.api.profiles.db')
-def test_get_user_profile(profiles_db_mock, decorator_db_mock, auth_mock, client, firebase_mock, auth_token):
+def test_get_user_profile(auth_mock, client, firebase_mock, auth_token, seed):
     """Test getting another user's profile."""
     # Configure mocks
     auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
-    
-    # Mock profile document
-    profile_doc_mock = MagicMock()
-    profile_doc_mock.exists = True
-    profile_doc_mock.to_dict.return_value = {
+
+    seed('users', 'other_user_123', {
         'uid': 'other_user_123',
         'display_name': 'Other User',
+        'email': 'other@example.com',
         'age': 29,
         'gender': 'female',
         'bio': 'Test bio',
         'interests': ['hiking', 'reading'],
         'photos': ['photo1.jpg']
-    }
-    
-    # Configure db mocks
-    decorator_db_mock.collection().document().get.return_value.exists = True
-    decorator_db_mock.collection().document().get.return_value.to_dict.return_value = {
-        'uid': 'test_user_123'
-    }
-    
-    profiles_db_mock.collection().document().get.return_value = profile_doc_mock
-    
+    })
+
     # Send request
     response = client.get(
         '/api/profiles/other_user_123',
         headers={'Authorization': auth_token}
     )
-    
+
     # Check response
     assert response.status_code == 200
     response_data = json.loads(response.data)
     assert response_data['uid'] == 'other_user_123'
     assert 'display_name' in response_data
     assert 'bio' in response_data
-    
+
     # Check that sensitive data is removed
     assert 'password' not in response_data
-    assert 'email' not in response_data 
\ No newline at end of file
+    assert 'email' not in response_data
+
+@patch('app.utils.decorators.auth')
+def test_discover_profiles_reads_scale_with_local_density(auth_mock, client, firebase_mock, auth_token, user_data, store, seed, app):
+    """Test that the geohash queries used without the candidate index never read profiles far away."""
+    auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
+    app.config['DISCOVERY_INDEX'] = False
+
+    seed('users', 'test_user_123', user_data)
+    nearby = {'latitude': 37.78, 'longitude': -122.41}
+    seed('users', 'near_user', {'uid': 'near_user', 'gender': 'female', 'location': nearby, **geohash_fields(nearby)})
+    for i in range(300):
+        far = {'latitude': 40.7 + i * 0.001, 'longitude': -74.0}
+        seed('users', f'far_user_{i}', {'uid': f'far_user_{i}', 'gender': 'female', 'location': far, **geohash_fields(far)})
+    store.client.stats.reset()
+
+    response = client.get('/api/profiles/discover', headers={'Authorization': auth_token})
+
+    assert [p['uid'] for p in json.loads(response.data)] == ['near_user']
+    # The user, seen, deck and recommendations documents plus at most nine
+    # cell queries (empty ones still cost a read, as do the two swipe queries
+    # that build a missing seen set)
+    assert store.client.stats.document_reads <= 4 + 2 + 9 + 1
+
+def data_url_photo(size):
+    """A PNG photo as the inline data: URL the frontend uploads."""
+    output = io.BytesIO()
+    Image.new('RGB', size, 'red').save(output, format='PNG')
+    return 'data:image/png;base64,' + base64.b64encode(output.getvalue()).decode('ascii')
+
+@patch('app.utils.decorators.auth')
+def test_public_profile_follows_profile_writes(auth_mock, client, firebase_mock, auth_token, user_data, store):
+    """Test that profile writes keep a public profile with photo references, served as thumbnails."""
+    auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
+    store.users.set('test_user_123', user_data)
+    assert store.public_profiles.get('test_user_123').to_dict()['display_name'] == 'Test User'
+
+    photo = data_url_photo((1600, 1200))
+    client.put('/api/profiles/', headers={'Authorization': auth_token}, json={
+        'bio': 'Public bio',
+        'photos': ['https://example.com/a.jpg', photo],
+        'location': {'latitude': 37.7749, 'longitude': -122.4194, 'city': 'San Francisco'}
+    })
+
+    public = store.public_profiles.get('test_user_123').to_dict()
+    assert public['bio'] == 'Public bio'
+    assert public['location'] == {'city': 'San Francisco', 'country': None}
+    assert public['photos'][0] == 'https://example.com/a.jpg'
+    assert public['photos'][1].startswith('/api/profiles/test_user_123/photos/')
+    assert 'email' not in public and 'preferences' not in public
+
+    response = client.get('/api/profiles/test_user_123', headers={'Authorization': auth_token})
+    photo_url = json.loads(response.data)['photos'][1]
+    assert photo_url.startswith('http://localhost/api/profiles/test_user_123/photos/')
+
+    response = client.get(photo_url)
+    assert response.status_code == 200
+    assert response.mimetype == 'image/jpeg'
+    assert Image.open(io.BytesIO(response.data)).size == (640, 480)
+    assert client.get('/api/profiles/test_user_123/photos/0000000000000000').status_code == 404
+
+    # Cached privately for a bounded time; the digest is the ETag, and the thumbnail is only rendered once
+    digest = photo_url.rsplit('/', 1)[1]
+    assert response.headers['ETag'] == f'"{digest}"'
+    assert response.headers['Cache-Control'] == 'private, max-age=3600'
+    store.client.stats.reset()
+    assert client.get(photo_url, headers={'If-None-Match': f'"{digest}"'}).status_code == 304
+    assert store.client.stats.round_trips == 1
+    with patch('app.api.profiles.Image.open') as image_open:
+        assert client.get(photo_url).data == response.data
+    image_open.assert_not_called()
+
+    # Once the photo is removed, revalidating no longer succeeds
+    client.put('/api/profiles/', headers={'Authorization': auth_token}, json={'photos': ['https://example.com/a.jpg']})
+    assert client.get(photo_url, headers={'If-None-Match': f'"{digest}"'}).status_code == 404
+
+def test_public_profiles_rebuilt_from_older_profiles(app, store, seed, user_data):
+    """Test that profiles from before the projection get a public profile when first read."""
+    seed('users', 'old_user', dict(user_data, uid='old_user'))
+    seed('users', 'updated_user', dict(user_data, uid='updated_user'))
+    # Updates merge into a public profile that was never built in full
+    store.users.update('updated_user', {'bio': 'New bio'})
+    assert 'uid' not in store.public_profiles.get('updated_user').to_dict()
+
+    with app.app_context():
+        profiles = store.public_profiles.profiles(['old_user', 'updated_user', 'missing_user'])
+
+    assert sorted(profiles) == ['old_user', 'updated_user']
+    assert profiles['updated_user']['bio'] == 'New bio'
+    assert profiles['old_user']['display_name'] == 'Test User'
+    assert 'email' not in profiles['old_user']
+
+    # Written back, so later reads only need the public profiles
+    store.client.stats.reset()
+    with app.app_context():
+        store.public_profiles.profiles(['old_user', 'updated_user'])
+    assert store.client.stats.round_trips == 1
+
+@patch('app.utils.decorators.auth')
+def test_profile_endpoints_return_requested_fields(auth_mock, client, firebase_mock, auth_token, user_data, store):
+    """Test that ?fields= trims profile responses and the documents read for them."""
+    auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
+    headers = {'Authorization': auth_token}
+    store.users.set('test_user_123', dict(user_data, photos=[data_url_photo((10, 10))]))
+    store.users.set('other_user_123', dict(user_data, uid='other_user_123', display_name='Other', bio='Hi'))
+
+    response = client.get('/api/profiles/?fields=display_name,preferences.gender,location.neighbourhood', headers=headers)
+    assert json.loads(response.data) == {'display_name': 'Test User', 'preferences': {'gender': 'female'}}
+
+    response = client.get('/api/profiles/other_user_123?fields=display_name,bio', headers=headers)
+    assert json.loads(response.data) == {'display_name': 'Other', 'bio': 'Hi'}
+
+    # The field mask reaches the repository, so whole documents are never read
+    with patch.object(store.public_profiles, 'get_many', wraps=store.public_profiles.get_many) as get_many:
+        client.get('/api/profiles/other_user_123?fields=bio', headers=headers)
+    assert get_many.call_args.kwargs['fields'] == ['uid', 'bio']
+
+    assert client.get('/api/profiles/?fields=', headers=headers).status_code == 400
+    assert client.get('/api/profiles/?fields=bio,$where', headers=headers).status_code == 400
+
+@patch('app.utils.decorators.auth')
+def test_get_user_profiles_batch(auth_mock, client, firebase_mock, auth_token, user_data, store):
+    """Test that several public profiles come back from one read, with missing UIDs reported inline."""
+    auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
+    headers = {'Authorization': auth_token}
+    for uid, name in (('user_a', 'A'), ('user_b', 'B')):
+        store.users.set(uid, dict(user_data, uid=uid, display_name=name))
+    store.client.stats.reset()
+
+    response = client.get('/api/profiles/batch?uids=user_b,nobody,user_a&fields=display_name', headers=headers)
+
+    assert response.status_code == 200
+    assert json.loads(response.data) == [
+        {'uid': 'user_b', 'display_name': 'B'},
+        {'uid': 'nobody', 'error': 'Profile not found'},
+        {'uid': 'user_a', 'display_name': 'A'}
+    ]
+    assert 'email' not in response.get_data(as_text=True)
+    # One get_all for the projection, one for the profile of the UID it lacked
+    assert store.client.stats.round_trips == 2
+
+    assert client.get('/api/profiles/batch', headers=headers).status_code == 400
+    too_many = ','.join(f'user_{i}' for i in range(101))
+    assert client.get(f'/api/profiles/batch?uids={too_many}', headers=headers).status_code == 400
+
+@pytest.mark.parametrize('path', [
+    '/api/profiles/',
+    '/api/profiles/discover',
+    '/api/profiles/other_user_123',
+    '/api/profiles/batch?uids=other_user_123',
+    '/api/matches/matches',
+    '/api/messages/conversations'
+])
+@patch('app.utils.decorators.auth')
+def test_invalid_fields_are_rejected_everywhere(auth_mock, path, client, firebase_mock, auth_token, user_data, store):
+    """Test that every endpoint taking ?fields= rejects a malformed list the same way."""
+    auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
+    store.users.set('test_user_123', user_data)
+    separator = '&' if '?' in path else '?'
+
+    response = client.get(f'{path}{separator}fields=bio,$where', headers={'Authorization': auth_token})
+
+    assert response.status_code == 400
+    assert json.loads(response.data) == {'error': 'Invalid fields'}
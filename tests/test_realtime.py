@@ -0,0 +1,347 @@
+"""
+Tests for the message event hub, the event bus and the SSE stream endpoints.
+"""
+import pytest
+import json
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from unittest.mock import patch
+
+from app.api.messages import match_sync_time
+from app.data.memory import MemoryClient
+from app.data.repositories import DataStore
+from app.realtime.broker import EventBroker, _Connection
+from app.realtime.bus import LocalEventBus, UnixSocketEventBus
+from app.realtime.hub import MatchEventHub, StreamLimitError
+from app.utils.stream_token import issue_stream_token
+from app.utils.sync_token import EPOCH, encode_sync_token
+
+
+@pytest.fixture
+def socket_path():
+    """A short Unix socket path (pytest's tmp_path can exceed the AF_UNIX limit)."""
+    directory = tempfile.mkdtemp(prefix='lucent-')
+    yield f"{directory}/events.sock"
+    shutil.rmtree(directory, ignore_errors=True)
+
+def wait_for(condition, timeout=2):
+    """Poll until `condition()` is true; the Unix bus delivers on background threads."""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+def next_message(subscription):
+    """The next queued message snapshot, skipping changes to the match document."""
+    while (snapshot := subscription.get(timeout=1)) is not None:
+        if snapshot.reference.parent.id == 'messages':
+            return snapshot
+    return None
+
+
+def test_hub_shares_one_listener_per_match():
+    """Test that subscribers of a match share a listener that stops with the last one."""
+    store = DataStore(MemoryClient(), backend='memory')
+    store.matches.set('match_123', {'user1_uid': 'a', 'user2_uid': 'b'})
+    hub = MatchEventHub(store.client)
+
+    first = hub.subscribe('match_123', EPOCH)
+    second = hub.subscribe('match_123', EPOCH)
+    assert hub.stats()['listeners'] == 1
+    assert hub.stats()['connections'] == 2
+
+    message_id = store.messages.send('match_123', 'a', 'b', 'Hello')
+    assert first.get(timeout=1).id == message_id
+    assert second.get(timeout=1).id == message_id
+
+    first.close()
+    first.close()
+    second.close()
+    assert hub.stats()['connections'] == 0
+    assert hub.stats()['listeners'] == 0
+    assert store.client._watches == []
+
+def test_hub_filters_on_subscriber_watermarks():
+    """Test that listeners start from the subscriber's watermark, not this server's clock."""
+    store = DataStore(MemoryClient(), backend='memory')
+    store.matches.set('match_123', {'user1_uid': 'a', 'user2_uid': 'b'})
+    hub = MatchEventHub(store.client)
+
+    # Written after the client's token but before the stream opened (or stamped
+    # by a server clock behind ours): still delivered
+    early_id = store.messages.send('match_123', 'a', 'b', 'Early')
+    early_at = store.messages.get(early_id).get('updated_at')
+    first = hub.subscribe('match_123', early_at - timedelta(seconds=1))
+    assert next_message(first).id == early_id
+
+    # A subscriber that has already seen it only gets later changes
+    second = hub.subscribe('match_123', early_at)
+    late_id = store.messages.send('match_123', 'b', 'a', 'Late')
+    assert next_message(second).id == late_id
+    assert next_message(first).id == late_id
+
+def test_hub_pushes_read_state_changes():
+    """Test that the hub also relays changes to the match document, such as read watermarks."""
+    store = DataStore(MemoryClient(), backend='memory')
+    store.matches.set('match_123', {'user1_uid': 'a', 'user2_uid': 'b'})
+    message_id = store.messages.send('match_123', 'a', 'b', 'Hello')
+    sent_at = store.messages.get(message_id).get('created_at')
+    hub = MatchEventHub(store.client)
+
+    subscription = hub.subscribe('match_123', store.matches.get('match_123').get('updated_at'))
+    assert store.messages.mark_read('match_123', 'b', sent_at)
+
+    snapshot = subscription.get(timeout=1)
+    assert snapshot.reference.parent.id == 'matches'
+    assert snapshot.get('last_read_at')['b'] == sent_at
+
+    subscription.close()
+    assert store.client._watches == []
+
+def test_hub_enforces_limits():
+    """Test the per-match and per-process connection limits."""
+    hub = MatchEventHub(MemoryClient(), max_connections=2, max_per_match=1)
+
+    hub.subscribe('match_1', EPOCH)
+    with pytest.raises(StreamLimitError):
+        hub.subscribe('match_1', EPOCH)
+
+    hub.subscribe('match_2', EPOCH)
+    with pytest.raises(StreamLimitError):
+        hub.subscribe('match_3', EPOCH)
+
+def test_slow_subscriber_overflows():
+    """Test that a full queue flags the subscriber instead of blocking the listener."""
+    store = DataStore(MemoryClient(), backend='memory')
+    store.matches.set('match_123', {'user1_uid': 'a', 'user2_uid': 'b'})
+    hub = MatchEventHub(store.client, queue_size=1)
+
+    subscription = hub.subscribe('match_123', EPOCH)
+    store.messages.send('match_123', 'a', 'b', 'One')
+    store.messages.send('match_123', 'a', 'b', 'Two')
+
+    assert subscription.overflowed
+
+@patch('app.utils.decorators.auth')
+def test_stream_messages(auth_mock, client, firebase_mock, auth_token, match_data, store, seed, app):
+    """Test that the stream pushes new messages and marks them read for the recipient."""
+    auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
+
+    seed('matches', 'match_123', dict(match_data, unread_counts={'test_user_123': 0, 'test_user_456': 0}))
+
+    response = client.get(
+        '/api/messages/match_123/stream',
+        headers={'Authorization': auth_token},
+        buffered=False
+    )
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+
+    message_id = store.messages.send('match_123', 'test_user_456', 'test_user_123', 'Pushed')
+
+    # The stream closes itself after the (short, testing) idle timeout
+    body = b''.join(response.response).decode()
+    response.close()
+
+    events = [
+        json.loads(line[len('data: '):])
+        for line in body.splitlines() if line.startswith('data: ')
+    ]
+    assert events[0]['id'] == message_id
+    assert events[0]['content'] == 'Pushed'
+
+    # Delivery marked the message read, which was pushed as a change too
+    assert events[-1]['read'] is True
+    assert store.matches.get('match_123').to_dict()['unread_counts']['test_user_123'] == 0
+    assert app.extensions['event_hub'].stats()['connections'] == 0
+
+@patch('app.utils.decorators.auth')
+def test_stream_marks_read_once_per_batch(auth_mock, client, firebase_mock, auth_token, match_data, store, seed):
+    """Test that a replayed batch moves the read watermark once, to its newest message."""
+    auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
+
+    seed('matches', 'match_123', dict(match_data, unread_counts={'test_user_123': 0, 'test_user_456': 0}))
+    token = encode_sync_token(match_sync_time(store.matches.get('match_123').to_dict()))
+    message_ids = [store.messages.send('match_123', 'test_user_456', 'test_user_123', f'Hi {n}') for n in range(3)]
+
+    with patch.object(store.messages, 'mark_read', wraps=store.messages.mark_read) as mark_read:
+        response = client.get(
+            f'/api/messages/match_123/stream?since={token}',
+            headers={'Authorization': auth_token},
+            buffered=False
+        )
+        body = b''.join(response.response).decode()
+        response.close()
+
+    newest = store.messages.get(message_ids[-1]).get('created_at')
+    mark_read.assert_called_once_with('match_123', 'test_user_123', newest)
+    match = store.matches.get('match_123').to_dict()
+    assert match['last_read_at']['test_user_123'] == newest
+    assert match['unread_counts']['test_user_123'] == 0
+    assert body.count('event: message') == 3
+
+@patch('app.utils.decorators.auth')
+def test_stream_pushes_the_other_users_reads(auth_mock, client, firebase_mock, auth_token, match_data, store, seed):
+    """Test that the stream sends a read event when the other user's watermark moves."""
+    auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
+
+    seed('matches', 'match_123', dict(match_data, unread_counts={'test_user_123': 0, 'test_user_456': 0}))
+    message_id = store.messages.send('match_123', 'test_user_123', 'test_user_456', 'Hello')
+    sent_at = store.messages.get(message_id).get('created_at')
+
+    response = client.get(
+        '/api/messages/match_123/stream',
+        headers={'Authorization': auth_token},
+        buffered=False
+    )
+    store.messages.mark_read('match_123', 'test_user_456', sent_at)
+    body = b''.join(response.response).decode()
+    response.close()
+
+    reads = [
+        json.loads(event.split('data: ', 1)[1])
+        for event in body.split('\n\n') if event.startswith('event: read')
+    ]
+    assert reads == [{
+        'match_id': 'match_123',
+        'reader_uid': 'test_user_456',
+        'last_read_at': sent_at.isoformat()
+    }]
+
+@patch('app.utils.decorators.auth')
+def test_stream_token_opens_streams(auth_mock, client, firebase_mock, auth_token, match_data, seed):
+    """Test that EventSource clients can open streams with a stream token instead of a header."""
+    auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
+    seed('matches', 'match_123', match_data)
+
+    response = client.post('/api/auth/stream-token', headers={'Authorization': auth_token})
+    assert response.status_code == 200
+    stream_token = response.json['stream_token']
+    assert response.json['expires_in'] > 0
+
+    for url in ('/api/messages/match_123/stream', '/api/events/stream'):
+        response = client.get(f'{url}?stream_token={stream_token}', buffered=False)
+        assert response.status_code == 200
+        assert response.mimetype == 'text/event-stream'
+        response.close()
+
+def test_stream_token_is_checked(client):
+    """Test that forged and expired stream tokens are refused."""
+    with client.application.app_context():
+        stream_token = issue_stream_token('test_user_123')
+
+    response = client.get(f'/api/events/stream?stream_token={stream_token}x')
+    assert response.status_code == 401
+
+    with patch('app.utils.stream_token.STREAM_TOKEN_LIFETIME', -1):
+        response = client.get(f'/api/events/stream?stream_token={stream_token}')
+    assert response.status_code == 401
+
+    # Without any token the bearer header is still required
+    assert client.get('/api/events/stream').status_code == 401
+
+@patch('app.utils.decorators.auth')
+def test_stream_messages_unauthorized(auth_mock, client, firebase_mock, auth_token, seed):
+    """Test that only participants can open a match's stream."""
+    auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
+
+    seed('matches', 'match_123', {'user1_uid': 'other_user_1', 'user2_uid': 'other_user_2', 'active': True})
+
+    response = client.get('/api/messages/match_123/stream', headers={'Authorization': auth_token})
+    assert response.status_code == 403
+
+def test_local_bus_delivers_to_topic_subscribers():
+    """Test per-topic delivery and counters of the in-process bus."""
+    bus = LocalEventBus()
+    received = []
+
+    def callback(topic, event):
+        received.append((topic, event))
+
+    bus.subscribe('user:a', callback)
+    bus.publish('user:a', {'type': 'match'})
+    bus.publish('user:b', {'type': 'match'})
+    assert received == [('user:a', {'type': 'match'})]
+
+    bus.unsubscribe('user:a', callback)
+    bus.publish('user:a', {'type': 'match'})
+    assert len(received) == 1
+
+    stats = bus.stats()
+    assert stats['published'] == 3
+    assert stats['delivered'] == 1
+    assert stats['topics'] == 0
+
+def test_unix_bus_fans_out_across_processes(socket_path):
+    """Test that two bus clients share events through a broker one of them hosts."""
+    first = UnixSocketEventBus(socket_path)
+    second = UnixSocketEventBus(socket_path)
+    received = []
+    try:
+        first.subscribe('user:a', lambda topic, event: received.append(event))
+        assert first.stats()['hosts_broker']
+        assert wait_for(lambda: first.stats()['broker']['subscriptions'] == 1)
+
+        second.publish('user:a', {'type': 'message', 'match_id': 'match_123'})
+        second.publish('user:b', {'type': 'message', 'match_id': 'match_456'})
+
+        assert wait_for(lambda: received)
+        assert received == [{'type': 'message', 'match_id': 'match_123'}]
+        assert not second.stats()['hosts_broker']
+        assert wait_for(lambda: first.stats()['broker']['published'] == 2)
+        assert first.stats()['broker']['delivered'] == 1
+    finally:
+        second.close()
+        first.close()
+
+def test_broker_drops_events_for_a_backed_up_connection(socket_path):
+    """Test that a full per-connection queue drops and counts events instead of blocking."""
+    broker = EventBroker(socket_path, queue_size=1)
+
+    # A worker that never reads: nothing drains its queue
+    stalled = _Connection(None, broker.queue_size)
+    stalled.topics.add('user:a')
+    broker._connections.add(stalled)
+
+    broker._route('user:a', {'n': 1})
+    broker._route('user:a', {'n': 2})
+
+    stats = broker.stats()
+    assert stats['published'] == 2
+    assert stats['delivered'] == 1
+    assert stats['dropped'] == 1
+    assert stats['queue_depths'] == [1]
+    assert stalled.dropped == 1
+
+@patch('app.utils.decorators.auth')
+def test_event_stream_announces_new_match(auth_mock, client, firebase_mock, auth_token, store, seed, app):
+    """Test that a match created by a like is pushed to the user's event stream."""
+    auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
+
+    seed('users', 'test_user_123', {'display_name': 'Test User'})
+    seed('users', 'target_user_456', {'display_name': 'Target User'})
+    seed('likes', 'like_1', {'liker_uid': 'target_user_456', 'target_uid': 'test_user_123'})
+
+    response = client.get('/api/events/stream', headers={'Authorization': auth_token}, buffered=False)
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+
+    like_response = client.post('/api/matches/like/target_user_456', headers={'Authorization': auth_token})
+    match_id = json.loads(like_response.data)['match_id']
+
+    body = b''.join(response.response).decode()
+    response.close()
+
+    assert 'event: match' in body
+    events = [
+        json.loads(line[len('data: '):])
+        for line in body.splitlines() if line.startswith('data: ')
+    ]
+    assert events == [{'type': 'match', 'match_id': match_id, 'other_uid': 'target_user_456'}]
+
+    # The stream unsubscribed when it closed
+    assert app.extensions['event_bus'].stats()['subscribers'] == 0
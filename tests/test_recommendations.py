@@ -0,0 +1,86 @@
+"""
+Tests for collaborative-filtering recommendations from the like graph.
+"""
+import pytest
+import json
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+from app.data.memory import MemoryClient
+from app.data.repositories import DataStore
+from app.discovery import get_deck_builder
+from app.discovery.recommendations import LikeGraph, RecommendationModel, refresh_recommendations
+
+OAKLAND = {'latitude': 37.8044, 'longitude': -122.2712}
+LOS_GATOS = {'latitude': 37.2358, 'longitude': -121.9624}
+
+
+def community_likes():
+    """Hikers like each other's favourite profiles, and so do gamers."""
+    likes = []
+    for group, targets in (('hiker', ['trail_1', 'trail_2', 'trail_3']), ('gamer', ['arcade_1', 'arcade_2', 'arcade_3'])):
+        for i in range(6):
+            # Everyone in a group likes two of its three favourites
+            likes += [(f'{group}_{i}', target) for j, target in enumerate(targets) if j != i % 3]
+    return likes
+
+@pytest.fixture
+def memory_store():
+    return DataStore(MemoryClient(), backend='memory')
+
+def test_model_recommends_what_similar_likers_liked():
+    """Test that each liker is recommended the favourite of their group they haven't liked yet."""
+    graph = LikeGraph()
+    likers, targets = zip(*community_likes())
+    graph.add(likers, targets)
+    model = RecommendationModel.fit(graph, factors=4)
+
+    recommendations = {uid: recs for uid, recs, _ in model.recommend(range(len(graph.liker_uids)), top_k=1)}
+    assert recommendations['hiker_0'] == ['trail_1']
+    assert recommendations['gamer_1'] == ['arcade_2']
+
+def test_refresh_only_rewrites_likers_with_new_likes(memory_store, tmp_path):
+    """Test a full run, then an incremental run that folds in a new liker and target."""
+    for liker, target in community_likes():
+        memory_store.likes.like(liker, target)
+
+    model, written = refresh_recommendations(memory_store, factors=2)
+    assert written == 12
+    assert memory_store.recommendations.get('hiker_0').to_dict()['uids'][0] == 'trail_1'
+
+    # The model survives a round trip through its file
+    model.save(tmp_path / 'model.npz')
+    model = RecommendationModel.load(tmp_path / 'model.npz')
+
+    memory_store.likes.like('newcomer', 'trail_2')
+    memory_store.likes.like('hiker_1', 'new_hiker')
+    memory_store.client.stats.reset()
+
+    model, written = refresh_recommendations(memory_store, model)
+    assert written == 2
+    assert memory_store.client.stats.document_reads == 2
+    assert set(memory_store.recommendations.get('newcomer').to_dict()['uids'][:2]) == {'trail_1', 'trail_3'}
+    assert 'new_hiker' not in memory_store.recommendations.get('hiker_1').to_dict()['uids']
+
+@patch('app.utils.decorators.auth')
+def test_deck_blends_in_recommendations(auth_mock, client, firebase_mock, auth_token, user_data, store, seed, app):
+    """Test that a recommended candidate who passes the filters moves up the deck."""
+    auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
+    app.config['DISCOVERY_RANK_POOL'] = 1
+
+    now = datetime.now(timezone.utc)
+    seed('users', 'test_user_123', dict(user_data, preferences=dict(user_data['preferences'], distance_max=100), updated_at=now))
+    seed('users', 'near', {'gender': 'female', 'age': 30, 'location': OAKLAND, 'updated_at': now})
+    seed('users', 'far', {'gender': 'female', 'age': 30, 'location': LOS_GATOS, 'updated_at': now})
+    seed('users', 'wrong_gender', {'gender': 'male', 'age': 30, 'location': OAKLAND, 'updated_at': now})
+    store.recommendations.save_many([('test_user_123', ['wrong_gender', 'far'], [2.0, 1.0])])
+
+    response = client.get('/api/profiles/discover', headers={'Authorization': auth_token})
+    assert response.status_code == 200
+    assert store.decks.get_deck('test_user_123')['uids'] == ['far', 'near']
+
+    # Without the recommendation the nearest candidate comes first
+    app.config['DISCOVERY_RECOMMENDATION_WEIGHT'] = 0
+    with app.app_context():
+        get_deck_builder().schedule('test_user_123')
+    assert store.decks.get_deck('test_user_123')['uids'] == ['near', 'far']
@@ -0,0 +1,49 @@
+"""
+Smoke tests for the maintenance scripts, run against the in-memory backend.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts')))
+
+import backfill_conversation_summaries
+import backfill_match_participants
+
+from app.data.repositories import pair_key
+
+
+def test_backfill_conversation_summaries(monkeypatch, match_data, message_data, store, seed):
+    """Test that the script backfills summaries and unread counts on matches without them."""
+    seed('matches', 'match_123', match_data)
+    seed('messages', 'message_123', message_data)
+    monkeypatch.setattr(backfill_conversation_summaries, 'initialize_firebase', lambda: store.client)
+
+    backfill_conversation_summaries.main()
+
+    match = store.matches.get('match_123').to_dict()
+    assert match['last_message']['id'] == 'message_123'
+    assert match['unread_counts'] == {
+        match_data['user1_uid']: 0 if message_data['sender_uid'] == match_data['user1_uid'] else 1,
+        match_data['user2_uid']: 0 if message_data['sender_uid'] == match_data['user2_uid'] else 1
+    }
+    assert set(match['last_read_at']) == {match_data['user1_uid'], match_data['user2_uid']}
+
+    # A second run leaves backfilled matches alone
+    assert backfill_conversation_summaries.backfill_conversation_summaries(store.client) == 0
+
+def test_backfill_match_participants_moves_matches_to_pair_keys(match_data, message_data, store, seed):
+    """Test that auto-ID matches move to their pair key with their messages, merging duplicates."""
+    uids = [match_data['user1_uid'], match_data['user2_uid']]
+    seed('matches', 'match_123', match_data)
+    seed('matches', 'match_456', match_data)
+    seed('messages', 'message_123', message_data)
+
+    assert backfill_match_participants.backfill_match_participants(store.client) == 2
+
+    match_id = pair_key(*uids)
+    assert [match.id for match in store.matches.collection.get()] == [match_id]
+    assert store.messages.collection.get()[0].to_dict()['match_id'] == match_id
+    assert store.matches.get(match_id).to_dict()['participants'] == sorted(uids)
+
+    # A second run leaves migrated matches alone
+    assert backfill_match_participants.backfill_match_participants(store.client) == 0
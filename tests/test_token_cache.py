@@ -0,0 +1,97 @@
+"""
+Tests for the verified-token cache.
+"""
+import pytest
+import json
+from unittest.mock import patch
+
+from app.utils.token_cache import TokenCache, hash_token
+
+
+class FakeClock:
+    """Controllable clock for expiry tests."""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_cache_hit_and_miss_counters():
+    """Test that lookups are counted as hits or misses."""
+    cache = TokenCache(max_size=10, ttl=60, clock=FakeClock())
+
+    assert cache.get('token_a') is None
+    cache.set('token_a', {'uid': 'user_a'})
+    assert cache.get('token_a') == {'uid': 'user_a'}
+
+    stats = cache.stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+    assert stats['size'] == 1
+
+def test_cache_keys_are_hashed():
+    """Test that raw tokens are not used as cache keys."""
+    cache = TokenCache(max_size=10, ttl=60, clock=FakeClock())
+    cache.set('secret_token', {'uid': 'user_a'})
+
+    assert 'secret_token' not in cache._entries
+    assert hash_token('secret_token') in cache._entries
+
+def test_cache_entry_expires_after_ttl():
+    """Test that entries are dropped once the TTL elapses."""
+    clock = FakeClock()
+    cache = TokenCache(max_size=10, ttl=60, clock=clock)
+    cache.set('token_a', {'uid': 'user_a'})
+
+    clock.now += 61
+    assert cache.get('token_a') is None
+
+def test_cache_entry_never_outlives_token_exp():
+    """Test that the token's exp claim caps the cache TTL."""
+    clock = FakeClock()
+    cache = TokenCache(max_size=10, ttl=300, clock=clock)
+    cache.set('token_a', {'uid': 'user_a', 'exp': clock.now + 10})
+
+    clock.now += 11
+    assert cache.get('token_a') is None
+
+def test_cache_skips_expired_tokens():
+    """Test that already-expired tokens are not cached."""
+    clock = FakeClock()
+    cache = TokenCache(max_size=10, ttl=300, clock=clock)
+    cache.set('token_a', {'uid': 'user_a', 'exp': clock.now - 1})
+
+    assert cache.stats()['size'] == 0
+
+def test_cache_evicts_least_recently_used():
+    """Test that the cache stays within its size bound."""
+    cache = TokenCache(max_size=2, ttl=60, clock=FakeClock())
+    cache.set('token_a', {'uid': 'user_a'})
+    cache.set('token_b', {'uid': 'user_b'})
+
+    # Touch token_a so token_b becomes the eviction candidate
+    cache.get('token_a')
+    cache.set('token_c', {'uid': 'user_c'})
+
+    assert cache.get('token_b') is None
+    assert cache.get('token_a') is not None
+    assert cache.stats()['evictions'] == 1
+
+@patch('app.utils.decorators.auth')
+def test_token_required_verifies_once(auth_mock, client, firebase_mock, auth_token, seed):
+    """Test that repeated requests with one token only verify it once."""
+    auth_mock.verify_id_token.return_value = firebase_mock['auth'].verify_id_token.return_value
+
+    seed('users', 'test_user_123', {
+        'uid': 'test_user_123',
+        'email': 'test@example.com',
+        'display_name': 'Test User'
+    })
+
+    for _ in range(3):
+        response = client.get('/api/auth/me', headers={'Authorization': auth_token})
+        assert response.status_code == 200
+
+    auth_mock.verify_id_token.assert_called_once()